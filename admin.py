@@ -4,8 +4,10 @@ from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 import models 
 import crud, schemas
+import orden_cola
+import reproduccion
 import config
-from database import SessionLocal
+from database import SessionLocal, get_db_lectura
 import websocket_manager
 from security import api_key_auth, MASTER_API_KEY
 
@@ -148,7 +150,7 @@ async def broadcast_message(notificacion: schemas.Notificacion, db: Session = De
 
 
 @router.get("/reports/top-songs", response_model=List[schemas.CancionMasCantada], summary="Obtener las canciones más cantadas")
-def get_top_songs_report(db: Session = Depends(get_db), limit: int = 10):
+def get_top_songs_report(db: Session = Depends(get_db_lectura), limit: int = 10):
     """
     **[Admin]** Devuelve un reporte de las canciones más cantadas de la noche,
     ordenadas por popularidad.
@@ -168,7 +170,7 @@ def get_top_songs_report(db: Session = Depends(get_db), limit: int = 10):
     return report
 
 @router.get("/reports/top-products", response_model=List[schemas.ProductoMasConsumido], summary="Obtener los productos más consumidos")
-def get_top_products_report(db: Session = Depends(get_db), limit: int = 10):
+def get_top_products_report(db: Session = Depends(get_db_lectura), limit: int = 10):
     """
     **[Admin]** Devuelve un reporte de los productos más consumidos de la noche,
     ordenados por la cantidad total vendida.
@@ -186,7 +188,7 @@ def get_top_products_report(db: Session = Depends(get_db), limit: int = 10):
     return report
 
 @router.get("/reports/average-wait-time", response_model=schemas.ReporteTiempoEsperaPromedio, summary="Obtener tiempo de espera promedio de canciones")
-def get_average_wait_time_report(db: Session = Depends(get_db)):
+def get_average_wait_time_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve el tiempo promedio en segundos que tarda una canción
     desde que es añadida por un usuario hasta que es marcada como 'cantada'.
@@ -216,7 +218,7 @@ def get_banned_nicks_list(db: Session = Depends(get_db)):
     return crud.get_banned_nicks(db)
 
 @router.get("/reports/hourly-activity", response_model=List[schemas.ReporteActividadPorHora], summary="Obtener actividad por hora")
-def get_hourly_activity_report(db: Session = Depends(get_db)):
+def get_hourly_activity_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve un reporte de las horas del día con más canciones cantadas,
     ordenado de mayor a menor actividad.
@@ -276,7 +278,7 @@ def deactivate_table(mesa_id: int, db: Session = Depends(get_db)):
     return db_mesa
 
 @router.get("/reports/income-by-category", response_model=List[schemas.ReporteIngresosPorCategoria], summary="Obtener los ingresos por categoría de producto")
-def get_income_by_category_report(db: Session = Depends(get_db)):
+def get_income_by_category_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve un reporte de los ingresos totales generados por cada
     categoría de producto (ej: Licores, Comidas, Snacks), ordenado de mayor a menor.
@@ -294,7 +296,7 @@ def get_income_by_category_report(db: Session = Depends(get_db)):
     return report
 
 @router.get("/reports/top-rejected-users", response_model=List[schemas.ReporteUsuarioRechazado], summary="Obtener usuarios con más canciones rechazadas")
-def get_top_rejected_users_report(db: Session = Depends(get_db), limit: int = 10):
+def get_top_rejected_users_report(db: Session = Depends(get_db_lectura), limit: int = 10):
     """
     **[Admin]** Devuelve un reporte de los usuarios a los que más se les han
     rechazado canciones, ordenados de mayor a menor.
@@ -321,7 +323,7 @@ def get_user_song_history(usuario_id: int, db: Session = Depends(get_db)):
     return crud.get_canciones_por_usuario(db, usuario_id=usuario_id)
 
 @router.get("/reports/top-rejected-songs", response_model=List[schemas.ReporteCancionesRechazadas], summary="Obtener las canciones más rechazadas")
-def get_top_rejected_songs_report(db: Session = Depends(get_db), limit: int = 10):
+def get_top_rejected_songs_report(db: Session = Depends(get_db_lectura), limit: int = 10):
     """
     **[Admin]** Devuelve un reporte de las canciones que más se han rechazado,
     ordenadas por la cantidad de veces que fueron rechazadas.
@@ -340,7 +342,7 @@ def get_top_rejected_songs_report(db: Session = Depends(get_db), limit: int = 10
     return report
 
 @router.get("/reports/empty-tables", response_model=List[schemas.MesaSimple], summary="Obtener mesas sin usuarios")
-def get_empty_tables_report(db: Session = Depends(get_db)):
+def get_empty_tables_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve una lista de todas las mesas que no tienen
     ningún usuario conectado.
@@ -380,7 +382,7 @@ async def ban_user(usuario_id: int, db: Session = Depends(get_db)):
     return Response(status_code=204)
 
 @router.get("/reports/average-income-per-table", response_model=List[schemas.ReporteIngresosPromedioPorMesa], summary="Obtener los ingresos promedio por usuario en cada mesa")
-def get_average_income_per_table_report(db: Session = Depends(get_db)):
+def get_average_income_per_table_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve un reporte con el ingreso promedio por usuario para cada mesa,
     ordenado por el ingreso total de la mesa.
@@ -392,7 +394,7 @@ def get_average_income_per_table_report(db: Session = Depends(get_db)):
     return report
 
 @router.get("/reports/songs-by-table", response_model=List[schemas.ReporteCancionesPorMesa], summary="Obtener cantidad de canciones por mesa")
-def get_songs_by_table_report(db: Session = Depends(get_db)):
+def get_songs_by_table_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve un reporte de cuántas canciones se han cantado en cada mesa,
     ordenado de mayor a menor.
@@ -430,7 +432,7 @@ def un_silence_user(usuario_id: int, db: Session = Depends(get_db)):
     return db_usuario
 
 @router.get("/reports/average-income-per-user", response_model=schemas.ReporteIngresosPromedio, summary="Obtener los ingresos promedio por usuario")
-def get_average_income_per_user_report(db: Session = Depends(get_db)):
+def get_average_income_per_user_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve un reporte con el ingreso promedio por cada usuario
     que ha realizado al menos un consumo.
@@ -459,7 +461,7 @@ def move_user_to_table(usuario_id: int, mover_data: schemas.UsuarioMoverMesa, db
     return usuario_actualizado
 
 @router.get("/reports/one-hit-wonders", response_model=List[schemas.UsuarioPublico], summary="Obtener usuarios que han cantado una sola canción")
-def get_one_hit_wonders_report(db: Session = Depends(get_db)):
+def get_one_hit_wonders_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve una lista de todos los usuarios que han cantado
     exactamente una canción durante la noche.
@@ -497,7 +499,7 @@ def edit_user_nick(usuario_id: int, nick_update: schemas.UsuarioNickUpdate, db:
     return db_usuario
 
 @router.get("/reports/songs-by-user", response_model=List[schemas.ReporteCancionesPorUsuario], summary="Obtener cantidad de canciones por usuario")
-def get_songs_by_user_report(db: Session = Depends(get_db)):
+def get_songs_by_user_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve un reporte de cuántas canciones ha cantado cada usuario,
     ordenado de mayor a menor.
@@ -529,7 +531,7 @@ async def reorder_queue(orden: schemas.ReordenarCola, db: Session = Depends(get_
     return {"mensaje": "La cola ha sido reordenada manualmente."}
 
 @router.get("/reports/inactive-users", response_model=List[schemas.UsuarioPublico], summary="Obtener usuarios sin consumo")
-def get_inactive_users_report(db: Session = Depends(get_db)):
+def get_inactive_users_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve una lista de todos los usuarios que no han
     realizado ningún consumo durante la noche.
@@ -554,11 +556,39 @@ async def move_song_to_top_endpoint(cancion_id: int, db: Session = Depends(get_d
     await websocket_manager.manager.broadcast_queue_update()
     return {"mensaje": f"La canción '{cancion_movida.titulo}' ha sido movida al principio de la cola."}
 
+@router.post("/canciones/{cancion_id}/move-up", status_code=200, summary="Mover canción aprobada hacia arriba")
+async def move_approved_song_up(cancion_id: int, db: Session = Depends(get_db), api_key: str = Depends(api_key_auth)):
+    """
+    **[Admin]** Mueve una canción aprobada una posición hacia arriba en la cola.
+    Solo se escribe la fila de la canción (salvo que haya que fijar el orden visible).
+    """
+    cancion = crud.mover_cancion_aprobada(db, cancion_id=cancion_id, desplazamiento=-1)
+    if not cancion:
+        raise HTTPException(status_code=404, detail="Canción aprobada no encontrada en la cola.")
+
+    crud.create_admin_log_entry(db, action="MOVE_SONG_UP", details=f"Canción '{cancion.titulo}' (ID: {cancion_id}) movida hacia arriba.")
+    await websocket_manager.manager.broadcast_queue_update()
+    return {"mensaje": "Canción movida hacia arriba."}
+
+@router.post("/canciones/{cancion_id}/move-down", status_code=200, summary="Mover canción aprobada hacia abajo")
+async def move_approved_song_down(cancion_id: int, db: Session = Depends(get_db), api_key: str = Depends(api_key_auth)):
+    """
+    **[Admin]** Mueve una canción aprobada una posición hacia abajo en la cola.
+    """
+    cancion = crud.mover_cancion_aprobada(db, cancion_id=cancion_id, desplazamiento=1)
+    if not cancion:
+        raise HTTPException(status_code=404, detail="Canción aprobada no encontrada en la cola.")
+
+    crud.create_admin_log_entry(db, action="MOVE_SONG_DOWN", details=f"Canción '{cancion.titulo}' (ID: {cancion_id}) movida hacia abajo.")
+    await websocket_manager.manager.broadcast_queue_update()
+    return {"mensaje": "Canción movida hacia abajo."}
+
 @router.post("/canciones/restart", status_code=200, summary="Reiniciar la canción actual")
 async def restart_current_song(db: Session = Depends(get_db)):
     """
     **[Admin]** Reinicia la canción que se está reproduciendo actualmente.
     """
+    reproduccion.reloj.reiniciar()
     await websocket_manager.manager.broadcast_restart_song()
     crud.create_admin_log_entry(db, action="RESTART_SONG", details="Canción actual reiniciada.")
     return {"mensaje": "Canción reiniciada."}
@@ -568,6 +598,7 @@ async def pause_playback(db: Session = Depends(get_db)):
     """
     **[Admin]** Pausa la reproducción en el player.
     """
+    reproduccion.reloj.pausar()
     await websocket_manager.manager.broadcast_pause()
     crud.create_admin_log_entry(db, action="PAUSE_PLAYBACK", details="Reproducción pausada por admin.")
     return {"mensaje": "Reproducción pausada."}
@@ -577,6 +608,7 @@ async def resume_playback(db: Session = Depends(get_db)):
     """
     **[Admin]** Reanuda la reproducción en el player.
     """
+    reproduccion.reloj.reanudar()
     await websocket_manager.manager.broadcast_resume()
     crud.create_admin_log_entry(db, action="RESUME_PLAYBACK", details="Reproducción reanudada por admin.")
     return {"mensaje": "Reproducción reanudada."}
@@ -667,7 +699,7 @@ async def move_pending_song_down(cancion_id: int, db: Session = Depends(get_db),
 async def move_lazy_song_up(cancion_id: int, db: Session = Depends(get_db), api_key: str = Depends(api_key_auth)):
     """
     **[Admin]** Mueve una canción en la cola lazy una posición hacia arriba.
-    CONVIERTE la cola dinámica en una cola manual estática para garantizar el orden.
+    Las canciones que quedan antes de ella pasan a orden manual para garantizar el orden.
     """
     # 1. Obtener la lista visual completa actual
     cola_lazy = crud.get_cola_lazy(db)
@@ -685,18 +717,12 @@ async def move_lazy_song_up(cancion_id: int, db: Session = Depends(get_db), api_
     if current_index == 0:
         return {"mensaje": "La canción ya está en el principio."}
         
-    # 3. Intercambiar en la lista EN MEMORIA
-    cola_lazy[current_index], cola_lazy[current_index - 1] = cola_lazy[current_index - 1], cola_lazy[current_index]
-    
-    # 4. "Congelar" el orden: Asignar orden_manual secuencial a TODA la lista
-    # Esto sobreescribe la lógica dinámica de Round Robin para las canciones actuales,
-    # garantizando que el orden visual se respete.
-    for index, song in enumerate(cola_lazy):
-        song.orden_manual = index + 1
-        
+    # 3. Asignar a la canción una clave entre sus nuevos vecinos. Si el destino cae dentro
+    # del orden dinámico (Round Robin), se "congela" el tramo visible hasta ella en un solo UPDATE.
+    orden_cola.mover(db, cola_lazy, cancion_id, current_index - 1)
     db.commit()
     
-    crud.create_admin_log_entry(db, action="MOVE_LAZY_UP", details=f"Canción ID {cancion_id} movida hacia arriba (Cola convertida a manual).")
+    crud.create_admin_log_entry(db, action="MOVE_LAZY_UP", details=f"Canción ID {cancion_id} movida hacia arriba en la cola lazy.")
     await websocket_manager.manager.broadcast_queue_update()
     return {"mensaje": "Canción movida hacia arriba."}
 
@@ -704,7 +730,7 @@ async def move_lazy_song_up(cancion_id: int, db: Session = Depends(get_db), api_
 async def move_lazy_song_down(cancion_id: int, db: Session = Depends(get_db), api_key: str = Depends(api_key_auth)):
     """
     **[Admin]** Mueve una canción en la cola lazy una posición hacia abajo.
-    CONVIERTE la cola dinámica en una cola manual estática para garantizar el orden.
+    Las canciones que quedan antes de ella pasan a orden manual para garantizar el orden.
     """
     # 1. Obtener la lista visual completa
     cola_lazy = crud.get_cola_lazy(db)
@@ -722,16 +748,11 @@ async def move_lazy_song_down(cancion_id: int, db: Session = Depends(get_db), ap
     if current_index >= len(cola_lazy) - 1:
         return {"mensaje": "La canción ya está en el final."}
         
-    # 3. Intercambiar en la lista EN MEMORIA
-    cola_lazy[current_index], cola_lazy[current_index + 1] = cola_lazy[current_index + 1], cola_lazy[current_index]
-    
-    # 4. "Congelar" el orden secuencial
-    for index, song in enumerate(cola_lazy):
-        song.orden_manual = index + 1
-        
+    # 3. Asignar la clave entre los nuevos vecinos (o congelar el tramo visible hasta ella)
+    orden_cola.mover(db, cola_lazy, cancion_id, current_index + 1)
     db.commit()
     
-    crud.create_admin_log_entry(db, action="MOVE_LAZY_DOWN", details=f"Canción ID {cancion_id} movida hacia abajo (Cola convertida a manual).")
+    crud.create_admin_log_entry(db, action="MOVE_LAZY_DOWN", details=f"Canción ID {cancion_id} movida hacia abajo en la cola lazy.")
     await websocket_manager.manager.broadcast_queue_update()
     return {"mensaje": "Canción movida hacia abajo."}
 
@@ -789,7 +810,7 @@ async def revert_approved_song(cancion_id: int, db: Session = Depends(get_db), a
     return db_cancion
 
 @router.get("/reports/total-income", response_model=schemas.ReporteIngresos, summary="Obtener los ingresos totales de la noche")
-def get_total_income_report(db: Session = Depends(get_db)):
+def get_total_income_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve un reporte con la suma total de los ingresos por consumos.
     """
@@ -797,7 +818,7 @@ def get_total_income_report(db: Session = Depends(get_db)):
     return schemas.ReporteIngresos(ingresos_totales=total_ingresos)
 
 @router.get("/reports/income-by-table", response_model=List[schemas.ReporteIngresosPorMesa], summary="Obtener los ingresos por mesa")
-def get_income_by_table_report(db: Session = Depends(get_db)):
+def get_income_by_table_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve un reporte de los ingresos totales generados por cada mesa,
     ordenado de mayor a menor.
@@ -815,7 +836,7 @@ def get_income_by_table_report(db: Session = Depends(get_db)):
     return report
 
 @router.get("/reports/least-sold-products", response_model=List[schemas.ProductoMasConsumido], summary="Obtener los productos menos vendidos")
-def get_least_sold_products_report(db: Session = Depends(get_db), limit: int = 5):
+def get_least_sold_products_report(db: Session = Depends(get_db_lectura), limit: int = 5):
     """
     **[Admin]** Devuelve un reporte de los productos que menos se han vendido,
     ordenados de menor a mayor cantidad.
@@ -833,7 +854,7 @@ def get_least_sold_products_report(db: Session = Depends(get_db), limit: int = 5
     return report
 
 @router.get("/reports/inactive-consumers", response_model=List[schemas.UsuarioPublico], summary="Obtener usuarios con consumo inactivo")
-def get_inactive_consumers_report(db: Session = Depends(get_db), horas: int = 2):
+def get_inactive_consumers_report(db: Session = Depends(get_db_lectura), horas: int = 2):
     """
     **[Admin]** Devuelve una lista de todos los usuarios cuyo último consumo
     fue hace más de X horas (por defecto 2), o que nunca han consumido.
@@ -842,7 +863,7 @@ def get_inactive_consumers_report(db: Session = Depends(get_db), horas: int = 2)
     return users
 
 @router.get("/reports/top-consumers-one-song", response_model=List[schemas.ReporteGastoUsuarioPorCategoria], summary="Obtener 'One-Hit Wonders' con mayor consumo")
-def get_top_consumers_one_song_report(db: Session = Depends(get_db), limit: int = 10):
+def get_top_consumers_one_song_report(db: Session = Depends(get_db_lectura), limit: int = 10):
     """
     **[Admin]** Devuelve un ranking de los usuarios que más han consumido
     pero que solo han cantado una canción.
@@ -860,7 +881,7 @@ def get_top_consumers_one_song_report(db: Session = Depends(get_db), limit: int
     return report
 
 @router.get("/reports/consumers-no-singers", response_model=List[schemas.UsuarioPublico], summary="Obtener usuarios que consumen pero no cantan")
-def get_consumers_no_singers_report(db: Session = Depends(get_db), umbral: float = 100.0):
+def get_consumers_no_singers_report(db: Session = Depends(get_db_lectura), umbral: float = 100.0):
     """
     **[Admin]** Devuelve una lista de todos los usuarios que han gastado más
     del umbral especificado pero no han cantado ninguna canción.
@@ -890,7 +911,7 @@ def get_top_categories_by_table_report(mesa_id: int, db: Session = Depends(get_d
     return report
 
 @router.get("/reports/active-gold-users", response_model=List[schemas.UsuarioPublico], summary="Obtener usuarios 'Oro' más activos")
-def get_active_gold_users_report(db: Session = Depends(get_db)):
+def get_active_gold_users_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve una lista de los usuarios de nivel "Oro" que han
     cantado más de 5 canciones.
@@ -943,7 +964,7 @@ def get_top_products_by_table_report(mesa_id: int, db: Session = Depends(get_db)
     return report
 
 @router.get("/reports/unsold-products", response_model=List[schemas.Producto], summary="Obtener productos nunca vendidos")
-def get_unsold_products_report(db: Session = Depends(get_db)):
+def get_unsold_products_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve un reporte de los productos del catálogo que
     nunca han sido consumidos durante la noche.
@@ -969,13 +990,20 @@ async def admin_delete_consumo(consumo_id: int, db: Session = Depends(get_db)):
     Restaura el stock y recalcula puntos del usuario.
     Notifica vía WebSocket a los clientes sobre la eliminación.
     """
+    # Mesa del consumo, para avisar también a sus clientes (tema mesa:{id})
+    mesa_id = (
+        db.query(models.Usuario.mesa_id)
+        .join(models.Consumo, models.Consumo.usuario_id == models.Usuario.id)
+        .filter(models.Consumo.id == consumo_id)
+        .scalar()
+    )
     deleted = crud.delete_consumo(db, consumo_id=consumo_id)
     if not deleted:
         raise HTTPException(status_code=404, detail='Consumo no encontrado')
 
     # Notificar a los clientes que un consumo fue eliminado
     try:
-        await websocket_manager.manager.broadcast_consumo_deleted({'id': consumo_id})
+        await websocket_manager.manager.broadcast_consumo_deleted({'id': consumo_id, 'mesa_id': mesa_id})
     except Exception:
         # No romper la respuesta si la notificación falla
         pass
@@ -1002,6 +1030,14 @@ async def admin_mark_consumo_despachado(consumo_id: int, db: Session = Depends(g
     # Notify clients that this consumption should be removed from recent lists
     try:
         await websocket_manager.manager.broadcast_consumo_deleted({'id': consumo_id})
+        # Aviso personal al usuario que lo pidió y a su mesa
+        await websocket_manager.manager.broadcast_consumo_despachado({
+            'id': consumo_id,
+            'usuario_id': db_consumo.usuario_id,
+            'mesa_id': db_consumo.mesa_id,
+            'producto': db_consumo.producto.nombre if db_consumo.producto else None,
+            'cantidad': db_consumo.cantidad,
+        })
     except Exception:
         pass # Don't break the response if notification fails
 
@@ -1048,7 +1084,7 @@ async def admin_decrease_consumo(consumo_id: int, db: Session = Depends(get_db))
     return consumo
 
 @router.get("/reports/gold-users", response_model=List[schemas.UsuarioPublico], summary="Obtener usuarios de nivel Oro")
-def get_gold_users_report(db: Session = Depends(get_db)):
+def get_gold_users_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve una lista de todos los usuarios que actualmente
     tienen el nivel "Oro".
@@ -1097,7 +1133,7 @@ def get_night_summary(db: Session = Depends(get_db)):
     )
 
 @router.get("/reports/table-consumption-summaries", response_model=List[schemas.MesaConsumoResumen], summary="Obtener resumen de consumo por mesa")
-def get_table_consumption_summaries_endpoint(db: Session = Depends(get_db)):
+def get_table_consumption_summaries_endpoint(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve un resumen detallado del consumo de cada mesa,
     incluyendo el valor total consumido y la lista de productos pedidos.
@@ -1106,7 +1142,7 @@ def get_table_consumption_summaries_endpoint(db: Session = Depends(get_db)):
     return summaries
 
 @router.get("/reports/table-payment-status", response_model=List[schemas.MesaEstadoPago], summary="Obtener estado de cuenta de todas las mesas", tags=["Reportes", "Cuentas"])
-async def get_table_payment_status_endpoint(db: Session = Depends(get_db)):
+async def get_table_payment_status_endpoint(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve un estado de cuenta detallado para cada mesa,
     incluyendo total consumido, total pagado, saldo pendiente, y listas
@@ -1156,6 +1192,15 @@ def get_table_summary(mesa_id: int, db: Session = Depends(get_db)):
     return summary_data
 
 
+@router.get("/websocket/stats", response_model=schemas.EstadisticasWebSocket, summary="Ver las conexiones WebSocket en vivo")
+def get_websocket_stats():
+    """
+    **[Admin]** Devuelve las conexiones WebSocket de este worker con sus contadores
+    (mensajes, bytes, latencia de envío, cola pendiente, inactividad y RTT del latido).
+    """
+    return websocket_manager.manager.estadisticas()
+
+
 @router.get("/logs", response_model=List[schemas.AdminLogView], summary="Ver el log de acciones administrativas")
 def get_admin_logs_endpoint(db: Session = Depends(get_db), limit: int = 100):
     """
@@ -1164,7 +1209,7 @@ def get_admin_logs_endpoint(db: Session = Depends(get_db), limit: int = 100):
     return crud.get_admin_logs(db, limit=limit)
 
 @router.get("/reports/silver-users", response_model=List[schemas.UsuarioPublico], summary="Obtener usuarios de nivel Plata")
-def get_silver_users_report(db: Session = Depends(get_db)):
+def get_silver_users_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve una lista de todos los usuarios que actualmente
     tienen el nivel "Plata".
@@ -1173,7 +1218,7 @@ def get_silver_users_report(db: Session = Depends(get_db)):
     return silver_users
 
 @router.get("/reports/users-without-sung-songs", response_model=List[schemas.UsuarioPublico], summary="Obtener usuarios que no han cantado")
-def get_users_without_sung_songs_report(db: Session = Depends(get_db)):
+def get_users_without_sung_songs_report(db: Session = Depends(get_db_lectura)):
     """
     **[Admin]** Devuelve una lista de todos los usuarios que no han cantado
     ninguna canción durante la noche.
@@ -1223,7 +1268,7 @@ def get_all_tables_status(db: Session = Depends(get_db)):
     return report
 
 @router.get("/reports/top-points-users", response_model=List[schemas.UsuarioPublico], summary="Obtener ranking de usuarios por puntos")
-def get_top_points_users_report(db: Session = Depends(get_db), limit: int = 10):
+def get_top_points_users_report(db: Session = Depends(get_db_lectura), limit: int = 10):
     """
     **[Admin]** Devuelve un ranking de los usuarios con más puntos acumulados,
     ordenado de mayor a menor.
@@ -1,6 +1,9 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
 from settings_storage import load_settings, save_settings
+import queue_engine
+import scheduler
+import websocket_manager
 
 router = APIRouter(prefix="/api/v1/admin/settings", tags=["Admin Settings"])
 
@@ -17,6 +20,10 @@ class ClosingTime(BaseModel):
     closing_minute: int
 
 
+class QueuePolicy(BaseModel):
+    policy: str
+
+
 # ============= ENDPOINTS =============
 
 @router.get("/")
@@ -93,3 +100,32 @@ def get_closing_time():
         "closing_hour": settings.get("closing_hour", 3),
         "closing_minute": settings.get("closing_minute", 0)
     }
+
+
+@router.get("/queue-policy")
+def get_queue_policy():
+    """Obtiene la política de ordenamiento de la cola y las disponibles"""
+    return {
+        "policy": scheduler.politica_actual().nombre,
+        "available": list(scheduler.POLITICAS.keys())
+    }
+
+
+@router.post("/queue-policy")
+async def update_queue_policy(data: QueuePolicy):
+    """Cambia la política de ordenamiento de la cola (cuota_nivel, wfq, fifo)"""
+    try:
+        scheduler.set_politica(data.policy)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    # La cola residente se reconstruye con la nueva política en la próxima lectura; el
+    # marcador "invalidar" viaja con la señal de cola y los demás workers releen la política
+    queue_engine.motor.registrar_cambios([("invalidar",)])
+    await websocket_manager.manager.broadcast_queue_update()
+
+    return {
+        "status": "success",
+        "message": "Queue policy updated",
+        "data": {"policy": data.policy}
+    }
@@ -0,0 +1,92 @@
+"""
+Control de admisión de canciones frente a la hora de cierre.
+
+Antes, cada canción nueva parseaba KARAOKE_CIERRE y sumaba con una consulta la duración
+de la cola aprobada, ignorando la cola lazy (donde espera la mayoría de canciones).
+Ahora la proyección es la cola completa:
+
+    restante de la que suena + aprobadas + pendiente_lazy
+
+usando los totales por estado y por mesa que mantiene la cola residente (queue_engine),
+de modo que "¿cabe esta canción antes del cierre?" es O(1).
+
+La capacidad por mesa reparte el tiempo hasta el cierre según el cupo de cada mesa
+(nivel de consumo) entre las mesas con canciones en cola, descontando lo que ya tiene
+encolado y sin superar la holgura global. Es informativa: la admisión usa la holgura global.
+"""
+import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+import config
+import crud
+from consumo_totales import cache_niveles
+from timezone_utils import now_bogota
+
+
+class ControlAdmision:
+    """Proyección de la cola completa contra la hora de cierre."""
+
+    def hora_cierre(self, ahora: Optional[datetime.datetime] = None) -> datetime.datetime:
+        """Próxima hora de cierre (KARAOKE_CIERRE, "HH:MM"). ValueError si el formato es inválido."""
+        ahora = ahora or now_bogota()
+        try:
+            h, m = map(int, config.settings.KARAOKE_CIERRE.split(':'))
+            hora_cierre = ahora.replace(hour=h, minute=m, second=0, microsecond=0)
+        except (ValueError, TypeError, AttributeError):
+            raise ValueError("Formato de hora de cierre inválido.")
+        if hora_cierre < ahora:
+            hora_cierre += datetime.timedelta(days=1)
+        return hora_cierre
+
+    def proyeccion(self, db: Session, mesa_id: Optional[int] = None, ahora: Optional[datetime.datetime] = None) -> dict:
+        """Tiempo hasta el cierre, cola proyectada y holgura, en segundos."""
+        ahora = ahora or now_bogota()
+        hasta_cierre = max(0, int((self.hora_cierre(ahora) - ahora).total_seconds()))
+        por_estado, total_mesa = crud.get_duraciones_cola(db, mesa_id)
+        restante_actual = int(crud.get_indice_espera(db).restante_actual(ahora))
+        proyectado = restante_actual + por_estado.get("aprobado", 0) + por_estado.get("pendiente_lazy", 0)
+        return {
+            "tiempo_hasta_cierre_segundos": hasta_cierre,
+            "restante_actual_segundos": restante_actual,
+            "aprobado_segundos": por_estado.get("aprobado", 0),
+            "lazy_segundos": por_estado.get("pendiente_lazy", 0),
+            "proyectado_segundos": proyectado,
+            "holgura_segundos": max(0, hasta_cierre - proyectado),
+            "encolado_mesa_segundos": total_mesa,
+        }
+
+    def admite(self, db: Session, duracion: int, ahora: Optional[datetime.datetime] = None) -> bool:
+        """Indica si una canción de `duracion` segundos alcanza a sonar antes del cierre."""
+        proyeccion = self.proyeccion(db, ahora=ahora)
+        return proyeccion["proyectado_segundos"] + (duracion or 0) <= proyeccion["tiempo_hasta_cierre_segundos"]
+
+    def capacidad_mesas(self, db: Session, mesa_id: Optional[int] = None, ahora: Optional[datetime.datetime] = None) -> dict:
+        """
+        Proyección global y capacidad restante de cada mesa con canciones en cola (más
+        `mesa_id`, si se indica; en ese caso solo se devuelve esa mesa).
+        """
+        proyeccion = self.proyeccion(db, ahora=ahora)
+        encolado = crud.get_duraciones_mesas(db)
+        activas = set(encolado)
+        if mesa_id is not None:
+            activas.add(mesa_id)
+        cupos = cache_niveles.cupos(db, activas)
+        suma_cupos = sum(cupos.values()) or 1
+
+        mesas: List[Dict] = []
+        for mid in sorted(activas) if mesa_id is None else [mesa_id]:
+            cuota = proyeccion["tiempo_hasta_cierre_segundos"] * cupos[mid] // suma_cupos
+            mesas.append({
+                "mesa_id": mid,
+                "cupo": cupos[mid],
+                "encolado_segundos": encolado.get(mid, 0),
+                "cuota_segundos": cuota,
+                "capacidad_segundos": max(0, min(proyeccion["holgura_segundos"], cuota - encolado.get(mid, 0))),
+            })
+        proyeccion["mesas"] = mesas
+        return proyeccion
+
+
+admision = ControlAdmision()
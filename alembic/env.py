@@ -29,11 +29,14 @@ except Exception:
     pass
 
 # Import your model's MetaData object here
-from database import SQLALCHEMY_DATABASE_URL, Base
+from database import SQLALCHEMY_DATABASE_URL, Base, url_con_driver
 import models
 
 # Prefer explicit environment variable DATABASE_URL or SQLALCHEMY_DATABASE_URL
 env_db_url = os.getenv('DATABASE_URL') or os.getenv('SQLALCHEMY_DATABASE_URL')
+if env_db_url:
+    # Same driver the app uses (e.g. postgresql:// -> postgresql+psycopg://)
+    env_db_url = url_con_driver(env_db_url)
 
 target_metadata = models.Base.metadata
 
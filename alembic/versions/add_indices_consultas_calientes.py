@@ -0,0 +1,51 @@
+"""Índices compuestos y parciales para las consultas calientes
+
+Revision ID: add_indices_calientes
+Revises: add_total_consumido
+Create Date: 2026-10-18
+
+Cambios (los mismos índices que declara models.py):
+1. canciones (estado, orden_manual, id) y (usuario_id, estado)
+2. consumos (usuario_id, created_at), (mesa_id), (cuenta_id, created_at) y
+   (created_at) parcial para los no despachados
+3. pagos (mesa_id, created_at) y (cuenta_id, created_at)
+4. cuentas (mesa_id, is_active)
+5. usuarios (mesa_id)
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_indices_calientes'
+down_revision = 'add_total_consumido'
+branch_labels = None
+depends_on = None
+
+INDICES = [
+    ('ix_canciones_estado_orden', 'canciones', ['estado', 'orden_manual', 'id']),
+    ('ix_canciones_usuario_estado', 'canciones', ['usuario_id', 'estado']),
+    ('ix_consumos_usuario_creado', 'consumos', ['usuario_id', 'created_at']),
+    ('ix_consumos_mesa_id', 'consumos', ['mesa_id']),
+    ('ix_consumos_cuenta_creado', 'consumos', ['cuenta_id', 'created_at']),
+    ('ix_pagos_mesa_creado', 'pagos', ['mesa_id', 'created_at']),
+    ('ix_pagos_cuenta_creado', 'pagos', ['cuenta_id', 'created_at']),
+    ('ix_cuentas_mesa_activa', 'cuentas', ['mesa_id', 'is_active']),
+    ('ix_usuarios_mesa_id', 'usuarios', ['mesa_id']),
+]
+
+
+def upgrade():
+    for nombre, tabla, columnas in INDICES:
+        op.create_index(nombre, tabla, columnas)
+
+    op.create_index(
+        'ix_consumos_sin_despachar', 'consumos', ['created_at'],
+        sqlite_where=sa.text('is_dispatched = 0'),
+        postgresql_where=sa.text('is_dispatched = false'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_consumos_sin_despachar', table_name='consumos')
+    for nombre, tabla, _ in reversed(INDICES):
+        op.drop_index(nombre, table_name=tabla)
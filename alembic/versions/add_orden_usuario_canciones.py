@@ -0,0 +1,26 @@
+"""Turno de la canción en la cola de su mesa cuando el usuario reordena su lista
+
+Revision ID: add_orden_usuario
+Revises: add_indices_calientes
+Create Date: 2026-10-18
+
+Subir/bajar una canción en la lista personal escribía orden_manual (el orden global del
+admin). Ahora intercambia los turnos de las canciones del usuario en orden_usuario
+(NULL = su propio id); ver orden_cola.py.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_orden_usuario'
+down_revision = 'add_indices_calientes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('canciones', sa.Column('orden_usuario', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('canciones', 'orden_usuario')
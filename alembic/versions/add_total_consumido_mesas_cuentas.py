@@ -0,0 +1,41 @@
+"""Totales de consumo materializados en mesas y cuentas
+
+Revision ID: add_total_consumido
+Revises: consolidate_consumos_mesa
+Create Date: 2026-10-18
+
+Cambios:
+1. Agregar columna total_consumido a mesas y cuentas
+2. Rellenarla con la suma de los consumos existentes
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_total_consumido'
+down_revision = 'consolidate_consumos_mesa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('mesas', sa.Column('total_consumido', sa.Numeric(12, 2), nullable=False, server_default='0'))
+    op.add_column('cuentas', sa.Column('total_consumido', sa.Numeric(12, 2), nullable=False, server_default='0'))
+
+    op.execute("""
+        UPDATE mesas
+        SET total_consumido = (
+            SELECT COALESCE(SUM(valor_total), 0) FROM consumos WHERE consumos.mesa_id = mesas.id
+        )
+    """)
+    op.execute("""
+        UPDATE cuentas
+        SET total_consumido = (
+            SELECT COALESCE(SUM(valor_total), 0) FROM consumos WHERE consumos.cuenta_id = cuentas.id
+        )
+    """)
+
+
+def downgrade():
+    op.drop_column('cuentas', 'total_consumido')
+    op.drop_column('mesas', 'total_consumido')
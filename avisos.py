@@ -0,0 +1,92 @@
+"""
+Avisos personales por WebSocket (tema "user:{id}").
+
+Tras cada cambio de cola el manager pasa la cola leída a CalculadorAvisos, que la
+compara con la anterior y genera los eventos de cada usuario:
+- song_approved: su canción entró a la cola aprobada desde pendiente (aprobación del
+  admin) o desde pendiente_lazy (promoción de la cola lazy, el flujo habitual).
+- up_next: su canción es la siguiente en sonar.
+- eta_update: su tiempo de espera se movió más de WS_UMBRAL_ETA_MINUTOS respecto a lo
+  esperado desde el último aviso (el paso del tiempo no cuenta como cambio).
+
+Las esperas salen de las sumas prefijas de duraciones (queue_engine.IndiceEspera): una
+pasada por la cola por cambio, en lugar de que cada mesa consulte /lista y /tiempo-espera.
+"""
+import datetime
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import config
+import queue_engine
+
+
+def _usuario_de(cancion: dict) -> Optional[int]:
+    usuario_id = cancion.get("usuario_id")
+    if usuario_id is None and isinstance(cancion.get("usuario"), dict):
+        usuario_id = cancion["usuario"].get("id")
+    return usuario_id
+
+
+def _tiempos_actual(cancion: Optional[dict]):
+    """(id, started_at, duracion) de la canción que suena, como espera IndiceEspera."""
+    if not cancion:
+        return None
+    started_at = cancion.get("started_at")
+    if isinstance(started_at, str):
+        try:
+            started_at = datetime.datetime.fromisoformat(started_at)
+        except ValueError:
+            started_at = None
+    return cancion["id"], started_at, cancion.get("duracion_seconds")
+
+
+def _aviso(tipo: str, cancion: dict, **datos) -> dict:
+    return {"type": tipo, "payload": {"cancion_id": cancion["id"], "titulo": cancion.get("titulo"), **datos}}
+
+
+class CalculadorAvisos:
+    """Estado de la última cola vista y avisos que produce cada cambio."""
+
+    def __init__(self):
+        self._iniciado = False
+        self._pendientes = set()  # ids pendientes o en la cola lazy en la cola anterior
+        self._siguiente: Optional[int] = None
+        self._avisado: Dict[int, Tuple[float, float]] = {}  # cancion_id -> (espera avisada, monotonic)
+
+    def calcular(self, queue_data: dict, ahora: Optional[float] = None, lazy: Iterable[int] = ()) -> List[Tuple[int, dict]]:
+        """
+        [(usuario_id, evento)] para la cola `queue_data` (forma de get_cola_completa).
+        `lazy`: ids en pendiente_lazy (get_cola_completa no los incluye).
+        """
+        ahora = time.monotonic() if ahora is None else ahora
+        upcoming = queue_data.get("upcoming") or []
+        indice = queue_engine.IndiceEspera(
+            [(c["id"], c.get("duracion_seconds")) for c in upcoming], _tiempos_actual(queue_data.get("now_playing"))
+        )
+        restante = indice.restante_actual()
+        umbral = config.settings.WS_UMBRAL_ETA_MINUTOS * 60
+
+        avisos = []
+        avisado = {}
+        for cancion in upcoming:
+            usuario_id = _usuario_de(cancion)
+            posicion, antes = indice.posiciones[cancion["id"]]
+            espera = int(restante + antes)
+            previo = self._avisado.get(cancion["id"])
+            avisado[cancion["id"]] = previo or (espera, ahora)
+            if not self._iniciado or usuario_id is None:
+                continue
+            if cancion["id"] in self._pendientes:
+                avisos.append((usuario_id, _aviso("song_approved", cancion, posicion=posicion, tiempo_espera_segundos=espera)))
+                avisado[cancion["id"]] = (espera, ahora)
+            elif previo is not None and abs(espera - (previo[0] - (ahora - previo[1]))) > umbral:
+                avisos.append((usuario_id, _aviso("eta_update", cancion, posicion=posicion, tiempo_espera_segundos=espera)))
+                avisado[cancion["id"]] = (espera, ahora)
+            if posicion == 1 and cancion["id"] != self._siguiente:
+                avisos.append((usuario_id, _aviso("up_next", cancion, tiempo_espera_segundos=espera)))
+
+        self._iniciado = True
+        self._pendientes = {c["id"] for c in queue_data.get("pending") or []} | set(lazy)
+        self._siguiente = upcoming[0]["id"] if upcoming else None
+        self._avisado = avisado
+        return avisos
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
+import time
+from typing import Dict, Optional, Tuple
+import config
 import websocket_manager
-import asyncio
 
 router = APIRouter()
 
@@ -12,15 +14,53 @@ class ReactionPayload(BaseModel):
     reaction: str  # El emoticono, ej: "😊"
     sender: str    # El nick del usuario que lo envía
 
+
+class LimitadorReacciones:
+    """
+    Cubeta de tokens por usuario: REACCIONES_RAFAGA de capacidad que se rellena a
+    REACCIONES_POR_SEGUNDO. Una tormenta de reacciones cuesta como mucho eso por usuario,
+    y el frame agregado cada WS_VENTANA_REACCIONES fija los broadcasts por segundo.
+    """
+
+    MAXIMO_USUARIOS = 10000  # por encima se olvidan las cubetas llenas (usuarios inactivos)
+
+    def __init__(self):
+        self._cubetas: Dict[str, Tuple[float, float]] = {}  # usuario -> (tokens, monotonic)
+
+    def permitir(self, usuario: str, ahora: Optional[float] = None) -> bool:
+        ahora = time.monotonic() if ahora is None else ahora
+        capacidad = config.settings.REACCIONES_RAFAGA
+        ritmo = config.settings.REACCIONES_POR_SEGUNDO
+        tokens, anterior = self._cubetas.get(usuario, (capacidad, ahora))
+        tokens = min(capacidad, tokens + (ahora - anterior) * ritmo)
+        permitido = tokens >= 1
+        self._cubetas[usuario] = (tokens - 1 if permitido else tokens, ahora)
+        if len(self._cubetas) > self.MAXIMO_USUARIOS:
+            self._olvidar_llenas(ahora)
+        return permitido
+
+    def _olvidar_llenas(self, ahora: float):
+        capacidad = config.settings.REACCIONES_RAFAGA
+        ritmo = config.settings.REACCIONES_POR_SEGUNDO
+        self._cubetas = {
+            usuario: (tokens, anterior) for usuario, (tokens, anterior) in self._cubetas.items()
+            if tokens + (ahora - anterior) * ritmo < capacidad
+        }
+
+
+limitador = LimitadorReacciones()
+
+
 @router.post("/reaction", status_code=202, summary="Enviar una reacción a todos")
 async def send_reaction(payload: ReactionPayload):
     """
     **[Público]** Endpoint para que cualquier usuario o el admin envíe una
     reacción (emoticono) que será visible para todos en tiempo real.
+    Las reacciones se agrupan en un frame cada ~250 ms; cada usuario tiene un
+    límite de reacciones por segundo (429 si lo supera).
     """
-    # Usamos asyncio.create_task para enviar la notificación en segundo plano
-    # y devolver la respuesta al cliente inmediatamente, sin esperar.
-    asyncio.create_task(
-        websocket_manager.manager.broadcast_reaction(payload.model_dump())
-    )
-    return {"message": "Reaction sent"}
\ No newline at end of file
+    if not limitador.permitir(payload.sender):
+        raise HTTPException(status_code=429, detail="Demasiadas reacciones, espera un momento.")
+    # Solo se acumula: el envío lo hace el frame agregado, sin un fan-out por emoji
+    websocket_manager.manager.agregar_reaccion(payload.model_dump())
+    return {"message": "Reaction sent"}
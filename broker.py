@@ -0,0 +1,289 @@
+"""
+Pub/sub entre procesos para el fan-out de WebSocket.
+
+Cada worker de uvicorn tiene su propio ConnectionManager con sus sockets. Para que un
+evento publicado en un worker llegue a los clientes de todos, el manager publica cada
+difusión en un broker y cada worker reparte a sus propios sockets lo que recibe.
+
+Backends (WS_BROKER):
+- "memoria": dentro del proceso (un solo worker; también une managers de un mismo
+  proceso, útil en pruebas).
+- "sqlite": tabla en un archivo SQLite compartido (WS_BROKER_URL = ruta) que cada worker
+  consulta cada WS_BROKER_INTERVALO segundos. Sin dependencias; para una sola máquina.
+- "redis": PUBLISH/SUBSCRIBE con el protocolo RESP de Redis (WS_BROKER_URL =
+  redis://host:puerto). Cliente mínimo sobre asyncio, sin dependencias.
+
+Los mensajes son dicts JSON con "origen" (el nodo que publica); cada backend entrega
+también los propios y el manager los descarta.
+
+Cada worker guarda en memoria la cola residente (queue_engine) y los niveles de consumo
+(consumo_totales.cache_niveles). Al recibir de otro worker una señal de cola o un evento
+de consumo, el manager los invalida antes de releer: el commit se hizo en otro proceso.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import config
+
+logger = logging.getLogger(__name__)
+
+CANAL = "karaoke:ws"
+
+AlRecibir = Callable[[dict], None]
+
+
+class Broker:
+    """Interfaz: publicar un mensaje y recibir los de todos los workers."""
+
+    async def iniciar(self, al_recibir: AlRecibir):
+        raise NotImplementedError
+
+    async def publicar(self, datos: dict):
+        raise NotImplementedError
+
+    async def detener(self):
+        pass
+
+
+class BrokerMemoria(Broker):
+    """Entrega a los suscriptores del mismo canal dentro del proceso."""
+
+    _canales: Dict[str, List[AlRecibir]] = {}
+
+    def __init__(self, canal: str = CANAL):
+        self.canal = canal
+        self._al_recibir: Optional[AlRecibir] = None
+
+    async def iniciar(self, al_recibir: AlRecibir):
+        self._al_recibir = al_recibir
+        self._canales.setdefault(self.canal, []).append(al_recibir)
+
+    async def publicar(self, datos: dict):
+        suscriptores = [s for s in self._canales.get(self.canal, []) if s is not self._al_recibir]
+        if not suscriptores:
+            # Un solo worker: nadie más a quien entregar
+            return
+        # Misma forma que los demás backends: se entrega serializado y deserializado
+        texto = json.dumps(datos, default=str)
+        for al_recibir in suscriptores:
+            al_recibir(json.loads(texto))
+
+    async def detener(self):
+        suscriptores = self._canales.get(self.canal, [])
+        if self._al_recibir in suscriptores:
+            suscriptores.remove(self._al_recibir)
+        self._al_recibir = None
+
+
+class BrokerSQLite(Broker):
+    """
+    Cola de mensajes en una tabla SQLite (modo WAL) que todos los workers leen por id
+    creciente. Los mensajes de más de WS_BROKER_RETENCION segundos se borran.
+    """
+
+    def __init__(self, ruta: str, intervalo: Optional[float] = None):
+        self.ruta = ruta
+        self.intervalo = intervalo if intervalo is not None else config.settings.WS_BROKER_INTERVALO
+        self._ultimo = 0
+        self._lector: Optional[asyncio.Task] = None
+        self._proxima_limpieza = 0.0
+
+    def _conectar(self) -> sqlite3.Connection:
+        # Cada consulta corre en un hilo del pool de asyncio.to_thread
+        conn = sqlite3.connect(self.ruta, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ws_mensajes ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, creado REAL NOT NULL, datos TEXT NOT NULL)"
+        )
+        return conn
+
+    async def iniciar(self, al_recibir: AlRecibir):
+        def preparar():
+            conn = self._conectar()
+            try:
+                return conn.execute("SELECT COALESCE(MAX(id), 0) FROM ws_mensajes").fetchone()[0]
+            finally:
+                conn.close()
+
+        self._ultimo = await asyncio.to_thread(preparar)
+        self._lector = asyncio.get_running_loop().create_task(self._leer(al_recibir))
+
+    async def publicar(self, datos: dict):
+        texto = json.dumps(datos, default=str)
+
+        def insertar():
+            conn = self._conectar()
+            try:
+                conn.execute("INSERT INTO ws_mensajes (creado, datos) VALUES (?, ?)", (time.time(), texto))
+                if time.monotonic() >= self._proxima_limpieza:
+                    self._proxima_limpieza = time.monotonic() + config.settings.WS_BROKER_RETENCION
+                    conn.execute("DELETE FROM ws_mensajes WHERE creado < ?", (time.time() - config.settings.WS_BROKER_RETENCION,))
+            finally:
+                conn.close()
+
+        await asyncio.to_thread(insertar)
+
+    async def _leer(self, al_recibir: AlRecibir):
+        while True:
+            conn = None
+            try:
+                conn = await asyncio.to_thread(self._conectar)
+                while True:
+                    filas = await asyncio.to_thread(
+                        lambda: conn.execute("SELECT id, datos FROM ws_mensajes WHERE id > ? ORDER BY id", (self._ultimo,)).fetchall()
+                    )
+                    for id_, datos in filas:
+                        self._ultimo = id_
+                        try:
+                            al_recibir(json.loads(datos))
+                        except Exception:
+                            logger.exception("Error al procesar un mensaje del broker")
+                    await asyncio.sleep(self.intervalo)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error leyendo el broker SQLite; reintentando")
+                await asyncio.sleep(1)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    async def detener(self):
+        if self._lector is not None:
+            self._lector.cancel()
+            try:
+                await self._lector
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._lector = None
+
+
+def _comando_resp(*partes: str) -> bytes:
+    """Codifica un comando como array RESP de bulk strings."""
+    salida = [f"*{len(partes)}\r\n".encode()]
+    for parte in partes:
+        datos = parte.encode()
+        salida.append(b"$%d\r\n%s\r\n" % (len(datos), datos))
+    return b"".join(salida)
+
+
+async def _leer_resp(reader: asyncio.StreamReader):
+    """Lee una respuesta RESP (simple, error, entero, bulk o array)."""
+    linea = await reader.readline()
+    if not linea:
+        raise ConnectionError("Conexión cerrada por el servidor")
+    tipo, resto = linea[:1], linea[1:-2]
+    if tipo == b"+":
+        return resto.decode()
+    if tipo == b"-":
+        raise RuntimeError(resto.decode())
+    if tipo == b":":
+        return int(resto)
+    if tipo == b"$":
+        largo = int(resto)
+        if largo < 0:
+            return None
+        datos = await reader.readexactly(largo + 2)
+        return datos[:-2].decode()
+    if tipo == b"*":
+        largo = int(resto)
+        return None if largo < 0 else [await _leer_resp(reader) for _ in range(largo)]
+    raise RuntimeError(f"Respuesta RESP inválida: {linea!r}")
+
+
+class BrokerRedis(Broker):
+    """PUBLISH/SUBSCRIBE sobre RESP: una conexión para publicar y otra suscrita al canal."""
+
+    def __init__(self, url: str, canal: str = CANAL):
+        destino = urlparse(url)
+        self.host = destino.hostname or "localhost"
+        self.puerto = destino.port or 6379
+        self.canal = canal
+        self._publicador = None  # (reader, writer)
+        self._lock: Optional[asyncio.Lock] = None
+        self._lector: Optional[asyncio.Task] = None
+
+    async def iniciar(self, al_recibir: AlRecibir):
+        self._lock = asyncio.Lock()
+        suscrito = asyncio.get_running_loop().create_future()
+        self._lector = asyncio.get_running_loop().create_task(self._leer(al_recibir, suscrito))
+        await suscrito
+
+    async def publicar(self, datos: dict):
+        async with self._lock:
+            try:
+                if self._publicador is None:
+                    self._publicador = await asyncio.open_connection(self.host, self.puerto)
+                reader, writer = self._publicador
+                writer.write(_comando_resp("PUBLISH", self.canal, json.dumps(datos, default=str)))
+                await writer.drain()
+                await _leer_resp(reader)
+            except Exception:
+                # Se reconecta en la próxima publicación
+                self._cerrar_publicador()
+                raise
+
+    async def _leer(self, al_recibir: AlRecibir, suscrito: asyncio.Future):
+        espera = 0.1
+        while True:
+            writer = None
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.puerto)
+                writer.write(_comando_resp("SUBSCRIBE", self.canal))
+                await writer.drain()
+                await _leer_resp(reader)  # ["subscribe", canal, n]
+                if not suscrito.done():
+                    suscrito.set_result(True)
+                espera = 0.1
+                while True:
+                    mensaje = await _leer_resp(reader)
+                    if isinstance(mensaje, list) and len(mensaje) == 3 and mensaje[0] == "message":
+                        try:
+                            al_recibir(json.loads(mensaje[2]))
+                        except Exception:
+                            logger.exception("Error al procesar un mensaje del broker")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not suscrito.done():
+                    suscrito.set_exception(e)
+                    return
+                logger.warning(f"Broker Redis desconectado ({e}); reintentando en {espera:.1f} s")
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, 5)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    def _cerrar_publicador(self):
+        if self._publicador is not None:
+            self._publicador[1].close()
+            self._publicador = None
+
+    async def detener(self):
+        self._cerrar_publicador()
+        if self._lector is not None:
+            self._lector.cancel()
+            try:
+                await self._lector
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._lector = None
+
+
+def crear_broker() -> Broker:
+    """Broker configurado en WS_BROKER / WS_BROKER_URL."""
+    tipo = config.settings.WS_BROKER
+    if tipo == "sqlite":
+        return BrokerSQLite(config.settings.WS_BROKER_URL or "ws_broker.db")
+    if tipo == "redis":
+        return BrokerRedis(config.settings.WS_BROKER_URL or "redis://localhost:6379")
+    if tipo != "memoria":
+        raise ValueError(f"WS_BROKER desconocido: {tipo!r}")
+    return BrokerMemoria()
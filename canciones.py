@@ -1,15 +1,19 @@
 ﻿import os
 import datetime
 import asyncio
-from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-import crud, schemas, models, config
-from database import SessionLocal # get_db se importará desde aquí
+import crud, crud_async, schemas, models, config
+from database import SessionLocal, get_async_db # get_db se importará desde aquí
 import websocket_manager
+import queue_snapshot
+import reproduccion
+from admision import admision
 from security import api_key_auth
 
 router = APIRouter() # El prefijo y las etiquetas se pueden definir aquí o al incluir el router en main.py
@@ -29,12 +33,18 @@ def get_db():
     responses={204: {"description": "No hay más canciones en la cola."}},
     summary="Avanzar la cola y obtener la siguiente canción para reproducir"
 )
-async def avanzar_cola(db: Session = Depends(get_db)):
+async def avanzar_cola(cancion_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
     """
     Avanza la cola a la siguiente canción.
+    Si se indica `cancion_id` (la canción que terminó en el player) y ya no es la que
+    suena, el servidor ya avanzó por su cuenta: se devuelve la actual sin avanzar otra vez.
     """
-    # Avanzamos la cola manualmente
-    nueva_cancion = await crud.avanzar_cola_automaticamente(db)
+    actual = await crud_async.get_cancion_reproduciendo(db)
+    if cancion_id is not None and (actual is None or actual.id != cancion_id):
+        nueva_cancion = await db.run_sync(lambda s: crud_async._con_relaciones(actual))
+    else:
+        # Avanzamos la cola manualmente
+        nueva_cancion = await crud_async.avanzar_cola_automaticamente()
 
     if not nueva_cancion:
         # Si no hay más canciones
@@ -57,66 +67,50 @@ async def avanzar_cola(db: Session = Depends(get_db)):
 async def anadir_cancion(
     usuario_id: int,
     cancion: schemas.CancionCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Añade una nueva canción a la lista personal de un usuario, si hay tiempo disponible.
     """
-    db_usuario = crud.get_usuario_by_id(db, usuario_id=usuario_id)
+    db_usuario = await crud_async.get_usuario_by_id(db, usuario_id=usuario_id)
     if not db_usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado.")
     if db_usuario.is_silenced:
         raise HTTPException(status_code=403, detail="No tienes permiso para añadir más canciones.")
 
-    # Validar hora de cierre
-    hora_cierre_str = config.settings.KARAOKE_CIERRE
+    # Validar hora de cierre: la cola proyectada completa (la que suena + aprobadas + lazy)
+    # más esta canción debe terminar antes del cierre
     try:
-        h, m = map(int, hora_cierre_str.split(':'))
-        from timezone_utils import now_bogota
-        ahora = now_bogota()
-        hora_cierre = ahora.replace(hour=h, minute=m, second=0, microsecond=0)
-        if hora_cierre < ahora:
-            hora_cierre += datetime.timedelta(days=1)
-    except (ValueError, TypeError):
+        proyeccion = await crud_async.en_sesion(admision.proyeccion)
+    except ValueError:
         raise HTTPException(status_code=500, detail="Formato de hora de cierre inválido.")
 
-    if ahora >= hora_cierre:
+    if proyeccion["tiempo_hasta_cierre_segundos"] <= 0:
         raise HTTPException(status_code=400, detail="Ya no se aceptan más canciones por hoy.")
 
-    # Verificar duración proyectada
-    tiempo_restante_segundos = (hora_cierre - ahora).total_seconds()
-    duracion_cola_actual = crud.get_duracion_total_cola_aprobada(db)
-    duracion_total_proyectada = duracion_cola_actual + (cancion.duracion_seconds or 0)
-
-    if duracion_total_proyectada > tiempo_restante_segundos:
+    duracion_total_proyectada = proyeccion["proyectado_segundos"] + (cancion.duracion_seconds or 0)
+    if duracion_total_proyectada > proyeccion["tiempo_hasta_cierre_segundos"]:
         raise HTTPException(
             status_code=400,
             detail="No hay tiempo suficiente para añadir esta canción antes del cierre."
         )
 
     # Verificar duplicados a nivel de mesa (evita que usuarios de la misma mesa agreguen la misma canción)
-    cancion_existente = crud.check_if_song_in_user_list(db, usuario_id=usuario_id, youtube_id=cancion.youtube_id)
+    cancion_existente = await crud_async.en_sesion(crud.check_if_song_in_user_list, usuario_id=usuario_id, youtube_id=cancion.youtube_id)
     if cancion_existente:
         raise HTTPException(
             status_code=409,
             detail=f"Esta canción ya está en la cola de tu mesa. '{cancion.titulo}' fue agregada por otro usuario de tu mesa."
         )
 
-    # Crear canción
-    db_cancion = crud.create_cancion_para_usuario(db=db, cancion=cancion, usuario_id=usuario_id)
-    
+    # Crear canción (en el escritor único)
     # LAZY APPROVAL: Solo aprobar si no hay más de 1 canción aprobada en espera
     # Si ya hay 1 o más canciones aprobadas (más la que suena), la nueva va a pendiente_lazy
-    approved_count = db.query(models.Cancion).filter(models.Cancion.estado == "aprobado").count()
-    
-    if approved_count >= 1:
-        # Ya hay una canción aprobada esperando, poner en cola lazy
-        cancion_final = crud.update_cancion_estado(db, cancion_id=db_cancion.id, nuevo_estado="pendiente_lazy")
-    else:
-        # Primera canción, aprobar inmediatamente
-        cancion_final = crud.update_cancion_estado(db, cancion_id=db_cancion.id, nuevo_estado="aprobado")
-        # Si autoplay está activo, iniciar reproducción si la cola estaba vacía
-        await crud.start_next_song_if_autoplay_and_idle(db)
+    cancion_final, aprobada = await crud_async.crear_cancion_en_cola(cancion, usuario_id=usuario_id)
+
+    if aprobada:
+        # Primera canción: si autoplay está activo, iniciar reproducción si la cola estaba vacía
+        await crud_async.start_next_song_if_autoplay_and_idle(db)
     
     await websocket_manager.manager.broadcast_queue_update()
 
@@ -180,29 +174,99 @@ async def admin_anadir_cancion(cancion: schemas.CancionCreate, db: Session = Dep
     return cancion_final
 
 
-@router.get("/cola", response_model=schemas.ColaView, summary="Ver la cola de canciones")
-def ver_cola_de_canciones(db: Session = Depends(get_db)):
+# Tiempo máximo que una petición ?since_version= espera un cambio de la cola (segundos)
+LONG_POLL_MAX_SEGUNDOS = 30
+
+
+def _serializar_cola(db: Session) -> bytes:
     cola_data = crud.get_cola_completa(db)
-    return schemas.ColaView(now_playing=cola_data["now_playing"], upcoming=cola_data["upcoming"])
+    return schemas.ColaView(now_playing=cola_data["now_playing"], upcoming=cola_data["upcoming"]).model_dump_json().encode()
+
+
+def _serializar_cola_extendida(db: Session) -> bytes:
+    cola_data = crud.get_cola_completa_con_lazy(db)
+    return schemas.ColaViewExtended(
+        now_playing=cola_data["now_playing"],
+        upcoming=cola_data["upcoming"],
+        lazy_queue=cola_data["lazy_queue"],
+        pending=cola_data["pending"]
+    ).model_dump_json().encode()
+
+
+async def _responder_cola(request: Request, vista: str, serializar, since_version: Optional[int], timeout: float) -> Response:
+    """
+    Responde con el snapshot de la vista para la versión actual de la cola.
+    - since_version: long-poll, espera hasta que la versión sea distinta (o se agote `timeout`).
+    - If-None-Match: 304 sin cuerpo si el cliente ya tiene esa versión.
+    """
+    if since_version is not None:
+        await queue_snapshot.snapshots.esperar_cambio(since_version, min(max(timeout, 0), LONG_POLL_MAX_SEGUNDOS))
+    # La consulta y la serialización van en un hilo (en_hilo), no en el event loop
+    snapshot = await queue_snapshot.snapshots.obtener_async(vista, serializar)
+    headers = {
+        "ETag": snapshot.etag,
+        "X-Queue-Version": str(snapshot.version),
+        # El navegador puede guardar la respuesta, pero debe revalidarla (If-None-Match) siempre
+        "Cache-Control": "no-cache",
+    }
+    if snapshot.coincide(request.headers.get("if-none-match")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=snapshot.cuerpo, media_type="application/json", headers=headers)
+
+
+@router.get("/cola", response_model=schemas.ColaView, summary="Ver la cola de canciones")
+async def ver_cola_de_canciones(request: Request, since_version: Optional[int] = None, timeout: float = 25):
+    """
+    Retorna la canción actual y la cola aprobada. Soporta ETag/If-None-Match (304) y
+    long-poll con `?since_version=N` (la cabecera X-Queue-Version trae la versión actual).
+    """
+    return await _responder_cola(request, "cola", _serializar_cola, since_version, timeout)
 
 @router.get("/cola/extended", response_model=schemas.ColaViewExtended, summary="Ver la cola de canciones con lazy queue")
-def ver_cola_extendida(db: Session = Depends(get_db)):
+async def ver_cola_extendida(request: Request, since_version: Optional[int] = None, timeout: float = 25):
     """
     Retorna la cola completa incluyendo:
     - now_playing: Canción actual
     - upcoming: Siguiente canción aprobada (máximo 1)
     - lazy_queue: Canciones en espera de aprobación lazy
     - pending: Canciones pendientes de aprobación manual
+
+    Soporta ETag/If-None-Match (304) y long-poll con `?since_version=N`.
     """
-    cola_data = crud.get_cola_completa_con_lazy(db)
-    return schemas.ColaViewExtended(
-        now_playing=cola_data["now_playing"],
-        upcoming=cola_data["upcoming"],
-        lazy_queue=cola_data["lazy_queue"],
-        pending=cola_data["pending"]
-    )
+    return await _responder_cola(request, "extended", _serializar_cola_extendida, since_version, timeout)
 
 
+@router.get("/tiempos-espera", response_model=List[schemas.TiempoEsperaCancion], summary="Tiempos de espera de un usuario o una mesa")
+def calcular_tiempos_espera(usuario_id: Optional[int] = None, mesa_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Devuelve en una sola llamada el tiempo de espera de todas las canciones aprobadas
+    de un usuario (`usuario_id`) o de una mesa (`mesa_id`), en orden de la cola.
+    """
+    if usuario_id is None and mesa_id is None:
+        raise HTTPException(status_code=400, detail="Indique usuario_id o mesa_id.")
+    return crud.get_tiempos_espera(db, usuario_id=usuario_id, mesa_id=mesa_id)
+
+@router.get("/capacidad", response_model=schemas.CapacidadCola, summary="Capacidad restante antes del cierre")
+def capacidad_cola(mesa_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Proyección de la cola completa contra la hora de cierre y capacidad restante por
+    mesa (o solo de `mesa_id`). Se calcula con totales en memoria, sin recorrer la cola.
+    """
+    try:
+        return admision.capacidad_mesas(db, mesa_id=mesa_id)
+    except ValueError:
+        raise HTTPException(status_code=500, detail="Formato de hora de cierre inválido.")
+
+@router.get("/reproduccion", response_model=schemas.EstadoReproduccion, summary="Estado del reloj de reproducción")
+def estado_reproduccion(db: Session = Depends(get_db)):
+    """
+    Posición de la canción actual según el reloj del servidor. Los clientes interpolan
+    con `posicion_seconds + (ahora - servidor_ts)` mientras no esté en pausa; los cambios
+    llegan por WebSocket como evento `playback_state`.
+    """
+    reproduccion.reloj.sincronizar(db)
+    return reproduccion.reloj.estado()
+
 @router.get("/{cancion_id}/tiempo-espera", response_model=dict, summary="Calcular tiempo de espera")
 def calcular_tiempo_espera(cancion_id: int, db: Session = Depends(get_db)):
     tiempo_segundos = crud.get_tiempo_espera_para_cancion(db, cancion_id=cancion_id)
@@ -234,13 +298,15 @@ async def play_song_now(cancion_id: int, db: Session = Depends(get_db), api_key:
     db_cancion.started_at = now_bogota()
     db.commit()
     db.refresh(db_cancion)
+    reproduccion.reloj.iniciar(db_cancion)
 
-    # Notificar a los clientes que la cola cambió y pedir al player que reproduzca
-    await websocket_manager.manager.broadcast_queue_update()
+    # Pedir al player que reproduzca (primero: es lo que determina el hueco entre canciones)
+    # y luego notificar a los clientes que la cola cambió
     await websocket_manager.manager.broadcast_play_song(
         youtube_id=db_cancion.youtube_id,
         duration_seconds=db_cancion.duracion_seconds or 0
     )
+    await websocket_manager.manager.broadcast_queue_update()
 
     # Registrar la acción en logs de admin
     try:
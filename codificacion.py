@@ -0,0 +1,111 @@
+"""
+Codificaciones de los mensajes WebSocket.
+
+Antes cada difusión hacía `json.dumps(..., default=str)` en el punto de llamada. Ahora
+los eventos viajan como dicts dentro de un `Evento`, que guarda cada codificación la
+primera vez que un cliente la necesita: un evento se codifica una vez por codificación
+en uso, no una vez por cliente ni por punto de llamada.
+
+El cliente elige al conectar (/ws/cola?encoding=...):
+- "json" (por defecto): texto, idéntico al formato anterior.
+- "orjson": texto JSON compacto generado con orjson (mucho más rápido que json).
+- "msgpack": frames binarios MessagePack (más pequeños; el cliente necesita un decoder).
+
+orjson y msgpack son opcionales: si no están instalados se usa "json". La compresión
+permessage-deflate la negocia uvicorn con el navegador (`--ws-per-message-deflate`,
+activo por defecto) y se aplica a cualquiera de las tres.
+
+"sse" no se negocia: es el formato de los clientes Server-Sent Events (stream.py), un
+bloque "id: ... / data: {json}" que también se calcula una vez por evento.
+"""
+import json
+from typing import Dict, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+CODIFICACIONES = ("json", "orjson", "msgpack")
+SSE = "sse"
+
+Codificado = Union[str, bytes]
+
+
+def disponible(codificacion: str) -> bool:
+    if codificacion == "json":
+        return True
+    if codificacion == "orjson":
+        return orjson is not None
+    if codificacion == "msgpack":
+        return msgpack is not None
+    return False
+
+
+def negociar(pedida: Optional[str]) -> str:
+    """Codificación a usar para lo que pide el cliente ("json" si no está disponible)."""
+    return pedida if pedida and disponible(pedida) else "json"
+
+
+# JSON de los bloques SSE: el más rápido disponible
+_JSON_SSE = "orjson" if orjson is not None else "json"
+
+
+def _bloque_sse(datos, texto: str, id_evento: Optional[str]) -> str:
+    if datos.get("type") == "ping":
+        # Comentario: mantiene viva la conexión en proxies sin despertar al cliente
+        return ": ping\n\n"
+    linea_id = f"id: {id_evento}\n" if id_evento is not None else ""
+    return f"{linea_id}data: {texto}\n\n"
+
+
+def codificar(datos, codificacion: str = "json", id_evento: Optional[str] = None) -> Codificado:
+    """str para frames de texto (json, orjson, sse), bytes para binarios (msgpack)."""
+    if codificacion == SSE:
+        return _bloque_sse(datos, codificar(datos, _JSON_SSE), id_evento)
+    if codificacion == "orjson":
+        # Fechas y Decimals como str(), igual que json.dumps(default=str)
+        return orjson.dumps(datos, default=str, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+    if codificacion == "msgpack":
+        return msgpack.packb(datos, default=str)
+    return json.dumps(datos, default=str)
+
+
+class Evento:
+    """Un mensaje y sus codificaciones, cada una calculada una sola vez."""
+
+    __slots__ = ("_datos", "_codificados", "id")
+
+    def __init__(self, datos: Optional[dict] = None, texto: Optional[str] = None, id: Optional[str] = None):
+        self._datos = datos
+        self._codificados: Dict[str, Codificado] = {}
+        self.id = id  # identificador para reanudar (el "id:" de SSE)
+        if texto is not None:
+            # Mensaje ya serializado como JSON
+            self._codificados["json"] = texto
+
+    @property
+    def datos(self) -> dict:
+        if self._datos is None:
+            self._datos = json.loads(self._codificados["json"])
+        return self._datos
+
+    def con_seq(self, seq: int, id: Optional[str] = None) -> "Evento":
+        """Copia del evento con su número de secuencia ("seq") como primer campo."""
+        return Evento({"seq": seq, **self.datos}, id=id)
+
+    def codificado(self, codificacion: str = "json") -> Codificado:
+        resultado = self._codificados.get(codificacion)
+        if resultado is None:
+            if codificacion == SSE:
+                # Reutiliza el JSON ya calculado para los clientes WebSocket
+                resultado = _bloque_sse(self.datos, self.codificado(_JSON_SSE), self.id)
+            else:
+                resultado = codificar(self.datos, codificacion)
+            self._codificados[codificacion] = resultado
+        return resultado
@@ -0,0 +1,133 @@
+"""
+Actualizaciones de la cola por diferencias (queue_delta) para WebSocket.
+
+Antes cada cambio enviaba a todos los clientes la cola completa (now_playing, upcoming,
+pending) con sus objetos anidados. Los clientes que lo piden (/ws/cola?queue=delta)
+reciben en su lugar:
+
+- queue_snapshot: {epoca, version, state}. Estado completo; al conectar y cuando el
+  cliente lo pide con {"type": "queue_resync"}.
+- queue_delta: {epoca, base_version, version, ops}. Operaciones que llevan el estado
+  `base_version` a `version`. Si el cliente no tiene exactamente `base_version` (perdió
+  un mensaje, reinicio del servidor = otra `epoca`), descarta el delta y pide resync.
+
+Operaciones, por sección ("now_playing", "upcoming", "pending"; now_playing es una
+lista de 0 o 1 elementos), aplicadas en orden:
+- {"op": "remove", "section", "id"}
+- {"op": "insert", "section", "index", "item"}
+- {"op": "move", "section", "id", "index"}
+- {"op": "update", "section", "id", "fields"}: solo los campos de primer nivel que cambiaron.
+
+Los clientes sin ?queue=delta siguen recibiendo queue_update con la cola completa.
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+SECCIONES = ("now_playing", "upcoming", "pending")
+
+# Identifica este proceso: tras un reinicio la versión vuelve a empezar
+_EPOCA = format(int(time.time() * 1000), "x")
+
+Estado = Dict[str, List[dict]]
+
+
+def estado_de_cola(queue_data: dict) -> Estado:
+    """Convierte la cola serializada (jsonable) en listas por sección."""
+    now_playing = queue_data.get("now_playing")
+    return {
+        "now_playing": [now_playing] if now_playing else [],
+        "upcoming": list(queue_data.get("upcoming") or []),
+        "pending": list(queue_data.get("pending") or []),
+    }
+
+
+def _diferencias_seccion(seccion: str, anterior: List[dict], nuevo: List[dict]) -> List[dict]:
+    ops = []
+    ids_nuevos = {item["id"] for item in nuevo}
+    previos = {item["id"]: item for item in anterior}
+    lista = []
+    for item in anterior:
+        if item["id"] in ids_nuevos:
+            lista.append(item["id"])
+        else:
+            ops.append({"op": "remove", "section": seccion, "id": item["id"]})
+    # Se simula la aplicación para emitir solo los insert/move necesarios
+    for indice, item in enumerate(nuevo):
+        cid = item["id"]
+        if cid not in previos:
+            lista.insert(indice, cid)
+            ops.append({"op": "insert", "section": seccion, "index": indice, "item": item})
+            continue
+        if lista[indice] != cid:
+            lista.remove(cid)
+            lista.insert(indice, cid)
+            ops.append({"op": "move", "section": seccion, "id": cid, "index": indice})
+        viejo = previos[cid]
+        campos = {k: v for k, v in item.items() if viejo.get(k, object()) != v}
+        campos.update({k: None for k in viejo if k not in item})
+        if campos:
+            ops.append({"op": "update", "section": seccion, "id": cid, "fields": campos})
+    return ops
+
+
+def diferencias(anterior: Estado, nuevo: Estado) -> List[dict]:
+    """Operaciones que transforman `anterior` en `nuevo`."""
+    ops = []
+    for seccion in SECCIONES:
+        ops.extend(_diferencias_seccion(seccion, anterior.get(seccion, []), nuevo.get(seccion, [])))
+    return ops
+
+
+def aplicar(estado: Estado, ops: List[dict]) -> Estado:
+    """Aplica `ops` sobre una copia de `estado` (lo mismo que hacen los clientes)."""
+    resultado = {seccion: list(estado.get(seccion, [])) for seccion in SECCIONES}
+    for op in ops:
+        lista = resultado[op["section"]]
+        if op["op"] == "remove":
+            resultado[op["section"]] = [i for i in lista if i["id"] != op["id"]]
+        elif op["op"] == "insert":
+            lista.insert(op["index"], op["item"])
+        elif op["op"] == "move":
+            item = next(i for i in lista if i["id"] == op["id"])
+            lista.remove(item)
+            lista.insert(op["index"], item)
+        elif op["op"] == "update":
+            posicion = next(n for n, i in enumerate(lista) if i["id"] == op["id"])
+            lista[posicion] = {**lista[posicion], **op["fields"]}
+    return resultado
+
+
+class CodificadorCola:
+    """Último estado publicado de la cola y su versión, base de los deltas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self.estado: Optional[Estado] = None
+
+    def publicar(self, queue_data: dict) -> Tuple[dict, Optional[dict]]:
+        """
+        Registra un nuevo estado. Devuelve (snapshot, delta); delta es None si no hay
+        estado previo o si nada cambió (en ese caso la versión no avanza).
+        """
+        nuevo = estado_de_cola(queue_data)
+        with self._lock:
+            delta = None
+            if self.estado is None:
+                self.version += 1
+            else:
+                ops = diferencias(self.estado, nuevo)
+                if ops:
+                    delta = {"epoca": _EPOCA, "base_version": self.version, "version": self.version + 1, "ops": ops}
+                    self.version += 1
+            self.estado = nuevo
+            return self._snapshot(), delta
+
+    def snapshot(self) -> Optional[dict]:
+        """Estado completo publicado más reciente (None si aún no se publicó ninguno)."""
+        with self._lock:
+            return self._snapshot() if self.estado is not None else None
+
+    def _snapshot(self) -> dict:
+        return {"epoca": _EPOCA, "version": self.version, "state": self.estado}
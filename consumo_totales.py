@@ -0,0 +1,258 @@
+"""
+Totales de consumo materializados por mesa y por cuenta, y caché de niveles.
+
+Mesa.total_consumido y Cuenta.total_consumido guardan la suma de valor_total de sus
+consumos. Se mantienen en la misma transacción que el cambio del consumo: antes de
+cada flush se calcula la diferencia de cada Consumo nuevo, modificado o borrado y,
+tras escribirlo, se aplica con un UPDATE incremental (total = total + delta).
+Así cualquier ruta que use el ORM (create_consumo_para_usuario, create_pedido_from_carrito,
+update_consumo_cantidad, delete_consumo...) mantiene los totales sin cambios adicionales.
+Los DELETE masivos de consumos no pasan por el flush: quien los haga debe ajustar los
+totales con `ajustar_totales`.
+
+La caché de niveles guarda en memoria el total de cada mesa para que la cola obtenga el
+cupo (ORO/PLATA/BRONCE) con un acceso a diccionario. Se invalida al confirmar
+cualquier transacción que haya tocado consumos.
+"""
+import threading
+from decimal import Decimal
+from typing import Dict, Iterable
+
+from sqlalchemy import event, func, inspect, update
+from sqlalchemy.orm import Session
+
+import models
+import scheduler
+from database import Base, engine as db_engine
+
+# Claves en Session.info
+_CLAVE_DELTAS = "consumo_totales_deltas"
+_CLAVE_MESAS = "consumo_totales_mesas"
+# {SAVEPOINT abierto: mesas anotadas al abrirlo}
+_CLAVE_SAVEPOINTS = "consumo_totales_savepoints"
+
+
+def nivel_para_total(total) -> str:
+    """Devuelve 'oro', 'plata' o 'bronce' según el consumo total."""
+    total = total or 0
+    if total >= scheduler.UMBRAL_ORO:
+        return "oro"
+    if total >= scheduler.UMBRAL_PLATA:
+        return "plata"
+    return "bronce"
+
+
+def ajustar_totales(db: Session, mesa_id: int, cuenta_id: int, delta):
+    """Suma `delta` al total materializado de una mesa y de una cuenta (sin confirmar)."""
+    if not delta:
+        return
+    conexion = db.connection()
+    if mesa_id is not None:
+        conexion.execute(
+            update(models.Mesa)
+            .where(models.Mesa.id == mesa_id)
+            .values(total_consumido=func.coalesce(models.Mesa.total_consumido, 0) + delta)
+        )
+        _expirar(db, models.Mesa, mesa_id)
+        db.info.setdefault(_CLAVE_MESAS, set()).add(mesa_id)
+    if cuenta_id is not None:
+        conexion.execute(
+            update(models.Cuenta)
+            .where(models.Cuenta.id == cuenta_id)
+            .values(total_consumido=func.coalesce(models.Cuenta.total_consumido, 0) + delta)
+        )
+        _expirar(db, models.Cuenta, cuenta_id)
+
+
+def recalcular_totales(db: Session):
+    """Recalcula desde cero todos los totales materializados (reparación / migración)."""
+    suma_mesa = (
+        db.query(func.coalesce(func.sum(models.Consumo.valor_total), 0))
+        .filter(models.Consumo.mesa_id == models.Mesa.id)
+        .scalar_subquery()
+    )
+    suma_cuenta = (
+        db.query(func.coalesce(func.sum(models.Consumo.valor_total), 0))
+        .filter(models.Consumo.cuenta_id == models.Cuenta.id)
+        .scalar_subquery()
+    )
+    conexion = db.connection()
+    conexion.execute(update(models.Mesa).values(total_consumido=suma_mesa))
+    conexion.execute(update(models.Cuenta).values(total_consumido=suma_cuenta))
+    db.expire_all()
+    db.info.setdefault(_CLAVE_MESAS, set()).add(None)
+
+
+def _expirar(db: Session, modelo, pk):
+    """Marca como obsoleto el total de un objeto ya cargado en la sesión."""
+    obj = db.identity_map.get(db.identity_key(modelo, pk))
+    if obj is not None:
+        db.expire(obj, ["total_consumido"])
+
+
+class CacheNiveles:
+    """Caché en memoria de los totales por mesa (mesa_id -> total)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totales: Dict[int, Decimal] = {}
+        # Se incrementa en cada invalidación: evita guardar un total leído antes de ella
+        self._generacion = 0
+
+    def invalidar(self, mesas_ids: Iterable = None):
+        """Descarta los totales de las mesas indicadas (o todos si incluye None)."""
+        with self._lock:
+            self._generacion += 1
+            if mesas_ids is None or None in mesas_ids:
+                self._totales.clear()
+                return
+            for mid in mesas_ids:
+                self._totales.pop(mid, None)
+
+    def totales(self, db: Session, mesas_ids: Iterable[int]) -> Dict[int, Decimal]:
+        """Devuelve {mesa_id: total}. Solo consulta la BD por las mesas que no están en caché."""
+        mesas_ids = set(mesas_ids)
+        # La caché es de la base de datos principal; otras (tests, scripts) leen siempre
+        usar_cache = db.get_bind() is db_engine
+        with self._lock:
+            resultado = {mid: self._totales[mid] for mid in mesas_ids if usar_cache and mid in self._totales}
+            generacion = self._generacion
+        faltantes = [mid for mid in mesas_ids if mid not in resultado and mid != 0]
+        if faltantes:
+            leidos = dict(
+                db.query(models.Mesa.id, models.Mesa.total_consumido)
+                .filter(models.Mesa.id.in_(faltantes))
+                .all()
+            )
+            leidos = {mid: leidos.get(mid) or Decimal(0) for mid in faltantes}
+            resultado.update(leidos)
+            with self._lock:
+                if usar_cache and generacion == self._generacion:
+                    self._totales.update(leidos)
+        return resultado
+
+    def cupos(self, db: Session, mesas_ids: Iterable[int]) -> Dict[int, int]:
+        """Devuelve {mesa_id: cupo} para la cola (la mesa 0 / DJ no consulta nada)."""
+        mesas_ids = set(mesas_ids)
+        totales = self.totales(db, mesas_ids)
+        return {mid: scheduler.cupo_para_mesa(mid, totales.get(mid, 0)) for mid in mesas_ids}
+
+
+cache_niveles = CacheNiveles()
+
+
+# --- Sincronización con las sesiones de SQLAlchemy ---
+
+def _valor(estado, atributo):
+    """Devuelve (valor_anterior, valor_actual) de un atributo de un objeto del flush."""
+    historia = estado.attrs[atributo].load_history()
+    actual = historia.added[0] if historia.added else (historia.unchanged[0] if historia.unchanged else None)
+    anterior = historia.deleted[0] if historia.deleted else actual
+    return anterior, actual
+
+
+def _calcular_deltas(session, flush_context, instances):
+    """Antes del flush: diferencia de total que aporta cada consumo por (mesa, cuenta)."""
+    # Descarta lo calculado para un flush anterior que falló
+    session.info.pop(_CLAVE_DELTAS, None)
+    deltas = {}
+
+    def sumar(mesa_id, cuenta_id, valor):
+        if valor:
+            clave = (mesa_id, cuenta_id)
+            deltas[clave] = deltas.get(clave, 0) + valor
+
+    for obj in session.new:
+        if isinstance(obj, models.Consumo):
+            sumar(obj.mesa_id, obj.cuenta_id, obj.valor_total)
+    for obj in session.deleted:
+        if isinstance(obj, models.Consumo):
+            estado = inspect(obj)
+            sumar(_valor(estado, "mesa_id")[0], _valor(estado, "cuenta_id")[0], -(_valor(estado, "valor_total")[0] or 0))
+    for obj in session.dirty:
+        if isinstance(obj, models.Consumo) and session.is_modified(obj):
+            estado = inspect(obj)
+            mesa_ant, mesa_act = _valor(estado, "mesa_id")
+            cuenta_ant, cuenta_act = _valor(estado, "cuenta_id")
+            valor_ant, valor_act = _valor(estado, "valor_total")
+            if (mesa_ant, cuenta_ant, valor_ant) != (mesa_act, cuenta_act, valor_act):
+                sumar(mesa_ant, cuenta_ant, -(valor_ant or 0))
+                sumar(mesa_act, cuenta_act, valor_act or 0)
+
+    if deltas:
+        session.info[_CLAVE_DELTAS] = deltas
+
+
+def _aplicar_deltas(session, flush_context):
+    """Después del flush (misma transacción): actualiza los totales materializados."""
+    # Mesas creadas o borradas: SQLite puede reutilizar el ID de una mesa borrada
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, models.Mesa):
+            session.info.setdefault(_CLAVE_MESAS, set()).add(obj.id)
+    deltas = session.info.pop(_CLAVE_DELTAS, None)
+    if not deltas:
+        return
+    for (mesa_id, cuenta_id), delta in deltas.items():
+        ajustar_totales(session, mesa_id, cuenta_id, delta)
+
+
+def _registrar_bulk(orm_execute_state):
+    """UPDATE/DELETE masivos sobre consumos o mesas: se invalida toda la caché al confirmar."""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if any(m.class_ in (models.Consumo, models.Mesa) for m in orm_execute_state.all_mappers):
+        orm_execute_state.session.info.setdefault(_CLAVE_MESAS, set()).add(None)
+
+
+def _aplicar_commit(session):
+    # Liberar o deshacer un SAVEPOINT (unidades de escritor.py) no es el commit real
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_CLAVE_SAVEPOINTS, None)
+    mesas = session.info.pop(_CLAVE_MESAS, None)
+    if mesas:
+        cache_niveles.invalidar(mesas)
+
+
+def _descartar(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_CLAVE_DELTAS, None)
+    session.info.pop(_CLAVE_MESAS, None)
+    session.info.pop(_CLAVE_SAVEPOINTS, None)
+
+
+def _abrir_savepoint(session, transaction):
+    if transaction.nested:
+        session.info.setdefault(_CLAVE_SAVEPOINTS, {})[transaction] = set(session.info.get(_CLAVE_MESAS, ()))
+
+
+def _deshacer_savepoint(session, previous_transaction):
+    """
+    Un SAVEPOINT deshecho: la BD ya revirtió sus totales; las mesas que anotó no cambiaron.
+    Invalidarlas de más no rompería nada, pero vaciaría la caché en cada unidad fallida.
+    """
+    if not previous_transaction.nested:
+        return
+    mesas = session.info.get(_CLAVE_SAVEPOINTS, {}).pop(previous_transaction, None)
+    if mesas is None:
+        return
+    if mesas:
+        session.info[_CLAVE_MESAS] = mesas
+    else:
+        session.info.pop(_CLAVE_MESAS, None)
+
+
+# Se registran en Session (todas las sesiones, no solo SessionLocal): los totales son datos
+# persistentes y deben mantenerse sea cual sea la sesión que escribe.
+event.listen(Session, "before_flush", _calcular_deltas)
+event.listen(Session, "after_flush", _aplicar_deltas)
+event.listen(Session, "do_orm_execute", _registrar_bulk)
+event.listen(Session, "after_commit", _aplicar_commit)
+event.listen(Session, "after_rollback", _descartar)
+event.listen(Session, "after_transaction_create", _abrir_savepoint)
+event.listen(Session, "after_soft_rollback", _deshacer_savepoint)
+
+# Crear o borrar tablas (reset, tests) deja la caché obsoleta
+event.listen(Base.metadata, "after_create", lambda *args, **kwargs: cache_niveles.invalidar())
+event.listen(Base.metadata, "after_drop", lambda *args, **kwargs: cache_niveles.invalidar())
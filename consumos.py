@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 
-import crud, schemas
+import crud, crud_async, schemas
 from database import SessionLocal
 import websocket_manager
 from security import api_key_auth
@@ -21,13 +21,13 @@ def get_db():
 
 @router.post("/{usuario_id}", response_model=schemas.Consumo, summary="Registrar un consumo para un usuario")
 async def registrar_consumo(
-    usuario_id: int, consumo: schemas.ConsumoCreate, db: Session = Depends(get_db), api_key: str = Depends(api_key_auth)
+    usuario_id: int, consumo: schemas.ConsumoCreate, api_key: str = Depends(api_key_auth)
 ):
     """
     **[Admin/Staff]** Añade un producto al registro de consumo de un usuario.
     Esto afectará directamente la prioridad del usuario en la cola de canciones.
     """
-    db_consumo, error_detail = crud.create_consumo_para_usuario(db=db, consumo=consumo, usuario_id=usuario_id)
+    db_consumo, error_detail = await crud_async.create_consumo_para_usuario(consumo=consumo, usuario_id=usuario_id)
     if error_detail:
         raise HTTPException(status_code=400, detail=error_detail)
     # Notificamos la actualización de la cola
@@ -47,6 +47,7 @@ async def registrar_consumo(
             'producto_nombre': db_consumo.producto.nombre if db_consumo.producto else None,
             'usuario_nick': db_consumo.usuario.nick if db_consumo.usuario else None,
             'mesa_nombre': mesa_nombre,
+            'mesa_id': db_consumo.usuario.mesa_id if db_consumo.usuario else None,
             'created_at': db_consumo.created_at.isoformat()
             # 'is_single_item': True is implied by 'type': 'single_consumo'
         } 
@@ -59,14 +60,14 @@ async def registrar_consumo(
 
 @router.post("/pedir/{usuario_id}", response_model=schemas.Consumo, summary="Un usuario pide un producto para sí mismo")
 async def usuario_pide_producto(
-    usuario_id: int, consumo: schemas.ConsumoCreate, db: Session = Depends(get_db)
+    usuario_id: int, consumo: schemas.ConsumoCreate
 ):
     """
     **[Público]** Permite que un usuario registrado en una mesa pida un producto.
     No requiere clave de API de administrador.
     """
     # La lógica es la misma que para el admin, solo que sin la autenticación de admin
-    db_consumo, error_detail = crud.create_consumo_para_usuario(db=db, consumo=consumo, usuario_id=usuario_id)
+    db_consumo, error_detail = await crud_async.create_consumo_para_usuario(consumo=consumo, usuario_id=usuario_id)
     if error_detail:
         raise HTTPException(status_code=400, detail=error_detail)
     # Notificamos a todos para que la cola se actualice (por si cambia la prioridad)
@@ -86,6 +87,7 @@ async def usuario_pide_producto(
             'producto_nombre': db_consumo.producto.nombre if db_consumo.producto else None,
             'usuario_nick': db_consumo.usuario.nick if db_consumo.usuario else None,
             'mesa_nombre': mesa_nombre,
+            'mesa_id': db_consumo.usuario.mesa_id if db_consumo.usuario else None,
             'created_at': db_consumo.created_at.isoformat()
                 # 'is_single_item': True is implied by 'type': 'single_consumo'
             } 
@@ -96,7 +98,7 @@ async def usuario_pide_producto(
 
 @router.post("/pedir/carrito/{usuario_id}", response_model=List[schemas.Consumo], summary="Un usuario pide un carrito de compras completo")
 async def usuario_pide_carrito(
-    usuario_id: int, carrito: schemas.CarritoCreate, db: Session = Depends(get_db)
+    usuario_id: int, carrito: schemas.CarritoCreate
 ):
     """
     **[Público]** Permite que un usuario envíe un pedido consolidado (carrito).
@@ -106,7 +108,7 @@ async def usuario_pide_carrito(
         raise HTTPException(status_code=400, detail="El carrito no puede estar vacío.")
 
     # La nueva función crud maneja la transacción completa
-    consumos_creados, error_detail = crud.create_pedido_from_carrito(db=db, carrito=carrito, usuario_id=usuario_id)
+    consumos_creados, error_detail = await crud_async.create_pedido_from_carrito(carrito=carrito, usuario_id=usuario_id)
 
     if error_detail:
         raise HTTPException(status_code=400, detail=error_detail)
@@ -126,6 +128,7 @@ async def usuario_pide_carrito(
                 'consumo_ids': [c.id for c in consumos_creados], # IDs para acciones
                 'usuario_nick': primer_consumo.usuario.nick if primer_consumo.usuario else 'Desconocido',
                 'mesa_nombre': mesa_nombre,
+                'mesa_id': primer_consumo.usuario.mesa_id if primer_consumo.usuario else None,
                 'created_at': primer_consumo.created_at.isoformat(),
                 'items': [
                     {'producto_nombre': c.producto.nombre, 'cantidad': c.cantidad} for c in consumos_creados
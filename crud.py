@@ -5,6 +5,12 @@ import secrets
 from typing import List, Optional
 import datetime
 import models, schemas
+import queue_engine
+import scheduler
+import orden_cola
+import reproduccion
+from consumo_totales import cache_niveles, ajustar_totales, nivel_para_total
+from dialectos import hora_del_dia, mayor_de, segundos_entre
 from timezone_utils import now_bogota
 from decimal import Decimal # Importar Decimal
 
@@ -46,7 +52,7 @@ def get_total_consumido_por_usuario(db: Session, usuario_id: int):
 
 def get_canciones_por_usuario(db: Session, usuario_id: int):
     """Busca todas las canciones de un usuario especÃÂ­fico."""
-    return db.query(models.Cancion).filter(models.Cancion.usuario_id == usuario_id).order_by(models.Cancion.orden_manual.asc().nulls_last(), models.Cancion.created_at.asc()).all()
+    return db.query(models.Cancion).filter(models.Cancion.usuario_id == usuario_id).order_by(models.Cancion.orden_manual.asc().nulls_last(), orden_cola.TURNO.asc()).all()
 
 def create_cancion_para_usuario(db: Session, cancion: schemas.CancionCreate, usuario_id: int):
     """Crea una nueva canciÃÂ³n y la asocia a un usuario."""
@@ -96,6 +102,43 @@ def get_duracion_total_cola_aprobada(db: Session) -> int:
     total_seconds = db.query(func.sum(models.Cancion.duracion_seconds)).filter(models.Cancion.estado == 'aprobado').scalar()
     return total_seconds or 0
 
+def get_duraciones_cola(db: Session, mesa_id: Optional[int] = None):
+    """
+    Segundos en cola por estado (aprobado, pendiente_lazy) y de una mesa.
+    Con la cola residente son totales mantenidos en memoria (O(1)); si no, una consulta.
+    """
+    if queue_engine.motor.sirve(db):
+        totales = queue_engine.motor.get_totales(db, mesa_id)
+        if totales is not None:
+            return totales
+    por_estado, por_mesa = _get_duraciones_cola_sql(db)
+    return por_estado, por_mesa.get(mesa_id, 0)
+
+def get_duraciones_mesas(db: Session) -> dict:
+    """Segundos en cola (aprobado + lazy) de cada mesa con canciones."""
+    if queue_engine.motor.sirve(db):
+        totales = queue_engine.motor.get_totales_mesas(db)
+        if totales is not None:
+            return totales
+    return _get_duraciones_cola_sql(db)[1]
+
+def _get_duraciones_cola_sql(db: Session):
+    """Totales por estado y por mesa calculados con una consulta agrupada."""
+    filas = (
+        db.query(models.Cancion.estado, models.Usuario.mesa_id, func.sum(models.Cancion.duracion_seconds))
+        .join(models.Usuario, models.Cancion.usuario_id == models.Usuario.id)
+        .filter(models.Cancion.estado.in_(queue_engine.ESTADOS_COLA))
+        .group_by(models.Cancion.estado, models.Usuario.mesa_id)
+        .all()
+    )
+    por_estado = {estado: 0 for estado in queue_engine.ESTADOS_COLA}
+    por_mesa = {}
+    for estado, mesa_id, total in filas:
+        por_estado[estado] += total or 0
+        if total:
+            por_mesa[mesa_id or 0] = por_mesa.get(mesa_id or 0, 0) + total
+    return por_estado, por_mesa
+
 def update_cancion_estado(db: Session, cancion_id: int, nuevo_estado: str):
     """Actualiza el estado de una canciÃÂ³n especÃÂ­fica."""
     db_cancion = db.query(models.Cancion).filter(models.Cancion.id == cancion_id).first()
@@ -107,140 +150,65 @@ def update_cancion_estado(db: Session, cancion_id: int, nuevo_estado: str):
 
 def get_cola_priorizada(db: Session):
     """
-    Obtiene la lista de canciones aprobadas, ordenadas por el algoritmo de "Cola Justa".
+    Obtiene la lista de canciones aprobadas en el orden de la "Cola Justa".
+    Se sirve desde la cola residente (queue_engine) cuando es posible; si no,
+    se calcula con la consulta SQL completa.
+    """
+    if queue_engine.motor.sirve(db):
+        cola = queue_engine.motor.get_cola(db, "aprobado")
+        if cola is not None:
+            return cola
+    return _get_cola_priorizada_sql(db)
+
+def _get_cola_priorizada_sql(db: Session):
+    """Cola aprobada calculada con la consulta SQL completa (ver _get_cola_sql)."""
+    return _get_cola_sql(db, "aprobado")
+
+def _get_cola_sql(db: Session, estado: str):
+    """
+    Obtiene la lista de canciones de un estado, ordenadas por el algoritmo de "Cola Justa".
     
     Reglas:
     1. Orden Manual: Las canciones con `orden_manual` tienen prioridad absoluta y mantienen su orden relativo.
-    2. AgrupaciÃÂ³n por Mesa: El resto de canciones se agrupan por su mesa de origen.
-    3. CategorÃÂ­as de Mesa (basado en consumo total de la mesa):
+    2. Agrupación por Mesa: El resto de canciones se agrupan por su mesa de origen.
+    3. Categorías de Mesa (basado en consumo total de la mesa):
         - ORO (> $150.000): Cupo de 3 canciones por turno.
         - PLATA (> $50.000): Cupo de 2 canciones por turno.
-        - BRONCE (<= $50.000): Cupo de 1 canciÃÂ³n por turno.
-    4. Round Robin: Se iteran las mesas (ordenadas por la hora de llegada de su primera canciÃÂ³n pendiente)
-       y se toman N canciones (segÃÂºn su cupo) en cada turno.
+        - BRONCE (<= $50.000): Cupo de 1 canción por turno.
+    4. El pool se ordena con la política activa (scheduler): por defecto round robin por
+       mesas (ordenadas por la llegada de su primera canción) tomando N canciones por turno.
     """
-    from collections import deque
-    
-    # 1. Obtener todas las canciones aprobadas
+    # 1. Obtener todas las canciones del estado
     # Ordenamos por ID ascendente para respetar el orden de llegada "natural" dentro de cada mesa
     todas_canciones = (
         db.query(models.Cancion)
         .join(models.Usuario, models.Cancion.usuario_id == models.Usuario.id)
-        .filter(models.Cancion.estado == "aprobado")
+        .filter(models.Cancion.estado == estado)
         .order_by(models.Cancion.orden_manual.asc().nulls_last(), models.Cancion.id.asc())
         .all()
     )
 
     # 2. Separar canciones con orden manual (Prioridad Absoluta)
-    cola_manual = []
-    cola_pool = []
-    
-    for cancion in todas_canciones:
-        if cancion.orden_manual is not None:
-            # Insertar respetando el valor de orden_manual si es posible, o simplemente al principio
-            cola_manual.append(cancion)
-        else:
-            cola_pool.append(cancion)
-            
-    # Si solo hay canciones manuales, retornamos
+    cola_manual = [c for c in todas_canciones if c.orden_manual is not None]
+    cola_pool = [c for c in todas_canciones if c.orden_manual is None]
     if not cola_pool:
         return cola_manual
 
-    # 3. Agrupar canciones por Mesa
-    match_mesa_canciones = {} # {mesa_id: deque([canciones])}
-    mesa_arrival_time = {} # {mesa_id: primer_id_cancion} para ordenar turnos
-    
-    mesas_involucradas_ids = set()
-
-    for cancion in cola_pool:
-        mesa_id = cancion.usuario.mesa_id
-        if not mesa_id:
-            # Si un usuario no tiene mesa (ej. DJ), lo tratamos como una mesa "ficticia" con ID negativo
-            # o lo agrupamos en un grupo especial. Asumamos ID 0 para "Sin Mesa"
-            mesa_id = 0
-            
-        if mesa_id not in match_mesa_canciones:
-            match_mesa_canciones[mesa_id] = deque()
-            mesa_arrival_time[mesa_id] = cancion.id # El ID mÃÂ¡s bajo es el primero que llegÃÂ³
-            mesas_involucradas_ids.add(mesa_id)
-            
-        match_mesa_canciones[mesa_id].append(cancion)
-
-    # 4. Calcular CategorÃÂ­a (Tier) de cada Mesa
-    # Necesitamos el consumo total de cada mesa involucrada
-    # Definimos umbrales
-    UMBRAL_ORO = 150000
-    UMBRAL_PLATA = 50000
-    
-    mesa_tiers = {} # {mesa_id: 'oro'|'plata'|'bronce'}
-    mesa_quotas = {} # {mesa_id: int}
-    
-    if mesas_involucradas_ids:
-        # Consulta eficiente para obtener consumos de las mesas relevantes
-        # Excluimos la mesa 0 (sin mesa/DJ) de la consulta de base de datos
-        ids_reales = [mid for mid in mesas_involucradas_ids if mid != 0]
-        
-        consumos_mesas = {}
-        if ids_reales:
-            rows = (
-                db.query(
-                    models.Usuario.mesa_id,
-                    func.sum(models.Consumo.valor_total)
-                )
-                .join(models.Consumo, models.Usuario.id == models.Consumo.usuario_id)
-                .filter(models.Usuario.mesa_id.in_(ids_reales))
-                .group_by(models.Usuario.mesa_id)
-                .all()
-            )
-            for mid, total in rows:
-                consumos_mesas[mid] = total or 0
-        
-        # Asignar quotas
-        for mid in mesas_involucradas_ids:
-            total = consumos_mesas.get(mid, 0)
-            
-            # DJ / Sin Mesa (ID 0) recibe trato Preferencial o EstÃÂ¡ndar?
-            # Vamos a darle trato de ORO al DJ si se usa para poner mÃÂºsica activamente.
-            if mid == 0: 
-                quota = 3 
-            elif total >= UMBRAL_ORO:
-                quota = 3
-            elif total >= UMBRAL_PLATA:
-                quota = 2
-            else:
-                quota = 1
-                
-            mesa_quotas[mid] = quota
-
-    # 5. Construir la Cola Round-Robin
-    cola_justa = []
-    
-    # Ordenamos las mesas por orden de llegada (quiÃÂ©n puso canciÃÂ³n primero)
-    orden_turnos_mesas = sorted(mesas_involucradas_ids, key=lambda mid: mesa_arrival_time[mid])
-    
-    # Bucle Round Robin
-    while match_mesa_canciones:
-        # Iterar sobre una copia de la lista de mesas para poder borrar claves del diccionario principal
-        for mesa_id in orden_turnos_mesas:
-            if mesa_id not in match_mesa_canciones:
-                continue
-                
-            queue_de_mesa = match_mesa_canciones[mesa_id]
-            cupo = mesa_quotas.get(mesa_id, 1)
-            
-            # Tomar hasta 'cupo' canciones
-            tomadas = 0
-            while tomadas < cupo and queue_de_mesa:
-                cancion = queue_de_mesa.popleft()
-                cola_justa.append(cancion)
-                tomadas += 1
-            
-            # Si la mesa se queda sin canciones, la eliminamos del diccionario
-            if not queue_de_mesa:
-                del match_mesa_canciones[mesa_id]
-    
-    # 6. Fusionar: Manual + Justa
-    return cola_manual + cola_justa
+    # 3. Agrupar canciones por Mesa. Usuarios sin mesa (ej. DJ) van a la mesa 0 "Sin Mesa"
+    # Dentro de la mesa cuenta el turno (el ID salvo que el usuario reordenara su lista)
+    grupos = {}  # {mesa_id: [(turno, duracion)]}
+    por_turno = {}
+    for cancion in sorted(cola_pool, key=orden_cola.turno):
+        grupos.setdefault(cancion.usuario.mesa_id or 0, []).append((orden_cola.turno(cancion), cancion.duracion_seconds))
+        por_turno[orden_cola.turno(cancion)] = cancion
+
+    # 4. Cupo de cada mesa según su consumo total (caché de niveles sobre Mesa.total_consumido)
+    cupos = cache_niveles.cupos(db, grupos)
+
+    # 5. Ordenar el pool con la política activa
+    orden = scheduler.politica_actual().ordenar(grupos, cupos)
+    return cola_manual + [por_turno[t] for t in orden]
+
 
 def get_producto_by_nombre(db: Session, nombre: str):
     """Busca un producto por su nombre."""
@@ -457,8 +425,18 @@ def marcar_cancion_actual_como_cantada(db: Session):
 
     db.commit()
     db.refresh(cancion_actual)
+    reproduccion.reloj.terminar(cancion_actual.id)
     return cancion_actual
 
+def get_siguiente_cancion(db: Session):
+    """Primera canción de la cola aprobada (la que sonará a continuación), o None."""
+    if queue_engine.motor.sirve(db):
+        cola = queue_engine.motor.get_cola(db, "aprobado", 0, 1)
+        if cola is not None:
+            return cola[0] if cola else None
+    cola = _get_cola_priorizada_sql(db)
+    return cola[0] if cola else None
+
 def marcar_siguiente_como_reproduciendo(db: Session):
     """Busca la siguiente canciÃÂ³n en la cola y la marca como 'reproduciendo'."""
     siguiente_cancion = get_cola_priorizada(db)
@@ -469,36 +447,55 @@ def marcar_siguiente_como_reproduciendo(db: Session):
     siguiente_cancion[0].started_at = now_bogota()
     db.commit()
     db.refresh(siguiente_cancion[0])
+    reproduccion.reloj.iniciar(siguiente_cancion[0])
     return siguiente_cancion[0]
 
-def get_tiempo_espera_para_cancion(db: Session, cancion_id: int) -> int:
+def get_indice_espera(db: Session) -> queue_engine.IndiceEspera:
     """
-    Calcula el tiempo de espera estimado en segundos para una canciÃÂ³n especÃÂ­fica.
+    Índice de tiempos de espera de la cola aprobada (sumas prefijas de duraciones).
+    Con la cola residente se reutiliza mientras la versión de la cola no cambie.
     """
-    # 1. Obtener la canciÃÂ³n que se estÃÂ¡ reproduciendo
-    cancion_actual = db.query(models.Cancion).filter(models.Cancion.estado == "reproduciendo").first()
-    
-    tiempo_espera_total = 0
-    if cancion_actual:
-        tiempo_transcurrido = (now_bogota() - cancion_actual.started_at).total_seconds()
-        tiempo_restante_actual = max(0, cancion_actual.duracion_seconds - tiempo_transcurrido)
-        tiempo_espera_total += tiempo_restante_actual
-
-    # 2. Obtener la cola de canciones aprobadas
-    cola_aprobada = get_cola_priorizada(db)
-
-    # 3. Sumar la duraciÃÂ³n de las canciones que estÃÂ¡n antes de la nuestra
-    for cancion_en_cola in cola_aprobada:
-        if cancion_en_cola.id == cancion_id:
-            # Llegamos a nuestra canciÃÂ³n, dejamos de sumar
-            break
-        tiempo_espera_total += cancion_en_cola.duracion_seconds
-    else:
-        # Si la canciÃÂ³n no se encuentra en la cola (ya se cantÃÂ³, fue rechazada, etc.)
-        # devolvemos -1 para indicar que no hay tiempo de espera.
-        return -1
+    if queue_engine.motor.sirve(db):
+        indice = queue_engine.motor.get_indice_espera(db)
+        if indice is not None:
+            return indice
+    cola = _get_cola_priorizada_sql(db)
+    return queue_engine.IndiceEspera([(c.id, c.duracion_seconds) for c in cola], queue_engine.cancion_actual_tiempos(db))
 
-    return int(tiempo_espera_total)
+def get_tiempo_espera_para_cancion(db: Session, cancion_id: int) -> int:
+    """
+    Calcula el tiempo de espera estimado en segundos para una canción específica:
+    lo que le queda a la canción que suena más la duración de las que van antes.
+    Devuelve -1 si la canción no está en la cola (ya se cantó, fue rechazada, etc.).
+    """
+    return get_indice_espera(db).espera(cancion_id)
+
+def get_tiempos_espera(db: Session, usuario_id: Optional[int] = None, mesa_id: Optional[int] = None) -> List[dict]:
+    """
+    Tiempos de espera de todas las canciones aprobadas de un usuario o de una mesa,
+    en orden de la cola, usando un único índice de espera.
+    """
+    query = db.query(models.Cancion.id, models.Cancion.titulo, models.Cancion.usuario_id).filter(models.Cancion.estado == "aprobado")
+    if usuario_id is not None:
+        query = query.filter(models.Cancion.usuario_id == usuario_id)
+    if mesa_id is not None:
+        query = query.join(models.Usuario, models.Cancion.usuario_id == models.Usuario.id).filter(models.Usuario.mesa_id == mesa_id)
+
+    indice = get_indice_espera(db)
+    ahora = now_bogota()
+    resultado = []
+    for cancion_id, titulo, uid in query.all():
+        posicion = indice.posicion(cancion_id)
+        if posicion is None:
+            continue
+        resultado.append({
+            "cancion_id": cancion_id,
+            "titulo": titulo,
+            "usuario_id": uid,
+            "posicion": posicion,
+            "tiempo_espera_segundos": indice.espera(cancion_id, ahora),
+        })
+    return sorted(resultado, key=lambda r: r["posicion"])
 
 def get_ranking_usuarios(db: Session):
     """
@@ -528,6 +525,8 @@ def reset_database_for_new_night(db: Session):
     db.query(models.Cancion).delete()
     db.query(models.Usuario).delete()
     db.query(models.Mesa).delete()
+    # Las cuentas se conservan, pero ya no tienen consumos
+    db.query(models.Cuenta).update({models.Cuenta.total_consumido: 0}, synchronize_session=False)
     
     db.commit()
 
@@ -644,14 +643,10 @@ def get_ingresos_por_mesa(db: Session):
 def reordenar_cola_manual(db: Session, canciones_ids: List[int]):
     """
     Actualiza el orden manual de las canciones en la cola.
+    Las canciones aprobadas que no están en la lista pierden su orden manual; todo se
+    escribe con una sola sentencia (ver orden_cola.asignar_claves).
     """
-    # Primero, reseteamos el orden manual de todas las canciones aprobadas
-    db.query(models.Cancion).filter(models.Cancion.estado == 'aprobado').update({"orden_manual": None})
-    
-    # Luego, asignamos el nuevo orden
-    for i, cancion_id in enumerate(canciones_ids):
-        db.query(models.Cancion).filter(models.Cancion.id == cancion_id).update({"orden_manual": i + 1})
-    
+    orden_cola.asignar_claves(db, canciones_ids, limpiar_estado='aprobado')
     db.commit()
 
 def get_usuarios_sin_consumo(db: Session):
@@ -690,19 +685,33 @@ def move_song_to_top(db: Session, cancion_id: int):
     if not cancion_a_mover:
         return None
 
-    # 2. Encontrar el valor de orden manual mÃÂ¡s bajo actual
-    min_orden = db.query(func.min(models.Cancion.orden_manual)).scalar()
+    # 2. Clave por debajo de la menor clave manual de la cola (solo se escribe esta fila)
+    min_orden = db.query(func.min(models.Cancion.orden_manual)).filter(
+        models.Cancion.estado == 'aprobado',
+        models.Cancion.id != cancion_id
+    ).scalar()
 
-    nuevo_orden = 1
-    if min_orden is not None:
-        nuevo_orden = min_orden - 1
-    
-    # 3. Asignar el nuevo orden a la canciÃÂ³n
-    cancion_a_mover.orden_manual = nuevo_orden
+    # 3. Asignar el nuevo orden a la canción
+    cancion_a_mover.orden_manual = orden_cola.clave_entre(None, min_orden)
     db.commit()
     db.refresh(cancion_a_mover)
     return cancion_a_mover
 
+def mover_cancion_aprobada(db: Session, cancion_id: int, desplazamiento: int):
+    """
+    Mueve una canción aprobada `desplazamiento` posiciones en la cola priorizada.
+    Devuelve None si la canción no está en la cola.
+    """
+    cola = get_cola_priorizada(db)
+    indice_actual = next((i for i, c in enumerate(cola) if c.id == cancion_id), None)
+    if indice_actual is None:
+        return None
+    destino = indice_actual + desplazamiento
+    if 0 <= destino < len(cola):
+        orden_cola.mover(db, cola, cancion_id, destino)
+        db.commit()
+    return cola[indice_actual]
+
 def get_canciones_cantadas_por_usuario(db: Session):
     """
     Obtiene un reporte de la cantidad de canciones cantadas por cada usuario.
@@ -801,6 +810,15 @@ def delete_usuario(db: Session, usuario_id: int):
         return None
 
     # Borrar datos dependientes primero para evitar errores de clave forÃÂ¡nea
+    # El DELETE masivo no pasa por el flush: descontamos a mano los totales de mesa y cuenta
+    totales_usuario = (
+        db.query(models.Consumo.mesa_id, models.Consumo.cuenta_id, func.sum(models.Consumo.valor_total))
+        .filter(models.Consumo.usuario_id == usuario_id)
+        .group_by(models.Consumo.mesa_id, models.Consumo.cuenta_id)
+        .all()
+    )
+    for mesa_id, cuenta_id, total in totales_usuario:
+        ajustar_totales(db, mesa_id, cuenta_id, -(total or 0))
     db.query(models.Consumo).filter(models.Consumo.usuario_id == usuario_id).delete(synchronize_session=False)
     db.query(models.Cancion).filter(models.Cancion.usuario_id == usuario_id).delete(synchronize_session=False)
 
@@ -819,7 +837,7 @@ def get_ingresos_promedio_por_usuario_por_mesa(db: Session):
             models.Mesa.nombre,
             (
                 func.coalesce(func.sum(models.Consumo.valor_total), 0) / 
-                func.greatest(func.count(func.distinct(models.Usuario.id)), 1)
+                mayor_de(func.count(func.distinct(models.Usuario.id)), 1)
             ).label("ingresos_promedio")
         )
         .select_from(models.Mesa)
@@ -860,27 +878,26 @@ def get_tiempo_promedio_espera(db: Session):
     """
     Calcula el tiempo promedio en segundos desde que una canciÃÂ³n se aÃÂ±ade hasta que se canta.
     """
-    # Para SQLite, usamos julianday para calcular la diferencia en dÃÂ­as y luego convertimos a segundos.
-    # Para PostgreSQL, serÃÂ­a: func.avg(func.extract('epoch', models.Cancion.finished_at - models.Cancion.created_at))
-    avg_seconds = db.query(func.avg((func.julianday(models.Cancion.finished_at) - func.julianday(models.Cancion.created_at)) * 86400)).filter(
+    # La resta de fechas depende del motor (julianday en SQLite, EXTRACT en PostgreSQL): dialectos.py
+    avg_seconds = db.query(func.avg(segundos_entre(models.Cancion.created_at, models.Cancion.finished_at))).filter(
         models.Cancion.estado == "cantada",
         models.Cancion.finished_at.isnot(None)
     ).scalar()
-    return avg_seconds or 0
+    return float(avg_seconds or 0)
 
 def get_actividad_por_hora(db: Session):
     """
     Obtiene un reporte de la cantidad de canciones cantadas por cada hora del dÃÂ­a.
     """
+    # Hora del día como entero, traducida para cada motor (dialectos.py)
+    hora = hora_del_dia(models.Cancion.started_at).label("hora")
     return (
         db.query(
-            # Usamos strftime para SQLite para extraer la hora.
-            # Para PostgreSQL serÃÂ­a: extract('hour', models.Cancion.started_at)
-            func.strftime('%H', models.Cancion.started_at).label("hora"),
+            hora,
             func.count(models.Cancion.id).label("canciones_cantadas"),
         )
         .filter(models.Cancion.estado == "cantada", models.Cancion.started_at.isnot(None))
-        .group_by(func.strftime('%H', models.Cancion.started_at))
+        .group_by(hora)
         .order_by(func.count(models.Cancion.id).desc())
         .all()
     )
@@ -1604,8 +1621,7 @@ def get_cola_completa(db: Session):
     - Cola aprobada (upcoming)
     - Cola pendiente por aprobar
     """
-    # Aplicar aprobaciÃÂ³n automÃÂ¡tica despuÃÂ©s de 10 minutos
-    auto_approve_songs_after_10_minutes(db)
+    # Lectura pura: la aprobación automática la hace el planificador (planificador.py)
     
     now_playing = db.query(models.Cancion).filter(models.Cancion.estado == "reproduciendo").first()
     approved_queue = get_cola_priorizada(db)
@@ -1710,13 +1726,8 @@ def get_all_tables_payment_status(db: Session) -> List[dict]:
     
     results = []
     for mesa in mesas:
-        # 1. Calcular total consumido
-        total_consumido = (
-            db.query(func.sum(models.Consumo.valor_total))
-            .join(models.Usuario, models.Consumo.usuario_id == models.Usuario.id)
-            .filter(models.Usuario.mesa_id == mesa.id)
-            .scalar() or Decimal('0.00')
-        )
+        # 1. Total consumido (materializado en la mesa)
+        total_consumido = mesa.total_consumido or Decimal('0.00')
 
         # 2. Calcular total pagado
         total_pagado = (
@@ -1747,15 +1758,7 @@ def get_all_tables_payment_status(db: Session) -> List[dict]:
         cuenta_id = active_account.id if active_account else None
 
         # 6. Calcular Nivel (Oro/Plata/Bronce)
-        nivel_mesa = "bronce"
-        try:
-             total_val = float(total_consumido)
-             if total_val >= 150000:
-                 nivel_mesa = "oro"
-             elif total_val >= 50000:
-                 nivel_mesa = "plata"
-        except:
-             pass
+        nivel_mesa = nivel_para_total(total_consumido)
 
         results.append({
             "mesa_id": mesa.id,
@@ -1814,8 +1817,8 @@ async def start_next_song_if_autoplay_and_idle(db: Session):
     if next_song:
         # Si se encontrÃÂ³ una siguiente canciÃÂ³n, notificamos a todos los clientes
         # para que la cola se actualice y el reproductor comience a reproducir.
-        await websocket_manager.manager.broadcast_queue_update()
         await websocket_manager.manager.broadcast_play_song(next_song.youtube_id, next_song.duracion_seconds or 0)
+        await websocket_manager.manager.broadcast_queue_update()
         create_admin_log_entry(db, action="AUTO_START", details=f"Iniciada automÃÂ¡ticamente la canciÃÂ³n '{next_song.titulo}'.")
 
 async def avanzar_cola_automaticamente(db: Session):
@@ -1835,13 +1838,13 @@ async def avanzar_cola_automaticamente(db: Session):
     # 2. Marcar la siguiente canciÃÂ³n como 'reproduciendo'
     siguiente_cancion = marcar_siguiente_como_reproduciendo(db)
 
-    # 3. Notificar a todos los clientes sobre la actualizaciÃÂ³n de la cola
-    await websocket_manager.manager.broadcast_queue_update()
-
-    # 4. Si hay una nueva canciÃÂ³n, enviar la orden de reproducciÃÂ³n al player
+    # 3. Si hay una nueva canción, enviar la orden de reproducción al player antes que nada:
+    #    el player ya la tiene precargada (evento preload_next) y el cambio es inmediato
     if siguiente_cancion:
         await websocket_manager.manager.broadcast_play_song(siguiente_cancion.youtube_id, siguiente_cancion.duracion_seconds or 0)
 
+    # 4. Notificar a todos los clientes sobre la actualización de la cola
+    await websocket_manager.manager.broadcast_queue_update()
 
     # 5. Aprobar la siguiente canciÃ³n lazy si es necesario
     check_and_approve_next_lazy_song(db)
@@ -2032,12 +2035,8 @@ def get_cuenta_payment_status(db: Session, cuenta_id: int) -> Optional[dict]:
     
     mesa = cuenta.mesa
     
-    # 1. Calcular total consumido EN ESTA CUENTA
-    total_consumido = (
-        db.query(func.sum(models.Consumo.valor_total))
-        .filter(models.Consumo.cuenta_id == cuenta.id)
-        .scalar() or Decimal('0.00')
-    )
+    # 1. Total consumido EN ESTA CUENTA (materializado en la cuenta)
+    total_consumido = cuenta.total_consumido or Decimal('0.00')
 
     # 2. Calcular total pagado EN ESTA CUENTA
     total_pagado = (
@@ -2075,328 +2074,10 @@ def get_cuenta_payment_status(db: Session, cuenta_id: int) -> Optional[dict]:
         saldo_pendiente=saldo_pendiente, 
         consumos=consumos_items, 
         pagos=pagos_detalle,
-        nivel=("oro" if total_consumido >= 150000 else "plata" if total_consumido >= 50000 else "bronce")
-    ).model_dump()# CÃÂ³digo para agregar al final de crud.py
-
-
-
-# --- Lazy Approval Queue Functions ---
-
-
-
-def get_cola_lazy(db: Session):
-
-    """
-
-    Obtiene todas las canciones en estado pendiente_lazy, ordenadas por prioridad.
-
-    Usa el mismo algoritmo de cola justa que get_cola_priorizada.
-
-    """
-
-    from collections import deque
-
-    
-
-    # Obtener todas las canciones en estado pendiente_lazy
-
-    todas_canciones = (
-
-        db.query(models.Cancion)
-
-        .join(models.Usuario, models.Cancion.usuario_id == models.Usuario.id)
-
-        .filter(models.Cancion.estado == "pendiente_lazy")
-
-        .order_by(models.Cancion.orden_manual.asc().nulls_last(), models.Cancion.created_at.asc(), models.Cancion.id.asc())
-
-        .all()
-
-    )
-
-    
-
-    if not todas_canciones:
-
-        return []
-
-    
-
-    # Aplicar el mismo algoritmo de cola justa
-
-    cola_manual = []
-
-    cola_pool = []
-
-    
-
-    for cancion in todas_canciones:
-
-        if cancion.orden_manual is not None:
-
-            cola_manual.append(cancion)
-
-        else:
-
-            cola_pool.append(cancion)
-
-    
-
-    if not cola_pool:
-
-        return cola_manual
-
-    
-
-    # Agrupar por mesa
-
-    match_mesa_canciones = {}
-
-    mesa_arrival_time = {}
-
-    mesas_involucradas_ids = set()
-
-    
-
-    for cancion in cola_pool:
-
-        mesa_id = cancion.usuario.mesa_id or 0
-
-        if mesa_id not in match_mesa_canciones:
-
-            match_mesa_canciones[mesa_id] = deque()
-
-            mesa_arrival_time[mesa_id] = cancion.created_at
-
-            mesas_involucradas_ids.add(mesa_id)
-
-        match_mesa_canciones[mesa_id].append(cancion)
-
-    
-
-    # Calcular quotas
-
-    UMBRAL_ORO = 150000
-
-    UMBRAL_PLATA = 50000
-
-    mesa_quotas = {}
-
-    
-
-    if mesas_involucradas_ids:
-
-        ids_reales = [mid for mid in mesas_involucradas_ids if mid != 0]
-
-        consumos_mesas = {}
-
-        
-
-        if ids_reales:
-
-            rows = (
-
-                db.query(
-
-                    models.Usuario.mesa_id,
-
-                    func.sum(models.Consumo.valor_total)
-
-                )
-
-                .join(models.Consumo, models.Usuario.id == models.Consumo.usuario_id)
-
-                .filter(models.Usuario.mesa_id.in_(ids_reales))
-
-                .group_by(models.Usuario.mesa_id)
-
-                .all()
-
-            )
-
-            for mid, total in rows:
-
-                consumos_mesas[mid] = total or 0
-
-        
-
-        for mid in mesas_involucradas_ids:
-
-            total = consumos_mesas.get(mid, 0)
-
-            if mid == 0:
-
-                quota = 3
-
-            elif total >= UMBRAL_ORO:
-
-                quota = 3
-
-            elif total >= UMBRAL_PLATA:
-
-                quota = 2
-
-            else:
-
-                quota = 1
-
-            mesa_quotas[mid] = quota
-
-    
-
-    # Round Robin
-
-    cola_justa = []
-
-    orden_turnos_mesas = sorted(mesas_involucradas_ids, key=lambda mid: mesa_arrival_time[mid])
-
-    
-
-    while match_mesa_canciones:
-
-        for mesa_id in orden_turnos_mesas:
-
-            if mesa_id not in match_mesa_canciones:
-
-                continue
-
-            queue_de_mesa = match_mesa_canciones[mesa_id]
-
-            cupo = mesa_quotas.get(mesa_id, 1)
-
-            tomadas = 0
-
-            while tomadas < cupo and queue_de_mesa:
-
-                cancion = queue_de_mesa.popleft()
-
-                cola_justa.append(cancion)
-
-                tomadas += 1
-
-            if not queue_de_mesa:
-
-                del match_mesa_canciones[mesa_id]
-
-    
-
-    return cola_manual + cola_justa
+        nivel=nivel_para_total(total_consumido)
+    ).model_dump()
 
 
-
-def aprobar_siguiente_cancion_lazy(db: Session):
-
-    """
-
-    Aprueba la siguiente canciÃÂ³n de la cola lazy.
-
-    Llamada automÃÂ¡ticamente cuando la canciÃÂ³n actual llega al 50%.
-
-    """
-
-    cola_lazy = get_cola_lazy(db)
-
-    if not cola_lazy:
-
-        return None
-
-    
-
-    siguiente = cola_lazy[0]
-
-    siguiente.estado = "aprobado"
-
-    siguiente.approved_at = now_bogota()
-
-    db.commit()
-
-    db.refresh(siguiente)
-
-    
-
-    create_admin_log_entry(db, action="LAZY_APPROVAL", details=f"CanciÃÂ³n '{siguiente.titulo}' aprobada automÃÂ¡ticamente (lazy).")
-
-    return siguiente
-
-
-
-def get_cola_completa_con_lazy(db: Session):
-
-    """
-
-    VersiÃÂ³n extendida de get_cola_completa que incluye la cola lazy.
-
-    Retorna:
-
-    - now_playing: CanciÃÂ³n actual
-
-    - upcoming: Solo la siguiente canciÃÂ³n aprobada (mÃÂ¡ximo 1)
-
-    - lazy_queue: Canciones en pendiente_lazy
-
-    - pending: Canciones pendientes de aprobaciÃÂ³n manual
-
-    """
-
-    # Aplicar aprobaciÃÂ³n automÃÂ¡tica despuÃÂ©s de 10 minutos
-
-    auto_approve_songs_after_10_minutes(db)
-
-    
-
-    now_playing = db.query(models.Cancion).filter(models.Cancion.estado == "reproduciendo").first()
-
-    approved_queue = get_cola_priorizada(db)
-
-    lazy_queue = get_cola_lazy(db)
-
-    pending_queue = get_canciones_pendientes_por_aprobar(db)
-
-    
-
-    # Si la canciÃÂ³n que se estÃÂ¡ reproduciendo sigue en la lista de upcoming, la quitamos
-
-    if now_playing:
-
-        approved_queue = [song for song in approved_queue if song.id != now_playing.id]
-
-    
-
-    # Limitar upcoming a mÃÂ¡ximo 1 canciÃÂ³n (la siguiente)
-
-    upcoming_limited = approved_queue[:1] if approved_queue else []
-
-    
-
-    return {
-
-        "now_playing": now_playing,
-
-        "upcoming": upcoming_limited,
-
-        "lazy_queue": lazy_queue,
-
-        "pending": pending_queue
-
-    }
-
-
-
-def check_and_approve_next_lazy_song(db: Session):
-    """
-    Verifica si hay espacio en la cola de aprobados y aprueba la siguiente lazy.
-    Regla: Mantener MÁXIMO 1 canción aprobada (upcoming) esperando, aparte de la que suena.
-    Esta función es llamada por un background task periódicamente o al avanzar canción.
-    """
-    # Contar cuántas canciones hay en estado 'aprobado'
-    approved_count = db.query(models.Cancion).filter(models.Cancion.estado == "aprobado").count()
-    
-    # Si hay menos de 1 canción aprobada (es decir, 0), aprobamos la siguiente de la lazy
-    if approved_count < 1:
-        return aprobar_siguiente_cancion_lazy(db)
-    
-    return None
-
 def close_table_session(db: Session, mesa_id: int):
     """
     Cierra la sesión de una mesa. Realiza las siguientes acciones:
@@ -2469,105 +2150,37 @@ def close_table_session(db: Session, mesa_id: int):
 
 # --- Lazy Approval Queue Functions ---
 
-def get_cola_lazy(db: Session):
+def _get_cola_lazy_sql(db: Session):
     """
     Obtiene todas las canciones en estado pendiente_lazy, ordenadas por prioridad.
     Usa el mismo algoritmo de cola justa que get_cola_priorizada.
     """
-    from collections import deque
-    
-    # Obtener todas las canciones en estado pendiente_lazy
-    todas_canciones = (
-        db.query(models.Cancion)
-        .join(models.Usuario, models.Cancion.usuario_id == models.Usuario.id)
-        .filter(models.Cancion.estado == "pendiente_lazy")
-        .order_by(models.Cancion.orden_manual.asc().nulls_last(), models.Cancion.id.asc())
-        .all()
+    return _get_cola_sql(db, "pendiente_lazy")
+
+def get_cola_lazy(db: Session):
+    """
+    Obtiene la cola lazy ordenada, desde la cola residente cuando es posible
+    o con la consulta SQL completa como respaldo.
+    """
+    if queue_engine.motor.sirve(db):
+        cola = queue_engine.motor.get_cola(db, "pendiente_lazy")
+        if cola is not None:
+            return cola
+    return _get_cola_lazy_sql(db)
+
+def verificar_cola_residente(db: Session) -> bool:
+    """
+    Compara la cola residente con el cálculo SQL. Si difieren, la reconstruye.
+    Devuelve True si ambas coincidían.
+    """
+    coincide = (
+        queue_engine.motor.get_ids(db, "aprobado") == [c.id for c in _get_cola_priorizada_sql(db)]
+        and queue_engine.motor.get_ids(db, "pendiente_lazy") == [c.id for c in _get_cola_lazy_sql(db)]
+        and queue_engine.motor.get_totales_mesas(db) == _get_duraciones_cola_sql(db)[1]
     )
-    
-    if not todas_canciones:
-        return []
-    
-    # Aplicar el mismo algoritmo de cola justa
-    cola_manual = []
-    cola_pool = []
-    
-    for cancion in todas_canciones:
-        if cancion.orden_manual is not None:
-            cola_manual.append(cancion)
-        else:
-            cola_pool.append(cancion)
-    
-    if not cola_pool:
-        return cola_manual
-    
-    # Agrupar por mesa
-    match_mesa_canciones = {}
-    mesa_arrival_time = {}
-    mesas_involucradas_ids = set()
-    
-    for cancion in cola_pool:
-        mesa_id = cancion.usuario.mesa_id or 0
-        if mesa_id not in match_mesa_canciones:
-            match_mesa_canciones[mesa_id] = deque()
-            mesa_arrival_time[mesa_id] = cancion.id
-            mesas_involucradas_ids.add(mesa_id)
-        match_mesa_canciones[mesa_id].append(cancion)
-    
-    # Calcular quotas
-    UMBRAL_ORO = 150000
-    UMBRAL_PLATA = 50000
-    mesa_quotas = {}
-    
-    if mesas_involucradas_ids:
-        ids_reales = [mid for mid in mesas_involucradas_ids if mid != 0]
-        consumos_mesas = {}
-        
-        if ids_reales:
-            rows = (
-                db.query(
-                    models.Usuario.mesa_id,
-                    func.sum(models.Consumo.valor_total)
-                )
-                .join(models.Consumo, models.Usuario.id == models.Consumo.usuario_id)
-                .filter(models.Usuario.mesa_id.in_(ids_reales))
-                .group_by(models.Usuario.mesa_id)
-                .all()
-            )
-            for mid, total in rows:
-                consumos_mesas[mid] = total or 0
-        
-        for mid in mesas_involucradas_ids:
-            total = consumos_mesas.get(mid, 0)
-            if mid == 0:
-                quota = 3
-            elif total >= UMBRAL_ORO:
-                quota = 3
-            elif total >= UMBRAL_PLATA:
-                quota = 2
-            else:
-                quota = 1
-            mesa_quotas[mid] = quota
-    
-    # Round Robin
-    cola_justa = []
-    orden_turnos_mesas = sorted(mesas_involucradas_ids, key=lambda mid: mesa_arrival_time[mid])
-    
-    while match_mesa_canciones:
-        for mesa_id in orden_turnos_mesas:
-            if mesa_id not in match_mesa_canciones:
-                continue
-            queue_de_mesa = match_mesa_canciones[mesa_id]
-            cupo = mesa_quotas.get(mesa_id, 1)
-            tomadas = 0
-            while tomadas < cupo and queue_de_mesa:
-                cancion = queue_de_mesa.popleft()
-                cola_justa.append(cancion)
-                tomadas += 1
-            if not queue_de_mesa:
-                del match_mesa_canciones[mesa_id]
-    
-    return cola_manual + cola_justa
+    if not coincide:
+        queue_engine.motor.reconstruir(db)
+    return coincide
 
 def aprobar_siguiente_cancion_lazy(db: Session):
     """
@@ -2596,8 +2209,7 @@ def get_cola_completa_con_lazy(db: Session):
     - lazy_queue: Canciones en pendiente_lazy
     - pending: Canciones pendientes de aprobaciÃ³n manual
     """
-    # Aplicar aprobaciÃ³n automÃ¡tica despuÃ©s de 10 minutos
-    auto_approve_songs_after_10_minutes(db)
+    # Lectura pura: la aprobación automática la hace el planificador (planificador.py)
     
     now_playing = db.query(models.Cancion).filter(models.Cancion.estado == "reproduciendo").first()
     approved_queue = get_cola_priorizada(db)
@@ -2687,10 +2299,11 @@ def update_consumo_cantidad(db: Session, consumo_id: int, delta: int):
     db.refresh(db_consumo)
     
     return db_consumo, None
-def move_lazy_song_up(db: Session, cancion_id: int, usuario_id: int):
+def _mover_lazy_de_usuario(db: Session, cancion_id: int, usuario_id: int, desplazamiento: int):
     """
-    Mueve una canción pendiente_lazy hacia arriba en la cola del usuario.
-    Solo funciona para canciones del usuario actual.
+    Mueve una canción pendiente_lazy del usuario `desplazamiento` posiciones dentro de
+    su cola personal. Solo intercambia turnos entre sus propias canciones (ver
+    orden_cola.mover_en_lista_de_usuario): no toca orden_manual ni a los demás usuarios.
     """
     # 1. Validar que la canción existe, está en pendiente_lazy y pertenece al usuario
     cancion = db.query(models.Cancion).filter(
@@ -2698,108 +2311,48 @@ def move_lazy_song_up(db: Session, cancion_id: int, usuario_id: int):
         models.Cancion.estado == 'pendiente_lazy',
         models.Cancion.usuario_id == usuario_id
     ).first()
-    
+
     if not cancion:
         return None
-    
-    # 2. Obtener todas las canciones pendiente_lazy del usuario, ordenadas
+    # Una canción fijada por el admin (orden_manual) no la mueve el usuario
+    if cancion.orden_manual is not None:
+        return cancion
+
+    # 2. Obtener las canciones pendiente_lazy del usuario en el pool, en orden de turno
     canciones_usuario = (
         db.query(models.Cancion)
         .filter(
             models.Cancion.usuario_id == usuario_id,
-            models.Cancion.estado == 'pendiente_lazy'
+            models.Cancion.estado == 'pendiente_lazy',
+            models.Cancion.orden_manual.is_(None)
         )
-        .order_by(models.Cancion.orden_manual.asc().nulls_last(), models.Cancion.id.asc())
+        .order_by(orden_cola.TURNO.asc())
         .all()
     )
-    
-    if len(canciones_usuario) <= 1:
-        # Si hay solo una canción, no se puede mover
-        return cancion
-    
-    # 3. Encontrar el índice de la canción actual
-    indice_actual = None
-    for i, c in enumerate(canciones_usuario):
-        if c.id == cancion_id:
-            indice_actual = i
-            break
-    
-    if indice_actual is None or indice_actual == 0:
-        # No encontrado o ya está al principio
+
+    # 3. Si ya está en el extremo no hay nada que mover
+    indice_actual = canciones_usuario.index(cancion)
+    destino = indice_actual + desplazamiento
+    if destino < 0 or destino >= len(canciones_usuario):
         return cancion
-    
-    # 4. Intercambiar orden con la canción anterior
-    cancion_anterior = canciones_usuario[indice_actual - 1]
-    
-    # Si la canción anterior tiene orden_manual, incrementamos el orden de la actual
-    if cancion_anterior.orden_manual is not None:
-        # Asignar un orden entre la anterior y la siguiente (si existe)
-        nuevo_orden = cancion_anterior.orden_manual - 0.5
-    else:
-        # Ambas sin orden_manual, asignar a la anterior
-        cancion_anterior.orden_manual = 1
-        nuevo_orden = 0
-    
-    cancion.orden_manual = nuevo_orden
+
+    # 4. Repartir sus turnos en el nuevo orden
+    orden_cola.mover_en_lista_de_usuario(canciones_usuario, cancion_id, destino)
     db.commit()
     db.refresh(cancion)
-    
+
     return cancion
 
+def move_lazy_song_up(db: Session, cancion_id: int, usuario_id: int):
+    """
+    Mueve una canción pendiente_lazy hacia arriba en la cola del usuario.
+    Solo funciona para canciones del usuario actual.
+    """
+    return _mover_lazy_de_usuario(db, cancion_id, usuario_id, -1)
+
 def move_lazy_song_down(db: Session, cancion_id: int, usuario_id: int):
     """
     Mueve una canción pendiente_lazy hacia abajo en la cola del usuario.
     Solo funciona para canciones del usuario actual.
     """
-    # 1. Validar que la canción existe, está en pendiente_lazy y pertenece al usuario
-    cancion = db.query(models.Cancion).filter(
-        models.Cancion.id == cancion_id,
-        models.Cancion.estado == 'pendiente_lazy',
-        models.Cancion.usuario_id == usuario_id
-    ).first()
-    
-    if not cancion:
-        return None
-    
-    # 2. Obtener todas las canciones pendiente_lazy del usuario, ordenadas
-    canciones_usuario = (
-        db.query(models.Cancion)
-        .filter(
-            models.Cancion.usuario_id == usuario_id,
-            models.Cancion.estado == 'pendiente_lazy'
-        )
-        .order_by(models.Cancion.orden_manual.asc().nulls_last(), models.Cancion.id.asc())
-        .all()
-    )
-    
-    if len(canciones_usuario) <= 1:
-        # Si hay solo una canción, no se puede mover
-        return cancion
-    
-    # 3. Encontrar el índice de la canción actual
-    indice_actual = None
-    for i, c in enumerate(canciones_usuario):
-        if c.id == cancion_id:
-            indice_actual = i
-            break
-    
-    if indice_actual is None or indice_actual == len(canciones_usuario) - 1:
-        # No encontrado o ya está al final
-        return cancion
-    
-    # 4. Intercambiar orden con la canción siguiente
-    cancion_siguiente = canciones_usuario[indice_actual + 1]
-    
-    # Asignar orden entre la canción siguiente y la anterior (si existe)
-    if cancion_siguiente.orden_manual is not None:
-        nuevo_orden = cancion_siguiente.orden_manual + 0.5
-    else:
-        # Ambas sin orden_manual, asignar a la siguiente
-        cancion_siguiente.orden_manual = 1
-        nuevo_orden = 2
-    
-    cancion.orden_manual = nuevo_orden
-    db.commit()
-    db.refresh(cancion)
-    
-    return cancion
\ No newline at end of file
+    return _mover_lazy_de_usuario(db, cancion_id, usuario_id, 1)
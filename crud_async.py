@@ -0,0 +1,137 @@
+"""
+Variantes async de las rutas calientes de `crud` para los endpoints async.
+
+Las consultas simples son selects async nativos; las operaciones compuestas reutilizan
+la función síncrona de `crud` con `en_sesion`, que la ejecuta con una sesión propia en
+un hilo del pool de database.en_hilo. Así hay una sola implementación de cada regla de
+negocio.
+
+No se usa `AsyncSession.run_sync` para código que toque la cola residente
+(queue_engine.motor): run_sync corre en el hilo del event loop, y para el lock de hilos
+del motor todas las corrutinas de ese hilo son el mismo dueño y entrarían a la vez.
+
+Las escrituras calientes (pedidos, canciones nuevas) no usan la sesión async: van como
+unidades al escritor único (escritor.py), que las confirma en lote.
+
+Los objetos devueltos salen con las relaciones que usan los endpoints y los eventos
+ya cargadas: fuera de su sesión (o del escritor) una carga perezosa fallaría.
+"""
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud, models, schemas
+from database import SessionLocal, en_hilo
+from escritor import escritor
+
+
+def _con_relaciones(obj):
+    """Carga (con la sesión abierta) usuario, mesa y producto de una canción o consumo."""
+    if obj is None:
+        return obj
+    usuario = getattr(obj, "usuario", None)
+    if usuario is not None:
+        usuario.mesa
+    if isinstance(obj, models.Consumo):
+        obj.producto
+    return obj
+
+
+def _con_sesion(funcion, *args, **kwargs):
+    db = SessionLocal()
+    try:
+        return _con_relaciones(funcion(db, *args, **kwargs))
+    finally:
+        db.close()
+
+
+async def en_sesion(funcion, *args, **kwargs):
+    """
+    Ejecuta `funcion(db, ...)` de crud con una sesión síncrona propia en un hilo de
+    en_hilo (hilos reales: el lock de la cola residente sí los distingue).
+    """
+    return await en_hilo(_con_sesion, funcion, *args, **kwargs)
+
+
+async def get_usuario_by_id(db: AsyncSession, usuario_id: int) -> Optional[models.Usuario]:
+    return (await db.execute(select(models.Usuario).where(models.Usuario.id == usuario_id))).scalar_one_or_none()
+
+
+async def get_cancion_reproduciendo(db: AsyncSession) -> Optional[models.Cancion]:
+    resultado = await db.execute(
+        select(models.Cancion).where(models.Cancion.estado == "reproduciendo").limit(1)
+    )
+    return resultado.scalar_one_or_none()
+
+
+async def crear_cancion_en_cola(cancion: schemas.CancionCreate, usuario_id: int):
+    """
+    Crea la canción y la deja aprobada si no hay otra aprobada esperando, o en la cola
+    lazy si la hay. Una sola unidad de escritura: dos canciones que llegan a la vez no
+    pueden ver las dos la cola vacía. Devuelve (canción, aprobada).
+    """
+    def crear(s):
+        db_cancion = crud.create_cancion_para_usuario(s, cancion=cancion, usuario_id=usuario_id)
+        aprobadas = s.query(models.Cancion).filter(models.Cancion.estado == "aprobado").count()
+        estado = "pendiente_lazy" if aprobadas >= 1 else "aprobado"
+        return crud.update_cancion_estado(s, cancion_id=db_cancion.id, nuevo_estado=estado), estado == "aprobado"
+
+    return await escritor.enviar(crear)
+
+
+async def create_consumo_para_usuario(consumo: schemas.ConsumoCreate, usuario_id: int):
+    def crear(s):
+        db_consumo, error = crud.create_consumo_para_usuario(s, consumo=consumo, usuario_id=usuario_id)
+        return _con_relaciones(db_consumo), error
+
+    return await escritor.enviar(crear)
+
+
+async def create_pedido_from_carrito(carrito: schemas.CarritoCreate, usuario_id: int):
+    def crear(s):
+        consumos, error = crud.create_pedido_from_carrito(s, carrito=carrito, usuario_id=usuario_id)
+        for db_consumo in consumos or []:
+            _con_relaciones(db_consumo)
+        return consumos, error
+
+    return await escritor.enviar(crear)
+
+
+async def start_next_song_if_autoplay_and_idle(db: AsyncSession):
+    """Versión async de crud.start_next_song_if_autoplay_and_idle."""
+    import websocket_manager
+
+    if await get_cancion_reproduciendo(db) is not None:
+        return
+
+    next_song = await en_sesion(crud.marcar_siguiente_como_reproduciendo)
+    if next_song:
+        await websocket_manager.manager.broadcast_play_song(next_song.youtube_id, next_song.duracion_seconds or 0)
+        await websocket_manager.manager.broadcast_queue_update()
+        await en_sesion(
+            crud.create_admin_log_entry,
+            action="AUTO_START",
+            details=f"Iniciada automáticamente la canción '{next_song.titulo}'.",
+        )
+
+
+async def avanzar_cola_automaticamente() -> Optional[models.Cancion]:
+    """
+    Versión async de crud.avanzar_cola_automaticamente: mismo orden de eventos
+    (song_finished, play_song, queue_update) y misma aprobación lazy al final.
+    """
+    import websocket_manager
+    manager = websocket_manager.manager
+
+    cancion_cantada = await en_sesion(crud.marcar_cancion_actual_como_cantada)
+    if cancion_cantada:
+        await manager.broadcast_song_finished(cancion_cantada)
+
+    siguiente_cancion = await en_sesion(crud.marcar_siguiente_como_reproduciendo)
+    if siguiente_cancion:
+        await manager.broadcast_play_song(siguiente_cancion.youtube_id, siguiente_cancion.duracion_seconds or 0)
+
+    await manager.broadcast_queue_update()
+    await en_sesion(crud.check_and_approve_next_lazy_song)
+    return siguiente_cancion
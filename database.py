@@ -1,18 +1,175 @@
-from sqlalchemy import create_engine
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, event, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
 import os
 from dotenv import load_dotenv
 
+import config
+
 load_dotenv()
 
-# Cambiamos a una URL de SQLite. Esto creará un archivo llamado `karaoke.db` en la raíz del proyecto.
-SQLALCHEMY_DATABASE_URL = "sqlite:///./karaoke.db"
+# Driver (síncrono, async) de cada motor cuando la URL no lo indica (None: el de
+# SQLAlchemy). psycopg 3 sirve para los dos modos; aiosqlite hace la E/S de SQLite en su hilo
+_DRIVERS = {
+    "sqlite": (None, "aiosqlite"),
+    "postgresql": ("psycopg", "psycopg"),
+}
+
+
+def url_con_driver(url: str, asincrona: bool = False) -> str:
+    """
+    URL con el driver del motor: postgresql://... -> postgresql+psycopg://...
+    Las URL síncronas con un driver explícito se respetan; las async usan el driver async.
+    """
+    url = make_url(url)
+    drivers = _DRIVERS.get(url.get_backend_name())
+    if drivers is None or drivers[asincrona] is None or (not asincrona and "+" in url.drivername):
+        return url.render_as_string(hide_password=False)
+    return url.set(drivername=f"{url.get_backend_name()}+{drivers[asincrona]}").render_as_string(hide_password=False)
+
+
+def es_sqlite(url) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+# DATABASE_URL: por defecto el archivo `karaoke.db` en la raíz del proyecto
+SQLALCHEMY_DATABASE_URL = url_con_driver(config.settings.DATABASE_URL)
+# La misma base de datos para las sesiones async
+SQLALCHEMY_ASYNC_DATABASE_URL = url_con_driver(config.settings.DATABASE_URL, asincrona=True)
+
+
+
+def configurar_sqlite(dbapi_connection, perfil: str = None):
+    """
+    Pragmas del perfil de SQLite en una conexión nueva. Con "produccion":
+    - journal_mode=WAL: los lectores no bloquean al escritor ni al revés;
+    - synchronous=NORMAL: en WAL solo se sincroniza en los checkpoints (un corte de luz
+      puede perder la última transacción, nunca corromper la base);
+    - mmap_size y cache_size: lecturas desde memoria en vez de llamadas read();
+    - busy_timeout: esperar al escritor en vez de fallar con "database is locked".
+    """
+    perfil = perfil or config.settings.SQLITE_PERFIL
+    if perfil != "produccion":
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={config.settings.SQLITE_MMAP_MB * 1024 * 1024}")
+        # Negativo: en KiB en lugar de páginas
+        cursor.execute(f"PRAGMA cache_size=-{config.settings.SQLITE_CACHE_MB * 1024}")
+        cursor.execute(f"PRAGMA busy_timeout={config.settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def _opciones_pool(kwargs: dict) -> dict:
+    """Pool de un servidor de BD: tamaño configurable, conexiones comprobadas y renovadas."""
+    kwargs.setdefault("pool_size", config.settings.DB_POOL_TAMANO)
+    kwargs.setdefault("max_overflow", config.settings.DB_POOL_DESBORDE)
+    kwargs.setdefault("pool_recycle", config.settings.DB_POOL_RECICLAR)
+    kwargs.setdefault("pool_pre_ping", True)
+    return kwargs
+
+
+def crear_engine(url: str = SQLALCHEMY_DATABASE_URL, perfil: str = None, solo_lectura: bool = False, **kwargs):
+    """
+    Engine síncrono con pool. En SQLite aplica el perfil en cada conexión; con un servidor
+    (PostgreSQL) usa el pool de DB_POOL_*. Con `solo_lectura` las conexiones rechazan
+    escrituras (PRAGMA query_only / transacciones READ ONLY).
+    """
+    url = url_con_driver(url)
+    if not es_sqlite(url):
+        nuevo = create_engine(url, **_opciones_pool(kwargs))
+        if solo_lectura:
+            @event.listens_for(nuevo, "connect")
+            def solo_lectura_servidor(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+                cursor.close()
+                dbapi_connection.commit()
+        return nuevo
+
+    # Para SQLite, es necesario añadir connect_args={"check_same_thread": False} para que funcione con FastAPI
+    nuevo = create_engine(url, connect_args={"check_same_thread": False}, **kwargs)
+
+    @event.listens_for(nuevo, "connect")
+    def al_conectar(dbapi_connection, connection_record):
+        configurar_sqlite(dbapi_connection, perfil)
+        if solo_lectura:
+            dbapi_connection.execute("PRAGMA query_only=ON")
+
+    return nuevo
 
-# Para SQLite, es necesario añadir connect_args={"check_same_thread": False} para que funcione con FastAPI
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+
+def crear_engine_async(url: str = SQLALCHEMY_ASYNC_DATABASE_URL):
+    """
+    Engine async. SQLite va sin pool: una conexión aiosqlite está atada al event loop que
+    la abrió, y abrir una cuesta muy poco frente a compartirlas entre loops (TestClient,
+    scripts). Con un servidor, donde conectar sí cuesta, usa el pool de DB_POOL_*.
+    """
+    url = url_con_driver(url, asincrona=True)
+    if not es_sqlite(url):
+        return create_async_engine(url, **_opciones_pool({}))
+    nuevo = create_async_engine(url, poolclass=NullPool)
+    event.listen(nuevo.sync_engine, "connect", lambda dbapi_connection, record: configurar_sqlite(dbapi_connection))
+    return nuevo
+
+
+engine = crear_engine()
+# Pool aparte para lecturas (informes, cola): con WAL (o en un servidor) leen en paralelo con el escritor
+engine_lectura = crear_engine(solo_lectura=True, pool_size=config.settings.DB_POOL_LECTURA, max_overflow=0)
+
+
+class SesionBD(Session):
+    """
+    Clase de sesión común a SessionLocal y a las sesiones async (que por dentro usan una
+    síncrona): los eventos registrados aquí (queue_engine) valen para las dos.
+    """
+
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=SesionBD)
+SessionLectura = sessionmaker(autocommit=False, autoflush=False, bind=engine_lectura, class_=SesionBD)
+
+async_engine = crear_engine_async()
+
+# expire_on_commit=False: tras el commit los objetos se leen sin volver a la BD (una carga
+# perezosa fuera de run_sync fallaría con MissingGreenlet)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False, sync_session_class=SesionBD
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+def get_db_lectura():
+    """Dependencia para los endpoints que solo leen (informes): pool de solo lectura."""
+    db = SessionLectura()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """Dependencia para los endpoints async: sesión que no bloquea el event loop."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Hilos acotados para las funciones síncronas que aún se llaman desde el event loop.
+# Pool propio: no comparte el limitador global de anyio que usan los endpoints `def`.
+_hilos = ThreadPoolExecutor(max_workers=config.settings.DB_HILOS, thread_name_prefix="bd")
+
+
+async def en_hilo(funcion, *args, **kwargs):
+    """Ejecuta una función síncrona (de BD) en el pool acotado sin bloquear el event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hilos, functools.partial(funcion, *args, **kwargs))
@@ -0,0 +1,92 @@
+"""
+Expresiones SQL que se escriben distinto en cada motor de base de datos.
+
+Los informes restan fechas, agrupan por hora del día y toman el mayor de dos valores:
+SQLite lo hace con julianday, strftime y max(a, b); PostgreSQL con EXTRACT y greatest.
+Estas construcciones se usan en las consultas como cualquier función de SQLAlchemy
+(`func.*`) y se compilan para el dialecto del engine que ejecuta la consulta, así crud
+no depende del motor configurado en DATABASE_URL.
+
+Un motor sin traducción falla al compilar (CompileError) en lugar de enviar SQL de otro.
+"""
+from sqlalchemy import Float, Integer
+from sqlalchemy.exc import CompileError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class segundos_entre(FunctionElement):
+    """segundos_entre(inicio, fin): segundos (con decimales) de `inicio` a `fin`."""
+
+    type = Float()
+    name = "segundos_entre"
+    inherit_cache = True
+
+
+class hora_del_dia(FunctionElement):
+    """hora_del_dia(momento): hora (entero de 0 a 23) de una fecha y hora."""
+
+    type = Integer()
+    name = "hora_del_dia"
+    inherit_cache = True
+
+
+class mayor_de(FunctionElement):
+    """mayor_de(a, b, ...): el mayor de los valores (el tipo es el del primero)."""
+
+    name = "mayor_de"
+    inherit_cache = True
+
+    def __init__(self, *argumentos, **kwargs):
+        super().__init__(*argumentos, **kwargs)
+        self.type = self.clauses.clauses[0].type
+
+
+def _argumentos(elemento, compiler, **kw):
+    return [compiler.process(argumento, **kw) for argumento in elemento.clauses]
+
+
+@compiles(segundos_entre)
+@compiles(hora_del_dia)
+@compiles(mayor_de)
+def _sin_traduccion(elemento, compiler, **kw):
+    raise CompileError(f"{elemento.name} no está disponible para el dialecto {compiler.dialect.name}")
+
+
+# --- SQLite ---
+
+@compiles(segundos_entre, "sqlite")
+def _segundos_entre_sqlite(elemento, compiler, **kw):
+    inicio, fin = _argumentos(elemento, compiler, **kw)
+    return f"((julianday({fin}) - julianday({inicio})) * 86400.0)"
+
+
+@compiles(hora_del_dia, "sqlite")
+def _hora_del_dia_sqlite(elemento, compiler, **kw):
+    (momento,) = _argumentos(elemento, compiler, **kw)
+    return f"CAST(strftime('%H', {momento}) AS INTEGER)"
+
+
+@compiles(mayor_de, "sqlite")
+def _mayor_de_sqlite(elemento, compiler, **kw):
+    # max() con varios argumentos es escalar en SQLite (con uno solo sería el agregado)
+    return f"max({', '.join(_argumentos(elemento, compiler, **kw))})"
+
+
+# --- PostgreSQL ---
+
+@compiles(segundos_entre, "postgresql")
+def _segundos_entre_postgresql(elemento, compiler, **kw):
+    inicio, fin = _argumentos(elemento, compiler, **kw)
+    return f"EXTRACT(EPOCH FROM ({fin} - {inicio}))"
+
+
+@compiles(hora_del_dia, "postgresql")
+def _hora_del_dia_postgresql(elemento, compiler, **kw):
+    (momento,) = _argumentos(elemento, compiler, **kw)
+    return f"CAST(EXTRACT(HOUR FROM {momento}) AS INTEGER)"
+
+
+@compiles(mayor_de, "postgresql")
+def _mayor_de_postgresql(elemento, compiler, **kw):
+    return f"greatest({', '.join(_argumentos(elemento, compiler, **kw))})"
@@ -0,0 +1,217 @@
+"""
+Escritor único de la base de datos con commit agrupado.
+
+SQLite admite un solo escritor a la vez: con varios hilos escribiendo, cada transacción
+espera el lock (o falla con "database is locked") y paga su propio fsync. Aquí las
+escrituras calientes (pedidos, canciones nuevas) se encolan como unidades de escritura
+—funciones `unidad(db, ...)` que reciben una sesión— y un hilo dedicado con su propia
+conexión las ejecuta en lotes: todas las que esperan en la cola van en una transacción
+y un solo commit.
+
+Cada unidad corre dentro de un SAVEPOINT. Para las funciones de crud, que confirman por
+su cuenta, `db.commit()` dentro de una unidad es un flush (ids y refresh funcionan) y
+`db.rollback()` deshace solo la unidad. Si una unidad lanza una excepción, se deshace su
+savepoint y la excepción llega a quien la encoló; las demás del lote se confirman.
+
+Los objetos devueltos salen desligados de la sesión (expunge) tras el commit, con lo que
+tuvieran cargado: la unidad debe cargar las relaciones que vaya a usar quien la llamó.
+"""
+import asyncio
+import copy
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import config
+from database import SQLALCHEMY_DATABASE_URL, SesionBD, crear_engine, es_sqlite
+
+logger = logging.getLogger(__name__)
+
+
+class _SesionEscritor(SesionBD):
+    """Sesión del escritor: commit/rollback de una unidad actúan sobre su savepoint."""
+
+    _savepoint = None
+    _info_unidad = None
+
+    def commit(self):
+        if self._savepoint is not None:
+            self.flush()
+            return
+        super().commit()
+
+    def rollback(self):
+        if self._savepoint is not None:
+            self.deshacer_unidad()
+            self._savepoint = self.begin_nested()
+            return
+        super().rollback()
+
+    def deshacer_unidad(self):
+        """
+        Deshace el savepoint de la unidad. Lo que los eventos de sesión acumulan hasta el
+        commit (cola residente, totales) vuelve a como estaba antes de la unidad.
+        """
+        self._savepoint.rollback()
+        self.info.clear()
+        self.info.update(self._info_unidad)
+
+
+def crear_engine_escritor(url: str = SQLALCHEMY_DATABASE_URL, perfil: str = None):
+    """
+    Una sola conexión. En SQLite, con control manual de transacciones: pysqlite no emite
+    SAVEPOINT bien por su cuenta, y BEGIN IMMEDIATE toma el lock de escritura al empezar
+    el lote. Un servidor (PostgreSQL) maneja los savepoints sin ayuda.
+    """
+    nuevo = crear_engine(url, perfil, pool_size=1, max_overflow=0)
+    if not es_sqlite(nuevo.url):
+        return nuevo
+
+    @event.listens_for(nuevo, "connect")
+    def sin_transacciones_implicitas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(nuevo, "begin")
+    def begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return nuevo
+
+
+class _Unidad:
+    __slots__ = ("funcion", "args", "kwargs", "futuro")
+
+    def __init__(self, funcion, args, kwargs):
+        self.funcion = funcion
+        self.args = args
+        self.kwargs = kwargs
+        self.futuro = Future()
+
+
+class EscritorBD:
+    """Hilo escritor con su cola de unidades. Arranca con la primera unidad encolada."""
+
+    def __init__(self, engine=None):
+        self._engine = engine
+        self._sesiones: Optional[sessionmaker] = None
+        self._cola: "queue.Queue[Optional[_Unidad]]" = queue.Queue()
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Estadísticas: unidades y lotes confirmados
+        self.unidades = 0
+        self.lotes = 0
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = crear_engine_escritor()
+        return self._engine
+
+    # --- Encolar ---
+
+    def ejecutar(self, funcion: Callable, *args, **kwargs):
+        """Encola una unidad y espera (bloqueando el hilo) a que se confirme su lote."""
+        if threading.current_thread() is self._hilo:
+            raise RuntimeError("Una unidad de escritura no puede encolar otra")
+        return self._encolar(funcion, args, kwargs).result()
+
+    async def enviar(self, funcion: Callable, *args, **kwargs):
+        """Versión async de ejecutar(): espera sin bloquear el event loop."""
+        return await asyncio.wrap_future(self._encolar(funcion, args, kwargs))
+
+    def _encolar(self, funcion, args, kwargs) -> Future:
+        self._arrancar()
+        unidad = _Unidad(funcion, args, kwargs)
+        self._cola.put(unidad)
+        return unidad.futuro
+
+    # --- Ciclo de vida ---
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                if self._sesiones is None:
+                    self._sesiones = sessionmaker(
+                        bind=self.engine, class_=_SesionEscritor, autoflush=False, expire_on_commit=False
+                    )
+                self._hilo = threading.Thread(target=self._bucle, name="escritor-bd", daemon=True)
+                self._hilo.start()
+
+    def detener(self, timeout: float = 5.0):
+        """Termina el hilo después de confirmar lo que ya estaba encolado."""
+        with self._lock:
+            hilo, self._hilo = self._hilo, None
+        if hilo is not None and hilo.is_alive():
+            self._cola.put(None)
+            hilo.join(timeout)
+
+    # --- Hilo escritor ---
+
+    def _bucle(self):
+        while True:
+            primera = self._cola.get()
+            if primera is None:
+                return
+            lote = [primera]
+            while len(lote) < config.settings.ESCRITOR_LOTE_MAXIMO:
+                try:
+                    siguiente = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if siguiente is None:
+                    self._cola.put(None)
+                    break
+                lote.append(siguiente)
+            self._confirmar_lote(lote)
+
+    def _confirmar_lote(self, lote):
+        db = self._sesiones()
+        resultados = []
+        try:
+            for unidad in lote:
+                resultados.append(self._ejecutar_unidad(db, unidad))
+            db.commit()
+            db.expunge_all()
+        except Exception as e:
+            logger.exception("Error al confirmar un lote de %d escrituras", len(lote))
+            try:
+                db.rollback()
+            finally:
+                db.close()
+            for unidad in lote:
+                if not unidad.futuro.done():
+                    unidad.futuro.set_exception(e)
+            return
+        db.close()
+        self.lotes += 1
+        self.unidades += len(lote)
+        for unidad, (ok, valor) in zip(lote, resultados):
+            if ok:
+                unidad.futuro.set_result(valor)
+            else:
+                unidad.futuro.set_exception(valor)
+
+    @staticmethod
+    def _ejecutar_unidad(db: _SesionEscritor, unidad: _Unidad):
+        """(True, resultado) o (False, excepción). Los cambios de una unidad fallida se deshacen."""
+        db._info_unidad = {clave: copy.copy(valor) for clave, valor in db.info.items()}
+        db._savepoint = db.begin_nested()
+        try:
+            resultado = unidad.funcion(db, *unidad.args, **unidad.kwargs)
+            db.flush()
+            db._savepoint.commit()
+            return True, resultado
+        except Exception as e:
+            db.deshacer_unidad()
+            return False, e
+        finally:
+            db._savepoint = None
+            db._info_unidad = None
+
+
+escritor = EscritorBD()
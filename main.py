@@ -2,6 +2,7 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
 from fastapi.responses import Response, FileResponse
 from fastapi.staticfiles import StaticFiles
 import os
+import json
 from dotenv import load_dotenv
 import logging
 
@@ -20,8 +21,12 @@ import models
 
 models.Base.metadata.create_all(bind=engine)
 
-import crud, schemas, broadcast, thumbnails
-import mesas, canciones, youtube, consumos, usuarios, admin, productos, websocket_manager
+import config
+import crud, schemas, broadcast, broker, thumbnails
+from planificador import planificador
+from reproduccion import reloj
+from escritor import escritor
+import mesas, canciones, youtube, consumos, usuarios, admin, productos, stream, websocket_manager
 from admin_settings_router import router as settings_router
 from admin_extra_router import router as admin_extra_router
 
@@ -58,8 +63,23 @@ async def lifespan(app: FastAPI):
     db = SessionLocal()
     try:
         crud.get_or_create_dj_user(db)
+        # Tareas automáticas de la cola (auto-aprobación, cola lazy, mantenimiento)
+        if config.settings.PLANIFICADOR_ACTIVO:
+            planificador.iniciar()
+        # Reloj de reproducción: fin de canción y avance automático del lado del servidor
+        reloj.activar()
+        # Fan-out de WebSocket entre workers (WS_BROKER)
+        await websocket_manager.manager.iniciar_broker(broker.crear_broker())
+        # Ping/pong y cierre de conexiones medio abiertas (WS_INTERVALO_PING)
+        websocket_manager.manager.iniciar_latidos()
         yield
     finally:
+        await websocket_manager.manager.detener_latidos()
+        await websocket_manager.manager.detener_broker()
+        reloj.desactivar()
+        await planificador.detener()
+        # Confirma las escrituras que quedaran en la cola del escritor único
+        escritor.detener()
         db.close()
 
 app = FastAPI(title="Karaoke 'LA CANTA QUE RANA'", lifespan=lifespan)
@@ -68,7 +88,8 @@ app = FastAPI(title="Karaoke 'LA CANTA QUE RANA'", lifespan=lifespan)
 # ✅ HEALTH CHECK PARA RENDER
 # ===============================
 @app.get("/salud", include_in_schema=False)
-def health_check():
+async def health_check():
+    # async: no ocupa un hilo del pool, que pueden estar todos en informes pesados
     return {"status": "ok"}
 
 # ===============================
@@ -108,13 +129,59 @@ async def read_player():
 # ===============================
 @app.websocket("/ws/cola")
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket_manager.manager.connect(websocket)
-    await websocket_manager.manager.broadcast_queue_update()
+    # ?queue=delta: el cliente recibe la cola como queue_snapshot + queue_delta (cola_delta.py)
+    delta = websocket.query_params.get("queue") == "delta"
+    # ?topics=queue,player,mesa:3: solo los eventos de esos temas (sin topics, todos)
+    temas = [t.strip() for t in websocket.query_params.get("topics", "").split(",") if t.strip()]
+    # ?last_seq=N: al reconectar, el cliente recibe solo los eventos que se perdió
+    # (y &nodo=: el worker que le dio ese seq; la secuencia es de cada worker)
     try:
+        last_seq = int(websocket.query_params["last_seq"])
+    except (KeyError, ValueError):
+        last_seq = None
+    # ?encoding=orjson|msgpack: codificación de los eventos (codificacion.py; por defecto json)
+    manager = websocket_manager.manager
+    codificacion = await manager.connect(websocket, delta=delta, temas=temas,
+                                         codificacion=websocket.query_params.get("encoding", "json"))
+    repetidos = last_seq is not None and manager.reproducir(websocket, last_seq, websocket.query_params.get("nodo"))
+    try:
+        # "session": codificación negociada, secuencia actual y si se reenviaron los eventos perdidos ("ok"), si el
+        # hueco superaba el historial ("gap") o si no había last_seq ("none"). Sin "ok" el
+        # cliente recibe el estado actual (queue_update / queue_snapshot y playback_state).
+        replay = "ok" if repetidos else ("gap" if last_seq is not None else "none")
+        await manager.send_personal(websocket, {"type": "session", "payload": {
+            "seq": manager.seq, "nodo": manager.nodo, "replay": replay, "encoding": codificacion}})
+        if not repetidos:
+            await manager.broadcast_queue_update()
+            if delta:
+                await manager.send_queue_snapshot(websocket)
+        # Posición actual para que el cliente recién conectado interpole sin consultar
+        await manager.send_personal(websocket, {"type": "playback_state", "payload": reloj.estado()}, clave="playback_state")
         while True:
-            await websocket.receive_text()
+            mensaje = await websocket.receive_text()
+            try:
+                datos = json.loads(mensaje)
+                tipo = datos.get("type")
+            except (ValueError, AttributeError):
+                datos, tipo = None, None
+            # Cualquier mensaje del cliente (incluido el "pong" del latido) lo mantiene vivo
+            manager.actividad(websocket, tipo)
+            if tipo is None or tipo == "pong":
+                continue
+            if tipo == "ping":
+                await manager.send_personal(websocket, {"type": "pong"})
+            # Un cliente en modo delta que detecta un hueco de versión pide el estado completo
+            elif delta and tipo == "queue_resync":
+                await manager.send_queue_snapshot(websocket)
+            elif tipo in ("subscribe", "unsubscribe") and isinstance(datos.get("topics"), list):
+                temas = [str(t) for t in datos["topics"]]
+                if tipo == "subscribe":
+                    temas = manager.suscribir(websocket, temas)
+                else:
+                    manager.desuscribir(websocket, temas)
+                await manager.send_personal(websocket, {"type": f"{tipo}d", "payload": {"topics": temas}})
     except WebSocketDisconnect:
-        websocket_manager.manager.disconnect(websocket)
+        manager.disconnect(websocket)
 
 # ===============================
 # ROUTERS API
@@ -128,6 +195,7 @@ app.include_router(admin.router, prefix="/api/v1/admin", tags=["Administración"
 app.include_router(admin.public_router, prefix="/api/v1", tags=["Público"])
 app.include_router(productos.router, prefix="/api/v1/productos", tags=["Productos"])
 app.include_router(broadcast.router, prefix="/api/v1/broadcast", tags=["Broadcast"])
+app.include_router(stream.router, prefix="/api/v1/stream", tags=["Stream"])
 app.include_router(thumbnails.router)
 app.include_router(settings_router)
 app.include_router(admin_extra_router)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Numeric, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Numeric, Boolean, Index
 from sqlalchemy.orm import relationship
 import datetime
 
@@ -12,6 +12,7 @@ class Mesa(Base):
     nombre = Column(String, index=True)
     qr_code = Column(String, unique=True, index=True)
     is_active = Column(Boolean, default=True) # Nuevo campo para activar/desactivar
+    total_consumido = Column(Numeric(12, 2), default=0, nullable=False, server_default="0") # Suma de sus consumos (ver consumo_totales)
 
     # Relaciones: Una mesa puede tener muchos usuarios y consumos
     usuarios = relationship("Usuario", back_populates="mesa")
@@ -27,11 +28,17 @@ class Cuenta(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=now_bogota)
     closed_at = Column(DateTime, nullable=True)
+    total_consumido = Column(Numeric(12, 2), default=0, nullable=False, server_default="0") # Suma de sus consumos (ver consumo_totales)
 
     mesa = relationship("Mesa", back_populates="cuentas")
     consumos = relationship("Consumo", back_populates="cuenta")
     pagos = relationship("Pago", back_populates="cuenta")
 
+    __table_args__ = (
+        # Cuenta activa de una mesa (get_active_cuenta) e historial de cerradas
+        Index("ix_cuentas_mesa_activa", "mesa_id", "is_active"),
+    )
+
 class Usuario(Base):
     __tablename__ = "usuarios"
 
@@ -50,6 +57,11 @@ class Usuario(Base):
     canciones = relationship("Cancion", back_populates="usuario")
     # Los consumos ahora se asignan a la mesa, no al usuario individual
 
+    __table_args__ = (
+        # Usuarios de una mesa: consumos por mesa, cierre de mesa, canciones de la mesa
+        Index("ix_usuarios_mesa_id", "mesa_id"),
+    )
+
 class Cancion(Base):
     __tablename__ = "canciones"
 
@@ -60,6 +72,8 @@ class Cancion(Base):
     estado = Column(String, default="pendiente")  # pendiente, pendiente_lazy, aprobado, reproduciendo, cantada, rechazada
     started_at = Column(DateTime, nullable=True)  # Hora en que empieza a sonar
     orden_manual = Column(Integer, nullable=True)  # Posición manual establecida por el admin
+    # Turno en la cola de su mesa si el usuario reordenó su lista (si no, el id; ver orden_cola)
+    orden_usuario = Column(Integer, nullable=True)
     puntuacion_ia = Column(Integer, nullable=True) # Nuevo campo para el puntaje de la IA
     is_karaoke = Column(Boolean, default=True)  # True: cantar (mostrar puntaje), False: escuchar (no mostrar puntaje)
     created_at = Column(DateTime, default=now_bogota)  # Hora en que se añade
@@ -69,6 +83,13 @@ class Cancion(Base):
     usuario_id = Column(Integer, ForeignKey("usuarios.id"))
     usuario = relationship("Usuario", back_populates="canciones")
 
+    __table_args__ = (
+        # Cola por estado en su orden (orden_manual, id): cola priorizada, lazy, actual
+        Index("ix_canciones_estado_orden", "estado", "orden_manual", "id"),
+        # Canciones de un usuario por estado (cola lazy personal, límites por usuario)
+        Index("ix_canciones_usuario_estado", "usuario_id", "estado"),
+    )
+
 class Producto(Base):
     __tablename__ = "productos"
     id = Column(Integer, primary_key=True, index=True)
@@ -102,6 +123,16 @@ class Consumo(Base):
     cuenta = relationship("Cuenta", back_populates="consumos")
     is_dispatched = Column(Boolean, default=False) # Nuevo campo para marcar si ya fue entregado
 
+    __table_args__ = (
+        # Historial y totales por usuario, por mesa y por cuenta
+        Index("ix_consumos_usuario_creado", "usuario_id", "created_at"),
+        Index("ix_consumos_mesa_id", "mesa_id"),
+        Index("ix_consumos_cuenta_creado", "cuenta_id", "created_at"),
+        # Parcial: solo los pedidos por despachar (la barra los lista por fecha)
+        Index("ix_consumos_sin_despachar", "created_at",
+              sqlite_where=is_dispatched == False, postgresql_where=is_dispatched == False),
+    )
+
 class BannedNick(Base):
     __tablename__ = "banned_nicks"
     id = Column(Integer, primary_key=True, index=True)
@@ -140,6 +171,12 @@ class Pago(Base):
     cuenta_id = Column(Integer, ForeignKey("cuentas.id"), nullable=True) # Nueva columna
     cuenta = relationship("Cuenta", back_populates="pagos")
 
+    __table_args__ = (
+        # Pagos de una mesa y de una cuenta, por fecha
+        Index("ix_pagos_mesa_creado", "mesa_id", "created_at"),
+        Index("ix_pagos_cuenta_creado", "cuenta_id", "created_at"),
+    )
+
 
 class ConfiguracionGlobal(Base):
     __tablename__ = "configuracion_global"
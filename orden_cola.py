@@ -0,0 +1,127 @@
+"""
+Claves de orden manual (Cancion.orden_manual) con huecos.
+
+Las canciones con orden_manual van primero, ordenadas por (orden_manual, id); el resto
+las ordena la política de la cola (scheduler). Antes cada reordenamiento renumeraba la
+lista completa (1, 2, 3...) con un UPDATE por canción, y los movimientos de la cola lazy
+escribían valores como `orden - 0.5` en una columna Integer.
+
+Ahora las claves se asignan separadas por HUECO:
+- Mover una canción escribe una sola fila: la clave entera entre las de sus vecinos.
+- Si no queda hueco entre los vecinos, se reasignan las claves del tramo manual con un
+  único UPDATE ... CASE.
+- Si el destino cae dentro del pool automático, se fija solo el tramo visible hasta la
+  canción movida; las que quedan detrás siguen en el pool (orden justo entre mesas).
+- Un reordenamiento completo (drag-and-drop del admin) también es un único UPDATE.
+
+La lista personal de un usuario (subir/bajar en su cola lazy) no usa orden_manual: eso
+adelantaría sus canciones a todo el pool y las claves de usuarios distintos chocarían.
+Cada canción ocupa un turno en la cola de su mesa (Cancion.orden_usuario, o su ID si no
+se movió); reordenar la lista reparte los mismos turnos del usuario en el nuevo orden,
+así que la cola de las demás canciones, mesas y el orden del admin no cambian.
+"""
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import case, func, or_
+from sqlalchemy.orm import Session
+
+import models
+
+HUECO = 1024
+
+# Turno de la canción en la cola de su mesa, como expresión SQL (para ORDER BY)
+TURNO = func.coalesce(models.Cancion.orden_usuario, models.Cancion.id)
+
+
+def turno(cancion: models.Cancion) -> int:
+    """Turno de la canción en la cola de su mesa: orden_usuario o, si no se movió, su ID."""
+    return cancion.orden_usuario if cancion.orden_usuario is not None else cancion.id
+
+
+def clave_entre(anterior: Optional[int], siguiente: Optional[int]) -> Optional[int]:
+    """
+    Clave entera estrictamente entre `anterior` y `siguiente` (None = sin vecino).
+    Devuelve None si no queda hueco y hay que rebalancear.
+    """
+    if anterior is None and siguiente is None:
+        return HUECO
+    if anterior is None:
+        return siguiente - HUECO
+    if siguiente is None:
+        return anterior + HUECO
+    if siguiente - anterior < 2:
+        return None
+    return (anterior + siguiente) // 2
+
+
+def asignar_claves(db: Session, canciones_ids: Sequence[int], limpiar_estado: Optional[str] = None) -> Dict[int, int]:
+    """
+    Asigna claves HUECO, 2*HUECO, ... a `canciones_ids` (en ese orden) con un único UPDATE.
+    Si se indica `limpiar_estado`, en la misma sentencia se quita el orden manual a las
+    demás canciones de ese estado. No hace commit.
+    """
+    claves = {cancion_id: (i + 1) * HUECO for i, cancion_id in enumerate(canciones_ids)}
+    filtro = models.Cancion.id.in_(list(claves))
+    if limpiar_estado is not None:
+        filtro = or_(filtro, models.Cancion.estado == limpiar_estado)
+    if not claves:
+        if limpiar_estado is not None:
+            db.query(models.Cancion).filter(filtro).update({"orden_manual": None}, synchronize_session="fetch")
+        return claves
+    nueva_clave = case(claves, value=models.Cancion.id, else_=None)
+    db.query(models.Cancion).filter(filtro).update({"orden_manual": nueva_clave}, synchronize_session="fetch")
+    return claves
+
+
+def mover(db: Session, canciones: List[models.Cancion], cancion_id: int, destino: int) -> Optional[models.Cancion]:
+    """
+    Mueve la canción `cancion_id` a la posición `destino` de `canciones` (la lista en el
+    orden visible). Normalmente escribe solo esa fila. Si no hay hueco entre los vecinos
+    reasigna las claves del tramo manual; si el destino queda detrás de una canción sin
+    orden manual, fija el tramo visible hasta la canción movida (las de detrás siguen en
+    el pool). No hace commit. Devuelve la canción o None si no está.
+    """
+    cancion = next((c for c in canciones if c.id == cancion_id), None)
+    if cancion is None:
+        return None
+    nueva = [c for c in canciones if c.id != cancion_id]
+    destino = max(0, min(destino, len(nueva)))
+    nueva.insert(destino, cancion)
+
+    anterior = nueva[destino - 1] if destino > 0 else None
+    siguiente = nueva[destino + 1] if destino + 1 < len(nueva) else None
+    clave = None
+    if anterior is None or anterior.orden_manual is not None:
+        clave = clave_entre(
+            anterior.orden_manual if anterior is not None else None,
+            siguiente.orden_manual if siguiente is not None else None,
+        )
+    if clave is not None:
+        cancion.orden_manual = clave
+    elif anterior is not None and anterior.orden_manual is None:
+        # Detrás de una canción del pool: se fija el tramo hasta la movida (las canciones
+        # con orden manual están todas al principio, así que quedan dentro)
+        asignar_claves(db, [c.id for c in nueva[:destino + 1]])
+    else:
+        # Sin hueco dentro del tramo manual: se reparten sus claves de nuevo
+        asignar_claves(db, [c.id for c in nueva if c.orden_manual is not None or c is cancion])
+    return cancion
+
+
+def mover_en_lista_de_usuario(canciones: List[models.Cancion], cancion_id: int, destino: int) -> Optional[models.Cancion]:
+    """
+    Mueve la canción `cancion_id` a la posición `destino` de `canciones` (las del pool de
+    un usuario, en orden de turno). Los turnos del usuario se reparten en el nuevo orden:
+    solo se escriben las filas cuyo turno cambia (dos al subir o bajar un puesto). No hace
+    commit. Devuelve la canción o None si no está.
+    """
+    cancion = next((c for c in canciones if c.id == cancion_id), None)
+    if cancion is None:
+        return None
+    turnos = sorted(turno(c) for c in canciones)
+    nueva = [c for c in canciones if c.id != cancion_id]
+    nueva.insert(max(0, min(destino, len(nueva))), cancion)
+    for c, nuevo_turno in zip(nueva, turnos):
+        if turno(c) != nuevo_turno:
+            c.orden_usuario = nuevo_turno if nuevo_turno != c.id else None
+    return cancion
@@ -0,0 +1,150 @@
+"""
+Planificador en segundo plano (asyncio) de las tareas automáticas de la cola.
+
+Antes, get_cola_completa y get_cola_completa_con_lazy aprobaban canciones en cada
+lectura (y por lo tanto en cada broadcast y cada GET público), tomando el bloqueo de
+escritura de SQLite. Ahora las lecturas son puras y estas tareas corren aquí:
+
+- Aprobación automática de canciones pendientes con más de 10 minutos
+  (crud.auto_approve_songs_after_10_minutes). El planificador se despierta justo
+  cuando vence la pendiente más antigua.
+- Promoción de la cola lazy cuando no hay canción aprobada esperando
+  (crud.check_and_approve_next_lazy_song).
+- Mantenimiento periódico: verificación de la cola residente contra la ruta SQL.
+
+El bucle solo toca la BD cuando cambió la versión de la cola (queue_engine), cuando
+vence una pendiente o cuando toca mantenimiento; el trabajo con la BD se hace en un
+hilo para no bloquear el event loop. Si algo cambió, se notifica a los clientes.
+"""
+import asyncio
+import datetime
+import logging
+import time
+from typing import Optional
+
+import config
+import crud
+import models
+import queue_engine
+from database import SessionLocal, en_hilo
+from timezone_utils import ensure_bogota, now_bogota
+
+logger = logging.getLogger(__name__)
+
+MINUTOS_AUTO_APROBACION = 10
+
+
+class Planificador:
+    """Tarea asyncio única que ejecuta las tareas automáticas de la cola."""
+
+    def __init__(self):
+        self._tarea: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._despertar: Optional[asyncio.Event] = None
+        self._version_vista = None
+        self._proximo_vencimiento: Optional[float] = None  # time.monotonic()
+        self._proximo_mantenimiento = 0.0
+
+    @property
+    def activo(self) -> bool:
+        return self._tarea is not None and not self._tarea.done()
+
+    def iniciar(self):
+        """Arranca el bucle en el event loop actual (llamar desde el lifespan)."""
+        if self.activo:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._despertar = asyncio.Event()
+        self._version_vista = None
+        self._proximo_mantenimiento = time.monotonic() + config.settings.PLANIFICADOR_MANTENIMIENTO
+        self._tarea = asyncio.create_task(self._bucle(), name="planificador_cola")
+
+    async def detener(self):
+        if self._tarea is None:
+            return
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None
+
+    def despertar(self):
+        """Fuerza un ciclo inmediato. Se puede llamar desde cualquier hilo."""
+        if self._loop is not None and self._despertar is not None:
+            self._loop.call_soon_threadsafe(self._despertar.set)
+
+    async def _bucle(self):
+        while True:
+            try:
+                await self._esperar()
+                ahora = time.monotonic()
+                mantenimiento = ahora >= self._proximo_mantenimiento
+                if mantenimiento:
+                    self._proximo_mantenimiento = ahora + config.settings.PLANIFICADOR_MANTENIMIENTO
+                if not self._hay_trabajo(ahora) and not mantenimiento:
+                    continue
+                self._version_vista = queue_engine.motor.version
+                hubo_cambios = await en_hilo(self.ejecutar_ciclo, mantenimiento)
+                if hubo_cambios:
+                    import websocket_manager
+                    await websocket_manager.manager.broadcast_queue_update()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error en el planificador de la cola")
+                await asyncio.sleep(config.settings.PLANIFICADOR_INTERVALO)
+
+    async def _esperar(self):
+        """Duerme hasta el próximo vencimiento, el intervalo de sondeo o un despertar()."""
+        espera = config.settings.PLANIFICADOR_INTERVALO
+        if self._proximo_vencimiento is not None:
+            espera = min(espera, max(0.0, self._proximo_vencimiento - time.monotonic()))
+        try:
+            await asyncio.wait_for(self._despertar.wait(), timeout=espera)
+            self._despertar.clear()
+            # despertar() pide un ciclo aunque la versión no haya cambiado
+            self._version_vista = None
+        except asyncio.TimeoutError:
+            pass
+
+    def _hay_trabajo(self, ahora: float) -> bool:
+        if self._version_vista != queue_engine.motor.version:
+            return True
+        return self._proximo_vencimiento is not None and ahora >= self._proximo_vencimiento
+
+    def ejecutar_ciclo(self, mantenimiento: bool = False) -> bool:
+        """
+        Ejecuta (de forma síncrona) las tareas automáticas y programa el próximo
+        vencimiento. Devuelve True si cambió alguna canción.
+        """
+        db = SessionLocal()
+        try:
+            aprobadas = crud.auto_approve_songs_after_10_minutes(db)
+            promovida = crud.check_and_approve_next_lazy_song(db)
+            if mantenimiento and queue_engine.motor.sirve(db) and not crud.verificar_cola_residente(db):
+                logger.warning("La cola residente no coincidía con la BD; se reconstruyó.")
+            self._proximo_vencimiento = self._calcular_vencimiento(db)
+            return bool(aprobadas) or promovida is not None
+        finally:
+            db.close()
+
+    def _calcular_vencimiento(self, db) -> Optional[float]:
+        """Momento (monotónico) en que la pendiente más antigua cumple los 10 minutos."""
+        mas_antigua = (
+            db.query(models.Cancion.created_at)
+            .filter(models.Cancion.estado == "pendiente", models.Cancion.created_at.isnot(None))
+            .order_by(models.Cancion.created_at.asc())
+            .first()
+        )
+        if not mas_antigua:
+            return None
+        vence = ensure_bogota(mas_antigua[0]) + datetime.timedelta(minutes=MINUTOS_AUTO_APROBACION)
+        faltan = (vence - now_bogota()).total_seconds()
+        if faltan <= 0:
+            # Ya venció pero no había cupo: se reintenta al ritmo del sondeo (o al cambiar la cola)
+            faltan = config.settings.PLANIFICADOR_INTERVALO
+        return time.monotonic() + faltan
+
+
+planificador = Planificador()
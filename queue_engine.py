@@ -0,0 +1,655 @@
+"""
+Motor de cola residente en memoria.
+
+Mantiene, para los estados 'aprobado' y 'pendiente_lazy', las canciones agrupadas
+por mesa y la lista ya ordenada según la "Cola Justa" (ver crud.get_cola_priorizada).
+En lugar de recargar todas las canciones y recalcular el round-robin en cada lectura,
+el motor se actualiza de forma incremental a partir de los cambios que confirman las
+sesiones de SQLAlchemy (eventos after_flush / after_commit).
+
+Cada canción del pool tiene la clave de orden que le asigna la política activa
+(ver scheduler); con cuota_nivel la clave es (ronda, llegada_mesa, indice, id) y ordenar
+por ella produce exactamente el mismo resultado que el bucle round-robin.
+Añadir una canción la ubica con una búsqueda binaria (O(log n) comparaciones) más la
+inserción en la lista (O(n) en el peor caso, pero es un desplazamiento de memoria y no
+recorre ni compara claves); quitar la primera o cambiar el cupo de una mesa solo
+recalcula las claves de esa mesa.
+
+Sobre la cola aprobada se mantiene además un índice de tiempos de espera (sumas
+prefijas de duraciones) que solo se reconstruye cuando cambia la versión de la cola.
+
+La ruta SQL original se conserva en crud como reconstrucción y verificación.
+"""
+import bisect
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+
+import config
+import models
+import reproduccion
+import scheduler
+# Importado antes de registrar nuestros eventos: la caché de niveles se invalida primero al confirmar
+from consumo_totales import cache_niveles
+from database import Base, SesionBD, engine as db_engine
+from timezone_utils import ensure_bogota, now_bogota
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_COLA = ("aprobado", "pendiente_lazy")
+
+# Clave en Session.info donde se acumulan los cambios hasta el commit
+_CLAVE_CAMBIOS = "queue_engine_cambios"
+# {SAVEPOINT abierto: cuántos cambios había anotados al abrirlo}
+_CLAVE_SAVEPOINTS = "queue_engine_savepoints"
+
+# Veces que una lectura para ponerse al día se repite si la cola cambia mientras tanto
+_INTENTOS_SINCRONIZAR = 5
+
+
+class _ColaEstado:
+    """Estructura ordenada de una cola (aprobada o lazy)."""
+
+    def __init__(self, politica: scheduler.PoliticaCola):
+        self.politica = politica
+        self.manual = []   # [(orden_manual, id)] ordenada: prioridad absoluta
+        self.orden = []    # [clave de la política] ordenada: pool
+        self.mesas = {}    # mesa_id -> [(turno, duracion)] en orden de turno
+        self.claves = {}   # id -> clave actual (en manual u orden)
+        self.mesa_de = {}  # id -> mesa_id (solo canciones del pool)
+        # Turno en la cola de su mesa (el id salvo que el usuario reordenara su lista,
+        # ver orden_cola); las claves del pool terminan en el turno
+        self.turno_de = {}  # id -> turno (solo canciones del pool)
+        self.id_de = {}     # turno -> id
+
+    def __len__(self):
+        return len(self.claves)
+
+    def ids(self, offset: int = 0, limit: Optional[int] = None) -> List[int]:
+        """Devuelve un tramo de la cola ordenada (O(k))."""
+        fin = len(self.claves) if limit is None else offset + limit
+        n_manual = len(self.manual)
+        resultado = [c[1] for c in self.manual[offset:fin]]
+        if fin > n_manual:
+            inicio_pool = max(offset - n_manual, 0)
+            resultado.extend(self.id_de[c[-1]] for c in self.orden[inicio_pool:fin - n_manual])
+        return resultado
+
+    def agregar(self, cancion_id: int, mesa_id: int, orden_manual, duracion: int, cupo: int,
+                turno: Optional[int] = None):
+        if orden_manual is not None:
+            clave = (orden_manual, cancion_id)
+            bisect.insort(self.manual, clave)
+            self.claves[cancion_id] = clave
+            return
+
+        turno = cancion_id if turno is None else turno
+        lista = self.mesas.setdefault(mesa_id, [])
+        self.mesa_de[cancion_id] = mesa_id
+        self.turno_de[cancion_id] = turno
+        self.id_de[turno] = cancion_id
+        if not lista or turno > lista[-1][0]:
+            # Caso habitual: la canción llega al final de su mesa, nada más cambia.
+            anterior = self.claves[self.id_de[lista[-1][0]]] if lista else None
+            lista.append((turno, duracion or 0))
+            clave = self.politica.clave_al_final(lista, cupo, anterior)
+            bisect.insort(self.orden, clave)
+            self.claves[cancion_id] = clave
+        else:
+            bisect.insort(lista, (turno, duracion or 0))
+            self.recalcular_mesa(mesa_id, cupo)
+
+    def quitar(self, cancion_id: int) -> Optional[int]:
+        """Quita una canción. Devuelve la mesa cuyo orden interno cambió (o None)."""
+        clave = self.claves.pop(cancion_id, None)
+        if clave is None:
+            return None
+        mesa_id = self.mesa_de.pop(cancion_id, None)
+        if mesa_id is None:
+            self._borrar_clave(self.manual, clave)
+            return None
+
+        self._borrar_clave(self.orden, clave)
+        turno = self.turno_de.pop(cancion_id)
+        del self.id_de[turno]
+        lista = self.mesas[mesa_id]
+        posicion = bisect.bisect_left(lista, (turno,))
+        del lista[posicion]
+        if not lista:
+            del self.mesas[mesa_id]
+            return None
+        # Si se quitó la última canción de la mesa las demás claves siguen siendo válidas
+        if self.politica.depende_de_posicion and posicion < len(lista):
+            return mesa_id
+        return None
+
+    def recalcular_mesa(self, mesa_id: int, cupo: int):
+        """Recalcula las claves de todas las canciones de una mesa."""
+        lista = self.mesas.get(mesa_id)
+        if not lista:
+            return
+        for turno, _ in lista:
+            clave = self.claves.get(self.id_de[turno])
+            if clave is not None:
+                self._borrar_clave(self.orden, clave)
+        for clave in self.politica.claves(lista, cupo):
+            bisect.insort(self.orden, clave)
+            self.claves[self.id_de[clave[-1]]] = clave
+
+    @staticmethod
+    def _borrar_clave(lista, clave):
+        posicion = bisect.bisect_left(lista, clave)
+        if posicion < len(lista) and lista[posicion] == clave:
+            del lista[posicion]
+
+
+class IndiceEspera:
+    """
+    Tiempos de espera de la cola aprobada para una versión de la cola.
+    `canciones` es la cola ordenada [(id, duracion)] y `actual` el (id, started_at, duracion)
+    de la canción que suena. La espera de una canción es lo que le queda a la actual
+    (según el reloj de reproducción, que descuenta las pausas) más la suma de las
+    duraciones anteriores a ella: un acceso a diccionario.
+    """
+
+    def __init__(self, canciones: List[Tuple[int, int]], actual=None, version: Optional[int] = None):
+        self.version = version
+        self.actual = actual
+        self.posiciones: Dict[int, Tuple[int, int]] = {}  # id -> (posición, segundos antes)
+        acumulado = 0
+        for posicion, (cancion_id, duracion) in enumerate(canciones, start=1):
+            self.posiciones[cancion_id] = (posicion, acumulado)
+            acumulado += duracion or 0
+        self.total = acumulado
+
+    def restante_actual(self, ahora=None) -> float:
+        """Segundos que le quedan a la canción que está sonando (0 si no hay)."""
+        if self.actual is None:
+            return 0
+        cancion_id, started_at, duracion = self.actual
+        restante = reproduccion.reloj.restante_de(cancion_id, ahora)
+        if restante is not None:
+            return restante
+        if started_at is None:
+            return duracion or 0
+        transcurrido = ((ahora or now_bogota()) - ensure_bogota(started_at)).total_seconds()
+        return max(0, (duracion or 0) - transcurrido)
+
+    def posicion(self, cancion_id: int) -> Optional[int]:
+        """Posición en la cola aprobada (1 = la siguiente) o None si no está."""
+        entrada = self.posiciones.get(cancion_id)
+        return entrada[0] if entrada else None
+
+    def espera(self, cancion_id: int, ahora=None) -> int:
+        """Segundos de espera estimados, o -1 si la canción no está en la cola aprobada."""
+        entrada = self.posiciones.get(cancion_id)
+        if entrada is None:
+            return -1
+        return int(self.restante_actual(ahora) + entrada[1])
+
+
+def cancion_actual_tiempos(db: Session):
+    """(id, started_at, duracion) de la canción que se está reproduciendo, o None."""
+    fila = (
+        db.query(models.Cancion.id, models.Cancion.started_at, models.Cancion.duracion_seconds)
+        .filter(models.Cancion.estado == "reproduciendo")
+        .first()
+    )
+    return tuple(fila) if fila else None
+
+
+class MotorCola:
+    """
+    Cola residente compartida por todo el proceso.
+    Los cambios confirmados se acumulan y se aplican en la siguiente lectura,
+    usando la sesión de quien lee para resolver los datos que falten.
+
+    Los locks son de hilos: el motor se usa desde hilos (endpoints síncronos, en_hilo,
+    escritor), nunca desde AsyncSession.run_sync, que corre en el hilo del event loop.
+    `_lock` protege el estado en memoria y no se tiene durante consultas a la BD; las
+    consultas para ponerse al día (_sincronizar, reconstruir) van sin él, serializadas
+    por `_lock_sincronizar`.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._lock_sincronizar = threading.RLock()
+        self._valido = False
+        self._reconstruyendo = False
+        self._generacion = 0       # cambia con cada invalidar(): una lectura en curso ya no vale
+        self._politica = scheduler.politica_actual()
+        self._colas = {estado: _ColaEstado(self._politica) for estado in ESTADOS_COLA}
+        self._estado_de = {}       # cancion_id -> estado en el que está indexada
+        self._duracion = {}        # cancion_id -> duracion_seconds (canciones indexadas)
+        self._mesa_de = {}         # cancion_id -> mesa_id (canciones indexadas)
+        self._totales = {estado: 0 for estado in ESTADOS_COLA}  # segundos por estado
+        self._totales_mesa = {}    # mesa_id -> segundos en cola (aprobado + lazy)
+        self._indice_espera: Optional[IndiceEspera] = None
+        self._observadores = []    # callbacks(version) al cambiar la versión
+        self._confirmados = []     # callbacks(cambios) con los commits de este proceso
+        self._usuario_mesa = {}    # usuario_id -> mesa_id (0 = sin mesa)
+        self._cupos = {}           # mesa_id -> cupo
+        self._pendientes = []      # cambios confirmados aún no aplicados
+        self.version = 0
+
+    # --- Entrada de cambios ---
+
+    def al_cambiar(self, callback):
+        """
+        Registra un callback(version) que se llama cada vez que cambia la versión de la cola.
+        Se ejecuta en el hilo que confirmó la transacción y con el lock tomado: debe ser
+        inmediato (p. ej. loop.call_soon_threadsafe).
+        """
+        self._observadores.append(callback)
+
+    def al_confirmar(self, callback):
+        """
+        Registra un callback(cambios) que recibe los cambios de cada commit de este proceso
+        (no los que llegan de otros workers). Se llama en el hilo que confirmó: debe ser
+        inmediato. Así el broker reparte los cambios en lugar de invalidar todo.
+        """
+        self._confirmados.append(callback)
+
+    def quitar_al_confirmar(self, callback):
+        if callback in self._confirmados:
+            self._confirmados.remove(callback)
+
+    def _nueva_version(self):
+        self.version += 1
+        for callback in self._observadores:
+            try:
+                callback(self.version)
+            except Exception:
+                logger.exception("Error notificando el cambio de versión de la cola")
+
+    def invalidar(self):
+        """Descarta el estado en memoria; la próxima lectura reconstruye desde la BD."""
+        with self._lock:
+            self._valido = False
+            self._generacion += 1
+            self._pendientes.clear()
+            self._nueva_version()
+
+    def registrar_cambios(self, cambios: list, local: bool = True):
+        """
+        Recibe los cambios de una transacción confirmada. `local` es False para los que
+        llegan de otro worker por el broker (no se vuelven a anunciar).
+        """
+        with self._lock:
+            if any(cambio[0] == "invalidar" for cambio in cambios):
+                self.invalidar()
+            else:
+                # Durante una reconstrucción también: la lectura puede no incluirlos
+                if self._valido or self._reconstruyendo:
+                    self._pendientes.extend(cambios)
+                self._nueva_version()
+        if local:
+            for callback in self._confirmados:
+                try:
+                    callback(cambios)
+                except Exception:
+                    logger.exception("Error anunciando los cambios confirmados de la cola")
+
+    # --- Lectura ---
+    # Los lectores devuelven None si no pudieron ponerse al día: el llamador usa la ruta SQL
+
+    def sirve(self, db: Session) -> bool:
+        """Indica si el motor puede responder por esta sesión (misma base de datos)."""
+        # Cualquier engine sobre el mismo archivo: el principal, el async, el de solo
+        # lectura o el del escritor único
+        return config.settings.COLA_RESIDENTE and db.get_bind().url.database == db_engine.url.database
+
+    def get_ids(self, db: Session, estado: str, offset: int = 0, limit: Optional[int] = None) -> Optional[List[int]]:
+        if not self._sincronizar(db):
+            return None
+        with self._lock:
+            return self._colas[estado].ids(offset, limit)
+
+    def get_indice_espera(self, db: Session) -> Optional[IndiceEspera]:
+        """Índice de tiempos de espera; solo se reconstruye si cambió la versión de la cola."""
+        # Versión leída antes de sincronizar: los cambios de hasta esa versión quedan aplicados
+        version = self.version
+        indice = self._indice_espera
+        if indice is not None and indice.version == version:
+            return indice
+        if not self._sincronizar(db):
+            return None
+        actual = cancion_actual_tiempos(db)
+        with self._lock:
+            canciones = [(cid, self._duracion.get(cid)) for cid in self._colas["aprobado"].ids()]
+        indice = IndiceEspera(canciones, actual, version)
+        with self._lock:
+            if self._indice_espera is None or self._indice_espera.version <= version:
+                self._indice_espera = indice
+        return indice
+
+    def get_totales(self, db: Session, mesa_id: Optional[int] = None) -> Optional[Tuple[Dict[str, int], int]]:
+        """
+        Segundos en cola por estado y, si se indica, de una mesa (aprobado + lazy).
+        Son totales que se mantienen al aplicar cada cambio: O(1).
+        """
+        if not self._sincronizar(db):
+            return None
+        with self._lock:
+            return dict(self._totales), self._totales_mesa.get(mesa_id, 0)
+
+    def get_totales_mesas(self, db: Session) -> Optional[Dict[int, int]]:
+        """Segundos en cola (aprobado + lazy) de cada mesa con canciones."""
+        if not self._sincronizar(db):
+            return None
+        with self._lock:
+            return dict(self._totales_mesa)
+
+    def get_cola(self, db: Session, estado: str, offset: int = 0, limit: Optional[int] = None):
+        """
+        Devuelve las canciones de la cola en orden, o None si el estado en memoria
+        no coincide con la BD o no se pudo poner al día (el llamador usa la ruta SQL).
+        """
+        ids = self.get_ids(db, estado, offset, limit)
+        if ids is None:
+            return None
+        if not ids:
+            return []
+        canciones = (
+            db.query(models.Cancion)
+            .options(joinedload(models.Cancion.usuario).joinedload(models.Usuario.mesa))
+            .filter(models.Cancion.id.in_(ids))
+            .all()
+        )
+        por_id = {c.id: c for c in canciones}
+        if len(por_id) != len(ids) or any(c.estado != estado for c in canciones):
+            logger.warning("Cola residente desincronizada (%s); se reconstruirá.", estado)
+            self.invalidar()
+            return None
+        return [por_id[cid] for cid in ids]
+
+    def reconstruir(self, db: Session) -> bool:
+        """
+        Carga todo el estado desde la BD (misma información que la ruta SQL). Devuelve
+        False si la cola siguió cambiando durante todos los intentos.
+        """
+        with self._lock_sincronizar:
+            for _ in range(_INTENTOS_SINCRONIZAR):
+                if self._reconstruir(db):
+                    return True
+        logger.warning("No se pudo reconstruir la cola residente en %d intentos.", _INTENTOS_SINCRONIZAR)
+        return False
+
+    def _reconstruir(self, db: Session) -> bool:
+        """Una lectura completa; False si se invalidó mientras se leía (hay que repetirla)."""
+        with self._lock:
+            generacion = self._generacion
+            # Los cambios ya anotados están en la BD que vamos a leer
+            ya_leidos = len(self._pendientes)
+            self._reconstruyendo = True
+        try:
+            politica = scheduler.politica_actual()
+            filas = (
+                db.query(
+                    models.Cancion.id,
+                    models.Cancion.estado,
+                    models.Cancion.orden_manual,
+                    models.Cancion.duracion_seconds,
+                    models.Cancion.usuario_id,
+                    models.Usuario.mesa_id,
+                    models.Cancion.orden_usuario,
+                )
+                .join(models.Usuario, models.Cancion.usuario_id == models.Usuario.id)
+                .filter(models.Cancion.estado.in_(ESTADOS_COLA))
+                .order_by(models.Cancion.id.asc())
+                .all()
+            )
+            usuario_mesa = {fila.usuario_id: fila.mesa_id or 0 for fila in filas}
+            cupos = cache_niveles.cupos(db, set(usuario_mesa.values())) if usuario_mesa else {}
+        finally:
+            with self._lock:
+                self._reconstruyendo = False
+
+        with self._lock:
+            if self._generacion != generacion:
+                return False
+            self._politica = politica
+            self._colas = {estado: _ColaEstado(politica) for estado in ESTADOS_COLA}
+            self._estado_de = {}
+            self._duracion = {}
+            self._mesa_de = {}
+            self._totales = {estado: 0 for estado in ESTADOS_COLA}
+            self._totales_mesa = {}
+            self._usuario_mesa = usuario_mesa
+            self._cupos = cupos
+            # Los que llegaron durante la lectura se aplican encima (aplicar un cambio
+            # que la lectura ya incluía no altera nada: cada uno lleva el estado completo)
+            del self._pendientes[:ya_leidos]
+
+            for cancion_id, estado, orden_manual, duracion, usuario_id, _, turno in filas:
+                mesa_id = usuario_mesa[usuario_id]
+                self._colas[estado].agregar(cancion_id, mesa_id, orden_manual, duracion, cupos[mesa_id], turno)
+                self._indexar(cancion_id, estado, mesa_id, duracion)
+
+            self._valido = True
+            return True
+
+    # --- Aplicación incremental ---
+
+    def _sincronizar(self, db: Session) -> bool:
+        """
+        Pone el estado al día con los cambios confirmados (o lo reconstruye). Devuelve
+        False si no lo logró en _INTENTOS_SINCRONIZAR: el estado en memoria no es fiable.
+        """
+        with self._lock_sincronizar:
+            for _ in range(_INTENTOS_SINCRONIZAR):
+                if self._aplicar_pendientes(db):
+                    return True
+        logger.warning("La cola residente no se pudo poner al día en %d intentos; se usa la ruta SQL.",
+                       _INTENTOS_SINCRONIZAR)
+        return False
+
+    def _aplicar_pendientes(self, db: Session) -> bool:
+        """True si el estado quedó al día; False si hay que volver a intentarlo."""
+        # 1. Con el lock: tomar los cambios pendientes y lo que se sabe de usuarios y cupos
+        with self._lock:
+            if not self._valido or self._politica is not scheduler.politica_actual():
+                reconstruir = True
+            elif not self._pendientes:
+                return True
+            else:
+                reconstruir = False
+                generacion = self._generacion
+                pendientes, self._pendientes = self._pendientes, []
+                usuario_mesa = dict(self._usuario_mesa)
+                cupos_conocidos = set(self._cupos)
+        if reconstruir:
+            self._reconstruir(db)
+            return False
+
+        # 2. Sin el lock: consultar la mesa de los usuarios nuevos y los cupos
+        try:
+            usuarios = {c[4] for c in pendientes if c[0] == "cancion" and c[4] is not None}
+            desconocidos = [uid for uid in usuarios if uid not in usuario_mesa]
+            nuevos = {}
+            if desconocidos:
+                for uid, mesa_id in db.query(models.Usuario.id, models.Usuario.mesa_id).filter(models.Usuario.id.in_(desconocidos)):
+                    nuevos[uid] = mesa_id or 0
+            usuario_mesa.update(nuevos)
+
+            mesas_sucias = set()
+            for cambio in pendientes:
+                tipo = cambio[0]
+                if tipo == "usuario":
+                    _, usuario_id, mesa_id = cambio
+                    anterior = usuario_mesa.get(usuario_id)
+                    if anterior is not None and anterior != (mesa_id or 0):
+                        # Un usuario cambió de mesa: cambia la agrupación de sus canciones; reconstruimos.
+                        self.invalidar()
+                        return False
+                elif tipo == "consumo":
+                    mesas_sucias.add(cambio[1] or 0)
+
+            # Cupos de mesas nuevas o con consumos modificados
+            mesas_nuevas = {
+                usuario_mesa[c[4]] for c in pendientes
+                if c[0] == "cancion" and c[2] in ESTADOS_COLA and c[4] in usuario_mesa
+            } - cupos_conocidos
+            mesas = mesas_nuevas | mesas_sucias
+            cupos = cache_niveles.cupos(db, mesas) if mesas else {}
+        except Exception:
+            # Los cambios tomados no se pueden devolver en orden: la próxima lectura reconstruye
+            self.invalidar()
+            raise
+
+        # 3. Con el lock: aplicar
+        with self._lock:
+            if self._generacion != generacion:
+                # Se invalidó mientras consultábamos: se reconstruirá
+                return False
+            self._usuario_mesa.update(nuevos)
+            cupos_anteriores = {mid: self._cupos.get(mid) for mid in mesas_sucias}
+            self._cupos.update(cupos)
+
+            # Cada cambio de canción trae su estado completo: vale el último de cada una. Se
+            # quitan todas antes de volver a agregarlas porque un reordenamiento de la lista
+            # de un usuario intercambia turnos entre canciones del mismo commit (orden_cola)
+            finales = {}
+            for cambio in pendientes:
+                if cambio[0] == "cancion":
+                    finales[cambio[1]] = cambio[2:]
+                elif cambio[0] == "borrar":
+                    finales[cambio[1]] = None
+            for cancion_id in finales:
+                self._quitar_cancion(cancion_id)
+            for cancion_id, final in finales.items():
+                if final is not None:
+                    self._agregar_cancion(cancion_id, *final)
+
+            # Reordenar las mesas que cambiaron de categoría
+            for mesa_id, cupo_anterior in cupos_anteriores.items():
+                if cupo_anterior is not None and cupo_anterior != self._cupos[mesa_id]:
+                    for cola in self._colas.values():
+                        cola.recalcular_mesa(mesa_id, self._cupos[mesa_id])
+            return not self._pendientes
+
+    def _quitar_cancion(self, cancion_id: int):
+        anterior = self._desindexar(cancion_id)
+        if anterior is not None:
+            cola = self._colas[anterior]
+            mesa_afectada = cola.quitar(cancion_id)
+            if mesa_afectada is not None:
+                cola.recalcular_mesa(mesa_afectada, self._cupos.get(mesa_afectada, 1))
+
+    def _agregar_cancion(self, cancion_id: int, estado, orden_manual, usuario_id, duracion, turno):
+        if estado not in ESTADOS_COLA:
+            return
+        mesa_id = self._usuario_mesa.get(usuario_id)
+        if mesa_id is None:
+            # Canción sin usuario válido: la ruta SQL también la excluye (JOIN con usuarios)
+            return
+        self._colas[estado].agregar(cancion_id, mesa_id, orden_manual, duracion, self._cupos.get(mesa_id, 1), turno)
+        self._indexar(cancion_id, estado, mesa_id, duracion)
+
+    def _indexar(self, cancion_id: int, estado: str, mesa_id: int, duracion):
+        """Registra la canción y suma su duración a los totales de su estado y su mesa."""
+        self._estado_de[cancion_id] = estado
+        self._duracion[cancion_id] = duracion
+        self._mesa_de[cancion_id] = mesa_id
+        self._totales[estado] += duracion or 0
+        self._totales_mesa[mesa_id] = self._totales_mesa.get(mesa_id, 0) + (duracion or 0)
+
+    def _desindexar(self, cancion_id: int) -> Optional[str]:
+        """Quita la canción de los índices y de los totales. Devuelve su estado anterior."""
+        estado = self._estado_de.pop(cancion_id, None)
+        duracion = self._duracion.pop(cancion_id, None) or 0
+        mesa_id = self._mesa_de.pop(cancion_id, None)
+        if estado is not None:
+            self._totales[estado] -= duracion
+            restante = self._totales_mesa.get(mesa_id, 0) - duracion
+            if restante > 0:
+                self._totales_mesa[mesa_id] = restante
+            else:
+                self._totales_mesa.pop(mesa_id, None)
+        return estado
+
+
+motor = MotorCola()
+
+
+# --- Sincronización con las sesiones de SQLAlchemy ---
+
+def _registrar_flush(session, flush_context):
+    """Anota en la sesión los cambios de canciones, usuarios, mesas y consumos (aún sin confirmar)."""
+    cambios = session.info.setdefault(_CLAVE_CAMBIOS, [])
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, models.Cancion):
+            cambios.append(("cancion", obj.id, obj.estado, obj.orden_manual, obj.usuario_id, obj.duracion_seconds,
+                            obj.orden_usuario))
+        elif isinstance(obj, models.Consumo):
+            cambios.append(("consumo", obj.mesa_id))
+        elif isinstance(obj, models.Usuario) and obj in session.dirty:
+            cambios.append(("usuario", obj.id, obj.mesa_id))
+        elif isinstance(obj, models.Mesa):
+            # No cambia el orden, pero sí lo que se muestra (nombre de la mesa): nueva versión.
+            # Las creadas también: SQLite puede reutilizar el id y otro worker tendría su total
+            cambios.append(("mesa", obj.id))
+    for obj in session.deleted:
+        if isinstance(obj, models.Cancion):
+            cambios.append(("borrar", obj.id))
+        elif isinstance(obj, models.Consumo):
+            cambios.append(("consumo", obj.mesa_id))
+        elif isinstance(obj, models.Usuario):
+            cambios.append(("invalidar",))
+        elif isinstance(obj, models.Mesa):
+            cambios.append(("mesa", obj.id))
+
+
+def _registrar_bulk(orm_execute_state):
+    """Los UPDATE/DELETE masivos no pasan por el flush: invalidamos al confirmar."""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if any(m.class_ in (models.Cancion, models.Usuario, models.Consumo) for m in orm_execute_state.all_mappers):
+        orm_execute_state.session.info.setdefault(_CLAVE_CAMBIOS, []).append(("invalidar",))
+
+
+def _aplicar_commit(session):
+    # Liberar o deshacer un SAVEPOINT (unidades de escritor.py) no es el commit real
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_CLAVE_SAVEPOINTS, None)
+    cambios = session.info.pop(_CLAVE_CAMBIOS, None)
+    if cambios:
+        motor.registrar_cambios(cambios)
+
+
+def _descartar(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_CLAVE_SAVEPOINTS, None)
+    session.info.pop(_CLAVE_CAMBIOS, None)
+
+
+def _abrir_savepoint(session, transaction):
+    if transaction.nested:
+        session.info.setdefault(_CLAVE_SAVEPOINTS, {})[transaction] = len(session.info.get(_CLAVE_CAMBIOS, ()))
+
+
+def _deshacer_savepoint(session, previous_transaction):
+    """Un SAVEPOINT deshecho (p. ej. una unidad fallida del escritor): sus cambios no llegan al commit."""
+    if not previous_transaction.nested:
+        return
+    marca = session.info.get(_CLAVE_SAVEPOINTS, {}).pop(previous_transaction, None)
+    cambios = session.info.get(_CLAVE_CAMBIOS)
+    if marca is not None and cambios is not None:
+        del cambios[marca:]
+
+
+event.listen(SesionBD, "after_flush", _registrar_flush)
+event.listen(SesionBD, "do_orm_execute", _registrar_bulk)
+event.listen(SesionBD, "after_commit", _aplicar_commit)
+event.listen(SesionBD, "after_rollback", _descartar)
+event.listen(SesionBD, "after_transaction_create", _abrir_savepoint)
+event.listen(SesionBD, "after_soft_rollback", _deshacer_savepoint)
+
+# Crear o borrar tablas (reset, tests) deja el estado en memoria obsoleto
+event.listen(Base.metadata, "after_create", lambda *args, **kwargs: motor.invalidar())
+event.listen(Base.metadata, "after_drop", lambda *args, **kwargs: motor.invalidar())
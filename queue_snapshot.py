@@ -0,0 +1,130 @@
+"""
+Snapshots serializados de la cola por versión.
+
+/api/v1/canciones/cola y /cola/extended se consultan periódicamente (player, admin).
+Cada vista se serializa una sola vez por versión de la cola (queue_engine.motor.version,
+que cambia con cada transacción que toca canciones, usuarios, mesas o consumos) y se
+reutiliza mientras la versión no cambie. Sobre eso se apoyan:
+- ETag / If-None-Match: 304 sin cuerpo si el cliente ya tiene la versión actual.
+- ?since_version=N: long-poll; la respuesta espera hasta que la versión supere N.
+"""
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import queue_engine
+from database import SessionLocal, en_hilo
+
+# Identifica este proceso: tras reiniciar, la versión vuelve a 0 y un ETag viejo no debe coincidir
+_EPOCA = format(int(time.time() * 1000), "x")
+
+
+class Snapshot:
+    """Cuerpo JSON de una vista de la cola para una versión."""
+
+    def __init__(self, vista: str, version: int, cuerpo: bytes):
+        self.vista = vista
+        self.version = version
+        self.cuerpo = cuerpo
+        self.etag = f'"{vista}-{_EPOCA}-{version}"'
+
+    def coincide(self, if_none_match: Optional[str]) -> bool:
+        """Indica si la cabecera If-None-Match del cliente incluye este ETag."""
+        if not if_none_match:
+            return False
+        etiquetas = [e.strip() for e in if_none_match.split(",")]
+        return "*" in etiquetas or self.etag in etiquetas or f"W/{self.etag}" in etiquetas
+
+
+class SnapshotsCola:
+    """Caché de snapshots por vista y espera de cambios de versión."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._esperas = []  # [(loop, asyncio.Event)]
+        queue_engine.motor.al_cambiar(self._notificar)
+
+    @property
+    def version(self) -> int:
+        return queue_engine.motor.version
+
+    def _vigente(self, vista: str) -> Optional[Snapshot]:
+        version = self.version
+        with self._lock:
+            snapshot = self._snapshots.get(vista)
+        return snapshot if snapshot is not None and snapshot.version == version else None
+
+    def obtener(self, db: Session, vista: str, serializar: Callable[[Session], bytes]) -> Snapshot:
+        """
+        Devuelve el snapshot de la vista para la versión actual, serializándolo solo si
+        no existe. La versión se lee antes de calcular: si cambia durante el cálculo,
+        el snapshot queda con la versión anterior y la siguiente petición lo recalcula.
+        """
+        version = self.version
+        snapshot = self._vigente(vista)
+        if snapshot is not None:
+            return snapshot
+        snapshot = Snapshot(vista, version, serializar(db))
+        with self._lock:
+            actual = self._snapshots.get(vista)
+            if actual is None or actual.version <= version:
+                self._snapshots[vista] = snapshot
+        return snapshot
+
+    async def obtener_async(self, vista: str, serializar: Callable[[Session], bytes]) -> Snapshot:
+        """
+        obtener() para los endpoints async: el snapshot vigente sale sin más; si hay que
+        serializar, la consulta y la serialización van en un hilo de en_hilo con su sesión.
+        """
+        snapshot = self._vigente(vista)
+        if snapshot is not None:
+            return snapshot
+        return await en_hilo(self._obtener_con_sesion, vista, serializar)
+
+    def _obtener_con_sesion(self, vista: str, serializar) -> Snapshot:
+        db = SessionLocal()
+        try:
+            return self.obtener(db, vista, serializar)
+        finally:
+            db.close()
+
+    async def esperar_cambio(self, desde_version: int, timeout: float) -> bool:
+        """
+        Espera (sin consultar la BD) a que la versión de la cola supere `desde_version`.
+        Devuelve True si cambió, False si se agotó el tiempo.
+        """
+        # Una versión mayor que la actual viene de antes de un reinicio: responder ya
+        if self.version != desde_version:
+            return True
+        evento = asyncio.Event()
+        entrada = (asyncio.get_running_loop(), evento)
+        with self._lock:
+            self._esperas.append(entrada)
+        try:
+            # Puede haber cambiado entre la primera comprobación y el registro
+            if self.version != desde_version:
+                return True
+            await asyncio.wait_for(evento.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self.version != desde_version
+        finally:
+            with self._lock:
+                self._esperas.remove(entrada)
+
+    def _notificar(self, version: int):
+        with self._lock:
+            esperas = list(self._esperas)
+        for loop, evento in esperas:
+            try:
+                loop.call_soon_threadsafe(evento.set)
+            except RuntimeError:
+                # El loop ya se cerró
+                pass
+
+
+snapshots = SnapshotsCola()
@@ -0,0 +1,303 @@
+"""
+Reloj de reproducción autoritativo del servidor.
+
+Antes la cola solo avanzaba cuando player.html llamaba a /canciones/siguiente, y el
+tiempo de espera suponía que la canción actual empezó en `started_at` sin pausas.
+El reloj lleva, para la canción que suena:
+- posición (descontando los intervalos en pausa) y hora esperada de fin;
+- un único temporizador asyncio para el fin exacto (más un pequeño margen para que el
+  player avance por sí mismo). Si al vencer la canción sigue sonando y no hay player
+  conectado (ningún socket del tema "player" con latido reciente), el servidor avanza la
+  cola. Con player, su aviso de fin manda (la duración de la BD puede no coincidir con la
+  del video) y el servidor solo avanza como respaldo, pasado RELOJ_MARGEN_CON_PLAYER;
+- instantáneas de posición (evento `playback_state`) que se envían en cada cambio para
+  que los clientes interpolen localmente en vez de consultar.
+- precarga: al pasar RELOJ_UMBRAL_PRECARGA de la canción se envía `preload_next` con la
+  siguiente de la cola (y otra vez si la siguiente cambia), para que el player tenga el
+  video listo y el cambio al terminar sea un único `play_song`.
+
+El estado vive en memoria; tras un reinicio se reconstruye desde la BD (sin pausas).
+"""
+import asyncio
+import datetime
+import logging
+import threading
+import time
+from typing import Optional
+
+import config
+import models
+from database import AsyncSessionLocal, SessionLocal, en_hilo
+from timezone_utils import ensure_bogota, now_bogota
+
+logger = logging.getLogger(__name__)
+
+
+class RelojReproduccion:
+    """Máquina de estados de la canción actual: detenido, reproduciendo o en pausa."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._temporizador: Optional[asyncio.TimerHandle] = None
+        self._temporizador_precarga: Optional[asyncio.TimerHandle] = None
+        self._observando_cola = False
+        self._limpiar()
+
+    def _limpiar(self):
+        self.cancion_id: Optional[int] = None
+        self.youtube_id: Optional[str] = None
+        self.duracion = 0
+        self._inicio: Optional[datetime.datetime] = None
+        self._pausado_desde: Optional[datetime.datetime] = None
+        self._pausa_acumulada = 0.0
+        self._umbral_superado = False
+        self._precargada_id: Optional[int] = None
+
+    # --- Ciclo de vida (lifespan) ---
+
+    def activar(self):
+        """Asocia el reloj al event loop actual y programa el fin de la canción en curso."""
+        self._loop = asyncio.get_running_loop()
+        if not self._observando_cola:
+            import queue_engine
+            queue_engine.motor.al_cambiar(self._cola_cambio)
+            self._observando_cola = True
+        db = SessionLocal()
+        try:
+            self.sincronizar(db)
+        finally:
+            db.close()
+        self._reprogramar()
+
+    def desactivar(self):
+        with self._lock:
+            self._cancelar_temporizadores()
+            self._loop = None
+
+    # --- Transiciones ---
+
+    def iniciar(self, cancion: models.Cancion):
+        """La canción empieza a sonar (desde su started_at)."""
+        with self._lock:
+            self._limpiar()
+            self.cancion_id = cancion.id
+            self.youtube_id = cancion.youtube_id
+            self.duracion = cancion.duracion_seconds or 0
+            self._inicio = ensure_bogota(cancion.started_at) if cancion.started_at else now_bogota()
+        self._cambio()
+
+    def terminar(self, cancion_id: Optional[int] = None):
+        """La canción dejó de sonar. Con `cancion_id`, solo si es la que lleva el reloj."""
+        with self._lock:
+            if self.cancion_id is None or (cancion_id is not None and cancion_id != self.cancion_id):
+                return
+            self._limpiar()
+        self._cambio()
+
+    def pausar(self) -> bool:
+        with self._lock:
+            if self.cancion_id is None or self._pausado_desde is not None:
+                return False
+            self._pausado_desde = now_bogota()
+        self._cambio()
+        return True
+
+    def reanudar(self) -> bool:
+        with self._lock:
+            if self.cancion_id is None or self._pausado_desde is None:
+                return False
+            self._pausa_acumulada += (now_bogota() - self._pausado_desde).total_seconds()
+            self._pausado_desde = None
+        self._cambio()
+        return True
+
+    def reiniciar(self) -> bool:
+        """La canción vuelve a empezar (conserva el estado de pausa)."""
+        with self._lock:
+            if self.cancion_id is None:
+                return False
+            ahora = now_bogota()
+            self._inicio = ahora
+            self._pausa_acumulada = 0.0
+            if self._pausado_desde is not None:
+                self._pausado_desde = ahora
+        self._cambio()
+        return True
+
+    def sincronizar(self, db):
+        """Alinea el reloj con la canción 'reproduciendo' de la BD (p. ej. tras un reinicio)."""
+        actual = db.query(models.Cancion).filter(models.Cancion.estado == "reproduciendo").first()
+        with self._lock:
+            if actual is not None and actual.id == self.cancion_id:
+                return
+        if actual is None:
+            self.terminar()
+        else:
+            self.iniciar(actual)
+
+    # --- Consultas ---
+
+    @property
+    def pausado(self) -> bool:
+        return self._pausado_desde is not None
+
+    def posicion(self, ahora: Optional[datetime.datetime] = None) -> float:
+        """Segundos reproducidos de la canción actual, sin contar las pausas."""
+        with self._lock:
+            if self.cancion_id is None:
+                return 0.0
+            referencia = self._pausado_desde or ahora or now_bogota()
+            transcurrido = (referencia - self._inicio).total_seconds() - self._pausa_acumulada
+            return min(max(0.0, transcurrido), float(self.duracion))
+
+    def restante(self, ahora: Optional[datetime.datetime] = None) -> float:
+        with self._lock:
+            if self.cancion_id is None:
+                return 0.0
+            return max(0.0, self.duracion - self.posicion(ahora))
+
+    def restante_de(self, cancion_id: int, ahora: Optional[datetime.datetime] = None) -> Optional[float]:
+        """Restante de `cancion_id` si es la que lleva el reloj; None si no."""
+        with self._lock:
+            if cancion_id is None or cancion_id != self.cancion_id:
+                return None
+            return self.restante(ahora)
+
+    def estado(self) -> dict:
+        """Instantánea para los clientes: interpolan con posicion + (ahora - servidor_ts)."""
+        with self._lock:
+            ahora = now_bogota()
+            fin = None
+            if self.cancion_id is not None and not self.pausado:
+                fin = (ahora + datetime.timedelta(seconds=self.restante(ahora))).isoformat()
+            return {
+                "cancion_id": self.cancion_id,
+                "youtube_id": self.youtube_id,
+                "duracion_seconds": self.duracion,
+                "posicion_seconds": round(self.posicion(ahora), 3),
+                "pausado": self.pausado,
+                "fin_esperado": fin,
+                "servidor_ts": time.time(),
+            }
+
+    # --- Temporizador y notificaciones ---
+
+    def _cambio(self):
+        """Reprograma el temporizador y notifica a los clientes desde el event loop."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._publicar)
+        except RuntimeError:
+            # El loop ya se cerró
+            pass
+
+    def _publicar(self):
+        if self._loop is None:
+            return
+        self._reprogramar()
+        import websocket_manager
+        self._loop.create_task(websocket_manager.manager.broadcast_playback_state(self.estado()))
+
+    def _reprogramar(self):
+        """
+        Debe ejecutarse en el event loop: un temporizador para el fin de la canción y,
+        si aún no se superó, otro para el umbral de precarga.
+        """
+        with self._lock:
+            self._cancelar_temporizadores()
+            if self._loop is None or self.cancion_id is None or self.pausado:
+                return
+            if not self._umbral_superado:
+                faltan = self.duracion * config.settings.RELOJ_UMBRAL_PRECARGA - self.posicion()
+                self._temporizador_precarga = self._loop.call_later(max(0.0, faltan), self._al_umbral, self.cancion_id)
+            if config.settings.RELOJ_AVANCE_AUTOMATICO:
+                espera = self.restante() + config.settings.RELOJ_MARGEN_AVANCE
+                self._temporizador = self._loop.call_later(espera, self._al_vencer, self.cancion_id)
+
+    def _cancelar_temporizadores(self):
+        for nombre in ("_temporizador", "_temporizador_precarga"):
+            temporizador = getattr(self, nombre)
+            if temporizador is not None:
+                temporizador.cancel()
+                setattr(self, nombre, None)
+
+    def _al_umbral(self, cancion_id: int):
+        self._temporizador_precarga = None
+        with self._lock:
+            if cancion_id != self.cancion_id:
+                return
+            self._umbral_superado = True
+        self._loop.create_task(self._precargar_siguiente(cancion_id))
+
+    def _cola_cambio(self, version: int):
+        """Observador de queue_engine: si ya se precargó, la siguiente pudo cambiar."""
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self._umbral_superado:
+            return
+        cancion_id = self.cancion_id
+        try:
+            loop.call_soon_threadsafe(lambda: loop.create_task(self._precargar_siguiente(cancion_id)))
+        except RuntimeError:
+            pass
+
+    async def _precargar_siguiente(self, cancion_id: int):
+        """Envía preload_next con la siguiente de la cola si es distinta de la ya enviada."""
+        import crud
+        import websocket_manager
+
+        def buscar():
+            db = SessionLocal()
+            try:
+                siguiente = crud.get_siguiente_cancion(db)
+                if siguiente is not None:
+                    db.expunge(siguiente)
+                return siguiente
+            finally:
+                db.close()
+
+        try:
+            siguiente = await en_hilo(buscar)
+        except Exception:
+            logger.exception("Error al buscar la canción a precargar")
+            return
+        with self._lock:
+            if cancion_id != self.cancion_id or siguiente is None or siguiente.id == self._precargada_id:
+                return
+            self._precargada_id = siguiente.id
+        await websocket_manager.manager.broadcast_preload_next(siguiente)
+
+    def _al_vencer(self, cancion_id: int, respaldo: bool = False):
+        self._temporizador = None
+        if not respaldo and self._player_conectado():
+            # El player avisará al terminar el video: solo se avanza si no lo hace a tiempo
+            with self._lock:
+                if cancion_id != self.cancion_id:
+                    return
+                espera = max(0.0, config.settings.RELOJ_MARGEN_CON_PLAYER - config.settings.RELOJ_MARGEN_AVANCE)
+                self._temporizador = self._loop.call_later(espera, self._al_vencer, cancion_id, True)
+            return
+        self._loop.create_task(self._avanzar_si_sigue(cancion_id))
+
+    @staticmethod
+    def _player_conectado() -> bool:
+        import websocket_manager
+        return websocket_manager.manager.player_conectado()
+
+    async def _avanzar_si_sigue(self, cancion_id: int):
+        """Avanza la cola si `cancion_id` sigue sonando (el player no lo hizo)."""
+        import crud_async
+        try:
+            async with AsyncSessionLocal() as db:
+                actual = await crud_async.get_cancion_reproduciendo(db)
+                if actual is None or actual.id != cancion_id:
+                    return
+                logger.info("Fin de '%s' sin avance del player; el servidor avanza la cola.", actual.titulo)
+                await crud_async.avanzar_cola_automaticamente()
+        except Exception:
+            logger.exception("Error al avanzar la cola desde el reloj de reproducción")
+
+
+reloj = RelojReproduccion()
@@ -0,0 +1,147 @@
+"""
+Políticas de ordenamiento de la cola de canciones.
+
+Todas las políticas trabajan igual: las canciones del pool (sin orden manual) se
+agrupan por mesa y cada política asigna a cada canción una clave de orden; la cola
+final es la mezcla (heap) de las listas de claves de cada mesa. Así la misma política
+sirve para la ruta SQL (crud) y para la cola residente (queue_engine), que mantiene
+las claves de forma incremental.
+
+Políticas disponibles:
+- cuota_nivel: round-robin por mesa con cupo según consumo (ORO=3, PLATA=2, BRONCE=1).
+- wfq: weighted fair queuing; tiempo virtual de fin = duración acumulada / peso (cupo).
+- fifo: orden de llegada puro, sin agrupar por mesa.
+
+La política activa se guarda en settings.json ("queue_policy") y se puede cambiar en
+tiempo de ejecución.
+"""
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+import settings_storage
+
+UMBRAL_ORO = 150000
+UMBRAL_PLATA = 50000
+
+# Duración asumida para canciones sin duración conocida (solo afecta a WFQ)
+DURACION_NOMINAL = 240
+
+POLITICA_POR_DEFECTO = "cuota_nivel"
+
+
+def cupo_para_mesa(mesa_id: int, total) -> int:
+    """Devuelve el cupo de canciones por turno según el consumo total de la mesa."""
+    # El DJ / Sin Mesa (ID 0) recibe trato de ORO
+    if mesa_id == 0:
+        return 3
+    total = total or 0
+    if total >= UMBRAL_ORO:
+        return 3
+    if total >= UMBRAL_PLATA:
+        return 2
+    return 1
+
+
+class PoliticaCola:
+    """
+    Interfaz de una política. `canciones` es la lista [(turno, duracion_seconds)] de una
+    mesa en orden de llegada; la clave de cada canción termina siempre con su turno.
+    El turno es el ID de la canción salvo que el usuario haya reordenado su lista
+    (orden_cola.mover_en_lista_de_usuario): entonces es el ID de otra canción suya.
+    """
+    nombre = ""
+    # Si es False, quitar una canción no cambia las claves del resto de su mesa
+    depende_de_posicion = True
+
+    def claves(self, canciones: List[Tuple[int, int]], cupo: int) -> List[tuple]:
+        raise NotImplementedError
+
+    def clave_al_final(self, canciones: List[Tuple[int, int]], cupo: int, clave_anterior: Optional[tuple]) -> tuple:
+        """Clave de la última canción de la lista, sabiendo la clave de la penúltima."""
+        return self.claves(canciones, cupo)[-1]
+
+    def ordenar(self, grupos: Dict[int, List[Tuple[int, int]]], cupos: Dict[int, int]) -> List[int]:
+        """Ordena el pool completo: mezcla con heap las claves (ya ordenadas) de cada mesa."""
+        listas = [self.claves(canciones, cupos.get(mesa_id, 1)) for mesa_id, canciones in grupos.items() if canciones]
+        return [clave[-1] for clave in heapq.merge(*listas)]
+
+
+class CuotaPorNivel(PoliticaCola):
+    """
+    Cola Justa original: se recorren las mesas por orden de llegada de su primera
+    canción y cada una toma `cupo` canciones por turno.
+    Clave: (ronda, llegada_mesa, indice, id).
+    """
+    nombre = "cuota_nivel"
+
+    def claves(self, canciones, cupo):
+        if not canciones:
+            return []
+        llegada = canciones[0][0]
+        return [(indice // cupo, llegada, indice, cid) for indice, (cid, _) in enumerate(canciones)]
+
+    def clave_al_final(self, canciones, cupo, clave_anterior):
+        indice = len(canciones) - 1
+        return (indice // cupo, canciones[0][0], indice, canciones[-1][0])
+
+
+class WeightedFairQueuing(PoliticaCola):
+    """
+    WFQ: cada canción termina en el tiempo virtual F = F_anterior + duración / peso,
+    con peso = cupo de la mesa. Las mesas con más consumo avanzan más lento en tiempo
+    virtual y por lo tanto cantan más seguido, proporcional a la duración de sus canciones.
+    Clave: (F, llegada_mesa, id).
+    """
+    nombre = "wfq"
+
+    def claves(self, canciones, cupo):
+        if not canciones:
+            return []
+        llegada = canciones[0][0]
+        resultado = []
+        fin = 0.0
+        for cid, duracion in canciones:
+            fin += (duracion or DURACION_NOMINAL) / cupo
+            resultado.append((fin, llegada, cid))
+        return resultado
+
+    def clave_al_final(self, canciones, cupo, clave_anterior):
+        cid, duracion = canciones[-1]
+        previo = clave_anterior[0] if clave_anterior is not None else 0.0
+        return (previo + (duracion or DURACION_NOMINAL) / cupo, canciones[0][0], cid)
+
+
+class Fifo(PoliticaCola):
+    """Orden de llegada puro. La más barata: no depende de mesas ni consumos."""
+    nombre = "fifo"
+    depende_de_posicion = False
+
+    def claves(self, canciones, cupo):
+        return [(cid,) for cid, _ in canciones]
+
+    def clave_al_final(self, canciones, cupo, clave_anterior):
+        return (canciones[-1][0],)
+
+
+POLITICAS = {p.nombre: p for p in (CuotaPorNivel(), WeightedFairQueuing(), Fifo())}
+
+_politica_actual: Optional[PoliticaCola] = None
+
+
+def politica_actual() -> PoliticaCola:
+    """Devuelve la política activa (leída de settings.json solo la primera vez)."""
+    global _politica_actual
+    if _politica_actual is None:
+        nombre = settings_storage.get_setting("queue_policy", POLITICA_POR_DEFECTO)
+        _politica_actual = POLITICAS.get(nombre, POLITICAS[POLITICA_POR_DEFECTO])
+    return _politica_actual
+
+
+def set_politica(nombre: str) -> PoliticaCola:
+    """Cambia la política activa y la persiste. Lanza ValueError si no existe."""
+    global _politica_actual
+    if nombre not in POLITICAS:
+        raise ValueError(f"Política de cola desconocida: {nombre}")
+    settings_storage.set_setting("queue_policy", nombre)
+    _politica_actual = POLITICAS[nombre]
+    return _politica_actual
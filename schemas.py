@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
+from typing import Dict, List, Optional
 from decimal import Decimal
 from datetime import datetime
 
@@ -162,12 +162,49 @@ class ColaViewExtended(BaseModel):
     pending: List[CancionAdminView] = []  # Canciones pendientes de aprobación manual
 
 
+# --- Schema para los tiempos de espera por usuario / mesa ---
+class TiempoEsperaCancion(BaseModel):
+    cancion_id: int
+    titulo: str
+    usuario_id: int
+    posicion: int  # 1 = la siguiente en sonar
+    tiempo_espera_segundos: int
+
+
 # --- Schema para la respuesta de "siguiente canción" ---
 class PlayNextResponse(BaseModel):
     play_url: str
     cancion: CancionAdminView
 
 
+class CapacidadMesa(BaseModel):
+    mesa_id: int
+    cupo: int
+    encolado_segundos: int
+    cuota_segundos: int
+    capacidad_segundos: int
+
+
+class CapacidadCola(BaseModel):
+    tiempo_hasta_cierre_segundos: int
+    restante_actual_segundos: int
+    aprobado_segundos: int
+    lazy_segundos: int
+    proyectado_segundos: int
+    holgura_segundos: int
+    mesas: List[CapacidadMesa]
+
+
+class EstadoReproduccion(BaseModel):
+    cancion_id: Optional[int] = None
+    youtube_id: Optional[str] = None
+    duracion_seconds: int = 0
+    posicion_seconds: float = 0
+    pausado: bool = False
+    fin_esperado: Optional[datetime] = None
+    servidor_ts: float
+
+
 # --- Schema para ConfiguracionGlobal ---
 class ConfiguracionGlobalBase(BaseModel):
     clave: str
@@ -446,4 +483,31 @@ class CuentaInfo(BaseModel):
     is_active: bool
     created_at: datetime
     closed_at: Optional[datetime] = None
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+# --- Schemas para estadísticas de WebSocket ---
+class ConexionWebSocketStats(BaseModel):
+    id: int
+    temas: List[str]
+    delta: bool
+    codificacion: str
+    conectado_hace: float  # segundos
+    inactivo: float  # segundos desde el último mensaje del cliente
+    rtt_ms: Optional[float] = None
+    cola: int  # mensajes pendientes de envío
+    mensajes: int
+    bytes: int
+    descartados: int
+    latencia_media_ms: float
+    latencia_max_ms: float
+
+class EstadisticasWebSocket(BaseModel):
+    nodo: str
+    seq: int
+    conexiones: int
+    por_tema: Dict[str, int]
+    cerradas_por_inactividad: int
+    mensajes: int
+    bytes: int
+    cola_total: int
+    detalle: List[ConexionWebSocketStats]
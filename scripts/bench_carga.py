@@ -0,0 +1,190 @@
+"""
+Prueba de carga: latencia de /salud y de entrega por WebSocket mientras corren informes pesados.
+
+Levanta la app con uvicorn (en otro proceso, sobre una base de datos temporal con --consumos
+consumos y --canciones canciones) y mide en dos fases de --duracion segundos:
+- reposo: solo las sondas;
+- informes: además, --informes clientes pidiendo sin pausa informes de admin pesados.
+
+Sondas:
+- /salud cada 10 ms (p50 / p99 / máximo);
+- entrega WS: un pedido (POST /api/v1/consumos/pedir, endpoint async con sesión async)
+  hasta que el queue_update que provoca llega a un cliente de /ws/cola (WS_VENTANA_COLA=0).
+
+Los informes (endpoints síncronos, en el pool de hilos de anyio) compiten por la CPU con
+el event loop, pero ya no lo bloquean: los endpoints async usan la sesión async y el
+código síncrono que toca la cola va en el pool propio de database.en_hilo. Con pocos
+núcleos el p99 sube por el reparto de CPU/GIL; el efecto de DB_HILOS se ve variándolo
+por variable de entorno.
+
+Uso: python scripts/bench_carga.py [--duracion 10] [--informes 8] [--consumos 20000] [--canciones 3000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import subprocess
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+INFORMES = (
+    "/api/v1/admin/reports/table-consumption-summaries",
+    "/api/v1/admin/reports/income-by-table",
+    "/api/v1/admin/reports/top-products",
+    "/api/v1/admin/reports/hourly-activity",
+    "/api/v1/admin/reports/songs-by-user",
+)
+CABECERAS_ADMIN = {"X-API-Key": "zxc12345"}
+
+
+def preparar_entorno():
+    """La app usa ./karaoke.db y ./static: se ejecuta en un directorio temporal."""
+    directorio = tempfile.mkdtemp(prefix="bench_carga_")
+    os.symlink(os.path.join(PROJECT_ROOT, "static"), os.path.join(directorio, "static"))
+    os.chdir(directorio)
+    os.environ.setdefault("WS_VENTANA_COLA", "0")
+    os.environ.setdefault("PLANIFICADOR_ACTIVO", "0")
+    return directorio
+
+
+def sembrar(n_consumos: int, n_canciones: int, n_mesas: int = 40):
+    import models
+    from database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    rnd = random.Random(7)
+    db = SessionLocal()
+    mesas = [models.Mesa(nombre=f"Mesa {i}", qr_code=f"mesa-{i}") for i in range(n_mesas)]
+    productos = [models.Producto(nombre=f"Producto {i}", categoria=f"Cat {i % 6}", valor=5 + i, stock=10**6)
+                 for i in range(30)]
+    db.add_all(mesas + productos)
+    db.commit()
+    usuarios = [models.Usuario(nick=f"u{i}", mesa_id=mesas[i % n_mesas].id) for i in range(n_mesas * 5)]
+    db.add_all(usuarios)
+    db.commit()
+    db.add_all(
+        models.Consumo(producto_id=rnd.choice(productos).id, cantidad=1, valor_total=10,
+                       mesa_id=u.mesa_id, usuario_id=u.id)
+        for u in (rnd.choice(usuarios) for _ in range(n_consumos))
+    )
+    estados = ("cantada",) * 8 + ("aprobado", "pendiente")
+    db.add_all(
+        models.Cancion(titulo=f"Canción {i}", youtube_id=f"yt{i}", usuario_id=rnd.choice(usuarios).id,
+                       estado=rnd.choice(estados), duracion_seconds=rnd.randint(120, 400))
+        for i in range(n_canciones)
+    )
+    db.commit()
+    usuario_id, producto_id = usuarios[0].id, productos[0].id
+    db.close()
+    return usuario_id, producto_id
+
+
+def arrancar_servidor(puerto: int):
+    """uvicorn en otro proceso: el cliente de la prueba no comparte el GIL con el servidor."""
+    import httpx
+
+    entorno = dict(os.environ, PYTHONPATH=PROJECT_ROOT)
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(puerto), "--log-level", "warning"],
+        env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{puerto}/salud")
+            return proceso
+        except httpx.TransportError:
+            time.sleep(0.05)
+    proceso.terminate()
+    raise RuntimeError("El servidor no arrancó")
+
+
+def resumen(muestras):
+    if not muestras:
+        return "sin muestras"
+    ordenadas = sorted(muestras)
+    p99 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.99))]
+    return (f"n={len(ordenadas):>5}  p50={statistics.median(ordenadas) * 1000:7.2f} ms  "
+            f"p99={p99 * 1000:7.2f} ms  max={ordenadas[-1] * 1000:7.2f} ms")
+
+
+async def fase(base: str, duracion: float, n_informes: int, usuario_id: int, producto_id: int):
+    import httpx
+    import websockets
+
+    salud, entregas, informes = [], [], [0]
+    fin = time.monotonic() + duracion
+    llegada = asyncio.Event()
+
+    async with httpx.AsyncClient(base_url=base, timeout=60) as client, \
+            websockets.connect(base.replace("http", "ws") + "/ws/cola?topics=queue") as ws:
+
+        async def leer_ws():
+            async for mensaje in ws:
+                if json.loads(mensaje).get("type") == "queue_update":
+                    llegada.set()
+
+        async def sonda_salud():
+            while time.monotonic() < fin:
+                inicio = time.perf_counter()
+                await client.get("/salud")
+                salud.append(time.perf_counter() - inicio)
+                await asyncio.sleep(0.01)
+
+        async def sonda_ws():
+            while time.monotonic() < fin:
+                llegada.clear()
+                inicio = time.perf_counter()
+                await client.post(f"/api/v1/consumos/pedir/{usuario_id}", json={"producto_id": producto_id, "cantidad": 1})
+                try:
+                    await asyncio.wait_for(llegada.wait(), timeout=10)
+                    entregas.append(time.perf_counter() - inicio)
+                except asyncio.TimeoutError:
+                    pass
+                await asyncio.sleep(0.05)
+
+        async def informe(indice: int):
+            while time.monotonic() < fin:
+                await client.get(INFORMES[indice % len(INFORMES)], headers=CABECERAS_ADMIN)
+                informes[0] += 1
+                indice += 1
+
+        lector = asyncio.create_task(leer_ws())
+        await asyncio.gather(sonda_salud(), sonda_ws(), *(informe(i) for i in range(n_informes)))
+        lector.cancel()
+    return salud, entregas, informes[0] / duracion
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duracion", type=float, default=10, help="segundos por fase")
+    parser.add_argument("--informes", type=int, default=8, help="clientes pidiendo informes en paralelo")
+    parser.add_argument("--consumos", type=int, default=20000)
+    parser.add_argument("--canciones", type=int, default=3000)
+    parser.add_argument("--puerto", type=int, default=8765)
+    args = parser.parse_args()
+
+    directorio = preparar_entorno()
+    print(f"Sembrando {args.consumos} consumos y {args.canciones} canciones en {directorio}...")
+    usuario_id, producto_id = sembrar(args.consumos, args.canciones)
+    servidor = arrancar_servidor(args.puerto)
+    base = f"http://127.0.0.1:{args.puerto}"
+    try:
+        for nombre, n_informes in (("reposo", 0), ("informes", args.informes)):
+            salud, entregas, ritmo = asyncio.run(fase(base, args.duracion, n_informes, usuario_id, producto_id))
+            print(f"\n[{nombre}] {n_informes} clientes de informes, {ritmo:.1f} informes/s")
+            print(f"  /salud       {resumen(salud)}")
+            print(f"  entrega WS   {resumen(entregas)}")
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark de las codificaciones WebSocket (codificacion.py) con una cola de 200 canciones.
+
+Para cada codificación disponible mide:
+- el tiempo de codificar un queue_update (media de --repeticiones);
+- los bytes en el cable sin comprimir y comprimidos con deflate, como haría
+  permessage-deflate (zlib con ventana raw de 15 bits, sin contexto previo);
+- el tiempo de codificar el mismo evento para --clientes conexiones: antes una vez por
+  cliente, ahora una vez por codificación gracias al caché de Evento.
+
+Uso: python scripts/bench_codificacion.py [--canciones 200] [--repeticiones 500] [--clientes 300]
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+import zlib
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import codificacion
+from codificacion import Evento
+
+
+def crear_cola(n: int) -> dict:
+    inicio = datetime.datetime(2024, 5, 1, 21, 0)
+
+    def cancion(i, estado):
+        return {"id": i, "titulo": f"Canción número {i} - Artista {i % 37}", "youtube_id": f"yt{i:09d}",
+                "estado": estado, "duracion_seconds": 180 + i % 120, "puntuacion_ia": None,
+                "created_at": inicio + datetime.timedelta(minutes=i),
+                "usuario": {"id": i % 25, "nick": f"usuario{i % 25}", "puntos": i * 3,
+                            "mesa": {"id": i % 12, "nombre": f"Mesa {i % 12}", "qr_code": f"mesa-{i % 12}"}}}
+
+    return {"type": "queue_update", "payload": {
+        "now_playing": cancion(0, "reproduciendo"),
+        "upcoming": [cancion(i, "aprobado") for i in range(1, n + 1)],
+        "pending": [],
+    }}
+
+
+def deflate(datos: bytes) -> int:
+    compresor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return len(compresor.compress(datos) + compresor.flush(zlib.Z_SYNC_FLUSH))
+
+
+def medir(cola: dict, cod: str, repeticiones: int, clientes: int):
+    codificado = codificacion.codificar(cola, cod)
+    binario = codificado if isinstance(codificado, bytes) else codificado.encode()
+
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        codificacion.codificar(cola, cod)
+    por_evento = (time.perf_counter() - inicio) / repeticiones
+
+    inicio = time.perf_counter()
+    for _ in range(clientes):
+        codificacion.codificar(cola, cod)
+    por_cliente = time.perf_counter() - inicio
+
+    evento = Evento(cola)
+    inicio = time.perf_counter()
+    for _ in range(clientes):
+        evento.codificado(cod)
+    compartido = time.perf_counter() - inicio
+    return por_evento, len(binario), deflate(binario), por_cliente, compartido
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--canciones", type=int, default=200)
+    parser.add_argument("--repeticiones", type=int, default=500)
+    parser.add_argument("--clientes", type=int, default=300)
+    args = parser.parse_args()
+    cola = crear_cola(args.canciones)
+
+    print(f"{'codificación':<13} {'codificar (ms)':>14} {'bytes':>8} {'deflate':>8} "
+          f"{'x' + str(args.clientes) + ' antes (ms)':>17} {'x' + str(args.clientes) + ' ahora (ms)':>17}")
+    for cod in codificacion.CODIFICACIONES:
+        if not codificacion.disponible(cod):
+            print(f"{cod:<13} (no instalado)")
+            continue
+        por_evento, crudo, comprimido, por_cliente, compartido = medir(cola, cod, args.repeticiones, args.clientes)
+        print(f"{cod:<13} {por_evento * 1000:>14.3f} {crudo:>8} {comprimido:>8} "
+              f"{por_cliente * 1000:>17.2f} {compartido * 1000:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark de escrituras concurrentes: pedidos por segundo antes y después del perfil de
+producción de SQLite y del escritor único (escritor.py).
+
+Con --hilos hilos haciendo --pedidos pedidos cada uno (crud.create_consumo_para_usuario,
+como POST /api/v1/consumos/pedir) compara, cada escenario sobre una base de datos nueva:
+- basico + sesiones: journal por defecto, synchronous=FULL, una sesión y un commit por
+  pedido (lo de antes);
+- WAL + sesiones: perfil "produccion", una sesión y un commit por pedido;
+- WAL + escritor: perfil "produccion" y los pedidos encolados al escritor único, que los
+  confirma en lotes (un commit y un fsync por lote).
+
+Muestra pedidos/s, latencia p50/p99 por pedido y los errores ("database is locked").
+
+Uso: python scripts/bench_escritura.py [--hilos 16] [--pedidos 50]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from sqlalchemy.orm import sessionmaker
+
+import crud, models, schemas
+from database import SesionBD, crear_engine
+from escritor import EscritorBD, crear_engine_escritor
+
+
+def sembrar(engine, n_mesas: int = 20):
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, class_=SesionBD)()
+    mesas = [models.Mesa(nombre=f"Mesa {i}", qr_code=f"mesa-{i}") for i in range(n_mesas)]
+    productos = [models.Producto(nombre=f"Producto {i}", categoria="Bebidas", valor=5 + i, stock=10**7) for i in range(10)]
+    db.add_all(mesas + productos)
+    db.commit()
+    usuarios = [models.Usuario(nick=f"u{i}", mesa_id=mesas[i % n_mesas].id) for i in range(n_mesas * 5)]
+    db.add_all(usuarios)
+    db.commit()
+    ids = [u.id for u in usuarios], [p.id for p in productos]
+    db.close()
+    return ids
+
+
+def medir(nombre: str, hilos: int, pedidos: int):
+    directorio = tempfile.mkdtemp(prefix="bench_escritura_")
+    url = f"sqlite:///{os.path.join(directorio, 'karaoke.db')}"
+    perfil = "basico" if nombre.startswith("basico") else "produccion"
+    engine = crear_engine(url, perfil, pool_size=hilos, max_overflow=0)
+    usuarios, productos = sembrar(engine)
+    sesiones = sessionmaker(bind=engine, class_=SesionBD, autoflush=False)
+    escritor = EscritorBD(crear_engine_escritor(url, perfil)) if nombre.endswith("escritor") else None
+
+    latencias, errores = [], []
+    lock = threading.Lock()
+
+    def pedir(db, usuario_id, producto_id):
+        consumo = schemas.ConsumoCreate(producto_id=producto_id, cantidad=1)
+        return crud.create_consumo_para_usuario(db, consumo=consumo, usuario_id=usuario_id)
+
+    def trabajador(semilla: int):
+        rnd = random.Random(semilla)
+        for _ in range(pedidos):
+            argumentos = (rnd.choice(usuarios), rnd.choice(productos))
+            inicio = time.perf_counter()
+            try:
+                if escritor is not None:
+                    escritor.ejecutar(pedir, *argumentos)
+                else:
+                    db = sesiones()
+                    try:
+                        pedir(db, *argumentos)
+                    finally:
+                        db.close()
+                with lock:
+                    latencias.append(time.perf_counter() - inicio)
+            except Exception as e:
+                with lock:
+                    errores.append(type(e).__name__)
+
+    inicio = time.perf_counter()
+    trabajadores = [threading.Thread(target=trabajador, args=(i,)) for i in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    total = time.perf_counter() - inicio
+    lotes = f"{escritor.unidades / max(escritor.lotes, 1):.1f}" if escritor is not None else "-"
+    if escritor is not None:
+        escritor.detener()
+    engine.dispose()
+    latencias.sort()
+    p99 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))] if latencias else 0.0
+    p50 = statistics.median(latencias) if latencias else 0.0
+    return len(latencias) / total, p50, p99, len(errores), lotes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--pedidos", type=int, default=50, help="pedidos por hilo")
+    args = parser.parse_args()
+
+    print(f"{'escenario':<18} {'pedidos/s':>10} {'p50 (ms)':>9} {'p99 (ms)':>9} {'errores':>8} {'pedidos/lote':>13}")
+    for nombre in ("basico + sesiones", "WAL + sesiones", "WAL + escritor"):
+        ritmo, p50, p99, errores, lotes = medir(nombre, args.hilos, args.pedidos)
+        print(f"{nombre:<18} {ritmo:>10.1f} {p50 * 1000:>9.2f} {p99 * 1000:>9.2f} {errores:>8} {lotes:>13}")
+
+
+if __name__ == "__main__":
+    main()
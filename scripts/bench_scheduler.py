@@ -0,0 +1,68 @@
+"""
+Micro-benchmark de las políticas de cola (scheduler).
+
+Mide, para colas de 1.000 y 10.000 canciones repartidas entre mesas:
+- ordenar: cálculo completo del pool (lo que hace la ruta SQL en cada lectura).
+- agregar: coste medio de añadir una canción a la cola residente (queue_engine).
+
+Uso: python scripts/bench_scheduler.py [--mesas 40] [--repeticiones 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import scheduler
+from queue_engine import _ColaEstado
+
+
+def generar(n_canciones: int, n_mesas: int, semilla: int = 42):
+    """Devuelve [(id, mesa_id, duracion)] y los cupos por mesa."""
+    rnd = random.Random(semilla)
+    canciones = [(cid, rnd.randint(1, n_mesas), rnd.randint(120, 420)) for cid in range(1, n_canciones + 1)]
+    cupos = {mid: rnd.choice((1, 1, 1, 2, 3)) for mid in range(1, n_mesas + 1)}
+    return canciones, cupos
+
+
+def medir_ordenar(politica, canciones, cupos, repeticiones: int) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        grupos = {}
+        for cid, mid, dur in canciones:
+            grupos.setdefault(mid, []).append((cid, dur))
+        politica.ordenar(grupos, cupos)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def medir_agregar(politica, canciones, cupos) -> float:
+    cola = _ColaEstado(politica)
+    inicio = time.perf_counter()
+    for cid, mid, dur in canciones:
+        cola.agregar(cid, mid, None, dur, cupos[mid])
+    return (time.perf_counter() - inicio) / len(canciones)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mesas", type=int, default=40)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'política':<12} {'canciones':>9} {'ordenar (ms)':>13} {'agregar (µs)':>13}")
+    for n in (1_000, 10_000):
+        canciones, cupos = generar(n, args.mesas)
+        for nombre, politica in scheduler.POLITICAS.items():
+            t_ordenar = medir_ordenar(politica, canciones, cupos, args.repeticiones)
+            t_agregar = medir_agregar(politica, canciones, cupos)
+            print(f"{nombre:<12} {n:>9} {t_ordenar * 1000:>13.2f} {t_agregar * 1e6:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark del fan-out de WebSocket con clientes lentos.
+
+Simula cientos de clientes (la mayoría rápidos y una fracción lentos que tardan en
+aceptar cada envío) y compara:
+- secuencial: el broadcast anterior, un `await send_text` tras otro;
+- colas: ConnectionManager._broadcast, que solo encola y deja el envío a la tarea
+  escritora de cada conexión.
+
+Para cada uno mide cuánto tarda el broadcast en volver y cuánto tardan en recibir el
+mensaje todos los clientes rápidos. Con colas ambos tiempos no dependen del más lento.
+
+Uso: python scripts/bench_websocket.py [--clientes 300] [--lentos 0.1] [--retardo 0.5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import config
+from websocket_manager import ConnectionManager
+
+
+class ClienteSimulado:
+    def __init__(self, retardo: float):
+        self.retardo = retardo
+        self.recibido = None
+
+    async def send_text(self, mensaje: str):
+        if self.retardo:
+            await asyncio.sleep(self.retardo)
+        self.recibido = time.perf_counter()
+
+    async def close(self):
+        pass
+
+
+def crear_clientes(n: int, fraccion_lentos: float, retardo: float):
+    n_lentos = int(n * fraccion_lentos)
+    lentos = [ClienteSimulado(retardo) for _ in range(n_lentos)]
+    rapidos = [ClienteSimulado(0.0) for _ in range(n - n_lentos)]
+    # Los lentos se intercalan al principio: el peor caso para el envío secuencial
+    return lentos + rapidos, rapidos
+
+
+async def broadcast_secuencial(clientes, mensaje: str):
+    for cliente in clientes:
+        try:
+            await cliente.send_text(mensaje)
+        except Exception:
+            pass
+
+
+async def medir(nombre: str, n: int, fraccion_lentos: float, retardo: float):
+    clientes, rapidos = crear_clientes(n, fraccion_lentos, retardo)
+    mensaje = '{"type": "queue_update", "payload": {}}'
+    manager = ConnectionManager()
+    if nombre != "secuencial":
+        for cliente in clientes:
+            manager.registrar(cliente)
+    inicio = time.perf_counter()
+    if nombre == "secuencial":
+        await broadcast_secuencial(clientes, mensaje)
+    else:
+        await manager._broadcast(mensaje, clave="queue_update")
+    vuelta = time.perf_counter() - inicio
+    while any(c.recibido is None for c in rapidos):
+        await asyncio.sleep(0.001)
+    entrega = max(c.recibido for c in rapidos) - inicio
+    if nombre != "secuencial":
+        for cliente in clientes:
+            manager.disconnect(cliente)
+    return vuelta, entrega
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", type=int, default=300)
+    parser.add_argument("--lentos", type=float, default=0.1, help="fracción de clientes lentos")
+    parser.add_argument("--retardo", type=float, default=0.5, help="segundos que tarda cada envío a un lento")
+    args = parser.parse_args()
+    # El timeout de envío no debe cortar a los lentos durante la medición
+    config.settings.WS_TIMEOUT_ENVIO = args.retardo * 10
+
+    print(f"{'fan-out':<12} {'clientes':>8} {'lentos':>7} {'broadcast (ms)':>15} {'rápidos (ms)':>13}")
+    for n in (100, args.clientes):
+        for nombre in ("secuencial", "colas"):
+            vuelta, entrega = asyncio.run(medir(nombre, n, args.lentos, args.retardo))
+            print(f"{nombre:<12} {n:>8} {int(n * args.lentos):>7} {vuelta * 1000:>15.2f} {entrega * 1000:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,8 @@ DEFAULT_SETTINGS = {
     "closing_minute": 0,
     "app_name": "QR Karaoke",
     "theme": "dark",
-    "enable_notifications": True
+    "enable_notifications": True,
+    "queue_policy": "cuota_nivel"
 }
 
 def load_settings():
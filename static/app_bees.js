@@ -169,6 +169,11 @@ function renderMyList(songs) {
     myListContainer.innerHTML = songs.map(song => createSongItemHTML(song, true)).join('');
 }
 
+function formatWait(segundos) {
+    const minutos = Math.max(0, Math.round(segundos / 60));
+    return minutos < 1 ? 'menos de 1 min' : `${minutos} min`;
+}
+
 function showNotification(message, type = 'success', duration = 3000) {
     notificationBanner.textContent = message;
     notificationBanner.classList.remove('success', 'error');
@@ -184,14 +189,50 @@ function showNotification(message, type = 'success', duration = 3000) {
 // WEBSOCKET
 // ============================================
 
+// Temas de este usuario y su mesa (avisos personales, pedidos)
+function userTopics() {
+    const topics = [];
+    if (state.user && state.user.id) topics.push(`user:${state.user.id}`);
+    if (state.user && state.user.mesa && state.user.mesa.id) topics.push(`mesa:${state.user.mesa.id}`);
+    return topics;
+}
+
+// El usuario o su mesa pueden conocerse después de abrir el socket (login, perfil):
+// suscribirse sin reconectar. Repetir una suscripción no tiene efecto en el servidor.
+function subscribeUserTopics() {
+    const topics = userTopics();
+    if (topics.length && state.websocket && state.websocket.readyState === WebSocket.OPEN) {
+        state.websocket.send(JSON.stringify({ type: 'subscribe', topics }));
+    }
+}
+
 function connectWebSocket() {
-    state.websocket = new WebSocket(WEBSOCKET_URL);
+    // Solo los eventos de la cola, las reacciones y los de este usuario y su mesa
+    const topics = ['queue', 'reactions', ...userTopics()];
+    // Con last_seq el servidor reenvía solo los eventos perdidos mientras estuvo desconectado
+    const lastSeq = state.lastSeq !== undefined && state.lastSeq !== null ? `&last_seq=${state.lastSeq}&nodo=${state.lastNodo}` : '';
+    state.websocket = new WebSocket(`${WEBSOCKET_URL}?topics=${topics.join(',')}${lastSeq}`);
+
+    // Lo que se supo del usuario mientras el socket se abría
+    state.websocket.onopen = subscribeUserTopics;
 
     state.websocket.onmessage = (event) => {
         const data = JSON.parse(event.data);
+        if (typeof data.seq === 'number') {
+            state.lastSeq = data.seq;
+        }
+        // Latido del servidor: sin respuesta la conexión se cierra
+        if (data.type === 'ping') {
+            state.websocket.send(JSON.stringify({ type: 'pong' }));
+            return;
+        }
 
         if (data.type) {
-            if (data.type === 'notification' || data.type === 'admin_notification') {
+            if (data.type === 'session') {
+                // Otro worker: su secuencia no se compara con la anterior
+                state.lastSeq = data.payload.nodo === state.lastNodo ? Math.max(state.lastSeq || 0, data.payload.seq) : data.payload.seq;
+                state.lastNodo = data.payload.nodo;
+            } else if (data.type === 'notification' || data.type === 'admin_notification') {
                 showNotification(data.payload.mensaje);
             } else if (data.type === 'product_update') {
                 fetchProducts();
@@ -204,14 +245,29 @@ function connectWebSocket() {
             } else if (data.type === 'reaction') {
                 const reactionPayload = data.payload;
                 if (reactionPayload && reactionPayload.reaction) {
-                    const emoji = document.createElement('div');
-                    emoji.className = 'reaction-emoji';
-                    emoji.textContent = reactionPayload.reaction;
-                    emoji.style.left = `${Math.random() * 90 + 5}%`;
-                    emoji.style.setProperty('--tx', `${(Math.random() - 0.5) * 100}px`);
-                    document.getElementById('reaction-container').appendChild(emoji);
-                    setTimeout(() => emoji.remove(), 5000);
+                    // Frame agregado: { counts: {emoji: n} }; se muestran hasta 10 emojis por frame
+                    const counts = reactionPayload.counts || { [reactionPayload.reaction]: 1 };
+                    Object.entries(counts).flatMap(([e, n]) => Array(n).fill(e)).slice(0, 10).forEach((texto) => {
+                        const emoji = document.createElement('div');
+                        emoji.className = 'reaction-emoji';
+                        emoji.textContent = texto;
+                        emoji.style.left = `${Math.random() * 90 + 5}%`;
+                        emoji.style.setProperty('--tx', `${(Math.random() - 0.5) * 100}px`);
+                        document.getElementById('reaction-container').appendChild(emoji);
+                        setTimeout(() => emoji.remove(), 5000);
+                    });
                 }
+            } else if (data.type === 'song_approved') {
+                // Avisos personales (tema user:{id}): sin consultar /lista ni /tiempo-espera
+                showNotification(`'${data.payload.titulo}' fue aprobada. Turno ${data.payload.posicion}, ~${formatWait(data.payload.tiempo_espera_segundos)}.`, 'success', 5000);
+                fetchMyList();
+            } else if (data.type === 'up_next') {
+                showNotification(`¡Prepárate! '${data.payload.titulo}' es la siguiente (~${formatWait(data.payload.tiempo_espera_segundos)}).`, 'success', 8000);
+            } else if (data.type === 'eta_update') {
+                showNotification(`'${data.payload.titulo}': ahora en turno ${data.payload.posicion}, ~${formatWait(data.payload.tiempo_espera_segundos)}.`, 'success', 5000);
+            } else if (data.type === 'order_dispatched') {
+                showNotification(`Tu pedido${data.payload.producto ? ` de ${data.payload.producto}` : ''} va en camino.`, 'success', 5000);
+                fetchTableAccountStatus();
             } else if (data.type === 'update_account') {
                 if (state.user && state.user.mesa && data.mesa_id === state.user.mesa.id) {
                     fetchTableAccountStatus();
@@ -260,6 +316,7 @@ async function performConnect(nick) {
         state.user = data;
         sessionStorage.setItem('karaokeUser', JSON.stringify(state.user));
         sessionStorage.setItem('karaokeTable', state.tableQrCode);
+        subscribeUserTopics();
 
         await fetchUserProfile();
         showDashboard();
@@ -720,6 +777,8 @@ async function fetchUserProfile() {
         }
 
         sessionStorage.setItem('karaokeUser', JSON.stringify(state.user));
+        // La mesa puede llegar después de conectar el WebSocket: suscribirse a sus eventos
+        subscribeUserTopics();
         updateProfileCard();
     } catch (error) {
         console.error('Error al actualizar el perfil:', error);
@@ -789,11 +848,15 @@ async function handleSendReaction(event) {
         sender: state.user ? state.user.nick : "Anónimo"
     };
     try {
-        await fetch(`${API_BASE_URL}/broadcast/reaction`, {
+        const response = await fetch(`${API_BASE_URL}/broadcast/reaction`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(payload)
         });
+        if (response.status === 429) {
+            showNotification('Demasiadas reacciones, espera un momento.', 'error', 1500);
+            return;
+        }
         showNotification('¡Reacción enviada!', 'success', 1500);
     } catch (error) {
         console.error("Error enviando reacción:", error);
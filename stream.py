@@ -0,0 +1,126 @@
+"""
+Server-Sent Events para pantallas de solo lectura (TV, "now playing", player).
+
+Cada stream es un cliente más del ConnectionManager: mismos temas, misma secuencia,
+mismo historial y mismo broker entre workers que /ws/cola, sin bucle de recepción ni
+latido de ida y vuelta. Los eventos se codifican una vez en formato SSE
+("id: {nodo}.{seq}" + "data: {json}", el mismo JSON que por WebSocket).
+
+Reanudación: el navegador reenvía el último id en la cabecera Last-Event-ID (o
+?last_event_id= al abrir el EventSource) y recibe solo lo que se perdió; si el hueco
+supera el historial o el id es de otro worker, recibe el estado actual.
+
+Detrás de un proxy: Cache-Control: no-cache, no-transform (ni caché ni compresión que
+retenga el stream), X-Accel-Buffering: no (nginx) y un comentario ": ping" cada
+WS_INTERVALO_PING segundos para que no se cierre por inactividad.
+"""
+import asyncio
+from typing import Iterable, Optional, Tuple
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+import websocket_manager
+from codificacion import SSE
+from reproduccion import reloj
+
+router = APIRouter()
+
+CABECERAS = {
+    "Cache-Control": "no-cache, no-transform",
+    "X-Accel-Buffering": "no",
+}
+
+# Milisegundos que espera el navegador antes de reconectar
+REINTENTO_MS = 3000
+
+
+class ClienteSSE:
+    """
+    Hace de WebSocket para el manager: cada envío espera a que el stream lo entregue,
+    así el timeout de envío y la política con clientes lentos se aplican igual.
+    """
+
+    def __init__(self):
+        self.salida: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self.cerrado = False
+
+    async def send_text(self, mensaje: str):
+        await self.salida.put(mensaje)
+
+    async def close(self):
+        self.cerrado = True
+        try:
+            self.salida.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+
+def _ultimo_id(request: Request) -> Tuple[Optional[int], Optional[str]]:
+    """(seq, nodo) de Last-Event-ID / ?last_event_id=, o (None, None)."""
+    valor = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    if not valor:
+        return None, None
+    nodo, _, seq = valor.rpartition(".")
+    try:
+        return int(seq), nodo or None
+    except ValueError:
+        return None, None
+
+
+def _stream(request: Request, temas: Iterable[str], estado_inicial) -> StreamingResponse:
+    manager = websocket_manager.manager
+    last_seq, nodo = _ultimo_id(request)
+
+    async def eventos():
+        cliente = ClienteSSE()
+        manager.registrar(cliente, temas=temas, codificacion=SSE)
+        repetidos = last_seq is not None and manager.reproducir(cliente, last_seq, nodo)
+        try:
+            yield f"retry: {REINTENTO_MS}\n\n"
+            replay = "ok" if repetidos else ("gap" if last_seq is not None else "none")
+            await manager.send_personal(cliente, {"type": "session", "payload": {
+                "seq": manager.seq, "nodo": manager.nodo, "replay": replay, "encoding": SSE}})
+            if not repetidos:
+                await estado_inicial(cliente)
+            while not cliente.cerrado:
+                mensaje = await cliente.salida.get()
+                if mensaje is None:
+                    break
+                yield mensaje
+        finally:
+            manager.disconnect(cliente)
+
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers=CABECERAS)
+
+
+def _temas(request: Request, por_defecto: Tuple[str, ...]) -> list:
+    pedidos = [t.strip() for t in request.query_params.get("topics", "").split(",") if t.strip()]
+    return pedidos or list(por_defecto)
+
+
+@router.get("/queue", summary="Stream SSE de la cola")
+async def stream_queue(request: Request):
+    """
+    **[Público]** Eventos de la cola (queue_update, song_finished) como Server-Sent Events.
+    Empieza con el estado actual de la cola. `?topics=` añade o cambia los temas.
+    """
+    async def estado_inicial(cliente):
+        manager = websocket_manager.manager
+        await manager.send_personal(cliente, {"type": "queue_update", "payload": await manager._leer_cola()}, clave="queue_update")
+
+    return _stream(request, _temas(request, ("queue",)), estado_inicial)
+
+
+@router.get("/player", summary="Stream SSE del reproductor")
+async def stream_player(request: Request):
+    """
+    **[Público]** Eventos del reproductor (play_song, pausa, playback_state, preload_next)
+    como Server-Sent Events. Empieza con la posición actual (playback_state).
+    """
+    async def estado_inicial(cliente):
+        await websocket_manager.manager.send_personal(
+            cliente, {"type": "playback_state", "payload": reloj.estado()}, clave="playback_state"
+        )
+
+    return _stream(request, _temas(request, ("player",)), estado_inicial)
@@ -0,0 +1,112 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import config, crud, main, models
+from database import SessionLocal, engine
+from timezone_utils import now_bogota
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+def _cierre_en(monkeypatch, minutos):
+    cierre = now_bogota() + datetime.timedelta(minutes=minutos)
+    monkeypatch.setattr(config.settings, "KARAOKE_CIERRE", cierre.strftime("%H:%M"))
+
+
+def _preparar(db):
+    mesas = [models.Mesa(nombre=n, qr_code=n, is_active=True) for n in ("A", "B")]
+    db.add_all(mesas)
+    db.commit()
+    usuarios = [models.Usuario(nick=f"u{m.id}", mesa_id=m.id) for m in mesas]
+    db.add_all(usuarios)
+    db.commit()
+    canciones = [
+        models.Cancion(titulo="A1", youtube_id="a1", usuario_id=usuarios[0].id, estado="aprobado", duracion_seconds=200),
+        models.Cancion(titulo="A2", youtube_id="a2", usuario_id=usuarios[0].id, estado="pendiente_lazy", duracion_seconds=300),
+        models.Cancion(titulo="B1", youtube_id="b1", usuario_id=usuarios[1].id, estado="pendiente_lazy", duracion_seconds=400),
+    ]
+    db.add_all(canciones)
+    db.commit()
+    return mesas, usuarios, canciones
+
+
+def test_totales_incrementales_coinciden_con_sql():
+    db = SessionLocal()
+    mesas, usuarios, canciones = _preparar(db)
+    assert crud.get_duraciones_cola(db, mesas[0].id) == ({"aprobado": 200, "pendiente_lazy": 700}, 500)
+
+    canciones[1].estado = "aprobado"
+    canciones[2].duracion_seconds = 100
+    db.commit()
+    db.delete(canciones[0])
+    db.commit()
+    por_estado, por_mesa = crud._get_duraciones_cola_sql(db)
+    assert crud.get_duraciones_cola(db)[0] == por_estado == {"aprobado": 300, "pendiente_lazy": 100}
+    assert crud.get_duraciones_mesas(db) == por_mesa == {mesas[0].id: 300, mesas[1].id: 100}
+    assert crud.verificar_cola_residente(db)
+
+    # Sin cambios en la cola, la consulta de totales no toca la BD
+    consultas = []
+
+    def registrar(conn, cursor, statement, *args):
+        consultas.append(statement)
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        crud.get_duraciones_cola(db, mesas[0].id)
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+    assert consultas == []
+    db.close()
+
+
+def test_la_admision_cuenta_la_cola_lazy(monkeypatch):
+    db = SessionLocal()
+    _, usuarios, _ = _preparar(db)
+    usuario_id = usuarios[1].id
+    db.close()
+
+    # Cierre en ~14 minutos: solo las aprobadas (200 s) dejarían entrar una canción de
+    # 240 s, pero con la cola lazy (700 s) la proyección es 900 + 240 > 840
+    _cierre_en(monkeypatch, 15)
+    client = TestClient(main.app)
+    cancion = {"titulo": "Nueva", "youtube_id": "nueva", "duracion_seconds": 240}
+    resp = client.post(f"/api/v1/canciones/{usuario_id}", json=cancion)
+    assert resp.status_code == 400
+    assert "tiempo suficiente" in resp.json()["detail"]
+
+    _cierre_en(monkeypatch, 60)
+    assert client.post(f"/api/v1/canciones/{usuario_id}", json=cancion).status_code == 200
+
+
+def test_capacidad_por_mesa(monkeypatch):
+    db = SessionLocal()
+    mesas, _, _ = _preparar(db)
+    mesa_a, mesa_b = mesas[0].id, mesas[1].id
+    db.close()
+    _cierre_en(monkeypatch, 60)
+
+    client = TestClient(main.app)
+    datos = client.get("/api/v1/canciones/capacidad").json()
+    assert datos["proyectado_segundos"] == 900
+    assert 0 < datos["holgura_segundos"] == datos["tiempo_hasta_cierre_segundos"] - 900
+    por_mesa = {m["mesa_id"]: m for m in datos["mesas"]}
+    assert por_mesa[mesa_a]["encolado_segundos"] == 500
+    # Dos mesas del mismo nivel: mitad del tiempo hasta el cierre para cada una
+    cuota = datos["tiempo_hasta_cierre_segundos"] // 2
+    assert por_mesa[mesa_b]["cuota_segundos"] == cuota
+    assert por_mesa[mesa_b]["capacidad_segundos"] == cuota - 400
+
+    solo = client.get(f"/api/v1/canciones/capacidad?mesa_id={mesa_a}").json()["mesas"]
+    assert [m["mesa_id"] for m in solo] == [mesa_a]
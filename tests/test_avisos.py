@@ -0,0 +1,119 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+
+import pytest
+
+import config, reproduccion
+from avisos import CalculadorAvisos
+from websocket_manager import ConnectionManager
+
+
+def _cancion(cid, usuario_id, duracion=200):
+    return {"id": cid, "titulo": f"Canción {cid}", "duracion_seconds": duracion, "usuario_id": usuario_id}
+
+
+def _cola(actual, upcoming, pending=()):
+    return {"now_playing": actual, "upcoming": list(upcoming), "pending": list(pending)}
+
+
+@pytest.fixture(autouse=True)
+def umbral(monkeypatch):
+    monkeypatch.setattr(config.settings, "WS_UMBRAL_ETA_MINUTOS", 3)
+
+
+def test_avisos_de_aprobada_siguiente_y_cambio_de_espera(monkeypatch):
+    restante = {}
+    monkeypatch.setattr(reproduccion.reloj, "restante_de", lambda cancion_id, ahora=None: restante[cancion_id])
+    calculador = CalculadorAvisos()
+    sonando = _cancion(1, 9, duracion=400)
+    a, b, c = _cancion(2, 1), _cancion(3, 2), _cancion(4, 3)
+
+    # El primer estado solo se registra
+    restante[1] = 400
+    assert calculador.calcular(_cola(sonando, [a, b], [c]), ahora=0) == []
+
+    # Se aprueba la de 3 al final: un aviso con su posición y espera (390 + 200 + 200)
+    restante[1] = 390
+    avisos = calculador.calcular(_cola(sonando, [a, b, c]), ahora=10)
+    assert avisos == [(3, {"type": "song_approved", "payload": {
+        "cancion_id": 4, "titulo": "Canción 4", "posicion": 3, "tiempo_espera_segundos": 790}})]
+
+    # Pasan 4 minutos sin cambios en la cola: la espera baja con el tiempo, sin avisos
+    restante[1] = 150
+    assert calculador.calcular(_cola(sonando, [a, b, c]), ahora=250) == []
+
+    # Suena la de 1 (la anterior terminó antes de lo previsto): la de 2 pasa a ser la siguiente
+    restante[2] = 200
+    avisos = calculador.calcular(_cola(a, [b, c]), ahora=260)
+    assert [(u, e["type"]) for u, e in avisos] == [(2, "up_next")]
+
+    # Una canción larga se adelanta: la espera de 3 crece más del umbral
+    restante[2] = 190
+    larga = _cancion(5, 4, duracion=600)
+    avisos = calculador.calcular(_cola(a, [b, larga, c]), ahora=270)
+    assert [(u, e["type"]) for u, e in avisos] == [(3, "eta_update")]
+    assert avisos[0][1]["payload"] == {"cancion_id": 4, "titulo": "Canción 4", "posicion": 3, "tiempo_espera_segundos": 990}
+
+
+def test_aviso_al_promover_de_la_cola_lazy(monkeypatch):
+    """El flujo habitual: la canción del usuario pasa de pendiente_lazy a aprobado."""
+    monkeypatch.setattr(reproduccion.reloj, "restante_de", lambda cancion_id, ahora=None: 100)
+    calculador = CalculadorAvisos()
+    sonando = _cancion(1, 9)
+    a, lazy_b, lazy_c = _cancion(2, 1), _cancion(3, 2), _cancion(4, 3)
+
+    assert calculador.calcular(_cola(sonando, [a]), ahora=0, lazy=[3, 4]) == []
+
+    # Termina la actual: suena la de 1 y se promueve la primera de la cola lazy
+    avisos = calculador.calcular(_cola(a, [lazy_b]), ahora=100, lazy=[4])
+    assert [(u, e["type"]) for u, e in avisos] == [(2, "song_approved"), (2, "up_next")]
+    assert avisos[0][1]["payload"]["posicion"] == 1
+
+    # Una canción que entra directamente como aprobada no se avisa como aprobada
+    avisos = calculador.calcular(_cola(a, [lazy_b, _cancion(5, 4)]), ahora=110, lazy=[4])
+    assert avisos == []
+
+
+def test_los_avisos_llegan_solo_al_usuario(monkeypatch):
+    monkeypatch.setattr(config.settings, "WS_POLITICA_LENTOS", "drop_oldest")
+    colas = iter([_cola(None, [_cancion(2, 1)], [_cancion(3, 7)]), _cola(None, [_cancion(2, 1), _cancion(3, 7)])])
+    manager = ConnectionManager()
+
+    async def leer_cola():
+        return next(colas)
+
+    async def leer_lazy():
+        return []
+
+    monkeypatch.setattr(manager, "_leer_cola", leer_cola)
+    monkeypatch.setattr(manager, "_leer_lazy", leer_lazy)
+
+    class Cliente:
+        def __init__(self):
+            self.recibidos = []
+
+        async def send_text(self, mensaje):
+            self.recibidos.append(json.loads(mensaje))
+
+        async def close(self):
+            pass
+
+    usuario, otro, mesa = Cliente(), Cliente(), Cliente()
+
+    async def escenario():
+        manager.registrar(usuario, temas=["user:7"])
+        manager.registrar(otro, temas=["user:8", "queue"])
+        manager.registrar(mesa, temas=["mesa:2"])
+        await manager._enviar_cola()
+        await manager._enviar_cola()
+        await manager.broadcast_consumo_despachado({"id": 5, "usuario_id": 7, "mesa_id": 2, "producto": "Cerveza"})
+        await asyncio.sleep(0.01)
+
+    asyncio.run(escenario())
+    assert [m["type"] for m in usuario.recibidos] == ["song_approved", "order_dispatched"]
+    assert usuario.recibidos[0]["payload"]["cancion_id"] == 3
+    assert [m["type"] for m in otro.recibidos] == ["queue_update", "queue_update"]
+    assert [m["type"] for m in mesa.recibidos] == ["order_dispatched"]
@@ -0,0 +1,129 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import config, database, main, models, queue_engine
+from database import SessionLocal, engine
+from websocket_manager import ConnectionManager
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+def _preparar(db):
+    mesa = models.Mesa(nombre="M1", qr_code="m1", is_active=True)
+    db.add(mesa)
+    db.commit()
+    usuario = models.Usuario(nick="ana", mesa_id=mesa.id)
+    producto = models.Producto(nombre="Cerveza", categoria="Bebidas", valor=10, stock=5, is_active=True)
+    db.add_all([usuario, producto])
+    db.commit()
+    db.add_all([
+        models.Cancion(titulo="Sonando", youtube_id="yt_0", usuario_id=usuario.id, estado="reproduciendo", duracion_seconds=200),
+        models.Cancion(titulo="Siguiente", youtube_id="yt_1", usuario_id=usuario.id, estado="aprobado", duracion_seconds=100),
+    ])
+    db.commit()
+    return usuario.id, producto.id
+
+
+def test_endpoints_con_sesion_async():
+    db = SessionLocal()
+    usuario_id, producto_id = _preparar(db)
+    db.close()
+    client = TestClient(main.app)
+
+    version = queue_engine.motor.version
+    resp = client.post(f"/api/v1/consumos/pedir/{usuario_id}", json={"producto_id": producto_id, "cantidad": 2})
+    assert resp.status_code == 200
+    assert resp.json()["producto"]["nombre"] == "Cerveza"
+    # Los eventos de sesión (cola residente) también llegan desde las sesiones async
+    assert queue_engine.motor.version > version
+
+    resp = client.post("/api/v1/canciones/siguiente")
+    assert resp.status_code == 200
+    cancion = resp.json()["cancion"]
+    assert cancion["titulo"] == "Siguiente" and cancion["usuario"]["mesa"]["nombre"] == "M1"
+
+    db = SessionLocal()
+    estados = dict(db.query(models.Cancion.titulo, models.Cancion.estado).all())
+    assert estados == {"Sonando": "cantada", "Siguiente": "reproduciendo"}
+    assert db.query(models.Producto).get(producto_id).stock == 3
+    db.close()
+
+
+def test_el_pool_de_hilos_esta_acotado():
+    activos, maximo = [0], [0]
+    lock = threading.Lock()
+
+    def consulta_lenta():
+        with lock:
+            activos[0] += 1
+            maximo[0] = max(maximo[0], activos[0])
+        time.sleep(0.02)
+        with lock:
+            activos[0] -= 1
+
+    async def escenario():
+        latidos = 0
+
+        async def latir():
+            nonlocal latidos
+            while True:
+                await asyncio.sleep(0.005)
+                latidos += 1
+
+        tarea = asyncio.create_task(latir())
+        await asyncio.gather(*(database.en_hilo(consulta_lenta) for _ in range(config.settings.DB_HILOS * 3)))
+        tarea.cancel()
+        return latidos
+
+    # El event loop sigue atendiendo mientras las funciones síncronas corren en los hilos
+    assert asyncio.run(escenario()) >= 5
+    assert maximo[0] == config.settings.DB_HILOS
+
+
+def test_una_lectura_de_cola_que_se_cruza_con_un_commit_se_repite(monkeypatch):
+    monkeypatch.setattr(config.settings, "WS_VENTANA_COLA", 0)
+    lecturas = iter([{"now_playing": {"id": 1}, "upcoming": [], "pending": []},
+                     {"now_playing": {"id": 2}, "upcoming": [], "pending": []}])
+    manager = ConnectionManager()
+
+    async def leer_cola():
+        cola = next(lecturas)
+        if cola["now_playing"]["id"] == 1:
+            # Otra transacción confirma un cambio de la cola mientras se lee
+            queue_engine.motor.invalidar()
+        return cola
+
+    monkeypatch.setattr(manager, "_leer_cola", leer_cola)
+
+    class Cliente:
+        def __init__(self):
+            self.recibidos = []
+
+        async def send_text(self, mensaje):
+            self.recibidos.append(json.loads(mensaje))
+
+        async def close(self):
+            pass
+
+    cliente = Cliente()
+
+    async def escenario():
+        manager.registrar(cliente, temas=["queue"])
+        await manager.broadcast_queue_update()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(escenario())
+    assert [m["payload"]["now_playing"]["id"] for m in cliente.recibidos] == [2]
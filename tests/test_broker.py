@@ -0,0 +1,286 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+
+import pytest
+
+import broker, config
+from websocket_manager import ConnectionManager
+
+
+class ClienteSimulado:
+    def __init__(self):
+        self.recibidos = []
+
+    async def send_text(self, mensaje: str):
+        self.recibidos.append(json.loads(mensaje)["type"])
+
+    async def close(self):
+        pass
+
+
+class ServidorRESP:
+    """Sustituto local de Redis: solo SUBSCRIBE y PUBLISH."""
+
+    def __init__(self):
+        self.suscriptores = {}  # canal -> [writer]
+        self.servidor = None
+
+    async def iniciar(self) -> int:
+        self.servidor = await asyncio.start_server(self._atender, "127.0.0.1", 0)
+        return self.servidor.sockets[0].getsockname()[1]
+
+    async def _atender(self, reader, writer):
+        try:
+            while True:
+                comando = await broker._leer_resp(reader)
+                if comando[0].upper() == "SUBSCRIBE":
+                    self.suscriptores.setdefault(comando[1], []).append(writer)
+                    writer.write(b"*3\r\n$9\r\nsubscribe\r\n" + self._bulk(comando[1]) + b":1\r\n")
+                elif comando[0].upper() == "PUBLISH":
+                    destinos = self.suscriptores.get(comando[1], [])
+                    for destino in destinos:
+                        destino.write(b"*3\r\n$7\r\nmessage\r\n" + self._bulk(comando[1]) + self._bulk(comando[2]))
+                    writer.write(b":%d\r\n" % len(destinos))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+    @staticmethod
+    def _bulk(texto: str) -> bytes:
+        datos = texto.encode()
+        return b"$%d\r\n%s\r\n" % (len(datos), datos)
+
+    async def detener(self):
+        self.servidor.close()
+        for writers in self.suscriptores.values():
+            for writer in writers:
+                writer.close()
+
+
+async def _dos_workers(crear):
+    """Dos managers (workers) unidos por el broker: A publica, B reparte a sus sockets."""
+    a, b = ConnectionManager(), ConnectionManager()
+    cliente_a, cliente_b = ClienteSimulado(), ClienteSimulado()
+    a.registrar(cliente_a, temas=["player", "queue"])
+    b.registrar(cliente_b, temas=["player", "queue"])
+    async def leer_cola():
+        return {"now_playing": None, "upcoming": [], "pending": []}
+
+    b._leer_cola = leer_cola
+    await a.iniciar_broker(crear())
+    await b.iniciar_broker(crear())
+    try:
+        await a.broadcast_pause()
+        await a.broadcast_reaction({"reaction": "🎉"})
+        await a.broadcast_queue_update()
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if "queue_update" in cliente_b.recibidos:
+                break
+    finally:
+        await a.detener_broker()
+        await b.detener_broker()
+    return cliente_a.recibidos, cliente_b.recibidos
+
+
+def _comprobar(recibidos_a, recibidos_b):
+    # A no recibe dos veces su propio evento; B lo recibe y lee la cola por su cuenta
+    assert recibidos_a.count("pause_playback") == 1
+    assert recibidos_b[:2] == ["pause_playback", "queue_update"]
+    assert "reaction" not in recibidos_b
+
+
+@pytest.fixture(autouse=True)
+def ventana_corta(monkeypatch):
+    monkeypatch.setattr(config.settings, "WS_VENTANA_COLA", 0.01)
+
+
+def test_broker_en_memoria():
+    _comprobar(*asyncio.run(_dos_workers(lambda: broker.BrokerMemoria("prueba"))))
+
+
+def test_broker_sqlite(tmp_path):
+    ruta = str(tmp_path / "ws_broker.db")
+    _comprobar(*asyncio.run(_dos_workers(lambda: broker.BrokerSQLite(ruta, intervalo=0.01))))
+
+
+def test_broker_redis():
+    async def escenario():
+        servidor = ServidorRESP()
+        puerto = await servidor.iniciar()
+        try:
+            return await _dos_workers(lambda: broker.BrokerRedis(f"redis://127.0.0.1:{puerto}"))
+        finally:
+            await servidor.detener()
+
+    _comprobar(*asyncio.run(escenario()))
+
+
+def test_senal_de_otro_worker_invalida_estado_local(monkeypatch):
+    """Sin los cambios del otro worker (o con un lote perdido) la cola y los niveles se descartan."""
+    import queue_engine
+    from consumo_totales import cache_niveles
+
+    manager = ConnectionManager()
+    programadas = []
+    monkeypatch.setattr(manager, "_programar_cola", lambda publicar: programadas.append(publicar))
+
+    for datos in ({"tipo": "cola"}, {"tipo": "cola", "lote": 3, "cambios": []}):
+        cache_niveles._totales[1] = 5
+        version = queue_engine.motor.version
+        manager._al_recibir({"origen": "otro", **datos})
+        assert queue_engine.motor.version > version
+        assert not queue_engine.motor._valido
+        assert cache_niveles._totales == {}
+
+    # Un consumo de otro worker solo caduca el nivel de su mesa
+    cache_niveles._totales.update({1: 5, 2: 7})
+    version = queue_engine.motor.version
+    manager._al_recibir({"origen": "otro", "tipo": "evento", "datos": {"type": "consumo_created", "payload": {"mesa_id": 1}},
+                         "temas": ["mesa:1"]})
+    assert queue_engine.motor.version > version
+    assert cache_niveles._totales == {2: 7}
+    assert programadas == [False, False, False]
+    cache_niveles.invalidar()
+
+    # Un evento que no toca la cola ni los consumos no invalida nada
+    version = queue_engine.motor.version
+    manager._al_recibir({"origen": "otro", "tipo": "evento", "datos": {"type": "pause_playback"}})
+    assert queue_engine.motor.version == version
+
+
+@pytest.fixture
+def base_limpia():
+    import models
+    from database import engine
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+def test_cambios_de_otro_worker_se_aplican_sin_reconstruir(base_limpia, monkeypatch):
+    import crud, models, queue_engine
+    from database import SessionLocal, engine
+
+    db = SessionLocal()
+    mesa = models.Mesa(nombre="A", qr_code="A", is_active=True)
+    db.add(mesa)
+    db.commit()
+    usuario = models.Usuario(nick="a", mesa_id=mesa.id)
+    db.add(usuario)
+    db.commit()
+    primera = models.Cancion(titulo="A0", youtube_id="yt_A0", usuario_id=usuario.id, estado="aprobado", duracion_seconds=100)
+    db.add(primera)
+    db.commit()
+    assert [c.id for c in crud.get_cola_priorizada(db)] == [primera.id]
+
+    reconstrucciones = []
+    reconstruir = queue_engine.motor._reconstruir
+    monkeypatch.setattr(queue_engine.motor, "_reconstruir", lambda sesion: reconstrucciones.append(1) or reconstruir(sesion))
+    manager = ConnectionManager()
+    monkeypatch.setattr(manager, "_programar_cola", lambda publicar: None)
+
+    # El otro worker confirma sin pasar por las sesiones de este proceso y manda sus cambios
+    with engine.begin() as conexion:
+        nueva_id = conexion.execute(models.Cancion.__table__.insert().values(
+            titulo="A1", youtube_id="yt_A1", usuario_id=usuario.id, estado="aprobado", duracion_seconds=100,
+        )).inserted_primary_key[0]
+    manager._al_recibir({"origen": "otro", "tipo": "cola", "lote": 1,
+                         "cambios": [["cancion", nueva_id, "aprobado", None, usuario.id, 100, None]]})
+    assert [c.id for c in crud.get_cola_priorizada(db)] == [primera.id, nueva_id]
+    assert queue_engine.motor.get_totales(db, mesa.id)[1] == 200
+    assert reconstrucciones == []
+
+    # Un lote perdido obliga a leer desde la BD
+    manager._al_recibir({"origen": "otro", "tipo": "cola", "lote": 3, "cambios": []})
+    assert [c.id for c in crud.get_cola_priorizada(db)] == [primera.id, nueva_id]
+    assert reconstrucciones == [1]
+    db.close()
+
+
+def test_la_senal_de_cola_lleva_los_cambios_confirmados(base_limpia, monkeypatch):
+    import models
+    from database import SessionLocal
+
+    monkeypatch.setattr(config.settings, "WS_VENTANA_COLA", 0)
+    a, b = ConnectionManager(), ConnectionManager()
+    recibidos = []
+    monkeypatch.setattr(b, "_al_recibir", recibidos.append)
+
+    async def leer_cola():
+        return {"now_playing": None, "upcoming": [], "pending": []}
+    a._leer_cola = leer_cola
+
+    async def escenario():
+        await a.iniciar_broker(broker.BrokerMemoria("cambios"))
+        await b.iniciar_broker(broker.BrokerMemoria("cambios"))
+        try:
+            db = SessionLocal()
+            mesa = models.Mesa(nombre="A", qr_code="A", is_active=True)
+            db.add(mesa)
+            db.commit()
+            usuario = models.Usuario(nick="a", mesa_id=mesa.id)
+            db.add(usuario)
+            db.commit()
+            cancion = models.Cancion(titulo="A0", youtube_id="yt_A0", usuario_id=usuario.id, estado="aprobado",
+                                     duracion_seconds=100)
+            db.add(cancion)
+            db.commit()
+            ids = (mesa.id, usuario.id, cancion.id)
+            db.close()
+            await a.broadcast_queue_update()
+            await a.broadcast_queue_update()
+            return ids
+        finally:
+            await a.detener_broker()
+            await b.detener_broker()
+
+    mesa_id, usuario_id, cancion_id = asyncio.run(escenario())
+    assert [(d["tipo"], d["lote"]) for d in recibidos] == [("cola", 1), ("cola", 2)]
+    assert ["mesa", mesa_id] in recibidos[0]["cambios"]
+    assert ["cancion", cancion_id, "aprobado", None, usuario_id, 100, None] in recibidos[0]["cambios"]
+    # Cada commit viaja una sola vez
+    assert recibidos[1]["cambios"] == []
+
+
+def test_player_de_otro_worker_cuenta_como_conectado(monkeypatch):
+    monkeypatch.setattr(config.settings, "WS_INTERVALO_PING", 25)
+    monkeypatch.setattr(config.settings, "WS_TIMEOUT_PONG", 20)
+    manager = ConnectionManager()
+    assert not manager.player_conectado()
+    manager._al_recibir({"origen": "otro", "tipo": "player"})
+    assert manager.player_conectado()
+    # Sin más anuncios caduca como un latido sin respuesta
+    import time
+    assert not manager.player_conectado(ahora=time.monotonic() + 46)
+
+
+def test_cambio_de_politica_llega_a_los_demas_workers(monkeypatch):
+    """La política se guarda por proceso: la señal de cola hace que este worker la relea."""
+    import admin_settings_router, scheduler, websocket_manager
+
+    ajustes = {"queue_policy": "cuota_nivel"}
+    monkeypatch.setattr(scheduler.settings_storage, "get_setting", lambda clave, defecto=None: ajustes.get(clave, defecto))
+    monkeypatch.setattr(scheduler.settings_storage, "set_setting", lambda clave, valor: ajustes.__setitem__(clave, valor))
+    monkeypatch.setattr(scheduler, "_politica_actual", None)
+    assert scheduler.politica_actual().nombre == "cuota_nivel"
+
+    # El worker que atiende el POST cambia su política y avisa al resto
+    senales = []
+
+    async def senal():
+        senales.append("cola")
+    monkeypatch.setattr(websocket_manager.manager, "broadcast_queue_update", senal)
+    respuesta = asyncio.run(admin_settings_router.update_queue_policy(admin_settings_router.QueuePolicy(policy="wfq")))
+    assert respuesta["status"] == "success"
+    assert senales == ["cola"]
+
+    # Otro worker aún tiene la anterior en memoria hasta que recibe la señal
+    monkeypatch.setattr(scheduler, "_politica_actual", scheduler.POLITICAS["cuota_nivel"])
+    manager = ConnectionManager()
+    monkeypatch.setattr(manager, "_programar_cola", lambda publicar: None)
+    manager._al_recibir({"origen": "otro", "tipo": "cola"})
+    assert scheduler.politica_actual().nombre == "wfq"
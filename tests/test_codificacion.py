@@ -0,0 +1,81 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import datetime
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import codificacion, main
+from codificacion import Evento
+from websocket_manager import ConnectionManager
+
+
+class ClienteSimulado:
+    def __init__(self):
+        self.recibidos = []
+
+    async def send_text(self, mensaje: str):
+        self.recibidos.append(mensaje)
+
+    async def send_bytes(self, mensaje: bytes):
+        self.recibidos.append(mensaje)
+
+    async def close(self):
+        pass
+
+
+def test_cada_evento_se_codifica_una_vez_por_codificacion(monkeypatch):
+    llamadas = []
+    original = codificacion.codificar
+    monkeypatch.setattr(codificacion, "codificar", lambda datos, cod="json": llamadas.append(cod) or original(datos, cod))
+    manager = ConnectionManager()
+    pedidas = ["json", "orjson", "msgpack"]
+    clientes = [ClienteSimulado() for _ in range(30)]
+
+    async def escenario():
+        for i, cliente in enumerate(clientes):
+            manager.registrar(cliente, codificacion=pedidas[i % 3])
+        await manager.broadcast_pause()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(escenario())
+    en_uso = {codificacion.negociar(c) for c in pedidas}
+    assert sorted(llamadas) == sorted(en_uso)
+    for cliente in clientes:
+        recibido = cliente.recibidos[0]
+        datos = codificacion.msgpack.unpackb(recibido) if isinstance(recibido, bytes) else json.loads(recibido)
+        assert datos == {"seq": manager.seq, "type": "pause_playback"}
+
+
+def test_orjson_produce_el_mismo_json():
+    if not codificacion.disponible("orjson"):
+        pytest.skip("orjson no está instalado")
+    datos = {"type": "queue_update", "payload": {"titulo": "Canción ñ", "fecha": datetime.datetime(2024, 5, 1, 22, 30)}}
+    evento = Evento(datos)
+    assert json.loads(evento.codificado("orjson")) == json.loads(evento.codificado("json"))
+    assert evento.codificado("orjson") is evento.codificado("orjson")
+
+
+def test_msgpack_es_binario_y_mas_pequeno():
+    if not codificacion.disponible("msgpack"):
+        pytest.skip("msgpack no está instalado")
+    evento = Evento({"type": "queue_update", "payload": {"upcoming": [{"id": i, "titulo": f"Canción {i}"} for i in range(50)]}})
+    binario = evento.codificado("msgpack")
+    assert isinstance(binario, bytes) and len(binario) < len(evento.codificado("json").encode())
+    assert codificacion.msgpack.unpackb(binario) == evento.datos
+
+
+def test_codificacion_desconocida_usa_json(monkeypatch):
+    monkeypatch.setattr(codificacion, "msgpack", None)
+    assert codificacion.negociar("msgpack") == "json"
+    assert codificacion.negociar("xml") == "json"
+    assert codificacion.negociar(None) == "json"
+
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/cola?encoding=msgpack") as ws:
+        sesion = ws.receive_json()
+        assert sesion["type"] == "session"
+        assert sesion["payload"]["encoding"] == "json"
@@ -0,0 +1,115 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+import cola_delta, config, main, models
+from database import engine
+from websocket_manager import ConnectionManager
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+def _cancion(cid, estado="aprobado"):
+    return {"id": cid, "titulo": f"Canción {cid}", "youtube_id": f"yt_{cid}", "estado": estado,
+            "duracion_seconds": 180 + cid, "usuario": {"id": cid % 7, "nick": f"u{cid % 7}", "mesa": {"nombre": f"Mesa {cid % 7}"}}}
+
+
+def _cola(now_playing, upcoming, pending=()):
+    return {"now_playing": _cancion(now_playing, "reproduciendo") if now_playing else None,
+            "upcoming": [_cancion(c) for c in upcoming], "pending": [_cancion(c, "pendiente") for c in pending]}
+
+
+def test_las_diferencias_reconstruyen_el_estado():
+    rnd = random.Random(7)
+    anterior = cola_delta.estado_de_cola(_cola(1, range(2, 30), (40, 41)))
+    for _ in range(200):
+        ids = list(range(2, 60))
+        rnd.shuffle(ids)
+        upcoming = ids[:rnd.randint(0, 40)]
+        nuevo = cola_delta.estado_de_cola(_cola(rnd.choice([None, 1, 2]), upcoming, ids[40:rnd.randint(40, 50)]))
+        if nuevo["upcoming"]:
+            nuevo["upcoming"][0]["titulo"] = f"Editada {rnd.random()}"
+        assert cola_delta.aplicar(anterior, cola_delta.diferencias(anterior, nuevo)) == nuevo
+        anterior = nuevo
+
+
+def test_un_cambio_en_una_cola_de_200_cuesta_pocos_bytes():
+    codificador = cola_delta.CodificadorCola()
+    upcoming = list(range(2, 202))
+    snapshot, delta = codificador.publicar(_cola(1, upcoming))
+    assert delta is None and snapshot["version"] == 1
+    completo = len(json.dumps(_cola(1, upcoming)))
+
+    # Avanza la cola: la primera pasa a sonar y llega una canción nueva al final
+    snapshot, delta = codificador.publicar(_cola(2, upcoming[1:] + [300]))
+    assert (delta["base_version"], delta["version"]) == (1, 2) == (1, snapshot["version"])
+    assert [op["op"] for op in delta["ops"]] == ["remove", "insert", "remove", "insert"]
+    assert len(json.dumps(delta)) < 1000
+    assert completo > 30 * len(json.dumps(delta))
+
+    # Sin cambios no hay delta ni avanza la versión
+    assert codificador.publicar(_cola(2, upcoming[1:] + [300]))[1] is None
+    assert codificador.snapshot()["version"] == 2
+
+
+class ClienteSimulado:
+    def __init__(self):
+        self.recibidos = []
+
+    async def send_text(self, mensaje: str):
+        self.recibidos.append(json.loads(mensaje))
+
+    async def close(self):
+        pass
+
+
+def test_clientes_delta_y_clasicos_reciben_su_formato(monkeypatch):
+    monkeypatch.setattr(config.settings, "WS_POLITICA_LENTOS", "drop_oldest")
+    colas = iter([_cola(1, [2, 3]), _cola(1, [3, 2]), _cola(1, [3, 2])])
+    manager = ConnectionManager()
+
+    async def leer_cola():
+        return next(colas)
+
+    monkeypatch.setattr(manager, "_leer_cola", leer_cola)
+    clasico, delta = ClienteSimulado(), ClienteSimulado()
+
+    async def escenario():
+        manager.registrar(clasico)
+        manager.registrar(delta, delta=True)
+        await manager.send_queue_snapshot(delta)
+        await manager._enviar_cola()
+        await manager._enviar_cola()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(escenario())
+    assert [m["type"] for m in clasico.recibidos] == ["queue_update", "queue_update"]
+    assert [m["type"] for m in delta.recibidos] == ["queue_snapshot", "queue_delta"]
+    snapshot, cambio = delta.recibidos[0]["payload"], delta.recibidos[1]["payload"]
+    assert cambio["base_version"] == snapshot["version"]
+    estado = cola_delta.aplicar(snapshot["state"], cambio["ops"])
+    assert [c["id"] for c in estado["upcoming"]] == [3, 2]
+
+
+def test_resync_por_websocket():
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/cola?queue=delta") as ws:
+        assert ws.receive_json()["type"] == "session"
+        inicial = ws.receive_json()
+        assert inicial["type"] == "queue_snapshot"
+        assert ws.receive_json()["type"] == "playback_state"
+        ws.send_text(json.dumps({"type": "queue_resync"}))
+        resync = ws.receive_json()
+        assert resync["type"] == "queue_snapshot"
+        assert resync["payload"]["version"] == inicial["payload"]["version"]
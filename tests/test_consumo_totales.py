@@ -0,0 +1,104 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event, func
+
+import crud, models, schemas
+from consumo_totales import cache_niveles
+from database import SessionLocal, engine
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+def _totales_reales(db, mesa_id, cuenta_id):
+    por_mesa = db.query(func.coalesce(func.sum(models.Consumo.valor_total), 0)).filter(models.Consumo.mesa_id == mesa_id).scalar()
+    por_cuenta = db.query(func.coalesce(func.sum(models.Consumo.valor_total), 0)).filter(models.Consumo.cuenta_id == cuenta_id).scalar()
+    return Decimal(por_mesa), Decimal(por_cuenta)
+
+
+def _assert_totales(db, mesa_id):
+    db.expire_all()
+    mesa = crud.get_mesa_by_id(db, mesa_id)
+    cuenta = crud.get_active_cuenta(db, mesa_id)
+    assert (mesa.total_consumido, cuenta.total_consumido) == _totales_reales(db, mesa_id, cuenta.id)
+    return mesa.total_consumido
+
+
+def test_totales_se_mantienen_en_cada_escritura():
+    db = SessionLocal()
+    mesa = models.Mesa(nombre="M1", qr_code="M1", is_active=True)
+    db.add(mesa)
+    db.commit()
+    usuario = models.Usuario(nick="u1", mesa_id=mesa.id)
+    cerveza = models.Producto(nombre="Cerveza", valor=Decimal("10000"), stock=100)
+    db.add_all([usuario, cerveza])
+    db.commit()
+
+    consumo, error = crud.create_consumo_para_usuario(db, schemas.ConsumoCreate(producto_id=cerveza.id, cantidad=2), usuario.id)
+    assert error is None
+    assert _assert_totales(db, mesa.id) == Decimal("20000")
+
+    consumos, error = crud.create_pedido_from_carrito(db, schemas.CarritoCreate(items=[schemas.CarritoItem(producto_id=cerveza.id, cantidad=3)]), usuario.id)
+    assert error is None
+    assert _assert_totales(db, mesa.id) == Decimal("50000")
+    assert cache_niveles.cupos(db, [mesa.id]) == {mesa.id: 2}
+
+    crud.update_consumo_cantidad(db, consumo.id, 1)
+    assert _assert_totales(db, mesa.id) == Decimal("60000")
+
+    crud.delete_consumo(db, consumos[0].id)
+    assert _assert_totales(db, mesa.id) == Decimal("30000")
+    # La caché se invalidó al confirmar el borrado
+    assert cache_niveles.cupos(db, [mesa.id]) == {mesa.id: 1}
+
+    estado = crud.get_all_tables_payment_status(db)[0]
+    assert estado["total_consumido"] == Decimal("30000") and estado["nivel"] == "bronce"
+
+    crud.delete_usuario(db, usuario.id)
+    assert _assert_totales(db, mesa.id) == Decimal("0")
+    db.close()
+
+
+def test_cache_de_niveles_no_consulta_la_bd_si_ya_conoce_la_mesa():
+    db = SessionLocal()
+    mesa = models.Mesa(nombre="M1", qr_code="M1", is_active=True, total_consumido=Decimal("200000"))
+    db.add(mesa)
+    db.commit()
+    assert cache_niveles.cupos(db, [mesa.id, 0]) == {mesa.id: 3, 0: 3}
+
+    consultas = []
+    escuchar = lambda *args: consultas.append(args[2])
+    event.listen(engine, "before_cursor_execute", escuchar)
+    try:
+        assert cache_niveles.cupos(db, [mesa.id]) == {mesa.id: 3}
+    finally:
+        event.remove(engine, "before_cursor_execute", escuchar)
+    assert consultas == []
+    db.close()
+
+
+def test_savepoint_deshecho_no_invalida_la_cache():
+    db = SessionLocal()
+    mesa = models.Mesa(nombre="M1", qr_code="M1", is_active=True, total_consumido=Decimal("200000"))
+    db.add(mesa)
+    db.commit()
+    assert cache_niveles.cupos(db, [mesa.id]) == {mesa.id: 3}
+
+    savepoint = db.begin_nested()
+    db.add(models.Consumo(cantidad=1, valor_total=1000, mesa_id=mesa.id))
+    db.flush()
+    savepoint.rollback()
+    db.commit()
+
+    assert mesa.id in cache_niveles._totales
+    db.refresh(mesa)
+    assert mesa.total_consumido == Decimal("200000")
+    db.close()
@@ -0,0 +1,131 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import time
+
+import pytest
+from sqlalchemy import exc, text
+
+import crud, models, schemas
+from database import SessionLectura, SessionLocal, engine
+from escritor import EscritorBD, crear_engine_escritor
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+@pytest.fixture
+def escritor():
+    nuevo = EscritorBD(crear_engine_escritor())
+    yield nuevo
+    nuevo.detener()
+
+
+def _preparar():
+    db = SessionLocal()
+    mesa = models.Mesa(nombre="M1", qr_code="m1")
+    db.add(mesa)
+    db.commit()
+    usuario = models.Usuario(nick="ana", mesa_id=mesa.id)
+    producto = models.Producto(nombre="Cerveza", categoria="Bebidas", valor=10, stock=100)
+    db.add_all([usuario, producto])
+    db.commit()
+    ids = mesa.id, usuario.id, producto.id
+    db.close()
+    return ids
+
+
+def _pedir(db, usuario_id, producto_id, cantidad=1):
+    consumo, error = crud.create_consumo_para_usuario(
+        db, consumo=schemas.ConsumoCreate(producto_id=producto_id, cantidad=cantidad), usuario_id=usuario_id
+    )
+    if consumo is not None:
+        consumo.producto
+    return consumo, error
+
+
+def test_perfil_de_produccion_y_pool_de_solo_lectura():
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() > 0
+    db = SessionLectura()
+    try:
+        assert db.query(models.Mesa).count() == 0
+        with pytest.raises(exc.OperationalError):
+            db.execute(text("INSERT INTO mesas (nombre, qr_code, total_consumido) VALUES ('X', 'x', 0)"))
+    finally:
+        db.close()
+
+
+def test_las_escrituras_en_espera_se_confirman_en_un_lote(escritor):
+    _, usuario_id, producto_id = _preparar()
+    primera_en_curso, soltar = threading.Event(), threading.Event()
+
+    def bloqueante(db):
+        primera_en_curso.set()
+        soltar.wait(5)
+        return _pedir(db, usuario_id, producto_id)
+
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(escritor.ejecutar(bloqueante)))]
+    hilos[0].start()
+    primera_en_curso.wait(5)
+    # Mientras el escritor está ocupado llegan diez pedidos más: van todos en el lote siguiente
+    hilos += [threading.Thread(target=lambda: resultados.append(escritor.ejecutar(_pedir, usuario_id, producto_id)))
+              for _ in range(10)]
+    for hilo in hilos[1:]:
+        hilo.start()
+    for _ in range(500):
+        if escritor._cola.qsize() == 10:
+            break
+        time.sleep(0.01)
+    soltar.set()
+    for hilo in hilos:
+        hilo.join(5)
+
+    assert (escritor.lotes, escritor.unidades) == (2, 11)
+    # Los objetos salen desligados y con lo cargado en la unidad
+    assert all(consumo.producto.nombre == "Cerveza" for consumo, _ in resultados)
+    db = SessionLocal()
+    assert db.query(models.Consumo).count() == 11
+    assert db.get(models.Producto, producto_id).stock == 89
+    db.close()
+
+
+def test_una_unidad_fallida_no_deshace_las_demas(escritor):
+    mesa_id, usuario_id, producto_id = _preparar()
+    soltar = threading.Event()
+    futuros = [escritor._encolar(lambda db: soltar.wait(5), (), {})]
+
+    def duplicada(db):
+        _pedir(db, usuario_id, producto_id)
+        db.add(models.Mesa(nombre="Otra", qr_code="m1"))  # qr_code es único
+        db.flush()
+
+    futuros += [
+        escritor._encolar(_pedir, (usuario_id, producto_id), {}),
+        escritor._encolar(duplicada, (), {}),
+        # crud hace rollback ante un error de negocio: solo se deshace esta unidad
+        escritor._encolar(crud.create_pedido_from_carrito, (), {"usuario_id": usuario_id, "carrito": schemas.CarritoCreate(
+            items=[schemas.CarritoItem(producto_id=producto_id, cantidad=1), schemas.CarritoItem(producto_id=999, cantidad=1)])}),
+        escritor._encolar(_pedir, (usuario_id, producto_id, 2), {}),
+    ]
+    soltar.set()
+    assert futuros[1].result(5)[1] is None
+    with pytest.raises(exc.IntegrityError):
+        futuros[2].result(5)
+    assert futuros[3].result(5) == (None, "Producto con ID 999 no encontrado.")
+    assert futuros[4].result(5)[1] is None
+
+    db = SessionLocal()
+    assert [c.cantidad for c in db.query(models.Consumo).order_by(models.Consumo.id)] == [1, 2]
+    assert db.get(models.Producto, producto_id).stock == 97
+    # El total materializado de la mesa solo cuenta lo confirmado
+    assert float(db.get(models.Mesa, mesa_id).total_consumido) == 30
+    db.close()
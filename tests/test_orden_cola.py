@@ -0,0 +1,224 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import crud, main, models, orden_cola
+from database import SessionLocal, engine
+from security import MASTER_API_KEY
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+@pytest.fixture
+def updates():
+    """Registra las sentencias UPDATE sobre canciones que llegan a la BD."""
+    sentencias = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("UPDATE CANCIONES"):
+            sentencias.append(statement)
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    yield sentencias
+    event.remove(engine, "before_cursor_execute", registrar)
+
+
+def _cola(db, estado="aprobado", n=6):
+    mesa = models.Mesa(nombre="M", qr_code="M", is_active=True)
+    db.add(mesa)
+    db.commit()
+    usuario = models.Usuario(nick="u", mesa_id=mesa.id)
+    db.add(usuario)
+    db.commit()
+    canciones = [models.Cancion(titulo=f"C{i}", youtube_id=f"yt{i}", usuario_id=usuario.id, estado=estado, duracion_seconds=100)
+                 for i in range(n)]
+    db.add_all(canciones)
+    db.commit()
+    return usuario, [c.id for c in canciones]
+
+
+def _titulos(cola):
+    return [c.titulo for c in cola]
+
+
+def test_clave_entre():
+    assert orden_cola.clave_entre(None, None) == orden_cola.HUECO
+    assert orden_cola.clave_entre(None, 1024) == 0
+    assert orden_cola.clave_entre(1024, None) == 2048
+    assert orden_cola.clave_entre(1024, 2048) == 1536
+    assert orden_cola.clave_entre(5, 6) is None
+    assert orden_cola.clave_entre(5, 5) is None
+
+
+def test_reordenar_es_una_sola_sentencia(updates):
+    db = SessionLocal()
+    _, ids = _cola(db)
+    crud.move_song_to_top(db, ids[5])
+    updates.clear()
+
+    nuevo = [ids[3], ids[1], ids[4]]
+    crud.reordenar_cola_manual(db, nuevo)
+    assert len(updates) == 1
+    cola = crud.get_cola_priorizada(db)
+    assert [c.id for c in cola[:3]] == nuevo
+    # Las no incluidas (también la que estaba arriba) vuelven al orden automático
+    assert sorted(c.id for c in cola[3:]) == [ids[0], ids[2], ids[5]]
+    assert all(c.orden_manual is None for c in cola[3:])
+    db.close()
+
+
+def test_mover_toca_una_fila_y_rebalancea_sin_hueco(updates):
+    db = SessionLocal()
+    _, ids = _cola(db)
+    crud.reordenar_cola_manual(db, ids)
+    updates.clear()
+
+    # Subir C4 dos veces: cada movimiento es un UPDATE de una sola fila
+    crud.mover_cancion_aprobada(db, ids[4], -1)
+    crud.mover_cancion_aprobada(db, ids[4], -1)
+    assert len(updates) == 2 and all("WHERE canciones.id = ?" in s for s in updates)
+    assert _titulos(crud.get_cola_priorizada(db)) == ["C0", "C1", "C4", "C2", "C3", "C5"]
+
+    # Sin hueco entre vecinos: una única sentencia reasigna las claves
+    db.query(models.Cancion).filter(models.Cancion.id == ids[0]).update({"orden_manual": 1})
+    db.query(models.Cancion).filter(models.Cancion.id == ids[1]).update({"orden_manual": 2})
+    db.commit()
+    updates.clear()
+    crud.mover_cancion_aprobada(db, ids[4], -1)
+    assert _titulos(crud.get_cola_priorizada(db)) == ["C0", "C4", "C1", "C2", "C3", "C5"]
+    assert len(updates) == 1
+    assert {c.orden_manual % orden_cola.HUECO for c in crud.get_cola_priorizada(db)} == {0}
+    db.close()
+
+
+def test_mover_dentro_del_pool_fija_el_orden_visible():
+    db = SessionLocal()
+    _, ids = _cola(db)
+    antes = _titulos(crud.get_cola_priorizada(db))
+
+    crud.mover_cancion_aprobada(db, ids[3], 1)
+    esperado = antes[:3] + [antes[4], antes[3]] + antes[5:]
+    assert _titulos(crud.get_cola_priorizada(db)) == esperado
+
+    # Subir al principio solo cambia la fila movida
+    crud.move_song_to_top(db, ids[5])
+    assert _titulos(crud.get_cola_priorizada(db)) == ["C5"] + [t for t in esperado if t != "C5"]
+    db.close()
+
+
+def test_mover_en_el_pool_solo_fija_el_tramo_hasta_la_cancion():
+    """Un movimiento del admin no saca del orden justo a las canciones que quedan detrás."""
+    db = SessionLocal()
+    usuarios = {}
+    for nombre in ("A", "B", "C", "D"):
+        mesa = models.Mesa(nombre=nombre, qr_code=nombre, is_active=True)
+        db.add(mesa)
+        db.commit()
+        usuarios[nombre] = models.Usuario(nick=nombre.lower(), mesa_id=mesa.id)
+        db.add(usuarios[nombre])
+        db.commit()
+
+    def cancion(titulo, nombre):
+        nueva = models.Cancion(titulo=titulo, youtube_id=f"yt_{titulo}", usuario_id=usuarios[nombre].id,
+                               estado="aprobado", duracion_seconds=100)
+        db.add(nueva)
+        db.commit()
+        return nueva
+
+    for i in range(3):
+        for nombre in ("A", "B", "C"):
+            cancion(f"{nombre}{i}", nombre)
+    cola = crud.get_cola_priorizada(db)
+    assert _titulos(cola) == ["A0", "B0", "C0", "A1", "B1", "C1", "A2", "B2", "C2"]
+
+    crud.mover_cancion_aprobada(db, cola[4].id, -1)
+    fijadas = db.query(models.Cancion).filter(models.Cancion.orden_manual.isnot(None)).all()
+    assert sorted(_titulos(fijadas)) == ["A0", "B0", "B1", "C0"]
+    assert _titulos(crud.get_cola_priorizada(db))[:4] == ["A0", "B0", "C0", "B1"]
+
+    # Una mesa que llega después entra por su turno, no al final
+    cancion("D0", "D")
+    assert _titulos(crud.get_cola_priorizada(db)).index("D0") < 8
+    assert [c.id for c in crud.get_cola_priorizada(db)] == [c.id for c in crud._get_cola_priorizada_sql(db)]
+    db.close()
+
+
+def test_mover_lazy_del_usuario_con_claves_enteras():
+    db = SessionLocal()
+    usuario, ids = _cola(db, estado="pendiente_lazy", n=4)
+
+    for _ in range(3):
+        crud.move_lazy_song_up(db, ids[3], usuario.id)
+    crud.move_lazy_song_down(db, ids[0], usuario.id)
+    crud.move_lazy_song_down(db, ids[0], usuario.id)
+
+    cola = crud.get_canciones_por_usuario(db, usuario.id)
+    assert _titulos(cola) == ["C3", "C1", "C2", "C0"]
+    # La lista personal no usa el orden global del admin
+    assert all(c.orden_manual is None for c in cola)
+    assert _titulos(crud.get_cola_lazy(db)) == ["C3", "C1", "C2", "C0"]
+    db.close()
+
+
+def test_reordenar_listas_de_dos_usuarios_no_cambia_el_turno_de_los_demas():
+    """Cada usuario reordena solo sus canciones: la cola justa entre mesas se mantiene."""
+    db = SessionLocal()
+    usuarios = []
+    for nombre in ("A", "B"):
+        mesa = models.Mesa(nombre=nombre, qr_code=nombre, is_active=True)
+        db.add(mesa)
+        db.commit()
+        usuario = models.Usuario(nick=nombre.lower(), mesa_id=mesa.id)
+        db.add(usuario)
+        db.commit()
+        usuarios.append(usuario)
+    a, b = usuarios
+    for i in range(3):
+        for usuario in (a, b):
+            db.add(models.Cancion(titulo=f"{usuario.nick}{i}", youtube_id=f"yt_{usuario.nick}{i}", usuario_id=usuario.id,
+                                  estado="pendiente_lazy", duracion_seconds=100))
+            db.commit()
+    ids = {c.titulo: c.id for c in db.query(models.Cancion)}
+    assert _titulos(crud.get_cola_lazy(db)) == ["a0", "b0", "a1", "b1", "a2", "b2"]
+
+    crud.move_lazy_song_up(db, ids["a2"], a.id)
+    crud.move_lazy_song_up(db, ids["a2"], a.id)
+    crud.move_lazy_song_up(db, ids["b1"], b.id)
+    crud.move_lazy_song_down(db, ids["b2"], b.id)  # ya es la última
+
+    # Las mesas siguen alternando; cada una con su propio orden
+    assert _titulos(crud.get_cola_lazy(db)) == ["a2", "b1", "a0", "b0", "a1", "b2"]
+    assert _titulos(crud.get_canciones_por_usuario(db, a.id)) == ["a2", "a0", "a1"]
+    assert _titulos(crud.get_canciones_por_usuario(db, b.id)) == ["b1", "b0", "b2"]
+    assert db.query(models.Cancion).filter(models.Cancion.orden_manual.isnot(None)).count() == 0
+    assert [c.id for c in crud.get_cola_lazy(db)] == [c.id for c in crud._get_cola_lazy_sql(db)]
+
+    # La primera promovida es la que el usuario eligió, con el turno de su mesa
+    crud.aprobar_siguiente_cancion_lazy(db)
+    assert _titulos(crud.get_cola_priorizada(db)) == ["a2"]
+    assert crud.verificar_cola_residente(db)
+    db.close()
+
+
+def test_endpoints_mover_admin():
+    db = SessionLocal()
+    _, ids = _cola(db, n=3)
+    db.close()
+
+    client = TestClient(main.app)
+    headers = {"X-API-Key": MASTER_API_KEY}
+    assert client.post(f"/api/v1/admin/canciones/{ids[2]}/move-up", headers=headers).status_code == 200
+    assert client.post(f"/api/v1/admin/canciones/{ids[0]}/move-down", headers=headers).status_code == 200
+    assert client.post("/api/v1/admin/canciones/9999/move-up", headers=headers).status_code == 404
+
+    db = SessionLocal()
+    assert _titulos(crud.get_cola_priorizada(db)) == ["C2", "C0", "C1"]
+    db.close()
@@ -0,0 +1,133 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import re
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+import crud, models
+from database import SessionLocal, engine
+
+# Tablas que crecen durante la noche: ninguna consulta caliente puede recorrerlas enteras
+TABLAS_CALIENTES = ("canciones", "consumos", "pagos", "cuentas", "usuarios")
+# "SCAN tabla" sin índice es un recorrido completo (SQLite >= 3.36; antes "SCAN TABLE tabla")
+RECORRIDO_COMPLETO = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+@pytest.fixture
+def datos():
+    """Dos mesas con cuenta, usuarios, canciones en todos los estados, consumos y pagos."""
+    db = SessionLocal()
+    mesas = [models.Mesa(nombre=f"Mesa {i}", qr_code=f"mesa-{i}") for i in range(2)]
+    producto = models.Producto(nombre="Cerveza", categoria="Bebidas", valor=10, stock=100)
+    db.add_all(mesas + [producto])
+    db.commit()
+    cuentas = [models.Cuenta(mesa_id=m.id, is_active=True) for m in mesas]
+    usuarios = [models.Usuario(nick=f"u{i}", mesa_id=mesas[i % 2].id) for i in range(4)]
+    db.add_all(cuentas + usuarios)
+    db.commit()
+    estados = ("pendiente", "pendiente_lazy", "aprobado", "reproduciendo", "cantada", "rechazada")
+    db.add_all(
+        models.Cancion(titulo=f"C{i}", youtube_id=f"yt{i}", usuario_id=usuarios[i % 4].id,
+                       estado=estados[i % len(estados)], duracion_seconds=200)
+        for i in range(24)
+    )
+    db.add_all(
+        models.Consumo(producto_id=producto.id, cantidad=1, valor_total=10, usuario_id=u.id,
+                       mesa_id=u.mesa_id, cuenta_id=cuentas[i % 2].id, is_dispatched=bool(i % 2))
+        for i, u in enumerate(usuarios * 3)
+    )
+    db.add_all(models.Pago(monto=5, mesa_id=c.mesa_id, cuenta_id=c.id) for c in cuentas)
+    db.commit()
+    ids = {
+        "mesa_id": mesas[0].id,
+        "usuario_id": usuarios[0].id,
+        "cuenta_id": cuentas[0].id,
+        "lazy_id": db.query(models.Cancion.id).filter_by(usuario_id=usuarios[0].id, estado="pendiente_lazy").scalar(),
+    }
+    db.close()
+    return ids
+
+
+@contextmanager
+def _capturar_selects():
+    """Guarda (sql, parámetros) de cada SELECT que se ejecute en el engine."""
+    capturadas = []
+
+    def antes(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            capturadas.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", antes)
+    try:
+        yield capturadas
+    finally:
+        event.remove(engine, "before_cursor_execute", antes)
+
+
+def _recorridos_completos(capturadas):
+    """[(tabla, sql)] de cada recorrido completo de una tabla caliente según EXPLAIN QUERY PLAN."""
+    encontrados = []
+    with engine.connect() as conn:
+        for statement, parameters in capturadas:
+            for fila in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters):
+                coincidencia = RECORRIDO_COMPLETO.match(fila[-1])
+                if coincidencia and coincidencia.group(1) in TABLAS_CALIENTES:
+                    encontrados.append((coincidencia.group(1), " ".join(statement.split())))
+    return encontrados
+
+
+CONSULTAS_CALIENTES = {
+    # Cola
+    "cancion_actual": lambda db, ids: crud.get_cancion_actual(db),
+    "cola_aprobada": lambda db, ids: crud._get_cola_priorizada_sql(db),
+    "cola_lazy": lambda db, ids: crud._get_cola_lazy_sql(db),
+    "pendientes": lambda db, ids: crud.get_canciones_pendientes(db),
+    "pendientes_por_aprobar": lambda db, ids: crud.get_canciones_pendientes_por_aprobar(db),
+    "duracion_aprobada": lambda db, ids: crud.get_duracion_total_cola_aprobada(db),
+    "duraciones_cola": lambda db, ids: crud._get_duraciones_cola_sql(db),
+    "cola_lazy_de_usuario": lambda db, ids: crud.move_lazy_song_down(db, ids["lazy_id"], ids["usuario_id"]),
+    # Consumos
+    "consumos_de_usuario": lambda db, ids: crud.get_consumos_por_usuario(db, ids["usuario_id"]),
+    "total_de_usuario": lambda db, ids: crud.get_total_consumido_por_usuario(db, ids["usuario_id"]),
+    "consumos_de_mesa": lambda db, ids: crud.get_consumo_por_mesa(db, ids["mesa_id"]),
+    "pedidos_sin_despachar": lambda db, ids: crud.get_recent_consumos(db),
+    # Cuentas y pagos
+    "cuenta_activa": lambda db, ids: crud.get_active_cuenta(db, ids["mesa_id"]),
+    "cuentas_cerradas": lambda db, ids: crud.get_previous_cuentas(db, ids["mesa_id"]),
+    "estado_de_cuenta": lambda db, ids: crud.get_cuenta_payment_status(db, ids["cuenta_id"]),
+    "estado_de_mesas": lambda db, ids: crud.get_all_tables_payment_status(db),
+}
+
+
+@pytest.mark.parametrize("nombre", CONSULTAS_CALIENTES)
+def test_consulta_caliente_sin_recorrido_completo(datos, nombre):
+    db = SessionLocal()
+    try:
+        with _capturar_selects() as capturadas:
+            CONSULTAS_CALIENTES[nombre](db, datos)
+    finally:
+        db.close()
+
+    assert capturadas, "la consulta no llegó a la base de datos"
+    assert _recorridos_completos(capturadas) == []
+
+
+def test_indices_de_los_modelos():
+    """Los índices que crea la migración add_indices_calientes están en los modelos (create_all)."""
+    with engine.connect() as conn:
+        indices = dict(conn.exec_driver_sql("SELECT name, sql FROM sqlite_master WHERE type = 'index'").fetchall())
+    for nombre in ("ix_canciones_estado_orden", "ix_canciones_usuario_estado", "ix_consumos_usuario_creado",
+                   "ix_consumos_mesa_id", "ix_consumos_cuenta_creado", "ix_pagos_mesa_creado",
+                   "ix_pagos_cuenta_creado", "ix_cuentas_mesa_activa", "ix_usuarios_mesa_id"):
+        assert nombre in indices
+    assert indices["ix_consumos_sin_despachar"].endswith("WHERE is_dispatched = 0")
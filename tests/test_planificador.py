@@ -0,0 +1,96 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import datetime
+import time
+
+import pytest
+
+import config, crud, models
+from database import SessionLocal, engine
+from planificador import Planificador
+from timezone_utils import now_bogota
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+def _usuario(db):
+    mesa = models.Mesa(nombre="M", qr_code="M", is_active=True)
+    db.add(mesa)
+    db.commit()
+    usuario = models.Usuario(nick="u", mesa_id=mesa.id)
+    db.add(usuario)
+    db.commit()
+    return usuario
+
+
+def _cancion(db, usuario, estado, minutos_atras=0):
+    cancion = models.Cancion(titulo=f"{estado}_{minutos_atras}", youtube_id="yt", usuario_id=usuario.id, estado=estado,
+                             duracion_seconds=100, created_at=now_bogota() - datetime.timedelta(minutes=minutos_atras))
+    db.add(cancion)
+    db.commit()
+    return cancion
+
+
+def test_leer_la_cola_no_aprueba_nada():
+    db = SessionLocal()
+    vieja = _cancion(db, _usuario(db), "pendiente", minutos_atras=15)
+
+    crud.get_cola_completa(db)
+    crud.get_cola_completa_con_lazy(db)
+    db.refresh(vieja)
+    assert vieja.estado == "pendiente"
+    db.close()
+
+
+def test_ciclo_aprueba_vencidas_y_programa_el_proximo_vencimiento():
+    db = SessionLocal()
+    usuario = _usuario(db)
+    vieja = _cancion(db, usuario, "pendiente", minutos_atras=15)
+    _cancion(db, usuario, "pendiente", minutos_atras=5)
+
+    planificador = Planificador()
+    assert planificador.ejecutar_ciclo() is True
+    db.refresh(vieja)
+    assert vieja.estado == "aprobado"
+    # La siguiente pendiente vence en ~5 minutos
+    assert 290 <= planificador._proximo_vencimiento - time.monotonic() <= 300
+    assert planificador.ejecutar_ciclo() is False
+    db.close()
+
+
+def test_bucle_promueve_la_cola_lazy_al_cambiar_la_cola(monkeypatch):
+    monkeypatch.setattr(config.settings, "PLANIFICADOR_INTERVALO", 0.02)
+    db = SessionLocal()
+    usuario = _usuario(db)
+    aprobada = _cancion(db, usuario, "aprobado")
+    lazy = _cancion(db, usuario, "pendiente_lazy")
+
+    async def escenario():
+        planificador = Planificador()
+        planificador.iniciar()
+        try:
+            await asyncio.sleep(0.1)
+            db.refresh(lazy)
+            assert lazy.estado == "pendiente_lazy"  # aún hay una aprobada esperando
+
+            # La aprobada empieza a sonar: la cola cambia y el planificador promueve la lazy
+            aprobada.estado = "reproduciendo"
+            db.commit()
+            for _ in range(50):
+                await asyncio.sleep(0.02)
+                db.refresh(lazy)
+                if lazy.estado == "aprobado":
+                    break
+            assert lazy.estado == "aprobado"
+        finally:
+            await planificador.detener()
+
+    asyncio.run(escenario())
+    db.close()
@@ -0,0 +1,258 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+import crud, models, queue_engine, scheduler
+from database import SessionLocal, engine
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+@pytest.fixture
+def politica(request, monkeypatch):
+    """Activa una política de cola solo durante el test (sin tocar settings.json)."""
+    monkeypatch.setattr(scheduler, "_politica_actual", scheduler.POLITICAS[request.param])
+    yield scheduler.POLITICAS[request.param]
+
+
+def _crear_mesa(db, nombre, consumo):
+    mesa = models.Mesa(nombre=nombre, qr_code=nombre, is_active=True)
+    db.add(mesa)
+    db.commit()
+    usuario = models.Usuario(nick=f"user_{nombre}", mesa_id=mesa.id)
+    db.add(usuario)
+    db.commit()
+    if consumo:
+        db.add(models.Consumo(cantidad=1, valor_total=consumo, mesa_id=mesa.id, usuario_id=usuario.id))
+        db.commit()
+    return mesa, usuario
+
+
+def _cancion(db, titulo, usuario, estado="aprobado", duracion=100):
+    cancion = models.Cancion(titulo=titulo, youtube_id=f"yt_{titulo}", usuario_id=usuario.id, estado=estado, duracion_seconds=duracion)
+    db.add(cancion)
+    db.commit()
+    return cancion
+
+
+def _assert_igual_a_sql(db):
+    assert [c.id for c in crud.get_cola_priorizada(db)] == [c.id for c in crud._get_cola_priorizada_sql(db)]
+    assert [c.id for c in crud.get_cola_lazy(db)] == [c.id for c in crud._get_cola_lazy_sql(db)]
+
+
+def test_cola_residente_coincide_con_sql_tras_cada_cambio():
+    db = SessionLocal()
+    _, user_a = _crear_mesa(db, "A", 200000)
+    mesa_b, user_b = _crear_mesa(db, "B", 100000)
+    mesa_c, user_c = _crear_mesa(db, "C", 10000)
+
+    for titulo, usuario in [("A1", user_a), ("B1", user_b), ("C1", user_c), ("A2", user_a), ("B2", user_b),
+                            ("C2", user_c), ("A3", user_a), ("B3", user_b), ("C3", user_c), ("A4", user_a)]:
+        _cancion(db, titulo, usuario)
+
+    cola = crud.get_cola_priorizada(db)
+    assert [c.titulo for c in cola] == ["A1", "A2", "A3", "B1", "B2", "C1", "A4", "B3", "C2", "C3"]
+    _assert_igual_a_sql(db)
+
+    # Nueva canción al final de una mesa
+    _cancion(db, "B4", user_b)
+    _assert_igual_a_sql(db)
+
+    # Reproducir la primera canción: cambia el orden interno y la llegada de la mesa A
+    crud.marcar_siguiente_como_reproduciendo(db)
+    _assert_igual_a_sql(db)
+
+    # Un consumo sube la mesa C de BRONCE a PLATA
+    db.add(models.Consumo(cantidad=1, valor_total=60000, mesa_id=mesa_c.id, usuario_id=user_c.id))
+    db.commit()
+    _assert_igual_a_sql(db)
+    assert crud.verificar_cola_residente(db)
+
+    # Canciones lazy, borrado y movimiento manual
+    lazy = [_cancion(db, f"L{i}", u, estado="pendiente_lazy") for i, u in enumerate([user_a, user_b, user_c, user_b])]
+    _assert_igual_a_sql(db)
+    crud.delete_cancion(db, lazy[1].id)
+    _assert_igual_a_sql(db)
+    lazy[3].orden_manual = 1
+    db.commit()
+    _assert_igual_a_sql(db)
+
+    # Actualización masiva (reordenar) e invalidación
+    ids = [c.id for c in crud.get_cola_priorizada(db)]
+    crud.reordenar_cola_manual(db, canciones_ids=list(reversed(ids[:3])))
+    _assert_igual_a_sql(db)
+    assert [c.id for c in crud.get_cola_priorizada(db)][:3] == list(reversed(ids[:3]))
+    db.close()
+
+
+def test_ids_devuelve_tramos_de_la_cola():
+    db = SessionLocal()
+    _, user_a = _crear_mesa(db, "A", 0)
+    _, user_b = _crear_mesa(db, "B", 0)
+    for i in range(5):
+        _cancion(db, f"A{i}", user_a)
+        _cancion(db, f"B{i}", user_b)
+
+    completa = queue_engine.motor.get_ids(db, "aprobado")
+    assert len(completa) == 10
+    assert queue_engine.motor.get_ids(db, "aprobado", offset=3, limit=4) == completa[3:7]
+    db.close()
+
+
+@pytest.mark.parametrize("politica", list(scheduler.POLITICAS), indirect=True)
+def test_cola_residente_coincide_con_sql_en_cada_politica(politica):
+    db = SessionLocal()
+    _, user_a = _crear_mesa(db, "A", 200000)
+    mesa_b, user_b = _crear_mesa(db, "B", 0)
+    for i in range(4):
+        _cancion(db, f"A{i}", user_a, duracion=300)
+        _cancion(db, f"B{i}", user_b, duracion=60 + i)
+    _assert_igual_a_sql(db)
+
+    crud.marcar_siguiente_como_reproduciendo(db)
+    _assert_igual_a_sql(db)
+    db.add(models.Consumo(cantidad=1, valor_total=60000, mesa_id=mesa_b.id, usuario_id=user_b.id))
+    db.commit()
+    _assert_igual_a_sql(db)
+    assert crud.verificar_cola_residente(db)
+    db.close()
+
+
+def test_politicas_fifo_y_wfq(monkeypatch):
+    db = SessionLocal()
+    _, user_a = _crear_mesa(db, "A", 200000)  # ORO: peso 3
+    _, user_b = _crear_mesa(db, "B", 0)       # BRONCE: peso 1
+    canciones = [_cancion(db, "A0", user_a, duracion=300), _cancion(db, "B0", user_b, duracion=100),
+                 _cancion(db, "A1", user_a, duracion=300), _cancion(db, "B1", user_b, duracion=100)]
+
+    # set_politica persiste en settings.json: en el test solo se cambia la política en memoria
+    monkeypatch.setattr(scheduler.settings_storage, "set_setting", lambda clave, valor: None)
+    monkeypatch.setattr(scheduler, "_politica_actual", scheduler.POLITICAS["cuota_nivel"])
+
+    scheduler.set_politica("fifo")
+    assert [c.id for c in crud.get_cola_priorizada(db)] == [c.id for c in canciones]
+    # WFQ: A termina en 100, 200; B en 100, 200 -> empates por llegada de la mesa
+    scheduler.set_politica("wfq")
+    assert [c.titulo for c in crud.get_cola_priorizada(db)] == ["A0", "B0", "A1", "B1"]
+    _assert_igual_a_sql(db)
+    scheduler.set_politica("cuota_nivel")
+    assert [c.titulo for c in crud.get_cola_priorizada(db)] == ["A0", "A1", "B0", "B1"]
+
+    with pytest.raises(ValueError):
+        scheduler.set_politica("no_existe")
+    db.close()
+
+
+def test_lecturas_concurrentes_tras_invalidar_no_duplican():
+    """Varios hilos reconstruyen a la vez: una sola cola, sin ids repetidos ni totales inflados."""
+    import asyncio
+    from database import en_hilo
+
+    db = SessionLocal()
+    _, user_a = _crear_mesa(db, "A", 200000)
+    _, user_b = _crear_mesa(db, "B", 0)
+    for i in range(10):
+        _cancion(db, f"A{i}", user_a)
+        _cancion(db, f"B{i}", user_b)
+    db.close()
+
+    def leer():
+        sesion = SessionLocal()
+        try:
+            return queue_engine.motor.get_ids(sesion, "aprobado"), queue_engine.motor.get_totales_mesas(sesion)
+        finally:
+            sesion.close()
+
+    async def leer_a_la_vez():
+        return await asyncio.gather(*(en_hilo(leer) for _ in range(8)))
+
+    queue_engine.motor.invalidar()
+    for ids, totales in asyncio.run(leer_a_la_vez()):
+        assert len(ids) == len(set(ids)) == 20
+        assert sum(totales.values()) == 20 * 100  # segundos
+
+
+def test_lock_libre_durante_consultas(monkeypatch):
+    """El lock del estado no se tiene mientras el motor consulta la BD."""
+    import threading
+
+    db = SessionLocal()
+    _, user_a = _crear_mesa(db, "A", 0)
+    _cancion(db, "A0", user_a)
+
+    libre = []
+    cupos = queue_engine.cache_niveles.cupos
+
+    def cupos_vigilados(sesion, mesas):
+        hilo = threading.Thread(target=lambda: libre.append(_adquirir_y_soltar(queue_engine.motor._lock)))
+        hilo.start()
+        hilo.join()
+        return cupos(sesion, mesas)
+
+    monkeypatch.setattr(queue_engine.cache_niveles, "cupos", cupos_vigilados)
+    queue_engine.motor.invalidar()
+    assert queue_engine.motor.get_ids(db, "aprobado")  # reconstruye
+    _, user_b = _crear_mesa(db, "B", 0)
+    _cancion(db, "B0", user_b)
+    assert len(queue_engine.motor.get_ids(db, "aprobado")) == 2  # incremental con mesa nueva
+    assert libre == [True, True]
+    db.close()
+
+
+def _adquirir_y_soltar(lock):
+    if not lock.acquire(blocking=False):
+        return False
+    lock.release()
+    return True
+
+
+def test_savepoint_deshecho_no_llega_a_la_cola():
+    """Los cambios de un SAVEPOINT deshecho (unidad fallida) no se aplican al confirmar."""
+    db = SessionLocal()
+    _, user_a = _crear_mesa(db, "A", 0)
+    primera = _cancion(db, "A0", user_a)
+    assert queue_engine.motor.get_ids(db, "aprobado") == [primera.id]
+
+    savepoint = db.begin_nested()
+    primera.estado = "rechazada"
+    db.add(models.Cancion(titulo="A1", youtube_id="yt_A1", usuario_id=user_a.id, estado="aprobado", duracion_seconds=100))
+    db.flush()
+    savepoint.rollback()
+    segunda = _cancion(db, "A2", user_a)  # commit de la transacción externa
+
+    assert queue_engine.motor.get_ids(db, "aprobado") == [primera.id, segunda.id]
+    _assert_igual_a_sql(db)
+    db.close()
+
+
+def test_sin_poder_sincronizar_se_usa_la_ruta_sql(monkeypatch, caplog):
+    """Si la cola no se pone al día en _INTENTOS_SINCRONIZAR, nadie lee el estado viejo."""
+    db = SessionLocal()
+    mesa, usuario = _crear_mesa(db, "A", 0)
+    primera = _cancion(db, "A0", usuario)
+    assert [c.id for c in crud.get_cola_priorizada(db)] == [primera.id]
+
+    # Un commit que el motor no vio y una cola que no deja de cambiar mientras se sincroniza
+    with engine.begin() as conexion:
+        nueva_id = conexion.execute(models.Cancion.__table__.insert().values(
+            titulo="A1", youtube_id="yt_A1", usuario_id=usuario.id, estado="aprobado", duracion_seconds=100,
+        )).inserted_primary_key[0]
+    monkeypatch.setattr(queue_engine.motor, "_aplicar_pendientes", lambda sesion: False)
+    queue_engine.motor._indice_espera = None
+
+    assert queue_engine.motor.get_ids(db, "aprobado") is None
+    assert queue_engine.motor.get_totales(db, mesa.id) is None
+    assert queue_engine.motor.get_totales_mesas(db) is None
+    assert queue_engine.motor.get_indice_espera(db) is None
+    assert "no se pudo poner al día" in caplog.text
+
+    assert [c.id for c in crud.get_cola_priorizada(db)] == [primera.id, nueva_id]
+    assert crud.get_duraciones_cola(db, mesa.id) == ({"aprobado": 200, "pendiente_lazy": 0}, 200)
+    assert crud.get_duraciones_mesas(db) == {mesa.id: 200}
+    assert crud.get_tiempo_espera_para_cancion(db, nueva_id) == 100
+    db.close()
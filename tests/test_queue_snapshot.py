@@ -0,0 +1,86 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import crud, main, models
+from database import SessionLocal, engine
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+def _usuario():
+    db = SessionLocal()
+    mesa = models.Mesa(nombre="M", qr_code="M", is_active=True)
+    db.add(mesa)
+    db.commit()
+    usuario = models.Usuario(nick="u", mesa_id=mesa.id)
+    db.add(usuario)
+    db.commit()
+    usuario_id = usuario.id
+    db.close()
+    return usuario_id
+
+
+def _agregar_cancion(usuario_id, titulo):
+    db = SessionLocal()
+    db.add(models.Cancion(titulo=titulo, youtube_id="yt", usuario_id=usuario_id, estado="aprobado", duracion_seconds=100))
+    db.commit()
+    db.close()
+
+
+def test_etag_304_y_snapshot_por_version(monkeypatch):
+    usuario_id = _usuario()
+    _agregar_cancion(usuario_id, "A")
+
+    calculos = []
+    original = crud.get_cola_completa_con_lazy
+    monkeypatch.setattr(crud, "get_cola_completa_con_lazy", lambda db: calculos.append(1) or original(db))
+
+    client = TestClient(main.app)
+    resp = client.get("/api/v1/canciones/cola/extended")
+    assert resp.status_code == 200
+    etag = resp.headers["etag"]
+    assert resp.json()["upcoming"][0]["titulo"] == "A"
+
+    # Misma versión: 304 sin recalcular, y un GET normal reutiliza el snapshot
+    resp = client.get("/api/v1/canciones/cola/extended", headers={"If-None-Match": etag})
+    assert resp.status_code == 304 and resp.content == b""
+    assert client.get("/api/v1/canciones/cola/extended").headers["etag"] == etag
+    assert len(calculos) == 1
+
+    # Un cambio en la cola produce una versión nueva
+    _agregar_cancion(usuario_id, "B")
+    resp = client.get("/api/v1/canciones/cola/extended", headers={"If-None-Match": etag})
+    assert resp.status_code == 200 and resp.headers["etag"] != etag
+    assert int(resp.headers["x-queue-version"]) > 0
+    assert len(calculos) == 2
+
+
+def test_long_poll_since_version():
+    usuario_id = _usuario()
+    client = TestClient(main.app)
+    version = int(client.get("/api/v1/canciones/cola").headers["x-queue-version"])
+
+    # Sin cambios: responde al agotar el tiempo con la misma versión
+    inicio = time.monotonic()
+    resp = client.get(f"/api/v1/canciones/cola?since_version={version}&timeout=0.2")
+    assert time.monotonic() - inicio >= 0.2
+    assert int(resp.headers["x-queue-version"]) == version
+
+    # Con un cambio durante la espera: responde en cuanto cambia la versión
+    threading.Timer(0.2, _agregar_cancion, args=(usuario_id, "A")).start()
+    inicio = time.monotonic()
+    resp = client.get(f"/api/v1/canciones/cola?since_version={version}&timeout=10")
+    assert time.monotonic() - inicio < 5
+    assert int(resp.headers["x-queue-version"]) > version
+    assert [c["titulo"] for c in resp.json()["upcoming"]] == ["A"]
@@ -0,0 +1,74 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import broadcast, config, main, websocket_manager
+from websocket_manager import ConnectionManager
+
+
+@pytest.fixture(autouse=True)
+def limites(monkeypatch):
+    monkeypatch.setattr(config.settings, "REACCIONES_RAFAGA", 5)
+    monkeypatch.setattr(config.settings, "REACCIONES_POR_SEGUNDO", 2)
+    monkeypatch.setattr(config.settings, "WS_VENTANA_REACCIONES", 0.05)
+    monkeypatch.setattr(config.settings, "WS_MUESTRA_REMITENTES", 4)
+
+
+class ClienteSimulado:
+    def __init__(self):
+        self.recibidos = []
+
+    async def send_text(self, mensaje: str):
+        self.recibidos.append(json.loads(mensaje))
+
+    async def close(self):
+        pass
+
+
+def test_una_tormenta_de_reacciones_sale_en_un_frame():
+    manager = ConnectionManager()
+    cliente = ClienteSimulado()
+
+    async def escenario():
+        manager.registrar(cliente, temas=["reactions"])
+        for i in range(30):
+            manager.agregar_reaccion({"reaction": "🎉" if i % 3 else "🔥", "sender": f"u{i % 6}"})
+        await asyncio.sleep(0.1)
+        # Lo que llega después va en el siguiente frame
+        manager.agregar_reaccion({"reaction": "👏", "sender": "u1"})
+        await asyncio.sleep(0.1)
+
+    asyncio.run(escenario())
+    assert [m["type"] for m in cliente.recibidos] == ["reaction", "reaction"]
+    frame = cliente.recibidos[0]["payload"]
+    assert frame["counts"] == {"🔥": 10, "🎉": 20} and frame["total"] == 30
+    assert frame["reaction"] == "🎉" and frame["sender"] == "u0"
+    assert len(frame["senders"]) == 4
+    assert cliente.recibidos[1]["payload"]["counts"] == {"👏": 1}
+
+
+def test_cubeta_de_tokens_por_usuario():
+    limitador = broadcast.LimitadorReacciones()
+    assert [limitador.permitir("ana", ahora=0) for _ in range(6)] == [True] * 5 + [False]
+    # Otro usuario tiene su propia cubeta
+    assert limitador.permitir("beto", ahora=0)
+    # A 2 por segundo, medio segundo después hay un token más
+    assert limitador.permitir("ana", ahora=0.5)
+    assert not limitador.permitir("ana", ahora=0.5)
+    assert [limitador.permitir("ana", ahora=10) for _ in range(6)] == [True] * 5 + [False]
+
+
+def test_el_endpoint_limita_y_solo_acumula(monkeypatch):
+    acumuladas = []
+    monkeypatch.setattr(broadcast, "limitador", broadcast.LimitadorReacciones())
+    monkeypatch.setattr(websocket_manager.manager, "agregar_reaccion", acumuladas.append)
+    client = TestClient(main.app)
+    codigos = [client.post("/api/v1/broadcast/reaction", json={"reaction": "🎉", "sender": "ana"}).status_code
+               for _ in range(7)]
+    assert codigos[:5] == [202] * 5 and 429 in codigos[5:]
+    assert len(acumuladas) == codigos.count(202)
@@ -0,0 +1,181 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import config, crud, main, models, reproduccion
+from database import SessionLocal, engine
+from timezone_utils import now_bogota
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    reproduccion.reloj.terminar()
+    yield
+    reproduccion.reloj.desactivar()
+    reproduccion.reloj.terminar()
+
+
+def _preparar(db, segundos_transcurridos=50, duracion_actual=200):
+    mesa = models.Mesa(nombre="M", qr_code="M", is_active=True)
+    db.add(mesa)
+    db.commit()
+    usuario = models.Usuario(nick="u", mesa_id=mesa.id)
+    db.add(usuario)
+    db.commit()
+    actual = models.Cancion(titulo="Sonando", youtube_id="yt_0", usuario_id=usuario.id, estado="reproduciendo",
+                            duracion_seconds=duracion_actual,
+                            started_at=now_bogota() - datetime.timedelta(seconds=segundos_transcurridos))
+    siguiente = models.Cancion(titulo="Siguiente", youtube_id="yt_1", usuario_id=usuario.id, estado="aprobado", duracion_seconds=100)
+    db.add_all([actual, siguiente])
+    db.commit()
+    return actual, siguiente
+
+
+def test_pausas_se_descuentan_de_la_posicion_y_del_tiempo_de_espera(monkeypatch):
+    db = SessionLocal()
+    actual, siguiente = _preparar(db)
+    reloj = reproduccion.reloj
+    reloj.sincronizar(db)
+    assert reloj.cancion_id == actual.id
+    assert 49 <= reloj.posicion() <= 51
+
+    ahora = now_bogota()
+    monkeypatch.setattr(reproduccion, "now_bogota", lambda: ahora)
+    assert reloj.pausar()
+    # Diez minutos en pausa: la posición no avanza y el tiempo de espera tampoco baja
+    monkeypatch.setattr(reproduccion, "now_bogota", lambda: ahora + datetime.timedelta(minutes=10))
+    posicion = reloj.posicion()
+    assert reloj.estado()["pausado"] and reloj.estado()["fin_esperado"] is None
+    assert reloj.reanudar()
+    assert abs(reloj.posicion() - posicion) < 0.01
+    assert abs(crud.get_tiempo_espera_para_cancion(db, siguiente.id) - (200 - posicion)) <= 1
+
+    assert reloj.reiniciar()
+    assert reloj.posicion() == 0
+    db.close()
+
+
+def test_el_servidor_avanza_si_el_player_no_lo_hace(monkeypatch):
+    monkeypatch.setattr(config.settings, "RELOJ_MARGEN_AVANCE", 0)
+    db = SessionLocal()
+    actual, siguiente = _preparar(db, segundos_transcurridos=0.9, duracion_actual=1)
+
+    async def escenario():
+        reproduccion.reloj.activar()
+        assert reproduccion.reloj.cancion_id == actual.id
+        for _ in range(50):
+            await asyncio.sleep(0.05)
+            db.refresh(siguiente)
+            if siguiente.estado == "reproduciendo":
+                break
+        reproduccion.reloj.desactivar()
+
+    asyncio.run(escenario())
+    db.refresh(actual)
+    assert actual.estado == "cantada"
+    assert siguiente.estado == "reproduciendo"
+    assert reproduccion.reloj.cancion_id == siguiente.id
+    db.close()
+
+
+def test_con_player_conectado_el_servidor_solo_avanza_como_respaldo(monkeypatch):
+    """Con un player con latido manda su aviso de fin; el servidor espera RELOJ_MARGEN_CON_PLAYER."""
+    import websocket_manager
+
+    class Player:
+        async def send_text(self, mensaje):
+            pass
+
+        async def close(self):
+            pass
+
+    monkeypatch.setattr(config.settings, "RELOJ_MARGEN_AVANCE", 0)
+    monkeypatch.setattr(config.settings, "RELOJ_MARGEN_CON_PLAYER", 0.8)
+    db = SessionLocal()
+    actual, siguiente = _preparar(db, segundos_transcurridos=0.9, duracion_actual=1)
+    player = Player()
+
+    async def escenario():
+        websocket_manager.manager.registrar(player, temas=["player"])
+        try:
+            reproduccion.reloj.activar()
+            # Pasado el fin según la BD el video sigue: el player no avisó y está vivo
+            await asyncio.sleep(0.5)
+            db.refresh(siguiente)
+            assert siguiente.estado == "aprobado"
+            # Respaldo: el player no avisó dentro del margen
+            for _ in range(50):
+                await asyncio.sleep(0.05)
+                db.refresh(siguiente)
+                if siguiente.estado == "reproduciendo":
+                    break
+        finally:
+            websocket_manager.manager.disconnect(player)
+            reproduccion.reloj.desactivar()
+
+    asyncio.run(escenario())
+    db.refresh(actual)
+    assert actual.estado == "cantada"
+    assert siguiente.estado == "reproduciendo"
+    db.close()
+
+
+def test_siguiente_no_avanza_dos_veces():
+    db = SessionLocal()
+    actual, siguiente = _preparar(db)
+    actual_id, siguiente_id = actual.id, siguiente.id
+    db.close()
+
+    client = TestClient(main.app)
+    resp = client.post(f"/api/v1/canciones/siguiente?cancion_id={actual_id}")
+    assert resp.json()["cancion"]["id"] == siguiente_id
+    # El player repite el aviso de la canción ya terminada: se devuelve la actual sin avanzar
+    resp = client.post(f"/api/v1/canciones/siguiente?cancion_id={actual_id}")
+    assert resp.json()["cancion"]["id"] == siguiente_id
+
+    estado = client.get("/api/v1/canciones/reproduccion").json()
+    assert estado["cancion_id"] == siguiente_id and estado["pausado"] is False
+
+
+def test_preload_next_al_umbral_y_play_song_antes_de_la_cola(monkeypatch):
+    import websocket_manager
+    monkeypatch.setattr(config.settings, "RELOJ_AVANCE_AUTOMATICO", False)
+    monkeypatch.setattr(config.settings, "RELOJ_UMBRAL_PRECARGA", 0.5)
+    eventos = []
+
+    async def registrar(mensaje, **opciones):
+        eventos.append(mensaje)
+
+    monkeypatch.setattr(websocket_manager.manager, "_broadcast", registrar)
+    db = SessionLocal()
+    # 0.8 s de una canción de 2 s: el umbral del 50% llega en ~0.2 s
+    actual, siguiente = _preparar(db, segundos_transcurridos=0.8, duracion_actual=2)
+
+    async def escenario():
+        reproduccion.reloj.activar()
+        await asyncio.sleep(0.1)
+        assert not [e for e in eventos if e["type"] == "preload_next"]
+        for _ in range(40):
+            await asyncio.sleep(0.05)
+            if any(e["type"] == "preload_next" for e in eventos):
+                break
+        precarga = [e for e in eventos if e["type"] == "preload_next"]
+        assert len(precarga) == 1
+        assert precarga[0]["payload"]["youtube_id"] == "yt_1"
+
+        eventos.clear()
+        await crud.avanzar_cola_automaticamente(db)
+        await asyncio.sleep(config.settings.WS_VENTANA_COLA + 0.05)
+        tipos = [e["type"] for e in eventos]
+        assert tipos.index("play_song") < tipos.index("queue_update")
+        reproduccion.reloj.desactivar()
+
+    asyncio.run(escenario())
+    db.close()
@@ -0,0 +1,124 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+import time
+
+import pytest
+from starlette.requests import Request
+
+import config, stream, websocket_manager
+from websocket_manager import ConnectionManager
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    nuevo = ConnectionManager()
+    monkeypatch.setattr(websocket_manager, "manager", nuevo)
+    return nuevo
+
+
+def _request(ruta, last_event_id=None):
+    headers = [(b"last-event-id", last_event_id.encode())] if last_event_id else []
+    return Request({"type": "http", "method": "GET", "path": ruta, "headers": headers, "query_string": b""})
+
+
+def _bloque(texto):
+    """{"id": ..., "data": {...}} de un bloque SSE."""
+    campos = dict(linea.split(": ", 1) for linea in texto.strip().split("\n"))
+    return {"id": campos.get("id"), "data": json.loads(campos["data"])}
+
+
+async def _siguiente(cuerpo):
+    return _bloque(await asyncio.wait_for(cuerpo.__anext__(), timeout=1))
+
+
+def test_stream_del_player_y_reanudacion(manager):
+    async def escenario():
+        respuesta = await stream.stream_player(_request("/api/v1/stream/player"))
+        assert respuesta.media_type == "text/event-stream"
+        assert respuesta.headers["cache-control"] == "no-cache, no-transform"
+        cuerpo = respuesta.body_iterator
+        assert await cuerpo.__anext__() == "retry: 3000\n\n"
+        sesion = await _siguiente(cuerpo)
+        assert sesion["data"]["type"] == "session" and sesion["data"]["payload"]["replay"] == "none"
+        assert (await _siguiente(cuerpo))["data"]["type"] == "playback_state"
+
+        await manager.broadcast_pause()
+        pausa = await _siguiente(cuerpo)
+        assert pausa["data"]["type"] == "pause_playback"
+        assert pausa["id"] == f"{manager.nodo}.{pausa['data']['seq']}"
+        await cuerpo.aclose()
+        assert manager.active_connections == []
+
+        # Mientras estaba desconectado: una reacción (otro tema) y una reanudación
+        await manager.broadcast_reaction({"reaction": "🎉"})
+        await manager.broadcast_resume()
+        respuesta = await stream.stream_player(_request("/api/v1/stream/player", pausa["id"]))
+        cuerpo = respuesta.body_iterator
+        await cuerpo.__anext__()
+        reanudada = await _siguiente(cuerpo)
+        sesion = await _siguiente(cuerpo)
+        await cuerpo.aclose()
+        return reanudada, sesion
+
+    reanudada, sesion = asyncio.run(escenario())
+    # Lo perdido se encola al registrarse, antes del "session"
+    assert reanudada["data"]["type"] == "resume_playback"
+    assert sesion["data"]["payload"]["replay"] == "ok"
+
+
+def test_id_de_otro_worker_recibe_el_estado_actual(manager, monkeypatch):
+    async def leer_cola():
+        return {"now_playing": None, "upcoming": [], "pending": []}
+
+    monkeypatch.setattr(manager, "_leer_cola", leer_cola)
+
+    async def escenario():
+        respuesta = await stream.stream_queue(_request("/api/v1/stream/queue", f"otro-nodo.{manager.seq}"))
+        cuerpo = respuesta.body_iterator
+        await cuerpo.__anext__()
+        tipos = [(await _siguiente(cuerpo))["data"] for _ in range(2)]
+        await cuerpo.aclose()
+        return tipos
+
+    sesion, cola = asyncio.run(escenario())
+    assert sesion["payload"]["replay"] == "gap"
+    assert cola["type"] == "queue_update"
+
+
+def test_el_latido_no_cierra_los_streams(manager, monkeypatch):
+    monkeypatch.setattr(config.settings, "WS_INTERVALO_PING", 10)
+    monkeypatch.setattr(config.settings, "WS_TIMEOUT_PONG", 5)
+
+    async def escenario():
+        respuesta = await stream.stream_player(_request("/api/v1/stream/player"))
+        cuerpo = respuesta.body_iterator
+        for _ in range(3):
+            await cuerpo.__anext__()
+        cliente = manager.active_connections[0]
+        # Sin pong posible: recibe un comentario de latido y sigue conectado
+        assert manager.revisar_latidos(time.monotonic() + 60) == 0
+        assert await asyncio.wait_for(cuerpo.__anext__(), timeout=1) == ": ping\n\n"
+        assert manager.active_connections == [cliente]
+        await cuerpo.aclose()
+
+    asyncio.run(escenario())
+
+
+def test_un_stream_del_player_no_cuenta_como_player_conectado(manager, monkeypatch):
+    """Una pantalla SSE del tema "player" no impide que el servidor avance la cola."""
+    monkeypatch.setattr(config.settings, "WS_INTERVALO_PING", 10)
+    monkeypatch.setattr(config.settings, "WS_TIMEOUT_PONG", 5)
+
+    async def escenario():
+        cliente = stream.ClienteSSE()
+        manager.registrar(cliente, temas=["player"], codificacion="sse")
+        ahora = time.monotonic()
+        for i in range(1, 6):
+            manager.revisar_latidos(ahora + 10 * i)
+            assert not manager.player_conectado(ahora + 10 * i)
+        manager.disconnect(cliente)
+
+    asyncio.run(escenario())
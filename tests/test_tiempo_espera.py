@@ -0,0 +1,86 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import crud, main, models, queue_engine
+from database import SessionLocal, engine
+from timezone_utils import now_bogota
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+def _preparar(db):
+    mesa_a = models.Mesa(nombre="A", qr_code="A", is_active=True)
+    mesa_b = models.Mesa(nombre="B", qr_code="B", is_active=True)
+    db.add_all([mesa_a, mesa_b])
+    db.commit()
+    user_a = models.Usuario(nick="a", mesa_id=mesa_a.id)
+    user_b = models.Usuario(nick="b", mesa_id=mesa_b.id)
+    db.add_all([user_a, user_b])
+    db.commit()
+    db.add(models.Cancion(titulo="Sonando", youtube_id="yt_0", usuario_id=user_b.id, estado="reproduciendo",
+                          duracion_seconds=200, started_at=now_bogota() - datetime.timedelta(seconds=50)))
+    for i, (usuario, duracion) in enumerate([(user_a, 100), (user_b, 180), (user_a, 120), (user_b, 90)]):
+        db.add(models.Cancion(titulo=f"C{i}", youtube_id=f"yt_{i}", usuario_id=usuario.id, estado="aprobado", duracion_seconds=duracion))
+    db.commit()
+    return mesa_a, user_a, user_b
+
+
+def _espera_lineal(db, cancion_id):
+    """Cálculo de referencia: recorre la cola completa."""
+    total = 150  # restante de la canción que suena (200 - 50)
+    for cancion in crud._get_cola_priorizada_sql(db):
+        if cancion.id == cancion_id:
+            return total
+        total += cancion.duracion_seconds
+    return -1
+
+
+def test_indice_coincide_con_recorrido_lineal_y_se_reutiliza_por_version():
+    db = SessionLocal()
+    _, user_a, _ = _preparar(db)
+
+    cola = crud.get_cola_priorizada(db)
+    for cancion in cola:
+        assert abs(crud.get_tiempo_espera_para_cancion(db, cancion.id) - _espera_lineal(db, cancion.id)) <= 1
+
+    indice = crud.get_indice_espera(db)
+    assert crud.get_indice_espera(db) is indice
+    assert crud.get_tiempo_espera_para_cancion(db, 9999) == -1
+
+    # Una canción nueva cambia la versión de la cola y obliga a reconstruir el índice
+    nueva = models.Cancion(titulo="C9", youtube_id="yt_9", usuario_id=user_a.id, estado="aprobado", duracion_seconds=60)
+    db.add(nueva)
+    db.commit()
+    assert crud.get_indice_espera(db) is not indice
+    assert abs(crud.get_tiempo_espera_para_cancion(db, nueva.id) - _espera_lineal(db, nueva.id)) <= 1
+    db.close()
+
+
+def test_endpoint_tiempos_espera_por_usuario_y_mesa():
+    db = SessionLocal()
+    mesa_a, user_a, user_b = _preparar(db)
+    esperados = {c.id: _espera_lineal(db, c.id) for c in crud.get_cola_priorizada(db)}
+    db.close()
+
+    client = TestClient(main.app)
+    resp = client.get(f"/api/v1/canciones/tiempos-espera?usuario_id={user_b.id}")
+    assert resp.status_code == 200
+    filas = resp.json()
+    assert [f["titulo"] for f in filas] == ["C1", "C3"]
+    for fila in filas:
+        assert abs(fila["tiempo_espera_segundos"] - esperados[fila["cancion_id"]]) <= 1
+
+    resp = client.get(f"/api/v1/canciones/tiempos-espera?mesa_id={mesa_a.id}")
+    assert [f["posicion"] for f in resp.json()] == [1, 3]
+
+    assert client.get("/api/v1/canciones/tiempos-espera").status_code == 400
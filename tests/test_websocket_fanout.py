@@ -0,0 +1,134 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+import time
+
+import pytest
+
+import config
+from websocket_manager import ConnectionManager
+
+
+class ClienteSimulado:
+    """WebSocket falso: registra el "type" de lo recibido; `puerta` permite bloquear los envíos."""
+
+    def __init__(self, retardo: float = 0.0, bloqueado: bool = False):
+        self.retardo = retardo
+        self.recibidos = []
+        self.cerrado = False
+        self.puerta = asyncio.Event()
+        if not bloqueado:
+            self.puerta.set()
+
+    async def send_text(self, mensaje: str):
+        await self.puerta.wait()
+        if self.retardo:
+            await asyncio.sleep(self.retardo)
+        self.recibidos.append(json.loads(mensaje)["type"])
+
+    async def close(self):
+        self.cerrado = True
+
+
+@pytest.fixture
+def ajustes(monkeypatch):
+    def aplicar(**valores):
+        for nombre, valor in valores.items():
+            monkeypatch.setattr(config.settings, nombre, valor)
+    return aplicar
+
+
+def _manager(*clientes):
+    manager = ConnectionManager()
+    for cliente in clientes:
+        manager.registrar(cliente)
+    return manager
+
+
+def test_un_cliente_lento_no_retrasa_a_los_demas(ajustes):
+    ajustes(WS_TIMEOUT_ENVIO=0.3, WS_POLITICA_LENTOS="drop_oldest")
+
+    async def escenario():
+        lento = ClienteSimulado(retardo=10)
+        rapidos = [ClienteSimulado() for _ in range(20)]
+        manager = _manager(lento, *rapidos)
+
+        inicio = time.perf_counter()
+        await manager._broadcast({"type": "hola"})
+        assert time.perf_counter() - inicio < 0.05
+        await asyncio.sleep(0.05)
+        assert all(c.recibidos == ["hola"] for c in rapidos)
+
+        # El lento supera el timeout de envío: se desconecta y se cierra
+        await asyncio.sleep(0.4)
+        assert lento not in manager.active_connections and lento.cerrado
+        assert len(manager.active_connections) == 20
+
+    asyncio.run(escenario())
+
+
+def test_coalesce_deja_solo_el_ultimo_estado_de_la_cola(ajustes):
+    ajustes(WS_POLITICA_LENTOS="coalesce")
+
+    async def escenario():
+        cliente = ClienteSimulado(bloqueado=True)
+        manager = _manager(cliente)
+        await manager._broadcast({"type": "cola-1"}, clave="queue_update")
+        await asyncio.sleep(0)  # el escritor toma cola-1 y queda bloqueado enviándolo
+        for i in range(2, 6):
+            await manager._broadcast({"type": f"cola-{i}"}, clave="queue_update")
+        await manager._broadcast({"type": "play"})
+        await manager._broadcast({"type": "cola-6"}, clave="queue_update")
+        cliente.puerta.set()
+        await asyncio.sleep(0.05)
+        assert cliente.recibidos == ["cola-1", "play", "cola-6"]
+
+    asyncio.run(escenario())
+
+
+def test_drop_oldest_y_disconnect_con_la_cola_llena(ajustes):
+    ajustes(WS_COLA_MAXIMA=3, WS_POLITICA_LENTOS="drop_oldest")
+
+    async def escenario(politica):
+        ajustes(WS_POLITICA_LENTOS=politica)
+        cliente = ClienteSimulado(bloqueado=True)
+        manager = _manager(cliente)
+        await manager._broadcast({"type": "m0"})
+        await asyncio.sleep(0)
+        for i in range(1, 6):
+            await manager._broadcast({"type": f"m{i}"})
+        cliente.puerta.set()
+        await asyncio.sleep(0.05)
+        return cliente, manager
+
+    cliente, manager = asyncio.run(escenario("drop_oldest"))
+    assert cliente.recibidos == ["m0", "m3", "m4", "m5"]
+
+    cliente, manager = asyncio.run(escenario("disconnect"))
+    assert cliente not in manager.active_connections and cliente.cerrado
+
+
+def test_las_senales_de_cola_se_agrupan_en_un_envio(ajustes, monkeypatch):
+    import crud
+    ajustes(WS_VENTANA_COLA=0.05)
+    lecturas = []
+    monkeypatch.setattr(crud, "get_cola_completa", lambda db: lecturas.append(1) or {"now_playing": None})
+
+    async def escenario():
+        cliente = ClienteSimulado()
+        manager = _manager(cliente)
+        for _ in range(10):
+            await manager.broadcast_queue_update()
+        await manager.broadcast_play_song("yt_1", 200)
+        await manager.broadcast_queue_update()
+        await asyncio.sleep(0.1)
+        # Una señal tras la ventana programa un nuevo envío
+        await manager.broadcast_queue_update()
+        await asyncio.sleep(0.1)
+        return cliente.recibidos
+
+    tipos = asyncio.run(escenario())
+    assert len(lecturas) == 2
+    assert tipos == ["play_song", "queue_update", "queue_update"]
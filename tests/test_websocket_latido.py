@@ -0,0 +1,103 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import config, main, models
+from database import engine
+from websocket_manager import ConnectionManager
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    yield
+
+
+class ClienteSimulado:
+    def __init__(self):
+        self.recibidos = []
+        self.cerrado = False
+
+    async def send_text(self, mensaje: str):
+        self.recibidos.append(json.loads(mensaje)["type"])
+
+    async def close(self):
+        self.cerrado = True
+
+
+def test_ping_y_cierre_de_conexiones_sin_respuesta(monkeypatch):
+    monkeypatch.setattr(config.settings, "WS_INTERVALO_PING", 10)
+    monkeypatch.setattr(config.settings, "WS_TIMEOUT_PONG", 5)
+    manager = ConnectionManager()
+    vivo, muerto = ClienteSimulado(), ClienteSimulado()
+
+    async def escenario():
+        manager.registrar(vivo)
+        manager.registrar(muerto)
+        # Ambos llevan 11 s sin enviar nada: ping a los dos, una sola vez
+        hace_11 = time.monotonic() - 11
+        manager._conexion(vivo).ultima_actividad = manager._conexion(muerto).ultima_actividad = hace_11
+        assert manager.revisar_latidos() == 0
+        assert manager.revisar_latidos() == 0
+        await asyncio.sleep(0.01)
+        assert vivo.recibidos == muerto.recibidos == ["ping"]
+
+        # Solo uno responde; el otro supera intervalo + timeout (15 s) y se cierra
+        manager.actividad(vivo, "pong")
+        assert manager._conexion(vivo).rtt is not None
+        assert manager.revisar_latidos(time.monotonic() + 5) == 1
+        await asyncio.sleep(0.01)
+
+    asyncio.run(escenario())
+    assert manager.active_connections == [vivo]
+    assert muerto.cerrado and not vivo.cerrado
+    assert manager.estadisticas()["cerradas_por_inactividad"] == 1
+
+
+def test_contadores_por_conexion(monkeypatch):
+    monkeypatch.setattr(config.settings, "WS_POLITICA_LENTOS", "coalesce")
+    manager = ConnectionManager()
+    cliente = ClienteSimulado()
+
+    async def escenario():
+        manager.registrar(cliente, temas=["player"])
+        await manager.broadcast_pause()
+        await manager.broadcast_resume()
+        await asyncio.sleep(0.01)
+        # Dos estados de reproducción seguidos: el primero se descarta sin enviarse
+        await manager.broadcast_playback_state({"posicion": 1})
+        await manager.broadcast_playback_state({"posicion": 2})
+        return manager.estadisticas()
+
+    stats = asyncio.run(escenario())
+    assert stats["conexiones"] == 1 and stats["por_tema"] == {"player": 1}
+    detalle = stats["detalle"][0]
+    assert detalle["temas"] == ["player"]
+    assert detalle["mensajes"] == 2 and detalle["bytes"] > 0
+    assert detalle["descartados"] == 1 and detalle["cola"] == 1
+    assert detalle["latencia_max_ms"] >= detalle["latencia_media_ms"] >= 0
+
+
+def test_endpoint_de_estadisticas_y_pong():
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/cola?topics=queue") as ws:
+        assert ws.receive_json()["type"] == "session"
+        ws.send_text(json.dumps({"type": "ping"}))
+        tipos = [ws.receive_json()["type"] for _ in range(3)]
+        assert "pong" in tipos
+
+        r = client.get("/api/v1/admin/websocket/stats", headers={'X-API-Key': 'zxc12345'})
+        assert r.status_code == 200
+        stats = r.json()
+        assert stats["conexiones"] == 1
+        assert stats["detalle"][0]["temas"] == ["queue"]
+        assert stats["detalle"][0]["mensajes"] >= 3
+
+    assert client.get("/api/v1/admin/websocket/stats").status_code in (401, 403)
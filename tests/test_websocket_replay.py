@@ -0,0 +1,75 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import config, main
+from websocket_manager import ConnectionManager
+
+
+class ClienteSimulado:
+    def __init__(self):
+        self.recibidos = []
+
+    async def send_text(self, mensaje: str):
+        self.recibidos.append(json.loads(mensaje))
+
+    async def close(self):
+        pass
+
+
+def test_reenvia_solo_lo_perdido_y_detecta_huecos(monkeypatch):
+    monkeypatch.setattr(config.settings, "WS_HISTORIAL_EVENTOS", 4)
+    manager = ConnectionManager()
+    player, mesa = ClienteSimulado(), ClienteSimulado()
+
+    async def escenario():
+        await manager.broadcast_pause()
+        visto = manager.seq
+        await manager.broadcast_reaction({"reaction": "🎉"})
+        await manager.broadcast_resume()
+        await manager.broadcast_notification("hola")
+
+        manager.registrar(player, temas=["player"])
+        assert manager.reproducir(player, visto)
+        # Más eventos que el historial: el cliente debe pedir el estado actual
+        manager.registrar(mesa, temas=["reactions"])
+        for _ in range(4):
+            await manager.broadcast_reaction({"reaction": "👏"})
+        assert not manager.reproducir(mesa, visto)
+        assert manager.reproducir(mesa, manager.seq)
+        # Un last_seq mayor que el actual viene de otro proceso
+        assert not manager.reproducir(mesa, manager.seq + 1)
+        await asyncio.sleep(0.01)
+        return visto
+
+    visto = asyncio.run(escenario())
+    tipos = [(m["type"], m["seq"]) for m in player.recibidos]
+    assert tipos == [("resume_playback", visto + 2), ("notification", visto + 3)]
+
+
+def test_reconexion_con_last_seq():
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/cola?topics=player") as ws:
+        sesion = ws.receive_json()
+        assert sesion["type"] == "session" and sesion["payload"]["replay"] == "none"
+    seq = sesion["payload"]["seq"]
+
+    # Eventos mientras el cliente está desconectado
+    manager = main.websocket_manager.manager
+    asyncio.run(manager.broadcast_pause())
+    asyncio.run(manager.broadcast_reaction({"reaction": "🎉"}))
+
+    with client.websocket_connect(f"/ws/cola?topics=player&last_seq={seq}") as ws:
+        perdido = ws.receive_json()
+        assert perdido["type"] == "pause_playback" and perdido["seq"] == seq + 1
+        sesion = ws.receive_json()["payload"]
+        assert (sesion["seq"], sesion["replay"]) == (seq + 2, "ok")
+        assert ws.receive_json()["type"] == "playback_state"
+
+    # El seq de otro worker no se reenvía: se manda el estado actual
+    with client.websocket_connect(f"/ws/cola?topics=player&last_seq={seq}&nodo=otro") as ws:
+        assert ws.receive_json()["payload"]["replay"] == "gap"
@@ -0,0 +1,69 @@
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+from websocket_manager import ConnectionManager
+
+
+class ClienteSimulado:
+    def __init__(self):
+        self.recibidos = []
+
+    async def send_text(self, mensaje: str):
+        self.recibidos.append(json.loads(mensaje)["type"])
+
+    async def close(self):
+        pass
+
+
+def test_cada_evento_llega_solo_a_sus_suscriptores():
+    manager = ConnectionManager()
+    clientes = {
+        "admin": ["queue", "admin.orders"],
+        "mesa1": ["queue", "reactions", "mesa:1"],
+        "mesa2": ["queue", "reactions", "mesa:2"],
+        "player": ["queue", "player", "reactions"],
+        "clasico": None,
+    }
+    simulados = {nombre: ClienteSimulado() for nombre in clientes}
+
+    async def escenario():
+        for nombre, temas in clientes.items():
+            manager.registrar(simulados[nombre], temas=temas)
+        await manager.broadcast_consumo_created({"id": 1, "mesa_id": 1})
+        await manager.broadcast_pedido_created({"id": "p", "mesa_id": None})
+        await manager.broadcast_reaction({"reaction": "🎉"})
+        await manager.broadcast_play_song("yt", 10)
+        await manager.broadcast_notification("hola")
+        await asyncio.sleep(0.01)
+
+    asyncio.run(escenario())
+    recibidos = {nombre: cliente.recibidos for nombre, cliente in simulados.items()}
+    assert recibidos["admin"] == ["consumo_created", "pedido_created", "notification"]
+    assert recibidos["mesa1"] == ["consumo_created", "reaction", "notification"]
+    assert recibidos["mesa2"] == ["reaction", "notification"]
+    assert recibidos["player"] == ["reaction", "play_song", "notification"]
+    assert recibidos["clasico"] == ["consumo_created", "pedido_created", "reaction", "play_song", "notification"]
+
+    # Al desconectar sale del índice de temas
+    manager.disconnect(simulados["mesa1"])
+    assert "mesa:1" not in manager._suscriptores
+    assert list(manager._suscriptores["reactions"].values()) == [simulados["mesa2"], simulados["player"]]
+
+
+def test_suscripcion_por_mensaje():
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/cola?topics=player") as ws:
+        assert ws.receive_json()["type"] == "session"
+        assert ws.receive_json()["type"] == "playback_state"
+        ws.send_text(json.dumps({"type": "subscribe", "topics": ["reactions", "mesa:7", "secreto"]}))
+        assert ws.receive_json() == {"type": "subscribed", "payload": {"topics": ["reactions", "mesa:7"]}}
+        ws.send_text(json.dumps({"type": "unsubscribe", "topics": ["player"]}))
+        assert ws.receive_json()["type"] == "unsubscribed"
+        temas = {t for t, conexiones in main.websocket_manager.manager._suscriptores.items() if conexiones}
+        assert {"reactions", "mesa:7"} <= temas and "player" not in temas
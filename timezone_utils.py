@@ -14,3 +14,12 @@ def to_bogota(dt):
         # Si no tiene timezone, asumimos que es UTC
         dt = pytz.utc.localize(dt)
     return dt.astimezone(BOGOTA_TZ)
+
+def ensure_bogota(dt):
+    """
+    Devuelve el datetime con zona horaria de Bogotá. Los valores sin zona (SQLite no la
+    guarda) se asumen ya en hora de Bogotá, que es como los escribe now_bogota.
+    """
+    if dt.tzinfo is None:
+        return BOGOTA_TZ.localize(dt)
+    return dt.astimezone(BOGOTA_TZ)
@@ -1,5 +1,11 @@
-import json
-from typing import List
+import asyncio
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from typing import Dict, Iterable, List, Optional, Set, Union
 from fastapi import WebSocket
 import models
 from fastapi.encoders import jsonable_encoder
@@ -7,16 +13,439 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+import config
 import schemas, crud
-from database import SessionLocal
+from avisos import CalculadorAvisos
+from cola_delta import CodificadorCola
+from codificacion import SSE, Evento, negociar
+from database import SessionLectura, en_hilo
+import queue_engine
+import scheduler
+from consumo_totales import cache_niveles
+
+POLITICAS_LENTOS = ("drop_oldest", "coalesce", "disconnect")
+
+# Temas de suscripción. Además: "mesa:{id}" y "user:{id}". "*" recibe todo (clientes que no
+# indican temas al conectar, como antes). Los eventos sin tema (notification,
+# product_update) llegan a todas las conexiones.
+TEMAS = ("queue", "player", "admin.orders", "reactions")
+TODOS = "*"
+_TEMA_DIRIGIDO = re.compile(r"^(mesa|user):\d+$")
+
+
+# Eventos de otro worker que cambian los totales de consumo de una mesa
+_EVENTOS_CONSUMO = ("consumo_created", "consumo_deleted", "pedido_created")
+
+# Cambios confirmados que se acumulan para la próxima señal de cola; pasado el límite se
+# manda el marcador "invalidar" (los demás workers reconstruyen desde la BD)
+_MAX_CAMBIOS_SENAL = 1000
+
+
+def tema_valido(tema: str) -> bool:
+    return tema in TEMAS or tema == TODOS or bool(_TEMA_DIRIGIDO.match(tema))
+
+
+def _temas_pedido(payload: dict) -> tuple:
+    """Los eventos de pedidos van al admin y, si se conoce, a la mesa del pedido."""
+    mesa_id = payload.get("mesa_id") if isinstance(payload, dict) else None
+    return ("admin.orders", f"mesa:{mesa_id}") if mesa_id is not None else ("admin.orders",)
+
+
+def _como_evento(mensaje: Union[Evento, dict, str]) -> Evento:
+    """Los mensajes se pasan como dict (o str ya serializado en JSON)."""
+    if isinstance(mensaje, Evento):
+        return mensaje
+    if isinstance(mensaje, str):
+        return Evento(texto=mensaje)
+    return Evento(mensaje)
+
+
+class _Conexion:
+    """
+    Cola de salida acotada de un WebSocket y la tarea que la escribe.
+    Encolar es inmediato: un cliente lento solo retrasa su propia cola.
+    """
+
+    def __init__(self, websocket, delta: bool = False):
+        self.websocket = websocket
+        self.delta = delta  # recibe queue_delta/queue_snapshot en vez de queue_update
+        self.temas: Set[str] = set()
+        self.codificacion = "json"  # ver codificacion.py
+        self.responde_ping = True  # False en SSE: el cliente no puede contestar
+        self.pendientes = deque()  # [(clave, Evento)]
+        self._hay_mensajes: Optional[asyncio.Event] = None
+        self._escritor: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.al_fallar = None  # callback(websocket) si el envío falla o vence el timeout
+        # Latido: última vez que el cliente envió algo (monotonic) y ping sin respuesta
+        self.conectado = time.time()
+        self.ultima_actividad = time.monotonic()
+        self.ping_enviado: Optional[float] = None
+        self.rtt: Optional[float] = None  # segundos, del último ping/pong
+        # Contadores de envío
+        self.mensajes = 0
+        self.bytes = 0
+        self.descartados = 0  # por la política con clientes lentos
+        self.latencia_total = 0.0
+        self.latencia_max = 0.0
+
+    def encolar(self, mensaje: Union[Evento, dict, str], clave: Optional[str] = None) -> bool:
+        """
+        Añade un mensaje a la cola de salida. Devuelve False si la cola está llena y la
+        política es "disconnect" (el llamador debe cerrar la conexión).
+        """
+        politica = config.settings.WS_POLITICA_LENTOS
+        if politica == "coalesce" and clave is not None and self.pendientes:
+            # Solo importa el último estado: se descartan los pendientes con la misma clave
+            antes = len(self.pendientes)
+            self.pendientes = deque(p for p in self.pendientes if p[0] != clave)
+            self.descartados += antes - len(self.pendientes)
+        if len(self.pendientes) >= config.settings.WS_COLA_MAXIMA:
+            if politica == "disconnect":
+                return False
+            self.pendientes.popleft()
+            self.descartados += 1
+        self.pendientes.append((clave, _como_evento(mensaje)))
+        self._asegurar_escritor()
+        self._hay_mensajes.set()
+        return True
+
+    def _asegurar_escritor(self):
+        loop = asyncio.get_running_loop()
+        if self._escritor is not None and not self._escritor.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._hay_mensajes = asyncio.Event()
+        self._escritor = loop.create_task(self._escribir())
+
+    async def _escribir(self):
+        while True:
+            await self._hay_mensajes.wait()
+            self._hay_mensajes.clear()
+            while self.pendientes:
+                _, evento = self.pendientes.popleft()
+                try:
+                    # La codificación se calcula una vez por evento y se comparte entre conexiones
+                    mensaje = evento.codificado(self.codificacion)
+                    envio = self.websocket.send_bytes(mensaje) if isinstance(mensaje, bytes) else self.websocket.send_text(mensaje)
+                    inicio = time.perf_counter()
+                    await asyncio.wait_for(envio, timeout=config.settings.WS_TIMEOUT_ENVIO)
+                    latencia = time.perf_counter() - inicio
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # Envío fallido o cliente que no consume dentro del timeout
+                    self.pendientes.clear()
+                    if self.al_fallar is not None:
+                        self.al_fallar(self.websocket)
+                    return
+                self.mensajes += 1
+                self.bytes += len(mensaje) if isinstance(mensaje, bytes) else len(mensaje.encode())
+                self.latencia_total += latencia
+                self.latencia_max = max(self.latencia_max, latencia)
+
+    def estadisticas(self, ahora: float) -> dict:
+        return {
+            "id": id(self.websocket),
+            "temas": sorted(self.temas),
+            "delta": self.delta,
+            "codificacion": self.codificacion,
+            "conectado_hace": round(time.time() - self.conectado, 1),
+            "inactivo": round(ahora - self.ultima_actividad, 1),
+            "rtt_ms": round(self.rtt * 1000, 1) if self.rtt is not None else None,
+            "cola": len(self.pendientes),
+            "mensajes": self.mensajes,
+            "bytes": self.bytes,
+            "descartados": self.descartados,
+            "latencia_media_ms": round(self.latencia_total / self.mensajes * 1000, 2) if self.mensajes else 0.0,
+            "latencia_max_ms": round(self.latencia_max * 1000, 2),
+        }
+
+    def cerrar(self):
+        self.pendientes.clear()
+        if self._escritor is not None and not self._escritor.done():
+            self._escritor.cancel()
+        self._escritor = None
+
 
 class ConnectionManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
+        self._conexiones: Dict[int, _Conexion] = {}  # id(websocket) -> cola de salida
+        self._suscriptores: Dict[str, Dict[int, WebSocket]] = {}  # tema -> {id(websocket): websocket}
+        self._envio_cola: Optional[asyncio.Task] = None  # queue_update agrupado pendiente
+        # Reacciones acumuladas hasta el próximo frame (cada WS_VENTANA_REACCIONES)
+        self._reacciones: Counter = Counter()
+        self._remitentes: List[dict] = []
+        self._envio_reacciones: Optional[asyncio.Task] = None
+        self.codificador = CodificadorCola()  # base de los queue_delta
+        self.avisos = CalculadorAvisos()  # avisos personales por cambio de cola (avisos.py)
+        # Cada difusión lleva un número de secuencia y se guarda en un historial acotado
+        # [(seq, temas, delta, clave, mensaje)]. La secuencia arranca en la hora actual en
+        # ms: tras un reinicio sigue siendo mayor que cualquiera anterior, y el last_seq de
+        # un cliente del proceso previo cae fuera del historial (se le manda el estado actual).
+        self.seq = int(time.time() * 1000)
+        self._historial = deque(maxlen=config.settings.WS_HISTORIAL_EVENTOS)
+        # Pub/sub entre workers (broker.py). `nodo` identifica este manager: la secuencia y
+        # el historial son de cada worker, así que solo se reenvía lo perdido en el mismo nodo.
+        self.broker = None
+        self.nodo = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._publicar_cola = False
+        # Cambios de los commits de este proceso que viajan con la próxima señal de cola,
+        # numerados por lote: un salto en los lotes de otro nodo obliga a reconstruir
+        self._lock_cambios = threading.Lock()
+        self._cambios_salientes: List[tuple] = []
+        self._lote = 0
+        self._lotes_remotos: Dict[str, int] = {}
+        # Latido (ping/pong) y cierre de conexiones sin respuesta
+        self._latidos: Optional[asyncio.Task] = None
+        self.cerradas_por_inactividad = 0
+        # Hasta cuándo (time.monotonic) hay un player con latido en otro worker
+        self._player_remoto_hasta = 0.0
+
+    async def iniciar_broker(self, broker):
+        """Conecta el manager al broker: publica sus difusiones y reparte las de otros workers."""
+        self.broker = broker
+        queue_engine.motor.al_confirmar(self._anotar_cambios)
+        await broker.iniciar(self._al_recibir)
+
+    async def detener_broker(self):
+        broker, self.broker = self.broker, None
+        queue_engine.motor.quitar_al_confirmar(self._anotar_cambios)
+        if broker is not None:
+            await broker.detener()
+
+    def _anotar_cambios(self, cambios: list):
+        """Commit de este proceso (en el hilo que confirmó): sus cambios salen con la próxima señal."""
+        with self._lock_cambios:
+            if len(self._cambios_salientes) + len(cambios) > _MAX_CAMBIOS_SENAL:
+                self._cambios_salientes = [("invalidar",)]
+            else:
+                self._cambios_salientes.extend(cambios)
+
+    def _senal_cola(self) -> dict:
+        """Mensaje de cola para el broker: los cambios acumulados y su número de lote."""
+        with self._lock_cambios:
+            cambios, self._cambios_salientes = self._cambios_salientes, []
+            self._lote += 1
+            return {"tipo": "cola", "lote": self._lote, "cambios": cambios}
+
+    async def _publicar(self, datos: dict):
+        if self.broker is None:
+            return
+        try:
+            await self.broker.publicar({**datos, "origen": self.nodo})
+        except Exception:
+            logger.exception("No se pudo publicar en el broker de WebSocket")
 
-    async def connect(self, websocket: WebSocket):
+    def iniciar_latidos(self):
+        """Arranca la tarea que envía pings y cierra las conexiones que no responden."""
+        if config.settings.WS_INTERVALO_PING > 0 and self._latidos is None:
+            self._latidos = asyncio.get_running_loop().create_task(self._latir())
+
+    async def detener_latidos(self):
+        tarea, self._latidos = self._latidos, None
+        if tarea is not None:
+            tarea.cancel()
+            try:
+                await tarea
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def _latir(self):
+        while True:
+            await asyncio.sleep(config.settings.WS_INTERVALO_PING)
+            try:
+                self.revisar_latidos()
+                if self._player_local():
+                    # El reloj de reproducción de los demás workers también debe saberlo
+                    await self._publicar({"tipo": "player"})
+            except Exception:
+                logger.exception("Error revisando los latidos de WebSocket")
+
+    def _vida_latido(self) -> float:
+        """Segundos sin actividad tras los que una conexión se da por caída."""
+        return config.settings.WS_INTERVALO_PING + config.settings.WS_TIMEOUT_PONG
+
+    def _player_local(self, ahora: Optional[float] = None) -> bool:
+        ahora = time.monotonic() if ahora is None else ahora
+        for websocket in self._suscriptores.get("player", {}).values():
+            conexion = self._conexion(websocket)
+            # Solo cuentan los que contestan el ping: un stream SSE (TV, "now playing") del
+            # tema "player" no reproduce nada y su actividad la renueva el propio latido
+            if not conexion.responde_ping:
+                continue
+            # Sin latido (WS_INTERVALO_PING = 0) basta con que siga conectado
+            if config.settings.WS_INTERVALO_PING <= 0 or ahora - conexion.ultima_actividad <= self._vida_latido():
+                return True
+        return False
+
+    def player_conectado(self, ahora: Optional[float] = None) -> bool:
+        """
+        Hay un player (WebSocket suscrito al tema "player") con latido reciente en este worker
+        o en otro (lo anuncian por el broker en cada latido).
+        """
+        ahora = time.monotonic() if ahora is None else ahora
+        return self._player_local(ahora) or ahora < self._player_remoto_hasta
+
+    def revisar_latidos(self, ahora: Optional[float] = None) -> int:
+        """
+        Envía "ping" a las conexiones sin actividad en WS_INTERVALO_PING segundos y cierra
+        las que llevan más de WS_INTERVALO_PING + WS_TIMEOUT_PONG sin enviar nada (ni
+        el "pong"): conexiones medio abiertas de móviles que ya no están. Devuelve cuántas cerró.
+        """
+        ahora = time.monotonic() if ahora is None else ahora
+        intervalo = config.settings.WS_INTERVALO_PING
+        cerradas = 0
+        for websocket in self.active_connections[:]:
+            conexion = self._conexion(websocket)
+            inactivo = ahora - conexion.ultima_actividad
+            if not conexion.responde_ping:
+                # SSE: el ping es un comentario que mantiene viva la conexión en los proxies;
+                # un cliente caído se detecta al fallar el envío o al desconectarse el HTTP
+                if inactivo >= intervalo:
+                    conexion.ultima_actividad = ahora
+                    if not conexion.encolar({"type": "ping"}, clave="ping"):
+                        self._descartar(websocket)
+                continue
+            if inactivo > intervalo + config.settings.WS_TIMEOUT_PONG:
+                logger.info(f"WebSocket sin respuesta hace {inactivo:.0f} s: se cierra.")
+                self._descartar(websocket)
+                cerradas += 1
+            elif inactivo >= intervalo and (conexion.ping_enviado is None or conexion.ping_enviado < conexion.ultima_actividad):
+                conexion.ping_enviado = ahora
+                if not conexion.encolar({"type": "ping"}, clave="ping"):
+                    self._descartar(websocket)
+        self.cerradas_por_inactividad += cerradas
+        return cerradas
+
+    def actividad(self, websocket, tipo: Optional[str] = None):
+        """El cliente envió un mensaje (cualquiera cuenta como señal de vida)."""
+        conexion = self._conexiones.get(id(websocket))
+        if conexion is None or conexion.websocket is not websocket:
+            return
+        ahora = time.monotonic()
+        if tipo == "pong" and conexion.ping_enviado is not None:
+            conexion.rtt = ahora - conexion.ping_enviado
+        conexion.ultima_actividad = ahora
+
+    def estadisticas(self) -> dict:
+        """Estado en vivo de las conexiones de este worker (endpoint de admin)."""
+        ahora = time.monotonic()
+        conexiones = [self._conexion(ws).estadisticas(ahora) for ws in self.active_connections]
+        return {
+            "nodo": self.nodo,
+            "seq": self.seq,
+            "conexiones": len(conexiones),
+            "por_tema": {tema: len(suscriptores) for tema, suscriptores in sorted(self._suscriptores.items())},
+            "cerradas_por_inactividad": self.cerradas_por_inactividad,
+            "mensajes": sum(c["mensajes"] for c in conexiones),
+            "bytes": sum(c["bytes"] for c in conexiones),
+            "cola_total": sum(c["cola"] for c in conexiones),
+            "detalle": conexiones,
+        }
+
+    def _al_recibir(self, datos: dict):
+        """Mensaje de otro worker: se reparte a los sockets de este."""
+        if datos.get("origen") == self.nodo:
+            return
+        if datos.get("tipo") == "evento":
+            evento = Evento(datos["datos"])
+            if evento.datos.get("type") in _EVENTOS_CONSUMO:
+                # Los totales de la mesa cambiaron en otro worker: su nivel (y la cola) pueden cambiar
+                mesa_id = (evento.datos.get("payload") or {}).get("mesa_id")
+                if mesa_id is None:
+                    self._invalidar_estado_local()
+                else:
+                    self._aplicar_cambios_remotos([("consumo", mesa_id)])
+                self._programar_cola(publicar=False)
+            self._difundir(evento, datos.get("clave"), None, datos.get("temas"))
+        elif datos.get("tipo") == "cola":
+            # Cada worker lee la cola y la envía a sus clientes (con sus propios deltas)
+            origen, lote = datos.get("origen"), datos.get("lote")
+            anterior = self._lotes_remotos.get(origen)
+            if lote is not None:
+                self._lotes_remotos[origen] = lote
+            if datos.get("cambios") is None or lote != (anterior or 0) + 1:
+                # Sin cambios o con un lote perdido (broker caído, worker reiniciado): desde la BD
+                self._invalidar_estado_local()
+            else:
+                self._aplicar_cambios_remotos([tuple(cambio) for cambio in datos["cambios"]])
+            self._programar_cola(publicar=False)
+        elif datos.get("tipo") == "player":
+            self._player_remoto_hasta = time.monotonic() + self._vida_latido()
+
+    @staticmethod
+    def _invalidar_estado_local():
+        """
+        El commit se hizo en otro worker: la cola residente y la caché de niveles de este
+        no lo vieron. Se descartan (la próxima lectura reconstruye desde la BD) y la versión
+        de la cola sube, así que también caducan los snapshots/ETag de /cola y la admisión.
+        La política de cola se vuelve a leer de settings.json: pudo cambiarla otro worker.
+        """
+        scheduler._politica_actual = None
+        cache_niveles.invalidar()
+        queue_engine.motor.invalidar()
+
+    def _aplicar_cambios_remotos(self, cambios: List[tuple]):
+        """
+        Cambios que confirmó otro worker: se aplican como los de un commit propio. Solo
+        caducan los niveles de las mesas tocadas; el marcador "invalidar" (UPDATE masivo,
+        cambio de política) descarta todo.
+        """
+        if any(cambio[0] == "invalidar" for cambio in cambios):
+            self._invalidar_estado_local()
+            return
+        mesas = {cambio[1] for cambio in cambios if cambio[0] in ("consumo", "mesa")}
+        if mesas:
+            cache_niveles.invalidar(mesas)
+        # Sin cambios también sube la versión: caducan snapshots/ETag como antes
+        queue_engine.motor.registrar_cambios(cambios, local=False)
+
+    async def connect(self, websocket: WebSocket, delta: bool = False, temas: Optional[Iterable[str]] = None,
+                      codificacion: str = "json"):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        return self.registrar(websocket, delta=delta, temas=temas, codificacion=codificacion)
+
+    def registrar(self, websocket, delta: bool = False, temas: Optional[Iterable[str]] = None, codificacion: str = "json"):
+        """
+        Da de alta una conexión ya aceptada. Sin `temas` se suscribe a todo ("*").
+        Devuelve la codificación negociada (json si la pedida no está disponible).
+        """
+        if websocket not in self.active_connections:
+            self.active_connections.append(websocket)
+        conexion = self._conexion(websocket)
+        conexion.delta = delta
+        conexion.codificacion = SSE if codificacion == SSE else negociar(codificacion)
+        conexion.responde_ping = conexion.codificacion != SSE
+        temas = list(temas or [])
+        self.suscribir(websocket, temas or [TODOS])
+        return conexion.codificacion
+
+    def suscribir(self, websocket, temas: Iterable[str]) -> List[str]:
+        """Suscribe la conexión a los temas válidos de `temas` y los devuelve."""
+        conexion = self._conexion(websocket)
+        aceptados = []
+        for tema in temas:
+            if not tema_valido(tema):
+                logger.warning(f"Tema de WebSocket desconocido: {tema!r}")
+                continue
+            self._suscriptores.setdefault(tema, {})[id(websocket)] = websocket
+            conexion.temas.add(tema)
+            aceptados.append(tema)
+        return aceptados
+
+    def desuscribir(self, websocket, temas: Iterable[str]):
+        conexion = self._conexiones.get(id(websocket))
+        if conexion is None:
+            return
+        for tema in temas:
+            conexion.temas.discard(tema)
+            suscriptores = self._suscriptores.get(tema)
+            if suscriptores is not None:
+                suscriptores.pop(id(websocket), None)
+                if not suscriptores:
+                    del self._suscriptores[tema]
 
     def disconnect(self, websocket: WebSocket):
         try:
@@ -24,75 +453,287 @@ class ConnectionManager:
         except ValueError:
             # already removed
             pass
+        conexion = self._conexiones.get(id(websocket))
+        if conexion is not None and conexion.websocket is websocket:
+            self.desuscribir(websocket, list(conexion.temas))
+            del self._conexiones[id(websocket)]
+            conexion.cerrar()
 
-    async def _broadcast(self, message: str):
-        """Método auxiliar para enviar un mensaje a todas las conexiones activas."""
-        dead_connections = []
-        # Hacemos una copia de la lista para poder modificarla mientras iteramos
-        for connection in self.active_connections[:]:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                # Si el envío falla, marcamos la conexión para eliminarla.
-                dead_connections.append(connection)
+    def _conexion(self, websocket) -> _Conexion:
+        conexion = self._conexiones.get(id(websocket))
+        if conexion is None or conexion.websocket is not websocket:
+            conexion = _Conexion(websocket)
+            conexion.al_fallar = self._descartar
+            self._conexiones[id(websocket)] = conexion
+        return conexion
 
-        # Eliminamos las conexiones muertas de la lista activa.
-        for connection in dead_connections:
-            try:
-                self.active_connections.remove(connection)
-            except ValueError:
-                # La conexión ya fue eliminada, lo ignoramos.
-                pass
+    def _destinatarios(self, temas: Optional[Iterable[str]]) -> List:
+        """Conexiones interesadas en alguno de `temas` (todas si `temas` es None)."""
+        if temas is None:
+            return self.active_connections[:]
+        destinatarios: Dict[int, WebSocket] = dict(self._suscriptores.get(TODOS, {}))
+        for tema in temas:
+            destinatarios.update(self._suscriptores.get(tema, {}))
+        return list(destinatarios.values())
+
+    def _descartar(self, websocket):
+        """Quita una conexión muerta o lenta y la cierra en segundo plano."""
+        self.disconnect(websocket)
+        asyncio.get_running_loop().create_task(self._cerrar(websocket))
+
+    @staticmethod
+    async def _cerrar(websocket):
+        try:
+            await asyncio.wait_for(websocket.close(), timeout=config.settings.WS_TIMEOUT_ENVIO)
+        except Exception:
+            pass
+
+    async def _broadcast(self, message: Union[dict, str], clave: Optional[str] = None, delta: Optional[bool] = None,
+                         temas: Optional[Iterable[str]] = None, publicar: bool = True):
+        """
+        Método auxiliar para enviar un mensaje (dict) a las conexiones suscritas a alguno
+        de `temas` (a todas si no se indican). Se codifica una vez por codificación en uso.
+        Solo encola en la cola de salida de cada conexión (lo escribe su tarea), así que
+        no espera a ningún cliente. `clave` identifica mensajes de estado que la política
+        "coalesce" puede reemplazar por el más reciente (p. ej. queue_update). Con `delta`
+        solo se envía a las conexiones en ese modo de cola (ver cola_delta.py).
+        Con `publicar`, el mensaje se publica además en el broker para los demás workers.
+        """
+        evento = _como_evento(message)
+        # Primero los sockets propios: entre la llamada y el encolado no hay await
+        self._difundir(evento, clave, delta, temas)
+        if publicar:
+            await self._publicar({"tipo": "evento", "datos": evento.datos, "clave": clave,
+                                  "temas": list(temas) if temas is not None else None})
+
+    def _difundir(self, evento: Evento, clave: Optional[str], delta: Optional[bool], temas: Optional[Iterable[str]]):
+        """Encola el evento en los sockets de este worker, sellado con su número de secuencia ("seq")."""
+        self.seq += 1
+        evento = evento.con_seq(self.seq, id=f"{self.nodo}.{self.seq}")
+        self._historial.append((self.seq, tuple(temas) if temas is not None else None, delta, clave, evento))
+        # Copia de los destinatarios para poder descartar conexiones mientras iteramos
+        for connection in self._destinatarios(temas):
+            conexion = self._conexion(connection)
+            if delta is not None and conexion.delta != delta:
+                continue
+            if not conexion.encolar(evento, clave):
+                logger.warning("Cliente WebSocket lento: cola de salida llena, se desconecta.")
+                self._descartar(connection)
+
+    def reproducir(self, websocket, desde_seq: int, nodo: Optional[str] = None) -> bool:
+        """
+        Encola para un cliente que reconecta los eventos posteriores a `desde_seq` que le
+        corresponden (por temas y modo de cola), en orden. Devuelve False si el historial
+        ya no los tiene todos o si `desde_seq` es de otro worker (`nodo`): el cliente debe
+        recibir el estado actual en su lugar.
+        Sin await: ningún evento nuevo puede colarse entre el alta y la reproducción.
+        """
+        if nodo is not None and nodo != self.nodo:
+            return False
+        if desde_seq > self.seq:
+            return False
+        if desde_seq < self.seq and (not self._historial or self._historial[0][0] > desde_seq + 1):
+            return False
+        conexion = self._conexion(websocket)
+        for seq, temas, delta, clave, mensaje in self._historial:
+            if seq <= desde_seq or (delta is not None and conexion.delta != delta):
+                continue
+            if temas is not None and TODOS not in conexion.temas and not conexion.temas.intersection(temas):
+                continue
+            if not conexion.encolar(mensaje, clave):
+                self._descartar(websocket)
+                break
+        return True
+
+    async def send_personal(self, websocket: WebSocket, message: Union[dict, str], clave: Optional[str] = None):
+        """Envía un mensaje a una sola conexión, por su cola de salida (respeta el orden)."""
+        if not self._conexion(websocket).encolar(message, clave):
+            self._descartar(websocket)
 
     async def broadcast_queue_update(self):
-        """Obtiene la cola actualizada y la envía a todos los clientes."""
-        db = SessionLocal()
+        """
+        Señala que la cola cambió. Todas las señales dentro de WS_VENTANA_COLA se agrupan
+        en un único queue_update, que lee la cola al vencer la ventana (el estado más
+        reciente). Orden respecto a play_song/song_finished: el queue_update agrupado
+        siempre sale después de los eventos de canción emitidos mientras estaba pendiente
+        y refleja su efecto, nunca un estado anterior a ellos.
+        """
+        if config.settings.WS_VENTANA_COLA <= 0:
+            await self._publicar(self._senal_cola())
+            await self._enviar_cola()
+            return
+        self._programar_cola(publicar=True)
+
+    def _programar_cola(self, publicar: bool):
+        """Programa el envío agrupado; con `publicar`, también avisa a los demás workers."""
+        self._publicar_cola = self._publicar_cola or publicar
+        loop = asyncio.get_running_loop()
+        pendiente = self._envio_cola
+        if pendiente is not None and not pendiente.done() and pendiente.get_loop() is loop:
+            return
+        self._envio_cola = loop.create_task(self._enviar_cola_tras(max(0.0, config.settings.WS_VENTANA_COLA)))
+
+    async def _enviar_cola_tras(self, ventana: float):
+        await asyncio.sleep(ventana)
+        # Las señales que lleguen desde aquí programan un nuevo envío
+        self._envio_cola = None
+        publicar, self._publicar_cola = self._publicar_cola, False
+        if publicar:
+            await self._publicar(self._senal_cola())
+        await self._enviar_cola()
+
+    @staticmethod
+    def _leer_cola_bd() -> dict:
+        db = SessionLectura()
         try:
             # Usamos crud.get_cola_completa para obtener la cola real (aprobada y priorizada)
             # Esto corrige el error donde se mostraban solo canciones pendientes o se borraba la cola
-            cola_data = crud.get_cola_completa(db)
-            
-            queue_data = jsonable_encoder(cola_data)
-            
+            return jsonable_encoder(crud.get_cola_completa(db))
+        finally:
+            db.close()
+
+    async def _leer_cola(self) -> dict:
+        # Leer y serializar cientos de canciones es sobre todo CPU: en el pool acotado de
+        # hilos, no en el event loop (ni en run_sync, que también corre en el loop)
+        return await en_hilo(self._leer_cola_bd)
+
+    @staticmethod
+    def _leer_lazy_bd() -> List[int]:
+        db = SessionLectura()
+        try:
+            ids = queue_engine.motor.get_ids(db, "pendiente_lazy")
+            if ids is None:
+                ids = [c.id for c in crud._get_cola_lazy_sql(db)]
+            return ids
+        finally:
+            db.close()
+
+    async def _leer_lazy(self) -> List[int]:
+        """Ids de la cola lazy (para el aviso song_approved cuando se promueven)."""
+        return await en_hilo(self._leer_lazy_bd)
+
+    async def _enviar_cola(self):
+        """
+        Obtiene la cola actualizada y la envía: completa (queue_update) a los clientes
+        clásicos y como diferencias (queue_delta) a los que lo pidieron. Cada mensaje se
+        serializa una sola vez para todos sus destinatarios.
+        """
+        # La lectura va en un hilo (no bloquea el loop) y por eso puede intercalarse con el commit
+        # de un cambio de canción y su play_song/song_finished: si la cola cambió mientras se
+        # leía, el resultado puede ser anterior a esos eventos y se descarta por una nueva lectura.
+        try:
+            version = queue_engine.motor.version
+            queue_data = await self._leer_cola()
+            lazy = await self._leer_lazy()
+            if queue_engine.motor.version != version:
+                self._programar_cola(publicar=False)
+                return
+            _, delta = self.codificador.publicar(queue_data)
             payload = {"type": "queue_update", "payload": queue_data}
-            await self._broadcast(json.dumps(payload, default=str))
+            # Solo a los sockets propios: cada worker lee y envía la cola a sus clientes
+            await self._broadcast(payload, clave="queue_update", delta=False, temas=("queue",), publicar=False)
+            if delta is not None and any(self._conexion(c).delta for c in self._destinatarios(("queue",))):
+                await self._broadcast({"type": "queue_delta", "payload": delta}, delta=True, temas=("queue",), publicar=False)
+            # Avisos personales (aprobada, siguiente, cambio de espera) calculados una vez por cambio
+            for usuario_id, aviso in self.avisos.calcular(queue_data, lazy=lazy):
+                await self.enviar_a_usuario(usuario_id, aviso, publicar=False)
         except Exception as e:
             print(f"Error broadcasting queue update: {e}")
-        finally:
-            db.close()
+
+    async def enviar_a_usuario(self, usuario_id: int, payload: dict, publicar: bool = True):
+        """Envía un evento solo a los sockets del usuario (tema "user:{id}")."""
+        await self._broadcast(payload, temas=(f"user:{usuario_id}",), publicar=publicar)
+
+    async def enviar_a_mesa(self, mesa_id: int, payload: dict, publicar: bool = True):
+        """Envía un evento solo a los sockets de la mesa (tema "mesa:{id}")."""
+        await self._broadcast(payload, temas=(f"mesa:{mesa_id}",), publicar=publicar)
+
+    async def send_queue_snapshot(self, websocket: WebSocket):
+        """
+        Envía a un cliente en modo delta el estado completo de la cola en la versión
+        publicada más reciente (al conectar o cuando pide resync por un hueco de versión).
+        """
+        snapshot = self.codificador.snapshot()
+        if snapshot is None:
+            snapshot, _ = self.codificador.publicar(await self._leer_cola())
+        await self.send_personal(websocket, {"type": "queue_snapshot", "payload": snapshot})
 
     async def broadcast_product_update(self):
         """Envía una notificación para que los clientes recarguen el catálogo de productos."""
         payload = {"type": "product_update"}
-        await self._broadcast(json.dumps(payload))
+        await self._broadcast(payload)
 
     async def broadcast_consumo_created(self, consumo_payload: dict):
         """
         Envía un evento indicando que se creó un nuevo consumo.
         """
         payload = {"type": "consumo_created", "payload": consumo_payload}
-        await self._broadcast(json.dumps(payload, default=str))
+        await self._broadcast(payload, temas=_temas_pedido(payload["payload"]))
 
     async def broadcast_pedido_created(self, pedido_payload: dict):
         """
         Envía un evento indicando que se creó un nuevo pedido consolidado.
         """
         payload = {"type": "pedido_created", "payload": pedido_payload}
-        await self._broadcast(json.dumps(payload, default=str))
+        await self._broadcast(payload, temas=_temas_pedido(payload["payload"]))
 
     async def broadcast_consumo_deleted(self, consumo_payload: dict):
         """
         Envía un evento indicando que un consumo fue eliminado.
         """
         payload = {"type": "consumo_deleted", "payload": consumo_payload}
-        await self._broadcast(json.dumps(payload))
+        await self._broadcast(payload, temas=_temas_pedido(consumo_payload))
+
+    async def broadcast_consumo_despachado(self, consumo_payload: dict):
+        """
+        Avisa al usuario que pidió el consumo (y a su mesa) de que su pedido va en camino.
+        """
+        payload = {"type": "order_dispatched", "payload": consumo_payload}
+        temas = [f"user:{consumo_payload['usuario_id']}"] if consumo_payload.get("usuario_id") is not None else []
+        if consumo_payload.get("mesa_id") is not None:
+            temas.append(f"mesa:{consumo_payload['mesa_id']}")
+        if temas:
+            await self._broadcast(payload, temas=temas)
+
+    def agregar_reaccion(self, reaction_payload: dict):
+        """
+        Acumula una reacción para el próximo frame: en vez de un broadcast por emoji,
+        uno cada WS_VENTANA_REACCIONES con la cuenta por emoji y una muestra acotada
+        de remitentes (WS_MUESTRA_REMITENTES).
+        """
+        self._reacciones[reaction_payload["reaction"]] += 1
+        if len(self._remitentes) < config.settings.WS_MUESTRA_REMITENTES:
+            self._remitentes.append({"sender": reaction_payload.get("sender"), "reaction": reaction_payload["reaction"]})
+        loop = asyncio.get_running_loop()
+        pendiente = self._envio_reacciones
+        if pendiente is not None and not pendiente.done() and pendiente.get_loop() is loop:
+            return
+        self._envio_reacciones = loop.create_task(self._enviar_reacciones_tras(max(0.0, config.settings.WS_VENTANA_REACCIONES)))
+
+    async def _enviar_reacciones_tras(self, ventana: float):
+        await asyncio.sleep(ventana)
+        # Las reacciones que lleguen desde aquí van al siguiente frame
+        self._envio_reacciones = None
+        conteos, self._reacciones = self._reacciones, Counter()
+        remitentes, self._remitentes = self._remitentes, []
+        if not conteos:
+            return
+        # "reaction" y "sender" (la más repetida y el primer remitente) para los clientes
+        # que solo muestran un emoji por mensaje
+        await self.broadcast_reaction({
+            "reaction": conteos.most_common(1)[0][0],
+            "sender": remitentes[0]["sender"] if remitentes else None,
+            "counts": dict(conteos),
+            "total": sum(conteos.values()),
+            "senders": remitentes,
+        })
 
     async def broadcast_reaction(self, reaction_payload: dict):
         """
         Envía una reacción (emoticono) a todos los clientes.
         """
         payload = {"type": "reaction", "payload": reaction_payload}
-        await self._broadcast(json.dumps(payload))
+        await self._broadcast(payload, temas=("reactions",))
 
     async def broadcast_song_finished(self, cancion: models.Cancion):
         """
@@ -109,7 +750,7 @@ class ConnectionManager:
                 "is_karaoke": cancion.is_karaoke  # Nuevo campo para indicar si es karaoke
             }
         }
-        await self._broadcast(json.dumps(payload))
+        await self._broadcast(payload, temas=("player", "queue"))
 
     async def broadcast_play_song(self, youtube_id: str, duration_seconds: int = 0):
         """
@@ -130,28 +771,52 @@ class ConnectionManager:
                 "duracion_seconds": duration_seconds
             }
         }
-        await self._broadcast(json.dumps(payload))
+        await self._broadcast(payload, temas=("player",))
+
+    async def broadcast_preload_next(self, cancion: models.Cancion):
+        """
+        Envía la canción que sonará a continuación para que el player precargue el video
+        antes de que termine la actual.
+        """
+        payload = {
+            "type": "preload_next",
+            "payload": {
+                "cancion_id": cancion.id,
+                "youtube_id": cancion.youtube_id,
+                "duracion_seconds": cancion.duracion_seconds or 0,
+                "titulo": cancion.titulo,
+            }
+        }
+        await self._broadcast(payload, temas=("player",))
 
     async def broadcast_restart_song(self):
         """
         Envía un evento para reiniciar la canción actual en el reproductor.
         """
         payload = {"type": "restart_song"}
-        await self._broadcast(json.dumps(payload))
+        await self._broadcast(payload, temas=("player",))
 
     async def broadcast_pause(self):
         """
         Envía un evento para pausar la reproducción actual.
         """
         payload = {"type": "pause_playback"}
-        await self._broadcast(json.dumps(payload))
+        await self._broadcast(payload, temas=("player",))
 
     async def broadcast_resume(self):
         """
         Envía un evento para reanudar la reproducción.
         """
         payload = {"type": "resume_playback"}
-        await self._broadcast(json.dumps(payload))
+        await self._broadcast(payload, temas=("player",))
+
+    async def broadcast_playback_state(self, estado: dict):
+        """
+        Envía la instantánea del reloj de reproducción (posición, pausa, fin esperado)
+        para que los clientes interpolen la posición localmente.
+        """
+        payload = {"type": "playback_state", "payload": estado}
+        await self._broadcast(payload, clave="playback_state", temas=("player",))
 
     async def broadcast_notification(self, mensaje: str):
         """
@@ -163,6 +828,6 @@ class ConnectionManager:
                 "mensaje": mensaje
             }
         }
-        await self._broadcast(json.dumps(payload))
+        await self._broadcast(payload)
 
 manager = ConnectionManager()
\ No newline at end of file